@@ -1,3 +1,5 @@
+# 需最先导入：MAGICBRUSH_PROFILE_STARTUP=1 时统计之后所有模块的导入耗时
+from backend.utils.startup_profiler import get_startup_profiler
 import logging
 import sys
 from pathlib import Path
@@ -36,38 +38,56 @@ def setup_logging():
 
 
 def create_app():
+    profiler = get_startup_profiler()
+
     # 设置日志
-    logger = setup_logging()
+    with profiler.phase("setup_logging"):
+        logger = setup_logging()
     logger.info("🚀 正在启动 魔刷 AI图文生成器...")
 
     # 检查是否存在前端构建产物（Docker 环境）
     frontend_dist = Path(__file__).parent.parent / 'frontend' / 'dist'
-    if frontend_dist.exists():
-        logger.info("📦 检测到前端构建产物，启用静态文件托管模式")
-        app = Flask(
-            __name__,
-            static_folder=str(frontend_dist),
-            static_url_path=''
-        )
-    else:
-        logger.info("🔧 开发模式，前端请单独启动")
-        app = Flask(__name__)
-
-    app.config.from_object(Config)
-
-    CORS(app, resources={
-        r"/api/*": {
-            "origins": Config.CORS_ORIGINS,
-            "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type"],
-        }
-    })
+    with profiler.phase("create Flask app"):
+        if frontend_dist.exists():
+            logger.info("📦 检测到前端构建产物，启用静态文件托管模式")
+            app = Flask(
+                __name__,
+                static_folder=str(frontend_dist),
+                static_url_path=''
+            )
+        else:
+            logger.info("🔧 开发模式，前端请单独启动")
+            app = Flask(__name__)
+
+        app.config.from_object(Config)
+
+    with profiler.phase("CORS"):
+        CORS(app, resources={
+            r"/api/*": {
+                "origins": Config.CORS_ORIGINS,
+                "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+                "allow_headers": ["Content-Type"],
+            }
+        })
 
     # 注册所有 API 路由
-    register_routes(app)
+    with profiler.phase("register_routes"):
+        register_routes(app)
+
+    # 请求体超过 MAX_CONTENT_LENGTH 时返回 JSON 错误
+    @app.errorhandler(413)
+    def request_too_large(e):
+        return {
+            "success": False,
+            "error": (
+                f"请求体过大，上限 {Config.UPLOAD_MAX_REQUEST_MB}MB\n"
+                "解决方案：减少参考图数量或压缩图片后重试"
+            )
+        }, 413
 
     # 启动时验证配置
-    _validate_config_on_startup(logger)
+    with profiler.phase("validate config"):
+        _validate_config_on_startup(logger)
 
     # 根据是否有前端构建产物决定根路由行为
     if frontend_dist.exists():
@@ -93,6 +113,7 @@ def create_app():
                 }
             }
 
+    profiler.report(logger)
     return app
 
 
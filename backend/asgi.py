@@ -0,0 +1,399 @@
+"""
+ASGI 入口（生产部署）
+
+    uvicorn backend.asgi:app --host 0.0.0.0 --port 12398
+
+SSE 接口（POST /api/generate、POST /api/retry-failed、GET /api/jobs/<job_id>/events）以原生异步流运行：
+每条进度流只是事件循环上的一个协程，不再长期占用工作线程，单进程即可承载大量长连接。
+图片文件（GET /api/images/<task_id>/<filename>）在服务器支持 http.response.zerocopysend
+或 http.response.pathsend 扩展时直接交给服务器发送，不经过 Python 逐块复制。
+其余接口通过 asgiref 的 WsgiToAsgi 交给现有 Flask 应用处理，行为与开发服务器一致。
+"""
+
+# 需最先导入：MAGICBRUSH_PROFILE_STARTUP=1 时统计之后所有模块的导入耗时
+from backend.utils.startup_profiler import get_startup_profiler
+
+import asyncio
+import json
+import logging
+import os
+import re
+from email.utils import formatdate
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from asgiref.wsgi import WsgiToAsgi
+
+from backend.app import create_app
+from backend.config import Config
+from backend.routes.sse import (
+    SSE_HEADERS,
+    astream_job,
+    check_provider,
+    parse_generate_request,
+    parse_last_event_id,
+    parse_retry_failed_request,
+    submit_generate_job,
+    submit_retry_failed_job,
+)
+from backend.routes.utils import log_request, log_error
+from backend.services.image import get_image_service
+from backend.services.jobs import get_job_manager
+from backend.utils.upload import UploadError
+from backend.utils.file_serving import resolve_image_path
+
+logger = logging.getLogger(__name__)
+
+# 任务事件订阅路径
+JOB_EVENTS_PATH = re.compile(r"^/api/jobs/([^/]+)/events$")
+# 图片文件路径
+IMAGE_PATH = re.compile(r"^/api/images/([^/]+)/([^/]+)$")
+
+
+class MagicBrushASGI:
+    """ASGI 应用：SSE 接口原生异步处理，其余请求转发给 Flask"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi_app = WsgiToAsgi(flask_app)
+        self.sse_routes = {
+            "/api/generate": self._generate,
+            "/api/retry-failed": self._retry_failed,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+
+        if scope["type"] == "http":
+            if scope["method"] == "POST":
+                handler = self.sse_routes.get(scope["path"])
+                if handler is not None:
+                    await handler(scope, receive, send)
+                    return
+
+            if scope["method"] == "GET":
+                match = JOB_EVENTS_PATH.match(scope["path"])
+                if match and get_job_manager().has_job(match.group(1)):
+                    await self._job_events(scope, receive, send, match.group(1))
+                    return
+
+                match = IMAGE_PATH.match(scope["path"])
+                if match and await self._send_image(scope, send, *match.groups()):
+                    return
+
+        await self.wsgi_app(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        """处理 ASGI lifespan 事件（WsgiToAsgi 不支持 lifespan）"""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # ==================== SSE 接口 ====================
+
+    async def _generate(self, scope, receive, send):
+        """批量生成图片（SSE 流式返回，参数与 Flask 路由相同）"""
+        try:
+            data = await self._read_json(receive)
+            user_topic = data.get('user_topic', '')
+
+            log_request('/generate', {
+                'pages_count': len(data.get('pages') or []),
+                'task_id': data.get('task_id'),
+                'user_topic': user_topic[:50] if user_topic else None,
+                'user_images': data.get('user_images') or [],
+                'step': data.get('step', 'all')
+            })
+
+            # base64 图片解码可能较大，放到线程中执行
+            params, error = await asyncio.to_thread(parse_generate_request, data)
+            if error:
+                await self._send_json(scope, send, 400, {"success": False, "error": error})
+                return
+
+            logger.info(f"🖼️  开始图片生成任务: {params['task_id']}, 共 {len(params['pages'])} 页, 步骤: {params['step']}")
+            image_service = await asyncio.to_thread(get_image_service)
+
+            error = await asyncio.to_thread(check_provider, image_service, params['provider'])
+            if error:
+                await self._send_json(scope, send, 400, {"success": False, "error": error})
+                return
+
+        except UploadError as e:
+            await self._send_json(scope, send, e.status_code, {"success": False, "error": str(e)})
+            return
+
+        except ConnectionError:
+            logger.info("客户端在请求体上传完成前断开连接")
+            return
+
+        except Exception as e:
+            log_error('/generate', e)
+            await self._send_json(scope, send, 500, {
+                "success": False,
+                "error": f"图片生成异常。\n错误详情: {str(e)}\n建议：检查图片生成服务配置和后端日志"
+            })
+            return
+
+        # 生成在后台任务中运行，SSE 连接只是订阅者
+        job = submit_generate_job(image_service, params)
+        await self._send_stream(scope, receive, send, astream_job(job.job_id), job.job_id)
+
+    async def _retry_failed(self, scope, receive, send):
+        """批量重试失败的图片（SSE 流式返回，参数与 Flask 路由相同）"""
+        try:
+            data = await self._read_json(receive)
+
+            log_request('/retry-failed', {
+                'task_id': data.get('task_id'),
+                'pages_count': len(data.get('pages') or [])
+            })
+
+            # 引用的参考图需要读取文件，放到线程中执行
+            params, error = await asyncio.to_thread(parse_retry_failed_request, data)
+            if error:
+                await self._send_json(scope, send, 400, {"success": False, "error": error})
+                return
+
+            logger.info(f"🔄 批量重试失败图片: task={params['task_id']}, 共 {len(params['pages'])} 页")
+            image_service = await asyncio.to_thread(get_image_service)
+
+            error = await asyncio.to_thread(check_provider, image_service, params['provider'])
+            if error:
+                await self._send_json(scope, send, 400, {"success": False, "error": error})
+                return
+
+        except UploadError as e:
+            await self._send_json(scope, send, e.status_code, {"success": False, "error": str(e)})
+            return
+
+        except ConnectionError:
+            logger.info("客户端在请求体上传完成前断开连接")
+            return
+
+        except Exception as e:
+            log_error('/retry-failed', e)
+            await self._send_json(scope, send, 500, {
+                "success": False,
+                "error": f"批量重试失败。\n错误详情: {str(e)}"
+            })
+            return
+
+        job = submit_retry_failed_job(image_service, params)
+        await self._send_stream(scope, receive, send, astream_job(job.job_id), job.job_id)
+
+    async def _job_events(self, scope, receive, send, job_id: str):
+        """订阅后台任务事件（支持 Last-Event-ID 断线重连，参数与 Flask 路由相同）"""
+        last_event_id = None
+        for name, value in scope.get("headers", []):
+            if name == b"last-event-id":
+                last_event_id = value.decode("latin-1")
+                break
+        if last_event_id is None:
+            match = re.search(r"(?:^|&)last_event_id=([^&]*)", scope.get("query_string", b"").decode("latin-1"))
+            last_event_id = match.group(1) if match else None
+
+        last_event_id = parse_last_event_id(last_event_id)
+        logger.info(f"🔌 订阅后台任务事件: job={job_id}, last_event_id={last_event_id}")
+        await self._send_stream(scope, receive, send, astream_job(job_id, last_event_id), job_id)
+
+    async def _send_image(self, scope, send, task_id: str, filename: str) -> bool:
+        """
+        由服务器零拷贝发送图片文件（参数与 Flask 路由相同）
+
+        Returns:
+            是否已处理；配置了反向代理转发、服务器不支持相关扩展或文件不存在时返回 False，交给 Flask 处理
+        """
+        extensions = scope.get("extensions") or {}
+        zerocopy = "http.response.zerocopysend" in extensions
+        if Config.FILE_OFFLOAD or not (zerocopy or "http.response.pathsend" in extensions):
+            return False
+
+        query = scope.get("query_string", b"").decode("latin-1")
+        match = re.search(r"(?:^|&)thumbnail=([^&]*)", query)
+        thumbnail = (match.group(1) if match else "true").lower() == "true"
+        resolved = resolve_image_path(task_id, filename, thumbnail)
+        if resolved is None:
+            return False
+
+        filepath, content_hash = resolved
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            return False
+        etag = f'"{content_hash or f"{stat.st_mtime_ns:x}-{stat.st_size:x}"}"'
+        headers = [
+            (b"content-type", b"image/png"),
+            (b"etag", etag.encode()),
+            (b"last-modified", formatdate(stat.st_mtime, usegmt=True).encode()),
+            (b"cache-control", b"no-cache"),
+        ] + self._cors_headers(scope)
+
+        for name, value in scope.get("headers", []):
+            if name == b"if-none-match" and etag in value.decode("latin-1"):
+                await send({"type": "http.response.start", "status": 304, "headers": headers})
+                await send({"type": "http.response.body", "body": b""})
+                return True
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": headers + [(b"content-length", str(stat.st_size).encode())],
+        })
+        if zerocopy:
+            with open(filepath, "rb") as f:
+                await send({"type": "http.response.zerocopysend", "file": f})
+        else:
+            await send({"type": "http.response.pathsend", "path": filepath})
+        return True
+
+    # ==================== 辅助方法 ====================
+
+    async def _read_json(self, receive) -> Dict[str, Any]:
+        """
+        读取完整请求体并解析为 JSON 对象
+
+        Raises:
+            UploadError: 超过 MAX_CONTENT_LENGTH（413），或请求体不是合法的 JSON 对象（400）
+            ConnectionError: 读取过程中客户端断开连接
+        """
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise ConnectionError("客户端已断开连接")
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if size > Config.MAX_CONTENT_LENGTH:
+                raise UploadError(
+                    f"请求体过大，上限 {Config.UPLOAD_MAX_REQUEST_MB}MB\n"
+                    "解决方案：减少参考图数量或压缩图片后重试",
+                    status_code=413
+                )
+            if not message.get("more_body", False):
+                break
+
+        body = b"".join(chunks)
+        if not body:
+            return {}
+        try:
+            data = json.loads(body.decode("utf-8"))
+        except ValueError as e:
+            raise UploadError(
+                f"请求体不是合法的 JSON。\n"
+                f"错误详情: {e}\n"
+                "解决方案：检查请求体格式，并设置 Content-Type: application/json"
+            )
+        if data is None:
+            return {}
+        if not isinstance(data, dict):
+            raise UploadError(
+                "请求体格式错误：应为 JSON 对象。\n"
+                f"实际类型: {type(data).__name__}\n"
+                "解决方案：以 {\"task_id\": ..., \"pages\": [...]} 形式提交参数"
+            )
+        return data
+
+    def _cors_headers(self, scope) -> List[Tuple[bytes, bytes]]:
+        """与 Flask-CORS 配置一致的跨域响应头"""
+        origin = None
+        for name, value in scope.get("headers", []):
+            if name == b"origin":
+                origin = value.decode("latin-1")
+                break
+
+        if origin and ("*" in Config.CORS_ORIGINS or origin in Config.CORS_ORIGINS):
+            return [
+                (b"access-control-allow-origin", origin.encode("latin-1")),
+                (b"vary", b"Origin"),
+            ]
+        return []
+
+    async def _send_json(self, scope, send, status: int, payload: Dict[str, Any]):
+        """发送 JSON 响应"""
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ] + self._cors_headers(scope),
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def _send_stream(self, scope, receive, send, chunks: AsyncIterator[str], job_id: str):
+        """
+        发送 SSE 事件流
+
+        等待下一个事件的同时监听 http.disconnect：客户端断开后立即停止转发并结束订阅
+        （不必等到下一个事件产生），后台任务继续运行
+        """
+        async def watch_disconnect():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+
+        watcher = asyncio.create_task(watch_disconnect())
+        next_chunk = None
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream; charset=utf-8"),
+                    (b"x-job-id", job_id.encode()),
+                ] + [
+                    (name.lower().encode(), value.encode())
+                    for name, value in SSE_HEADERS.items()
+                ] + self._cors_headers(scope),
+            })
+
+            while True:
+                next_chunk = asyncio.ensure_future(chunks.__anext__())
+                await asyncio.wait({next_chunk, watcher}, return_when=asyncio.FIRST_COMPLETED)
+                if not next_chunk.done():
+                    logger.info("SSE 客户端已断开，停止推送事件")
+                    break
+                try:
+                    chunk = next_chunk.result()
+                except StopAsyncIteration:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+                    break
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk.encode("utf-8"),
+                    "more_body": True,
+                })
+        except OSError:
+            logger.info("SSE 客户端连接已关闭")
+        finally:
+            watcher.cancel()
+            if next_chunk is not None and not next_chunk.done():
+                # 等待中的订阅先结束，才能关闭事件流
+                next_chunk.cancel()
+                try:
+                    await next_chunk
+                except asyncio.CancelledError:
+                    pass
+            await chunks.aclose()
+
+
+app = MagicBrushASGI(create_app())
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(
+        app,
+        host=Config.HOST,
+        port=Config.PORT
+    )
@@ -1,4 +1,5 @@
 import logging
+import os
 import yaml
 from pathlib import Path
 
@@ -12,6 +13,60 @@ class Config:
     CORS_ORIGINS = ['http://localhost:5173', 'http://localhost:3000']
     OUTPUT_DIR = 'output'
 
+    # 任务状态存储：memory（单进程）/ sqlite（多 worker 共享）
+    TASK_STATE_STORE = os.environ.get('TASK_STATE_STORE', 'memory')
+    TASK_STATE_DB = os.environ.get('TASK_STATE_DB', '')
+    # memory 存储的内存预算（MB）和空闲超时（秒），超出后任务状态写入任务目录
+    TASK_STATE_MEMORY_MB = int(os.environ.get('TASK_STATE_MEMORY_MB', '256'))
+    TASK_STATE_TTL = int(os.environ.get('TASK_STATE_TTL', '1800'))
+
+    # 图片和 ZIP 下载的文件发送方式：空（应用发送，WSGI/ASGI 服务器支持时零拷贝）
+    # / x-accel（Nginx X-Accel-Redirect）/ x-sendfile（Apache、lighttpd 的 X-Sendfile）
+    FILE_OFFLOAD = os.environ.get('FILE_OFFLOAD', '').lower()
+    # X-Accel-Redirect 使用的 Nginx 内部 location，需指向 history 目录
+    FILE_OFFLOAD_PREFIX = os.environ.get('FILE_OFFLOAD_PREFIX', '/_history/')
+    USE_X_SENDFILE = FILE_OFFLOAD == 'x-sendfile'
+
+    # 上传限制：单次请求体大小（MB）、单张参考图大小（MB）、单次请求的参考图数量
+    UPLOAD_MAX_REQUEST_MB = int(os.environ.get('UPLOAD_MAX_REQUEST_MB', '64'))
+    UPLOAD_MAX_IMAGE_MB = int(os.environ.get('UPLOAD_MAX_IMAGE_MB', '20'))
+    UPLOAD_MAX_IMAGES = int(os.environ.get('UPLOAD_MAX_IMAGES', '10'))
+    MAX_CONTENT_LENGTH = UPLOAD_MAX_REQUEST_MB * 1024 * 1024
+
+    # 图片 ZIP 下载缓存（任务目录中的 .images.zip）：所有任务的缓存总大小上限（MB）
+    # 和未被下载的保留时间（秒），超出后删除最久未下载的缓存，0 表示不限制
+    ZIP_CACHE_MAX_MB = int(os.environ.get('ZIP_CACHE_MAX_MB', '512'))
+    ZIP_CACHE_TTL = int(os.environ.get('ZIP_CACHE_TTL', '86400'))
+
+    # 图片压缩进程池的进程数（默认 CPU 核数，0 表示在线程中直接压缩）
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', os.cpu_count() or 1))
+
+    # 参考图存储目录（默认 history/.references，按内容去重并缓存压缩结果）
+    REFERENCE_STORE_DIR = os.environ.get('REFERENCE_STORE_DIR', '')
+    # 参考图存储的大小上限（MB，超出后按最近使用时间淘汰）和没有任务使用的参考图的保留时间（秒，默认 7 天），0 表示不限制
+    REFERENCE_STORE_MAX_MB = int(os.environ.get('REFERENCE_STORE_MAX_MB', '1024'))
+    REFERENCE_STORE_TTL = int(os.environ.get('REFERENCE_STORE_TTL', '604800'))
+
+    # 推测生成：分步模式下等待用户确认封面期间，最多提前生成的内容页数量（0 表示禁用）
+    # 和未确认结果的保留时间（秒），超时或封面被重绘时丢弃
+    SPECULATIVE_MAX_PAGES = int(os.environ.get('SPECULATIVE_MAX_PAGES', '4'))
+    SPECULATIVE_TTL = int(os.environ.get('SPECULATIVE_TTL', '600'))
+
+    # 截止时间（秒，默认 0 表示不限制，需要时通过环境变量开启，如 TASK_DEADLINE=1800 PAGE_DEADLINE=600）：
+    # 一次生成 / 批量重试的整体时间（含排队），以及单页从获得服务商并发名额起的时间（含所有重试）；
+    # 开启后每次上游请求的超时不超过剩余时间，来不及时跳过剩余重试
+    TASK_DEADLINE = int(os.environ.get('TASK_DEADLINE', '0'))
+    PAGE_DEADLINE = int(os.environ.get('PAGE_DEADLINE', '0'))
+
+    # 生成图片的落盘策略：none / batch（任务结束时统一 fsync）/ always（每张图片写入后 fsync）
+    IMAGE_FSYNC = os.environ.get('IMAGE_FSYNC', 'batch').lower()
+
+    # 允许通过 provider.type（"模块路径:类名"）直接导入的自定义生成器模块前缀，逗号分隔（如 my_plugins,company.generators）。
+    # 默认为空：只能使用内置生成器和插件包通过 entry point 注册的生成器（配置接口没有鉴权，不能让客户端导入任意模块）
+    CUSTOM_GENERATOR_MODULES = [
+        prefix.strip() for prefix in os.environ.get('CUSTOM_GENERATOR_MODULES', '').split(',') if prefix.strip()
+    ]
+
     _image_providers_config = None
     _text_providers_config = None
 
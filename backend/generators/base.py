@@ -1,6 +1,7 @@
 """图片生成器抽象基类"""
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 
 class ImageGeneratorBase(ABC):
@@ -17,6 +18,10 @@ class ImageGeneratorBase(ABC):
         self.api_key = config.get('api_key')
         self.base_url = config.get('base_url')
 
+        # 异步 HTTP 客户端（按事件循环懒加载，连接池在请求间复用）
+        self._async_client = None
+        self._async_client_loop = None
+
     @abstractmethod
     def generate_image(
         self,
@@ -35,6 +40,121 @@ class ImageGeneratorBase(ABC):
         """
         pass
 
+    async def agenerate_image(
+        self,
+        prompt: str,
+        **kwargs
+    ) -> bytes:
+        """
+        异步生成图片
+
+        默认实现在线程池中运行 generate_image，原生支持异步的生成器应覆盖此方法，
+        使等待上游响应期间不占用线程。
+
+        Args:
+            prompt: 提示词
+            **kwargs: 其他参数（与 generate_image 相同）
+
+        Returns:
+            图片二进制数据
+        """
+        return await asyncio.to_thread(self.generate_image, prompt, **kwargs)
+
+    def get_batch_size(self) -> int:
+        """
+        获取单次上游请求最多可合并的页面数
+
+        默认为 1（不支持批量）。支持 n>1 或批量端点的生成器可覆盖此方法，
+        通常读取服务商配置中的 batch_size 字段。
+
+        Returns:
+            单次请求最多生成的图片数
+        """
+        return 1
+
+    def generate_images_batch(
+        self,
+        prompts: List[str],
+        **kwargs
+    ) -> List[bytes]:
+        """
+        批量生成图片（同一任务的多个页面合并为一次上游调用）
+
+        默认实现逐个调用 generate_image，支持批量的生成器应覆盖此方法。
+
+        Args:
+            prompts: 提示词列表
+            **kwargs: 其他参数（与 generate_image 相同，所有页面共用）
+
+        Returns:
+            图片二进制数据列表，顺序与 prompts 一致
+        """
+        return [self.generate_image(prompt, **kwargs) for prompt in prompts]
+
+    async def agenerate_images_batch(
+        self,
+        prompts: List[str],
+        **kwargs
+    ) -> List[bytes]:
+        """
+        异步批量生成图片
+
+        默认实现在线程池中运行 generate_images_batch
+
+        Args:
+            prompts: 提示词列表
+            **kwargs: 其他参数（所有页面共用）
+
+        Returns:
+            图片二进制数据列表，顺序与 prompts 一致
+        """
+        return await asyncio.to_thread(self.generate_images_batch, prompts, **kwargs)
+
+    def _get_async_client(self):
+        """
+        获取异步 HTTP 客户端
+
+        httpx.AsyncClient 绑定创建它的事件循环，切换事件循环时重新创建
+
+        Returns:
+            httpx.AsyncClient 实例
+        """
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            old_client, old_loop = self._async_client, self._async_client_loop
+            if old_client is not None and old_loop is not None and old_loop.is_running():
+                # 旧客户端只能在其所属事件循环中关闭；所属事件循环已停止时连接随客户端一起被回收
+                asyncio.run_coroutine_threadsafe(old_client.aclose(), old_loop)
+            max_connections = int(self.config.get('max_concurrent', 100) or 100)
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_connections
+                )
+            )
+            self._async_client_loop = loop
+        return self._async_client
+
+    async def aclose(self) -> None:
+        """
+        关闭异步 HTTP 客户端，释放连接池
+
+        生成器因配置变更被淘汰、且没有进行中的调用后调用。之后再次使用时会重新创建客户端。
+        客户端属于其他正在运行的事件循环时在该循环中关闭
+        """
+        client, loop = self._async_client, self._async_client_loop
+        self._async_client = None
+        self._async_client_loop = None
+        if client is None:
+            return
+
+        if loop is asyncio.get_running_loop():
+            await client.aclose()
+        elif loop is not None and loop.is_running():
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(client.aclose(), loop))
+
     @abstractmethod
     def validate_config(self) -> bool:
         """
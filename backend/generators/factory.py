@@ -1,39 +1,108 @@
 """图片生成器工厂"""
-from typing import Dict, Any
+import importlib
+import logging
+import threading
+from typing import Dict, Any, Optional, Tuple, Union
+from backend.config import Config
 from .base import ImageGeneratorBase
-from .google_genai import GoogleGenAIGenerator
-from .openai_compatible import OpenAICompatibleGenerator
-from .image_api import ImageApiGenerator
+
+logger = logging.getLogger(__name__)
+
+# 第三方生成器的 entry point 分组，例如在插件包的 pyproject.toml 中声明：
+# [project.entry-points."magicbrush.image_generators"]
+# my_provider = "my_package.generator:MyGenerator"
+ENTRY_POINT_GROUP = "magicbrush.image_generators"
 
 
 class ImageGeneratorFactory:
     """图片生成器工厂类"""
 
-    # 注册的生成器类型
-    GENERATORS = {
-        'google_genai': GoogleGenAIGenerator,
-        'imagen': GoogleGenAIGenerator,  # Imagen 4 also uses GenAI SDK
-        'openai': OpenAICompatibleGenerator,
-        'openai_compatible': OpenAICompatibleGenerator,
-        'image_api': ImageApiGenerator,
+    # 注册的生成器类型：值为生成器类，或 "模块路径:类名" 字符串（首次创建时才导入，
+    # 未使用的服务商不会加载其 SDK，如 google-genai）
+    GENERATORS: Dict[str, Union[str, type]] = {
+        'google_genai': 'backend.generators.google_genai:GoogleGenAIGenerator',
+        'imagen': 'backend.generators.google_genai:GoogleGenAIGenerator',  # Imagen 4 also uses GenAI SDK
+        'openai': 'backend.generators.openai_compatible:OpenAICompatibleGenerator',
+        'openai_compatible': 'backend.generators.openai_compatible:OpenAICompatibleGenerator',
+        'image_api': 'backend.generators.image_api:ImageApiGenerator',
     }
 
+    _entry_points_loaded = False
+    _lock = threading.Lock()
+
     @classmethod
     def create(cls, provider: str, config: Dict[str, Any]) -> ImageGeneratorBase:
         """
         创建图片生成器实例
 
         Args:
-            provider: 服务商类型 ('google_genai', 'openai', 'openai_compatible')
+            provider: 服务商类型（'google_genai', 'openai', 'openai_compatible' 等注册名称，
+                或 Config.CUSTOM_GENERATOR_MODULES 允许范围内 "模块路径:类名" 形式的自定义生成器路径）
             config: 配置字典
 
         Returns:
             图片生成器实例
 
         Raises:
-            ValueError: 不支持的服务商类型
+            ValueError: 不支持的服务商类型或生成器加载失败
+        """
+        generator_class = cls.get_generator_class(provider)
+        return generator_class(config)
+
+    @classmethod
+    def get_generator_class(cls, provider: str) -> type:
+        """
+        获取生成器类（按需导入并缓存）
+
+        Args:
+            provider: 服务商类型或 "模块路径:类名"
+
+        Returns:
+            生成器类
+
+        Raises:
+            ValueError: 不支持的服务商类型或生成器加载失败
+        """
+        target = cls.check_type(provider)
+
+        if target is None:
+            # 未注册的类型按自定义生成器路径处理（check_type 已确认在允许的模块前缀内）
+            target = provider
+
+        if isinstance(target, str):
+            generator_class = cls._import_generator(provider, target)
+            with cls._lock:
+                cls.GENERATORS[provider] = generator_class
+            return generator_class
+
+        return target
+
+    @classmethod
+    def check_type(cls, provider: str) -> Optional[Union[str, type]]:
+        """
+        检查服务商类型是否可用（不导入任何模块）
+
+        已注册的类型（内置生成器、插件包 entry point、register_generator）总是可用；
+        "模块路径:类名" 形式的自定义生成器只有模块在 Config.CUSTOM_GENERATOR_MODULES 声明的前缀内时可用，
+        避免通过配置接口让服务端导入任意模块（导入时模块顶层代码就会执行）
+
+        Args:
+            provider: 服务商类型或 "模块路径:类名"
+
+        Returns:
+            已注册的生成器类或路径，未注册但允许导入的自定义路径返回 None
+
+        Raises:
+            ValueError: 不支持的服务商类型，或自定义生成器的模块不在允许的前缀内
         """
-        if provider not in cls.GENERATORS:
+        cls._load_entry_points()
+
+        with cls._lock:
+            target = cls.GENERATORS.get(provider)
+        if target is not None:
+            return target
+
+        if not isinstance(provider, str) or (':' not in provider and '.' not in provider):
             available = ', '.join(cls.GENERATORS.keys())
             raise ValueError(
                 f"不支持的图片生成服务商: {provider}\n"
@@ -41,21 +110,91 @@ class ImageGeneratorFactory:
                 "解决方案：\n"
                 "1. 检查 image_providers.yaml 中的 active_provider 配置\n"
                 "2. 确认 provider.type 字段是否正确\n"
-                "3. 或使用环境变量 IMAGE_PROVIDER 指定服务商"
+                "3. 或使用环境变量 IMAGE_PROVIDER 指定服务商\n"
+                "4. 自定义生成器可通过插件包的 entry point 注册类型名称"
             )
 
-        generator_class = cls.GENERATORS[provider]
-        return generator_class(config)
+        module_name = cls._split_path(provider)[0]
+        allowed = Config.CUSTOM_GENERATOR_MODULES
+        if not any(module_name == prefix or module_name.startswith(prefix + '.') for prefix in allowed):
+            raise ValueError(
+                f"不允许加载自定义图片生成器: {provider}\n"
+                "可能原因：模块不在允许导入的范围内（默认不允许通过配置直接导入模块）\n"
+                "解决方案：\n"
+                "1. 推荐通过插件包的 entry point（magicbrush.image_generators）注册类型名称\n"
+                "2. 或在环境变量 CUSTOM_GENERATOR_MODULES 中声明允许导入的模块前缀"
+            )
+        return None
+
+    @staticmethod
+    def _split_path(path: str) -> Tuple[str, str]:
+        """拆分 "模块路径:类名"（或 "模块路径.类名"）"""
+        if ':' in path:
+            module_name, _, attr = path.partition(':')
+        else:
+            module_name, _, attr = path.rpartition('.')
+        return module_name, attr
 
     @classmethod
-    def register_generator(cls, name: str, generator_class: type):
+    def _import_generator(cls, provider: str, path: str) -> type:
+        """导入 "模块路径:类名"（或 "模块路径.类名"）指定的生成器类"""
+        module_name, attr = cls._split_path(path)
+
+        try:
+            module = importlib.import_module(module_name)
+            generator_class = getattr(module, attr)
+        except (ImportError, AttributeError, ValueError) as e:
+            raise ValueError(
+                f"加载图片生成器失败: {provider} ({path})\n"
+                f"错误详情: {e}\n"
+                "可能原因：\n"
+                "1. 生成器所需的依赖包未安装\n"
+                "2. 模块路径或类名填写错误\n"
+                "解决方案：安装对应依赖，或检查 provider.type 中的 \"模块路径:类名\""
+            )
+
+        if not isinstance(generator_class, type) or not issubclass(generator_class, ImageGeneratorBase):
+            raise ValueError(
+                f"加载图片生成器失败: {path} 不是 ImageGeneratorBase 的子类"
+            )
+
+        logger.debug(f"已加载图片生成器: {provider} -> {generator_class.__name__}")
+        return generator_class
+
+    @classmethod
+    def _load_entry_points(cls):
+        """注册已安装插件包通过 entry point 声明的生成器（只记录路径，首次创建时才导入）"""
+        if cls._entry_points_loaded:
+            return
+
+        with cls._lock:
+            if cls._entry_points_loaded:
+                return
+            cls._entry_points_loaded = True
+
+            from importlib.metadata import entry_points
+
+            for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+                if entry_point.name in cls.GENERATORS:
+                    logger.warning(f"图片生成器 {entry_point.name} 已注册，忽略插件中的同名生成器: {entry_point.value}")
+                    continue
+                cls.GENERATORS[entry_point.name] = entry_point.value
+                logger.info(f"发现图片生成器插件: {entry_point.name} -> {entry_point.value}")
+
+    @classmethod
+    def register_generator(cls, name: str, generator_class: Union[type, str]):
         """
         注册自定义生成器
 
         Args:
             name: 生成器名称
-            generator_class: 生成器类
+            generator_class: 生成器类，或 "模块路径:类名"（首次创建时才导入）
         """
+        if isinstance(generator_class, str):
+            with cls._lock:
+                cls.GENERATORS[name] = generator_class
+            return
+
         if not issubclass(generator_class, ImageGeneratorBase):
             raise TypeError(
                 f"注册失败：生成器类必须继承自 ImageGeneratorBase。\n"
@@ -63,4 +202,5 @@ class ImageGeneratorFactory:
                 f"基类: ImageGeneratorBase"
             )
 
-        cls.GENERATORS[name] = generator_class
+        with cls._lock:
+            cls.GENERATORS[name] = generator_class
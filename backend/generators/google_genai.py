@@ -1,4 +1,5 @@
 """Google GenAI 图片生成器"""
+import asyncio
 import logging
 import os
 import time
@@ -9,7 +10,8 @@ from typing import Dict, Any, Optional
 from google import genai
 from google.genai import types
 from .base import ImageGeneratorBase
-from ..utils.image_compressor import compress_image
+from ..utils.deadline import DeadlineExceeded, can_retry
+from ..utils.image_executor import get_image_executor
 
 logger = logging.getLogger(__name__)
 
@@ -281,50 +283,78 @@ def parse_genai_error(error: Exception) -> str:
 
 
 def retry_on_error(max_retries=5, base_delay=3):
-    """智能重试装饰器，根据错误类型决定是否重试"""
+    """智能重试装饰器，根据错误类型决定是否重试（同时支持同步函数和协程函数）"""
+    def next_wait_time(attempt: int, error: Exception) -> float:
+        """计算下次重试前的等待时间；不可重试、重试耗尽或剩余时间不足时抛出格式化后的错误"""
+        error_str = str(error).lower()
+
+        # 不可重试的错误类型
+        non_retryable = [
+            "401", "unauthenticated",  # 认证错误
+            "403", "permission_denied", "forbidden",  # 权限错误
+            "404", "not_found",  # 资源不存在
+            "invalid_argument",  # 参数错误
+            "safety", "blocked", "filter",  # 安全过滤
+        ]
+
+        should_retry = True
+        for keyword in non_retryable:
+            if keyword in error_str:
+                should_retry = False
+                break
+
+        if not should_retry:
+            # 直接抛出，不重试
+            raise Exception(parse_genai_error(error))
+
+        # 可重试的错误
+        if attempt < max_retries - 1:
+            rate_limited = "429" in error_str or "resource_exhausted" in error_str
+            if rate_limited:
+                wait_time = (base_delay ** attempt) + random.uniform(0, 1)
+            else:
+                wait_time = min(2 ** attempt, 10) + random.uniform(0, 1)
+            if can_retry(wait_time):
+                if rate_limited:
+                    logger.warning(f"⏳ 遇到速率限制，{wait_time:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries})")
+                else:
+                    logger.warning(f"⚠️ 请求失败，{wait_time:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries})")
+                return wait_time
+
+        # 重试次数耗尽或来不及再次尝试
+        raise Exception(parse_genai_error(error))
+
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                last_error = None
+                for attempt in range(max_retries):
+                    try:
+                        return await func(*args, **kwargs)
+                    except DeadlineExceeded:
+                        # 截止时间已到：原样抛出，交给调用方按超时处理
+                        raise
+                    except Exception as e:
+                        last_error = e
+                        await asyncio.sleep(next_wait_time(attempt, e))
+
+                # 理论上不会到这里，但保险起见
+                raise Exception(parse_genai_error(last_error))
+            return async_wrapper
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             last_error = None
             for attempt in range(max_retries):
                 try:
                     return func(*args, **kwargs)
+                except DeadlineExceeded:
+                    # 截止时间已到：原样抛出，交给调用方按超时处理
+                    raise
                 except Exception as e:
                     last_error = e
-                    error_str = str(e).lower()
-
-                    # 不可重试的错误类型
-                    non_retryable = [
-                        "401", "unauthenticated",  # 认证错误
-                        "403", "permission_denied", "forbidden",  # 权限错误
-                        "404", "not_found",  # 资源不存在
-                        "invalid_argument",  # 参数错误
-                        "safety", "blocked", "filter",  # 安全过滤
-                    ]
-
-                    should_retry = True
-                    for keyword in non_retryable:
-                        if keyword in error_str:
-                            should_retry = False
-                            break
-
-                    if not should_retry:
-                        # 直接抛出，不重试
-                        raise Exception(parse_genai_error(e))
-
-                    # 可重试的错误
-                    if attempt < max_retries - 1:
-                        if "429" in error_str or "resource_exhausted" in error_str:
-                            wait_time = (base_delay ** attempt) + random.uniform(0, 1)
-                            logger.warning(f"⏳ 遇到速率限制，{wait_time:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries})")
-                        else:
-                            wait_time = min(2 ** attempt, 10) + random.uniform(0, 1)
-                            logger.warning(f"⚠️ 请求失败，{wait_time:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries})")
-                        time.sleep(wait_time)
-                        continue
-
-                    # 重试次数耗尽
-                    raise Exception(parse_genai_error(e))
+                    time.sleep(next_wait_time(attempt, e))
 
             # 理论上不会到这里，但保险起见
             raise Exception(parse_genai_error(last_error))
@@ -392,6 +422,7 @@ class GoogleGenAIGenerator(ImageGeneratorBase):
 
         # Initialize client
         logger.debug("初始化 Google GenAI 客户端...")
+        self._client_kwargs = client_kwargs
         self.client = genai.Client(**client_kwargs)
 
         # 默认安全设置 - 使用 BLOCK_NONE 禁用过滤
@@ -403,6 +434,16 @@ class GoogleGenAIGenerator(ImageGeneratorBase):
         ]
         logger.info("GoogleGenAIGenerator 初始化完成")
 
+    async def aclose(self) -> None:
+        """关闭 genai.Client 的连接（换用新的客户端，仍在使用本实例的任务可以继续调用）"""
+        await super().aclose()
+        client, self.client = self.client, genai.Client(**self._client_kwargs)
+        try:
+            await client.aio.aclose()
+            client.close()
+        except Exception as e:
+            logger.debug(f"关闭 Google GenAI 客户端失败: {e}")
+
     def validate_config(self) -> bool:
         """验证配置"""
         return bool(self.api_key)
@@ -439,6 +480,70 @@ class GoogleGenAIGenerator(ImageGeneratorBase):
                 prompt, aspect_ratio, temperature, model, reference_image, **kwargs
             )
 
+    @retry_on_error(max_retries=5, base_delay=3)
+    async def agenerate_image(
+        self,
+        prompt: str,
+        aspect_ratio: str = "3:4",
+        temperature: float = 1.0,
+        model: str = "gemini-3-pro-image-preview",
+        reference_image: Optional[bytes] = None,
+        **kwargs
+    ) -> bytes:
+        """
+        异步生成图片（参数与 generate_image 相同，走 client.aio 原生异步接口）
+
+        Returns:
+            图片二进制数据
+        """
+        if model.startswith('imagen'):
+            return await self._agenerate_with_imagen(prompt, aspect_ratio, model)
+        else:
+            return await self._agenerate_with_gemini(
+                prompt, aspect_ratio, temperature, model, reference_image, **kwargs
+            )
+
+    def _build_imagen_config(self, aspect_ratio: str) -> types.GenerateImagesConfig:
+        """构建 Imagen 请求配置"""
+        # Use GenerateImagesConfig for Imagen models
+        if self.is_vertexai:
+            # Vertex AI mode supports advanced parameters
+            return types.GenerateImagesConfig(
+                number_of_images=1,
+                aspect_ratio=aspect_ratio,
+                # Parameters only available/recommended in Vertex AI
+                output_mime_type="image/png",
+                # Use LLM-based prompt rewriting for better results
+                enhance_prompt=True,
+                # Safety settings
+                person_generation="allow_adult",
+                safety_filter_level="block_only_high",
+            )
+        # Basic mode (if supported via API Key in future)
+        return types.GenerateImagesConfig(
+            number_of_images=1,
+            aspect_ratio=aspect_ratio,
+        )
+
+    def _extract_imagen_image(self, response) -> bytes:
+        """从 Imagen 响应中提取图片数据"""
+        if not response.generated_images:
+            logger.error("Imagen API 返回为空，未生成图片")
+            raise ValueError(
+                "❌ Imagen 图片生成失败：API 返回为空\n\n"
+                "【可能原因】\n"
+                "1. 提示词触发了安全过滤\n"
+                "2. 模型暂时不可用\n\n"
+                "【解决方案】\n"
+                "1. 修改提示词，避免敏感内容\n"
+                "2. 稍后重试"
+            )
+
+        # Get image bytes from the first generated image
+        image_data = response.generated_images[0].image.image_bytes
+        logger.info(f"✅ Imagen 图片生成成功: {len(image_data)} bytes")
+        return image_data
+
     def _generate_with_imagen(
         self,
         prompt: str,
@@ -460,85 +565,57 @@ class GoogleGenAIGenerator(ImageGeneratorBase):
         logger.debug(f"  prompt 长度: {len(prompt)} 字符")
 
         try:
-            # Use GenerateImagesConfig for Imagen models
-            if self.is_vertexai:
-                # Vertex AI mode supports advanced parameters
-                config = types.GenerateImagesConfig(
-                    number_of_images=1,
-                    aspect_ratio=aspect_ratio,
-                    # Parameters only available/recommended in Vertex AI
-                    output_mime_type="image/png",
-                    # Use LLM-based prompt rewriting for better results
-                    enhance_prompt=True,
-                    # Safety settings
-                    person_generation="allow_adult",
-                    safety_filter_level="block_only_high",
-                )
-            else:
-                # Basic mode (if supported via API Key in future)
-                config = types.GenerateImagesConfig(
-                    number_of_images=1,
-                    aspect_ratio=aspect_ratio,
-                )
-
             logger.debug(f"  开始调用 Imagen API: model={model}, vertex_mode={self.is_vertexai}")
             response = self.client.models.generate_images(
                 model=model,
                 prompt=prompt,
-                config=config,
+                config=self._build_imagen_config(aspect_ratio),
             )
-
-            if not response.generated_images:
-                logger.error("Imagen API 返回为空，未生成图片")
-                raise ValueError(
-                    "❌ Imagen 图片生成失败：API 返回为空\n\n"
-                    "【可能原因】\n"
-                    "1. 提示词触发了安全过滤\n"
-                    "2. 模型暂时不可用\n\n"
-                    "【解决方案】\n"
-                    "1. 修改提示词，避免敏感内容\n"
-                    "2. 稍后重试"
-                )
-
-            # Get image bytes from the first generated image
-            image_data = response.generated_images[0].image.image_bytes
-            logger.info(f"✅ Imagen 图片生成成功: {len(image_data)} bytes")
-            return image_data
+            return self._extract_imagen_image(response)
 
         except Exception as e:
-            error_str = str(e).lower()
             # Re-raise if already formatted error message
             if "❌" in str(e) or "【" in str(e):
                 raise
             # Parse and format the error
             raise Exception(parse_genai_error(e))
 
-    def _generate_with_gemini(
+    async def _agenerate_with_imagen(
         self,
         prompt: str,
         aspect_ratio: str = "3:4",
-        temperature: float = 1.0,
-        model: str = "gemini-3-pro-image-preview",
-        reference_image: Optional[bytes] = None,
-        **kwargs
+        model: str = "imagen-4.0-generate-001",
     ) -> bytes:
-        """
-        使用 Gemini 模型生成图片
+        """使用 Imagen 模型异步生成图片"""
+        logger.info(f"Imagen 异步生成图片: model={model}, aspect_ratio={aspect_ratio}")
+        logger.debug(f"  prompt 长度: {len(prompt)} 字符")
 
-        Args:
-            prompt: 提示词
-            aspect_ratio: 宽高比
-            temperature: 温度
-            model: Gemini 模型名称
-            reference_image: 参考图片二进制数据
-            **kwargs: 其他参数
+        try:
+            response = await self.client.aio.models.generate_images(
+                model=model,
+                prompt=prompt,
+                config=self._build_imagen_config(aspect_ratio),
+            )
+            return self._extract_imagen_image(response)
 
-        Returns:
-            图片二进制数据
+        except Exception as e:
+            if "❌" in str(e) or "【" in str(e):
+                raise
+            raise Exception(parse_genai_error(e))
+
+    def _build_gemini_request(
+        self,
+        prompt: str,
+        aspect_ratio: str,
+        temperature: float,
+        reference_image: Optional[bytes] = None
+    ):
         """
-        logger.info(f"Google GenAI 生成图片: model={model}, aspect_ratio={aspect_ratio}")
-        logger.debug(f"  prompt 长度: {len(prompt)} 字符, 有参考图: {reference_image is not None}")
+        构建 Gemini 图片生成请求
 
+        Returns:
+            (contents, generate_content_config)
+        """
         # 构建 parts 列表
         parts = []
 
@@ -546,7 +623,7 @@ class GoogleGenAIGenerator(ImageGeneratorBase):
         if reference_image:
             logger.debug(f"  添加参考图片 ({len(reference_image)} bytes)")
             # 压缩参考图到 200KB 以内
-            compressed_ref = compress_image(reference_image, max_size_kb=200)
+            compressed_ref = get_image_executor().compress(reference_image, max_size_kb=200)
             logger.debug(f"  参考图压缩后: {len(compressed_ref)} bytes")
             # 添加参考图
             parts.append(types.Part(
@@ -593,22 +670,20 @@ class GoogleGenAIGenerator(ImageGeneratorBase):
             safety_settings=self.safety_settings,
             image_config=types.ImageConfig(**image_config_kwargs),
         )
-
-        image_data = None
-        logger.debug(f"  开始调用 API: model={model}")
-        for chunk in self.client.models.generate_content_stream(
-            model=model,
-            contents=contents,
-            config=generate_content_config,
-        ):
-            if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
-                for part in chunk.candidates[0].content.parts:
-                    # 检查是否有图片数据
-                    if hasattr(part, 'inline_data') and part.inline_data:
-                        image_data = part.inline_data.data
-                        logger.debug(f"  收到图片数据: {len(image_data)} bytes")
-                        break
-
+        return contents, generate_content_config
+
+    def _extract_chunk_image(self, chunk) -> Optional[bytes]:
+        """从流式响应分片中提取图片数据"""
+        if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
+            for part in chunk.candidates[0].content.parts:
+                # 检查是否有图片数据
+                if hasattr(part, 'inline_data') and part.inline_data:
+                    logger.debug(f"  收到图片数据: {len(part.inline_data.data)} bytes")
+                    return part.inline_data.data
+        return None
+
+    def _ensure_image(self, image_data: Optional[bytes]) -> bytes:
+        """校验 Gemini 是否返回了图片"""
         if not image_data:
             logger.error("API 返回为空，未生成图片")
             raise ValueError(
@@ -629,6 +704,81 @@ class GoogleGenAIGenerator(ImageGeneratorBase):
         logger.info(f"✅ Google GenAI 图片生成成功: {len(image_data)} bytes")
         return image_data
 
+    def _generate_with_gemini(
+        self,
+        prompt: str,
+        aspect_ratio: str = "3:4",
+        temperature: float = 1.0,
+        model: str = "gemini-3-pro-image-preview",
+        reference_image: Optional[bytes] = None,
+        **kwargs
+    ) -> bytes:
+        """
+        使用 Gemini 模型生成图片
+
+        Args:
+            prompt: 提示词
+            aspect_ratio: 宽高比
+            temperature: 温度
+            model: Gemini 模型名称
+            reference_image: 参考图片二进制数据
+            **kwargs: 其他参数
+
+        Returns:
+            图片二进制数据
+        """
+        logger.info(f"Google GenAI 生成图片: model={model}, aspect_ratio={aspect_ratio}")
+        logger.debug(f"  prompt 长度: {len(prompt)} 字符, 有参考图: {reference_image is not None}")
+
+        contents, generate_content_config = self._build_gemini_request(
+            prompt, aspect_ratio, temperature, reference_image
+        )
+
+        image_data = None
+        logger.debug(f"  开始调用 API: model={model}")
+        for chunk in self.client.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=generate_content_config,
+        ):
+            chunk_image = self._extract_chunk_image(chunk)
+            if chunk_image:
+                image_data = chunk_image
+
+        return self._ensure_image(image_data)
+
+    async def _agenerate_with_gemini(
+        self,
+        prompt: str,
+        aspect_ratio: str = "3:4",
+        temperature: float = 1.0,
+        model: str = "gemini-3-pro-image-preview",
+        reference_image: Optional[bytes] = None,
+        **kwargs
+    ) -> bytes:
+        """使用 Gemini 模型异步生成图片（参数与 _generate_with_gemini 相同）"""
+        logger.info(f"Google GenAI 异步生成图片: model={model}, aspect_ratio={aspect_ratio}")
+        logger.debug(f"  prompt 长度: {len(prompt)} 字符, 有参考图: {reference_image is not None}")
+
+        # 参考图压缩是 CPU 密集操作，放到线程中执行，避免阻塞事件循环
+        contents, generate_content_config = await asyncio.to_thread(
+            self._build_gemini_request, prompt, aspect_ratio, temperature, reference_image
+        )
+
+        image_data = None
+        logger.debug(f"  开始调用异步 API: model={model}")
+        stream = await self.client.aio.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=generate_content_config,
+        )
+        async for chunk in stream:
+            chunk_image = self._extract_chunk_image(chunk)
+            if chunk_image:
+                image_data = chunk_image
+
+        return self._ensure_image(image_data)
+
     def get_supported_aspect_ratios(self) -> list:
         """获取支持的宽高比"""
         return ["1:1", "3:4", "4:3", "16:9", "9:16"]
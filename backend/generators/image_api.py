@@ -1,28 +1,57 @@
 """Image API 图片生成器"""
+import asyncio
 import logging
+import re
 import time
 import random
 import base64
 import requests
-from typing import Dict, Any, Optional, List, Union
+from functools import wraps
+from typing import Dict, Any, Optional, List, Tuple, Union
 from .base import ImageGeneratorBase
-from ..utils.image_compressor import compress_image
+from ..utils.deadline import DeadlineExceeded, can_retry, request_timeout
+from ..utils.image_executor import get_image_executor
 
 logger = logging.getLogger(__name__)
 
 
 def retry_on_error(max_retries: int = 3, base_delay: float = 2):
-    """错误重试装饰器"""
+    """错误重试装饰器（同时支持同步函数和协程函数，剩余时间不足以再尝试一次时不再重试）"""
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                last_error = None
+                for attempt in range(max_retries):
+                    try:
+                        return await func(*args, **kwargs)
+                    except DeadlineExceeded:
+                        raise
+                    except Exception as e:
+                        last_error = e
+                        if attempt < max_retries - 1:
+                            delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
+                            if not can_retry(delay):
+                                break
+                            logger.warning(f"请求失败，{delay:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries}): {str(e)[:100]}")
+                            await asyncio.sleep(delay)
+                raise last_error
+            return async_wrapper
+
+        @wraps(func)
         def wrapper(*args, **kwargs):
             last_error = None
             for attempt in range(max_retries):
                 try:
                     return func(*args, **kwargs)
+                except DeadlineExceeded:
+                    raise
                 except Exception as e:
                     last_error = e
                     if attempt < max_retries - 1:
                         delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
+                        if not can_retry(delay):
+                            break
                         logger.warning(f"请求失败，{delay:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries}): {str(e)[:100]}")
                         time.sleep(delay)
             raise last_error
@@ -73,6 +102,10 @@ class ImageApiGenerator(ImageGeneratorBase):
         """获取支持的宽高比"""
         return ["1:1", "2:3", "3:2", "3:4", "4:3", "4:5", "5:4", "9:16", "16:9", "21:9"]
 
+    def _is_chat_endpoint(self) -> bool:
+        """是否使用 chat/completions 端点"""
+        return 'chat' in self.endpoint_type or 'completions' in self.endpoint_type
+
     @retry_on_error(max_retries=3, base_delay=2)
     def generate_image(
         self,
@@ -109,20 +142,166 @@ class ImageApiGenerator(ImageGeneratorBase):
         logger.info(f"Image API 生成图片: model={model}, aspect_ratio={aspect_ratio}, endpoint={self.endpoint_type}")
 
         # 根据端点类型选择不同的生成方式
-        if 'chat' in self.endpoint_type or 'completions' in self.endpoint_type:
+        if self._is_chat_endpoint():
             return self._generate_via_chat_api(prompt, aspect_ratio, model, reference_image, reference_images)
         else:
             return self._generate_via_images_api(prompt, aspect_ratio, model, reference_image, reference_images)
 
-    def _generate_via_images_api(
+    @retry_on_error(max_retries=3, base_delay=2)
+    async def agenerate_image(
         self,
         prompt: str,
+        aspect_ratio: str = None,
+        temperature: float = 1.0,
+        model: str = None,
+        reference_image: Optional[bytes] = None,
+        reference_images: Optional[List[bytes]] = None,
+        **kwargs
+    ) -> bytes:
+        """
+        异步生成图片（参数与 generate_image 相同）
+
+        Returns:
+            生成的图片二进制数据
+        """
+        self.validate_config()
+
+        if aspect_ratio is None:
+            aspect_ratio = self.default_aspect_ratio
+
+        if model is None:
+            model = self.model
+
+        logger.info(f"Image API 异步生成图片: model={model}, aspect_ratio={aspect_ratio}, endpoint={self.endpoint_type}")
+
+        if self._is_chat_endpoint():
+            return await self._agenerate_via_chat_api(prompt, aspect_ratio, model, reference_image, reference_images)
+        else:
+            return await self._agenerate_via_images_api(prompt, aspect_ratio, model, reference_image, reference_images)
+
+    def get_batch_size(self) -> int:
+        """
+        获取单次请求最多合并的页面数
+
+        OpenAI images 接口的 prompt 只接受字符串，n 只是同一提示词的多张变体；
+        只有服务商在配置中声明 prompt_array: true（支持数组形式的 prompt）时
+        才合并多页，否则逐页请求。chat 端点不支持批量。
+        """
+        if self._is_chat_endpoint() or not self.config.get('prompt_array', False):
+            return 1
+        return max(1, int(self.config.get('batch_size', 1) or 1))
+
+    def generate_images_batch(
+        self,
+        prompts: List[str],
+        aspect_ratio: str = None,
+        temperature: float = 1.0,
+        model: str = None,
+        reference_image: Optional[bytes] = None,
+        reference_images: Optional[List[bytes]] = None,
+        **kwargs
+    ) -> List[bytes]:
+        """
+        批量生成图片：多个页面合并为一次 /v1/images/generations 请求
+
+        所有页面共用参考图片（同一任务的封面和用户图片），只压缩一次。
+
+        Args:
+            prompts: 提示词列表
+            aspect_ratio: 宽高比
+            temperature: 创意度（未使用，保留接口兼容）
+            model: 模型名称
+            reference_image: 单张参考图片数据（向后兼容）
+            reference_images: 多张参考图片数据列表
+
+        Returns:
+            图片二进制数据列表，顺序与 prompts 一致
+        """
+        if len(prompts) <= 1 or self.get_batch_size() <= 1:
+            return [
+                self.generate_image(
+                    prompt, aspect_ratio=aspect_ratio, model=model,
+                    reference_image=reference_image, reference_images=reference_images
+                )
+                for prompt in prompts
+            ]
+
+        self.validate_config()
+
+        if aspect_ratio is None:
+            aspect_ratio = self.default_aspect_ratio
+
+        if model is None:
+            model = self.model
+
+        logger.info(f"Image API 批量生成图片: model={model}, count={len(prompts)}, endpoint={self.endpoint_type}")
+        return self._generate_via_images_api(prompts, aspect_ratio, model, reference_image, reference_images)
+
+    async def agenerate_images_batch(
+        self,
+        prompts: List[str],
+        aspect_ratio: str = None,
+        temperature: float = 1.0,
+        model: str = None,
+        reference_image: Optional[bytes] = None,
+        reference_images: Optional[List[bytes]] = None,
+        **kwargs
+    ) -> List[bytes]:
+        """
+        异步批量生成图片（参数与 generate_images_batch 相同）
+
+        Returns:
+            图片二进制数据列表，顺序与 prompts 一致
+        """
+        if len(prompts) <= 1 or self.get_batch_size() <= 1:
+            return [
+                await self.agenerate_image(
+                    prompt, aspect_ratio=aspect_ratio, model=model,
+                    reference_image=reference_image, reference_images=reference_images
+                )
+                for prompt in prompts
+            ]
+
+        self.validate_config()
+
+        if aspect_ratio is None:
+            aspect_ratio = self.default_aspect_ratio
+
+        if model is None:
+            model = self.model
+
+        logger.info(f"Image API 异步批量生成图片: model={model}, count={len(prompts)}, endpoint={self.endpoint_type}")
+        return await self._agenerate_via_images_api(prompts, aspect_ratio, model, reference_image, reference_images)
+
+    def _collect_reference_images(
+        self,
+        reference_image: Optional[bytes] = None,
+        reference_images: Optional[List[bytes]] = None
+    ) -> List[bytes]:
+        """收集所有参考图片（多张参考图 + 单张参考图，去重）"""
+        all_reference_images = []
+        if reference_images and len(reference_images) > 0:
+            all_reference_images.extend(reference_images)
+        if reference_image and reference_image not in all_reference_images:
+            all_reference_images.append(reference_image)
+        return all_reference_images
+
+    def _build_images_request(
+        self,
+        prompts: List[str],
         aspect_ratio: str,
         model: str,
         reference_image: Optional[bytes] = None,
         reference_images: Optional[List[bytes]] = None
-    ) -> bytes:
-        """通过 /v1/images/generations 端点生成图片"""
+    ) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """
+        构建 /v1/images/generations 请求
+
+        多个提示词时走批量模式（仅服务商声明 prompt_array 时）：提示词全部相同则使用 n 参数，否则以数组形式提交
+
+        Returns:
+            (请求地址, 请求头, 请求体)
+        """
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
@@ -130,25 +309,20 @@ class ImageApiGenerator(ImageGeneratorBase):
 
         payload = {
             "model": model,
-            "prompt": prompt,
             "response_format": "b64_json",
             "aspect_ratio": aspect_ratio,
             "image_size": self.image_size
         }
 
         # 收集所有参考图片
-        all_reference_images = []
-        if reference_images and len(reference_images) > 0:
-            all_reference_images.extend(reference_images)
-        if reference_image and reference_image not in all_reference_images:
-            all_reference_images.append(reference_image)
+        all_reference_images = self._collect_reference_images(reference_image, reference_images)
 
         # 如果有参考图片，添加到 image 数组
         if all_reference_images:
             logger.debug(f"  添加 {len(all_reference_images)} 张参考图片")
             image_uris = []
-            for idx, img_data in enumerate(all_reference_images):
-                compressed_img = compress_image(img_data, max_size_kb=200)
+            compressed_images = get_image_executor().compress_many(all_reference_images, max_size_kb=200)
+            for idx, (img_data, compressed_img) in enumerate(zip(all_reference_images, compressed_images)):
                 logger.debug(f"  参考图 {idx}: {len(img_data)} -> {len(compressed_img)} bytes")
                 base64_image = base64.b64encode(compressed_img).decode('utf-8')
                 data_uri = f"data:image/png;base64,{base64_image}"
@@ -157,21 +331,41 @@ class ImageApiGenerator(ImageGeneratorBase):
             payload["image"] = image_uris
 
             ref_count = len(all_reference_images)
-            enhanced_prompt = f"""参考提供的 {ref_count} 张图片的风格（色彩、光影、构图、氛围），生成一张新图片。
+            prompts = [
+                f"""参考提供的 {ref_count} 张图片的风格（色彩、光影、构图、氛围），生成一张新图片。
 
-新图片内容：{prompt}
+新图片内容：{p}
 
 要求：
 1. 保持相似的色调和氛围
 2. 使用相似的光影处理
 3. 保持一致的画面质感
 4. 如果参考图中有人物或产品，可以适当融入"""
-            payload["prompt"] = enhanced_prompt
+                for p in prompts
+            ]
+
+        if len(prompts) == 1:
+            payload["prompt"] = prompts[0]
+        else:
+            # 批量模式：相同提示词使用 n，不同提示词以数组提交
+            payload["n"] = len(prompts)
+            payload["prompt"] = prompts[0] if len(set(prompts)) == 1 else prompts
 
         api_url = f"{self.base_url}{self.endpoint_type}"
-        logger.debug(f"  发送请求到: {api_url}")
-        response = requests.post(api_url, headers=headers, json=payload, timeout=300)
+        return api_url, headers, payload
+
+    def _parse_images_response(self, response, api_url: str, expected: int) -> List[bytes]:
+        """
+        解析 /v1/images/generations 响应
+
+        Args:
+            response: requests.Response 或 httpx.Response
+            api_url: 请求地址（用于错误信息）
+            expected: 期望的图片数量
 
+        Returns:
+            图片二进制数据列表
+        """
         if response.status_code != 200:
             error_detail = response.text[:500]
             logger.error(f"Image API 请求失败: status={response.status_code}, error={error_detail}")
@@ -188,20 +382,33 @@ class ImageApiGenerator(ImageGeneratorBase):
             )
 
         result = response.json()
-        logger.debug(f"  API 响应: data 长度={len(result.get('data', []))}")
+        data = result.get("data") or []
+        logger.debug(f"  API 响应: data 长度={len(data)}")
+
+        images = []
+        for item in data[:expected]:
+            if "b64_json" not in item:
+                break
+            b64_data_uri = item["b64_json"]
+            if b64_data_uri.startswith('data:'):
+                b64_string = b64_data_uri.split(',', 1)[1]
+            else:
+                b64_string = b64_data_uri
+            images.append(base64.b64decode(b64_string))
 
-        if "data" in result and len(result["data"]) > 0:
-            item = result["data"][0]
+        if images and len(images) == expected:
+            logger.info(f"✅ Image API 图片生成成功: {len(images)} 张, {sum(len(i) for i in images)} bytes")
+            return images
 
-            if "b64_json" in item:
-                b64_data_uri = item["b64_json"]
-                if b64_data_uri.startswith('data:'):
-                    b64_string = b64_data_uri.split(',', 1)[1]
-                else:
-                    b64_string = b64_data_uri
-                image_data = base64.b64decode(b64_string)
-                logger.info(f"✅ Image API 图片生成成功: {len(image_data)} bytes")
-                return image_data
+        if expected > 1:
+            logger.error(f"批量响应图片数量不符: 期望 {expected}, 实际 {len(images)}")
+            raise Exception(
+                f"批量图片数据提取失败：期望 {expected} 张，实际返回 {len(images)} 张。\n"
+                "可能原因：\n"
+                "1. 该服务商实际不支持数组形式的 prompt\n"
+                "2. 部分提示词被安全过滤\n"
+                "建议：去掉该服务商的 prompt_array 配置，改为逐页请求"
+            )
 
         logger.error(f"无法从响应中提取图片数据: {str(result)[:200]}")
         raise Exception(
@@ -214,17 +421,64 @@ class ImageApiGenerator(ImageGeneratorBase):
             "建议：检查API文档确认返回格式要求"
         )
 
-    def _generate_via_chat_api(
+    def _generate_via_images_api(
         self,
-        prompt: str,
+        prompt: Union[str, List[str]],
         aspect_ratio: str,
         model: str,
         reference_image: Optional[bytes] = None,
         reference_images: Optional[List[bytes]] = None
-    ) -> bytes:
-        """通过 /v1/chat/completions 端点生成图片（如即梦 API）"""
-        import re
+    ) -> Union[bytes, List[bytes]]:
+        """
+        通过 /v1/images/generations 端点生成图片
+
+        prompt 为列表时走批量模式，返回与 prompt 顺序一致的图片列表。
+        """
+        prompts = prompt if isinstance(prompt, list) else [prompt]
+        api_url, headers, payload = self._build_images_request(
+            prompts, aspect_ratio, model, reference_image, reference_images
+        )
+
+        logger.debug(f"  发送请求到: {api_url}")
+        response = requests.post(api_url, headers=headers, json=payload, timeout=request_timeout(300))
+
+        images = self._parse_images_response(response, api_url, len(prompts))
+        return images if isinstance(prompt, list) else images[0]
+
+    async def _agenerate_via_images_api(
+        self,
+        prompt: Union[str, List[str]],
+        aspect_ratio: str,
+        model: str,
+        reference_image: Optional[bytes] = None,
+        reference_images: Optional[List[bytes]] = None
+    ) -> Union[bytes, List[bytes]]:
+        """通过 /v1/images/generations 端点异步生成图片"""
+        prompts = prompt if isinstance(prompt, list) else [prompt]
+        # 参考图压缩是 CPU 密集操作，放到线程中执行，避免阻塞事件循环
+        api_url, headers, payload = await asyncio.to_thread(
+            self._build_images_request, prompts, aspect_ratio, model, reference_image, reference_images
+        )
+
+        logger.debug(f"  异步发送请求到: {api_url}")
+        response = await self._get_async_client().post(api_url, headers=headers, json=payload, timeout=request_timeout(300))
+
+        images = self._parse_images_response(response, api_url, len(prompts))
+        return images if isinstance(prompt, list) else images[0]
+
+    def _build_chat_request(
+        self,
+        prompt: str,
+        model: str,
+        reference_image: Optional[bytes] = None,
+        reference_images: Optional[List[bytes]] = None
+    ) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """
+        构建 /v1/chat/completions 请求
 
+        Returns:
+            (请求地址, 请求头, 请求体)
+        """
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
@@ -234,19 +488,15 @@ class ImageApiGenerator(ImageGeneratorBase):
         user_content: Any = prompt
 
         # 收集所有参考图片
-        all_reference_images = []
-        if reference_images and len(reference_images) > 0:
-            all_reference_images.extend(reference_images)
-        if reference_image and reference_image not in all_reference_images:
-            all_reference_images.append(reference_image)
+        all_reference_images = self._collect_reference_images(reference_image, reference_images)
 
         # 如果有参考图片，构建多模态消息
         if all_reference_images:
             logger.debug(f"  添加 {len(all_reference_images)} 张参考图片到 chat 消息")
             content_parts = [{"type": "text", "text": prompt}]
 
-            for idx, img_data in enumerate(all_reference_images):
-                compressed_img = compress_image(img_data, max_size_kb=200)
+            compressed_images = get_image_executor().compress_many(all_reference_images, max_size_kb=200)
+            for idx, (img_data, compressed_img) in enumerate(zip(all_reference_images, compressed_images)):
                 logger.debug(f"  参考图 {idx}: {len(img_data)} -> {len(compressed_img)} bytes")
                 base64_image = base64.b64encode(compressed_img).decode('utf-8')
                 content_parts.append({
@@ -266,10 +516,25 @@ class ImageApiGenerator(ImageGeneratorBase):
         }
 
         api_url = f"{self.base_url}{self.endpoint_type}"
-        logger.info(f"Chat API 生成图片: {api_url}, model={model}")
+        return api_url, headers, payload
+
+    def _parse_chat_response(
+        self,
+        response,
+        api_url: str,
+        model: str
+    ) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        解析 /v1/chat/completions 响应
 
-        response = requests.post(api_url, headers=headers, json=payload, timeout=300)
+        Args:
+            response: requests.Response 或 httpx.Response
+            api_url: 请求地址（用于错误信息）
+            model: 模型名称（用于错误信息）
 
+        Returns:
+            (图片数据, 待下载的图片 URL)，二者恰有一个不为 None
+        """
         if response.status_code != 200:
             error_detail = response.text[:500]
             status_code = response.status_code
@@ -313,7 +578,7 @@ class ImageApiGenerator(ImageGeneratorBase):
                     urls = re.findall(pattern, content)
                     if urls:
                         logger.info(f"从 Markdown 提取到 {len(urls)} 张图片，下载第一张...")
-                        return self._download_image(urls[0])
+                        return None, urls[0]
 
                     # Markdown 图片 Base64: ![xxx](data:image/...)
                     base64_pattern = r'!\[.*?\]\((data:image\/[^;]+;base64,[^\s\)]+)\)'
@@ -321,18 +586,18 @@ class ImageApiGenerator(ImageGeneratorBase):
                     if base64_urls:
                         logger.info("从 Markdown 提取到 Base64 图片数据")
                         base64_data = base64_urls[0].split(",")[1]
-                        return base64.b64decode(base64_data)
+                        return base64.b64decode(base64_data), None
 
                     # 纯 Base64 data URL
                     if content.startswith("data:image"):
                         logger.info("检测到 Base64 图片数据")
                         base64_data = content.split(",")[1]
-                        return base64.b64decode(base64_data)
+                        return base64.b64decode(base64_data), None
 
                     # 纯 URL
                     if content.startswith("http://") or content.startswith("https://"):
                         logger.info("检测到图片 URL")
-                        return self._download_image(content.strip())
+                        return None, content.strip()
 
         raise Exception(
             "❌ 无法从 Chat API 响应中提取图片数据\n\n"
@@ -346,11 +611,54 @@ class ImageApiGenerator(ImageGeneratorBase):
             "2. 修改提示词后重试"
         )
 
+    def _generate_via_chat_api(
+        self,
+        prompt: str,
+        aspect_ratio: str,
+        model: str,
+        reference_image: Optional[bytes] = None,
+        reference_images: Optional[List[bytes]] = None
+    ) -> bytes:
+        """通过 /v1/chat/completions 端点生成图片（如即梦 API）"""
+        api_url, headers, payload = self._build_chat_request(prompt, model, reference_image, reference_images)
+        logger.info(f"Chat API 生成图片: {api_url}, model={model}")
+
+        response = requests.post(api_url, headers=headers, json=payload, timeout=request_timeout(300))
+
+        image_data, image_url = self._parse_chat_response(response, api_url, model)
+        if image_url:
+            return self._download_image(image_url)
+        return image_data
+
+    async def _agenerate_via_chat_api(
+        self,
+        prompt: str,
+        aspect_ratio: str,
+        model: str,
+        reference_image: Optional[bytes] = None,
+        reference_images: Optional[List[bytes]] = None
+    ) -> bytes:
+        """通过 /v1/chat/completions 端点异步生成图片"""
+        # 参考图压缩是 CPU 密集操作，放到线程中执行，避免阻塞事件循环
+        api_url, headers, payload = await asyncio.to_thread(
+            self._build_chat_request, prompt, model, reference_image, reference_images
+        )
+        logger.info(f"Chat API 异步生成图片: {api_url}, model={model}")
+
+        response = await self._get_async_client().post(api_url, headers=headers, json=payload, timeout=request_timeout(300))
+
+        image_data, image_url = self._parse_chat_response(response, api_url, model)
+        if image_url:
+            return await self._adownload_image(image_url)
+        return image_data
+
     def _download_image(self, url: str) -> bytes:
         """下载图片并返回二进制数据"""
         logger.info(f"下载图片: {url[:100]}...")
+        # 剩余时间不足时直接抛出 DeadlineExceeded，不包装成普通错误（否则会被重试）
+        timeout = request_timeout(60)
         try:
-            response = requests.get(url, timeout=60)
+            response = requests.get(url, timeout=timeout)
             if response.status_code == 200:
                 logger.info(f"✅ 图片下载成功: {len(response.content)} bytes")
                 return response.content
@@ -360,3 +668,21 @@ class ImageApiGenerator(ImageGeneratorBase):
             raise Exception("❌ 下载图片超时，请重试")
         except Exception as e:
             raise Exception(f"❌ 下载图片失败: {str(e)}")
+
+    async def _adownload_image(self, url: str) -> bytes:
+        """异步下载图片并返回二进制数据"""
+        import httpx
+
+        logger.info(f"异步下载图片: {url[:100]}...")
+        timeout = request_timeout(60)
+        try:
+            response = await self._get_async_client().get(url, timeout=timeout)
+            if response.status_code == 200:
+                logger.info(f"✅ 图片下载成功: {len(response.content)} bytes")
+                return response.content
+            else:
+                raise Exception(f"下载图片失败: HTTP {response.status_code}")
+        except httpx.TimeoutException:
+            raise Exception("❌ 下载图片超时，请重试")
+        except Exception as e:
+            raise Exception(f"❌ 下载图片失败: {str(e)}")
@@ -1,49 +1,83 @@
 """OpenAI 兼容接口图片生成器"""
+import asyncio
 import logging
+import re
 import time
 import random
 import base64
 from functools import wraps
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple, Union
 import requests
 from .base import ImageGeneratorBase
+from ..utils.deadline import DeadlineExceeded, can_retry, request_timeout
 
 logger = logging.getLogger(__name__)
 
 
 def retry_on_error(max_retries=5, base_delay=3):
-    """错误自动重试装饰器"""
+    """错误自动重试装饰器（同时支持同步函数和协程函数）"""
+    def next_wait_time(attempt: int, error: Exception) -> float:
+        """计算下次重试前的等待时间，不再重试（含剩余时间不足）时返回 None"""
+        if attempt >= max_retries - 1:
+            return None
+        error_str = str(error)
+        # 检查是否是速率限制错误
+        if "429" in error_str or "rate" in error_str.lower():
+            wait_time = (base_delay ** attempt) + random.uniform(0, 1)
+            if not can_retry(wait_time):
+                return None
+            logger.warning(f"遇到速率限制，{wait_time:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries})")
+            return wait_time
+        # 其他错误
+        wait_time = 2 ** attempt
+        if not can_retry(wait_time):
+            return None
+        logger.warning(f"请求失败: {error_str[:100]}，{wait_time}秒后重试")
+        return wait_time
+
+    def exhausted_error() -> Exception:
+        logger.error(f"图片生成失败: 重试 {max_retries} 次后仍失败")
+        return Exception(
+            f"图片生成失败：重试 {max_retries} 次后仍失败。\n"
+            "可能原因：\n"
+            "1. API持续限流或配额不足\n"
+            "2. 网络连接持续不稳定\n"
+            "3. API服务暂时不可用\n"
+            "建议：稍后再试，或检查API配额和网络状态"
+        )
+
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                for attempt in range(max_retries):
+                    try:
+                        return await func(*args, **kwargs)
+                    except DeadlineExceeded:
+                        raise
+                    except Exception as e:
+                        wait_time = next_wait_time(attempt, e)
+                        if wait_time is None:
+                            # 重试耗尽
+                            raise
+                        await asyncio.sleep(wait_time)
+                raise exhausted_error()
+            return async_wrapper
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             for attempt in range(max_retries):
                 try:
                     return func(*args, **kwargs)
-                except Exception as e:
-                    error_str = str(e)
-                    # 检查是否是速率限制错误
-                    if "429" in error_str or "rate" in error_str.lower():
-                        if attempt < max_retries - 1:
-                            wait_time = (base_delay ** attempt) + random.uniform(0, 1)
-                            logger.warning(f"遇到速率限制，{wait_time:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries})")
-                            time.sleep(wait_time)
-                            continue
-                    # 其他错误或重试耗尽
-                    if attempt < max_retries - 1:
-                        wait_time = 2 ** attempt
-                        logger.warning(f"请求失败: {error_str[:100]}，{wait_time}秒后重试")
-                        time.sleep(wait_time)
-                        continue
+                except DeadlineExceeded:
                     raise
-            logger.error(f"图片生成失败: 重试 {max_retries} 次后仍失败")
-            raise Exception(
-                f"图片生成失败：重试 {max_retries} 次后仍失败。\n"
-                "可能原因：\n"
-                "1. API持续限流或配额不足\n"
-                "2. 网络连接持续不稳定\n"
-                "3. API服务暂时不可用\n"
-                "建议：稍后再试，或检查API配额和网络状态"
-            )
+                except Exception as e:
+                    wait_time = next_wait_time(attempt, e)
+                    if wait_time is None:
+                        # 重试耗尽
+                        raise
+                    time.sleep(wait_time)
+            raise exhausted_error()
         return wrapper
     return decorator
 
@@ -90,6 +124,16 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
         """验证配置"""
         return bool(self.api_key and self.base_url)
 
+    def _is_chat_endpoint(self) -> bool:
+        """是否使用 chat/completions 端点"""
+        return 'chat' in self.endpoint_type or 'completions' in self.endpoint_type
+
+    def _endpoint_url(self) -> str:
+        """完整请求地址"""
+        # 确保端点以 / 开头
+        endpoint = self.endpoint_type if self.endpoint_type.startswith('/') else '/' + self.endpoint_type
+        return f"{self.base_url}{endpoint}"
+
     @retry_on_error(max_retries=5, base_delay=3)
     def generate_image(
         self,
@@ -118,34 +162,124 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
         logger.info(f"OpenAI 兼容 API 生成图片: model={model}, size={size}, endpoint={self.endpoint_type}")
 
         # 根据端点路径决定使用哪种 API 方式
-        if 'chat' in self.endpoint_type or 'completions' in self.endpoint_type:
+        if self._is_chat_endpoint():
             return self._generate_via_chat_api(prompt, size, model)
         else:
             # 默认使用 images API
             return self._generate_via_images_api(prompt, size, model, quality)
 
-    def _generate_via_images_api(
+    @retry_on_error(max_retries=5, base_delay=3)
+    async def agenerate_image(
         self,
         prompt: str,
-        size: str,
-        model: str,
-        quality: str
+        size: str = "1024x1024",
+        model: str = None,
+        quality: str = "standard",
+        **kwargs
     ) -> bytes:
-        """通过 images API 端点生成"""
-        # 确保端点以 / 开头
-        endpoint = self.endpoint_type if self.endpoint_type.startswith('/') else '/' + self.endpoint_type
-        url = f"{self.base_url}{endpoint}"
-        logger.debug(f"  发送请求到: {url}")
+        """
+        异步生成图片（参数与 generate_image 相同）
+
+        Returns:
+            图片二进制数据
+        """
+        if model is None:
+            model = self.default_model
+
+        logger.info(f"OpenAI 兼容 API 异步生成图片: model={model}, size={size}, endpoint={self.endpoint_type}")
+
+        if self._is_chat_endpoint():
+            return await self._agenerate_via_chat_api(prompt, size, model)
+        else:
+            return await self._agenerate_via_images_api(prompt, size, model, quality)
+
+    def get_batch_size(self) -> int:
+        """
+        获取单次请求最多合并的页面数
+
+        OpenAI images 接口的 prompt 只接受字符串，n 只是同一提示词的多张变体；
+        只有服务商在配置中声明 prompt_array: true（支持数组形式的 prompt）时
+        才合并多页，否则逐页请求。chat 端点不支持批量。
+        """
+        if self._is_chat_endpoint() or not self.config.get('prompt_array', False):
+            return 1
+        return max(1, int(self.config.get('batch_size', 1) or 1))
+
+    def generate_images_batch(
+        self,
+        prompts: List[str],
+        size: str = "1024x1024",
+        model: str = None,
+        quality: str = "standard",
+        **kwargs
+    ) -> List[bytes]:
+        """
+        批量生成图片：多个页面合并为一次 images API 请求
+
+        Args:
+            prompts: 提示词列表
+            size: 图片尺寸
+            model: 模型名称
+            quality: 质量 ("standard" 或 "hd")
+
+        Returns:
+            图片二进制数据列表，顺序与 prompts 一致
+        """
+        if len(prompts) <= 1 or self.get_batch_size() <= 1:
+            return [
+                self.generate_image(prompt, size=size, model=model, quality=quality)
+                for prompt in prompts
+            ]
+
+        if model is None:
+            model = self.default_model
+
+        logger.info(f"OpenAI 兼容 API 批量生成图片: model={model}, size={size}, count={len(prompts)}")
+        return self._generate_via_images_api(prompts, size, model, quality)
+
+    async def agenerate_images_batch(
+        self,
+        prompts: List[str],
+        size: str = "1024x1024",
+        model: str = None,
+        quality: str = "standard",
+        **kwargs
+    ) -> List[bytes]:
+        """
+        异步批量生成图片（参数与 generate_images_batch 相同）
+
+        Returns:
+            图片二进制数据列表，顺序与 prompts 一致
+        """
+        if len(prompts) <= 1 or self.get_batch_size() <= 1:
+            return [
+                await self.agenerate_image(prompt, size=size, model=model, quality=quality)
+                for prompt in prompts
+            ]
 
-        headers = {
+        if model is None:
+            model = self.default_model
+
+        logger.info(f"OpenAI 兼容 API 异步批量生成图片: model={model}, size={size}, count={len(prompts)}")
+        return await self._agenerate_via_images_api(prompts, size, model, quality)
+
+    def _build_headers(self) -> Dict[str, str]:
+        """构建请求头"""
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
 
+    def _build_images_payload(self, prompts: List[str], size: str, model: str, quality: str) -> Dict[str, Any]:
+        """
+        构建 images API 请求体
+
+        多个提示词时走批量模式（仅服务商声明 prompt_array 时）：提示词全部相同则使用 n 参数，否则以数组形式提交
+        """
         payload = {
             "model": model,
-            "prompt": prompt,
-            "n": 1,
+            "prompt": prompts[0] if len(set(prompts)) == 1 else prompts,
+            "n": len(prompts),
             "size": size,
             "response_format": "b64_json"  # 使用base64格式更可靠
         }
@@ -154,8 +288,21 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
         if quality and model.startswith('dall-e'):
             payload["quality"] = quality
 
-        response = requests.post(url, headers=headers, json=payload, timeout=180)
+        return payload
+
+    def _parse_images_response(self, response, url: str, model: str, expected: int) -> List[Dict[str, Any]]:
+        """
+        解析 images API 响应
+
+        Args:
+            response: requests.Response 或 httpx.Response
+            url: 请求地址（用于错误信息）
+            model: 模型名称（用于错误信息）
+            expected: 期望的图片数量
 
+        Returns:
+            响应中的 data 项列表（包含 b64_json 或 url）
+        """
         if response.status_code != 200:
             error_detail = response.text[:500]
             logger.error(f"OpenAI Images API 请求失败: status={response.status_code}, error={error_detail}")
@@ -188,61 +335,113 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
                 "建议：修改提示词或检查模型配置"
             )
 
-        image_data = result["data"][0]
-
-        # 处理base64格式
-        if "b64_json" in image_data:
-            img_bytes = base64.b64decode(image_data["b64_json"])
-            logger.info(f"✅ OpenAI Images API 图片生成成功: {len(img_bytes)} bytes")
-            return img_bytes
-
-        # 处理URL格式
-        elif "url" in image_data:
-            logger.debug(f"  下载图片 URL...")
-            img_response = requests.get(image_data["url"], timeout=60)
-            if img_response.status_code == 200:
-                logger.info(f"✅ OpenAI Images API 图片生成成功: {len(img_response.content)} bytes")
-                return img_response.content
-            else:
-                logger.error(f"下载图片失败: {img_response.status_code}")
-                raise Exception(f"下载图片失败: {img_response.status_code}")
-
-        else:
-            logger.error(f"无法从响应中提取图片数据: {str(image_data)[:200]}")
+        if len(result["data"]) < expected:
+            logger.error(f"批量响应图片数量不符: 期望 {expected}, 实际 {len(result['data'])}")
             raise ValueError(
-                "无法从API响应中提取图片数据。\n"
-                f"响应数据: {str(image_data)[:500]}\n"
+                f"批量图片数据提取失败：期望 {expected} 张，实际返回 {len(result['data'])} 张。\n"
                 "可能原因：\n"
-                "1. 响应格式不包含 b64_json 或 url 字段\n"
-                "2. response_format 参数未生效\n"
-                "建议：检查API文档确认图片返回格式"
+                "1. 该服务商实际不支持数组形式的 prompt\n"
+                "2. 部分提示词被安全过滤\n"
+                "建议：去掉该服务商的 prompt_array 配置，改为逐页请求"
             )
 
-    def _generate_via_chat_api(
+        return result["data"][:expected]
+
+    def _generate_via_images_api(
         self,
-        prompt: str,
+        prompt: Union[str, List[str]],
         size: str,
-        model: str
-    ) -> bytes:
+        model: str,
+        quality: str
+    ) -> Union[bytes, List[bytes]]:
         """
-        通过 chat/completions 端点生成图片
+        通过 images API 端点生成
 
-        支持多种返回格式：
-        1. Markdown 图片链接: ![xxx](url) - 即梦、部分中转站使用
-        2. Base64 data URL: data:image/xxx;base64,xxx
-        3. 纯图片 URL
+        prompt 为列表时走批量模式，返回与 prompt 顺序一致的图片列表。
         """
-        # 确保端点以 / 开头
-        endpoint = self.endpoint_type if self.endpoint_type.startswith('/') else '/' + self.endpoint_type
-        url = f"{self.base_url}{endpoint}"
-        logger.info(f"Chat API 生成图片: {url}, model={model}")
+        prompts = prompt if isinstance(prompt, list) else [prompt]
+        url = self._endpoint_url()
+        logger.debug(f"  发送请求到: {url}")
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        payload = self._build_images_payload(prompts, size, model, quality)
+        response = requests.post(url, headers=self._build_headers(), json=payload, timeout=request_timeout(180))
 
-        payload = {
+        items = self._parse_images_response(response, url, model, len(prompts))
+        images = [self._extract_image_data(item) for item in items]
+        return images if isinstance(prompt, list) else images[0]
+
+    async def _agenerate_via_images_api(
+        self,
+        prompt: Union[str, List[str]],
+        size: str,
+        model: str,
+        quality: str
+    ) -> Union[bytes, List[bytes]]:
+        """通过 images API 端点异步生成"""
+        prompts = prompt if isinstance(prompt, list) else [prompt]
+        url = self._endpoint_url()
+        logger.debug(f"  异步发送请求到: {url}")
+
+        payload = self._build_images_payload(prompts, size, model, quality)
+        response = await self._get_async_client().post(
+            url, headers=self._build_headers(), json=payload, timeout=request_timeout(180)
+        )
+
+        items = self._parse_images_response(response, url, model, len(prompts))
+        images = []
+        for item in items:
+            image_data, image_url = self._split_image_item(item)
+            if image_url:
+                logger.debug(f"  下载图片 URL...")
+                image_data = await self._adownload_image(image_url)
+            images.append(image_data)
+        return images if isinstance(prompt, list) else images[0]
+
+    def _split_image_item(self, image_data: Dict[str, Any]) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        拆分 images API 响应的单个 data 项
+
+        Returns:
+            (图片数据, 待下载的图片 URL)，二者恰有一个不为 None
+        """
+        # 处理base64格式
+        if "b64_json" in image_data:
+            img_bytes = base64.b64decode(image_data["b64_json"])
+            logger.info(f"✅ OpenAI Images API 图片生成成功: {len(img_bytes)} bytes")
+            return img_bytes, None
+
+        # 处理URL格式
+        if "url" in image_data:
+            return None, image_data["url"]
+
+        logger.error(f"无法从响应中提取图片数据: {str(image_data)[:200]}")
+        raise ValueError(
+            "无法从API响应中提取图片数据。\n"
+            f"响应数据: {str(image_data)[:500]}\n"
+            "可能原因：\n"
+            "1. 响应格式不包含 b64_json 或 url 字段\n"
+            "2. response_format 参数未生效\n"
+            "建议：检查API文档确认图片返回格式"
+        )
+
+    def _extract_image_data(self, image_data: Dict[str, Any]) -> bytes:
+        """从 images API 响应的单个 data 项中提取图片数据"""
+        img_bytes, image_url = self._split_image_item(image_data)
+        if img_bytes is not None:
+            return img_bytes
+
+        logger.debug(f"  下载图片 URL...")
+        img_response = requests.get(image_url, timeout=request_timeout(60))
+        if img_response.status_code == 200:
+            logger.info(f"✅ OpenAI Images API 图片生成成功: {len(img_response.content)} bytes")
+            return img_response.content
+        else:
+            logger.error(f"下载图片失败: {img_response.status_code}")
+            raise Exception(f"下载图片失败: {img_response.status_code}")
+
+    def _build_chat_payload(self, prompt: str, model: str) -> Dict[str, Any]:
+        """构建 chat/completions 请求体"""
+        return {
             "model": model,
             "messages": [
                 {
@@ -254,8 +453,23 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
             "temperature": 1.0
         }
 
-        response = requests.post(url, headers=headers, json=payload, timeout=180)
+    def _parse_chat_response(self, response, url: str, model: str) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        解析 chat/completions 响应
+
+        支持多种返回格式：
+        1. Markdown 图片链接: ![xxx](url) - 即梦、部分中转站使用
+        2. Base64 data URL: data:image/xxx;base64,xxx
+        3. 纯图片 URL
+
+        Args:
+            response: requests.Response 或 httpx.Response
+            url: 请求地址（用于错误信息）
+            model: 模型名称（用于错误信息）
 
+        Returns:
+            (图片数据, 待下载的图片 URL)，二者恰有一个不为 None
+        """
         if response.status_code != 200:
             error_detail = response.text[:500]
             status_code = response.status_code
@@ -300,18 +514,18 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
                     if image_urls:
                         # 下载第一张图片
                         logger.info(f"从 Markdown 提取到 {len(image_urls)} 张图片，下载第一张...")
-                        return self._download_image(image_urls[0])
+                        return None, image_urls[0]
 
                     # 2. 尝试解析 Base64 data URL
                     if content.startswith("data:image"):
                         logger.info("检测到 Base64 图片数据")
                         base64_data = content.split(",")[1]
-                        return base64.b64decode(base64_data)
+                        return base64.b64decode(base64_data), None
 
                     # 3. 尝试作为纯 URL 处理
                     if content.startswith("http://") or content.startswith("https://"):
                         logger.info("检测到图片 URL")
-                        return self._download_image(content.strip())
+                        return None, content.strip()
 
         raise ValueError(
             "❌ 无法从 Chat API 响应中提取图片数据\n\n"
@@ -325,13 +539,50 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
             "2. 修改提示词后重试"
         )
 
+    def _generate_via_chat_api(
+        self,
+        prompt: str,
+        size: str,
+        model: str
+    ) -> bytes:
+        """通过 chat/completions 端点生成图片"""
+        url = self._endpoint_url()
+        logger.info(f"Chat API 生成图片: {url}, model={model}")
+
+        payload = self._build_chat_payload(prompt, model)
+        response = requests.post(url, headers=self._build_headers(), json=payload, timeout=request_timeout(180))
+
+        image_data, image_url = self._parse_chat_response(response, url, model)
+        if image_url:
+            return self._download_image(image_url)
+        return image_data
+
+    async def _agenerate_via_chat_api(
+        self,
+        prompt: str,
+        size: str,
+        model: str
+    ) -> bytes:
+        """通过 chat/completions 端点异步生成图片"""
+        url = self._endpoint_url()
+        logger.info(f"Chat API 异步生成图片: {url}, model={model}")
+
+        payload = self._build_chat_payload(prompt, model)
+        response = await self._get_async_client().post(
+            url, headers=self._build_headers(), json=payload, timeout=request_timeout(180)
+        )
+
+        image_data, image_url = self._parse_chat_response(response, url, model)
+        if image_url:
+            return await self._adownload_image(image_url)
+        return image_data
+
     def _extract_markdown_image_urls(self, content: str) -> list:
         """
         从 Markdown 内容中提取图片 URL
 
         支持格式: ![alt text](url) 或 ![](url)
         """
-        import re
         # 匹配 ![任意文字](url) 格式
         pattern = r'!\[.*?\]\((https?://[^\s\)]+)\)'
         urls = re.findall(pattern, content)
@@ -341,8 +592,10 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
     def _download_image(self, url: str) -> bytes:
         """下载图片并返回二进制数据"""
         logger.info(f"下载图片: {url[:100]}...")
+        # 剩余时间不足时直接抛出 DeadlineExceeded，不包装成普通错误（否则会被重试）
+        timeout = request_timeout(60)
         try:
-            response = requests.get(url, timeout=60)
+            response = requests.get(url, timeout=timeout)
             if response.status_code == 200:
                 logger.info(f"✅ 图片下载成功: {len(response.content)} bytes")
                 return response.content
@@ -353,6 +606,24 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
         except Exception as e:
             raise Exception(f"❌ 下载图片失败: {str(e)}")
 
+    async def _adownload_image(self, url: str) -> bytes:
+        """异步下载图片并返回二进制数据"""
+        import httpx
+
+        logger.info(f"异步下载图片: {url[:100]}...")
+        timeout = request_timeout(60)
+        try:
+            response = await self._get_async_client().get(url, timeout=timeout)
+            if response.status_code == 200:
+                logger.info(f"✅ 图片下载成功: {len(response.content)} bytes")
+                return response.content
+            else:
+                raise Exception(f"下载图片失败: HTTP {response.status_code}")
+        except httpx.TimeoutException:
+            raise Exception("❌ 下载图片超时，请重试")
+        except Exception as e:
+            raise Exception(f"❌ 下载图片失败: {str(e)}")
+
     def get_supported_sizes(self) -> list:
         """获取支持的图片尺寸"""
         # 默认OpenAI支持的尺寸
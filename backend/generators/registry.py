@@ -0,0 +1,92 @@
+"""
+图片生成器实例缓存
+
+按服务商名称缓存生成器实例（及其 HTTP 连接池、genai.Client），配置未变化时复用同一实例。
+配置更新后按服务商比较配置指纹，只淘汰配置发生变化或被删除的服务商；
+正在运行的任务持有旧实例的引用，会继续使用旧实例直到结束，之后由 ImageService 关闭其连接（aclose）。
+"""
+
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Tuple
+
+from .base import ImageGeneratorBase
+from .factory import ImageGeneratorFactory
+
+logger = logging.getLogger(__name__)
+
+
+def config_fingerprint(provider_config: Dict[str, Any]) -> str:
+    """服务商配置指纹（用于判断配置是否变化）"""
+    return json.dumps(provider_config, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class GeneratorRegistry:
+    """图片生成器实例缓存"""
+
+    def __init__(self):
+        # provider_name -> (配置指纹, 生成器实例)
+        self._generators: Dict[str, Tuple[str, ImageGeneratorBase]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider_name: str, provider_config: Dict[str, Any]) -> ImageGeneratorBase:
+        """
+        获取服务商的生成器实例（配置变化时重新创建）
+
+        Args:
+            provider_name: 服务商名称
+            provider_config: 服务商配置
+
+        Returns:
+            图片生成器实例
+        """
+        fingerprint = config_fingerprint(provider_config)
+        with self._lock:
+            cached = self._generators.get(provider_name)
+            if cached is not None and cached[0] == fingerprint:
+                return cached[1]
+
+            provider_type = provider_config.get('type', provider_name)
+            logger.debug(f"创建生成器: provider={provider_name}, type={provider_type}")
+            generator = ImageGeneratorFactory.create(provider_type, provider_config)
+            self._generators[provider_name] = (fingerprint, generator)
+            return generator
+
+    def apply_config(self, providers: Dict[str, Dict[str, Any]]) -> List[str]:
+        """
+        应用新的服务商配置，淘汰配置变化或已删除的服务商的生成器
+
+        被淘汰的实例在这里不关闭：仍在使用它的任务结束后由 ImageService.drop_providers 关闭
+
+        Args:
+            providers: 新配置中的 providers 字段
+
+        Returns:
+            被淘汰的服务商名称列表
+        """
+        with self._lock:
+            stale = [
+                name for name, (fingerprint, _) in self._generators.items()
+                if name not in providers or config_fingerprint(providers[name]) != fingerprint
+            ]
+            for name in stale:
+                del self._generators[name]
+
+        if stale:
+            logger.info(f"🔄 图片服务商配置已变化，将重建生成器: {', '.join(stale)}")
+        return stale
+
+
+# 全局生成器缓存实例
+_registry_instance = None
+_registry_lock = threading.Lock()
+
+
+def get_generator_registry() -> GeneratorRegistry:
+    """获取全局图片生成器缓存"""
+    global _registry_instance
+    with _registry_lock:
+        if _registry_instance is None:
+            _registry_instance = GeneratorRegistry()
+        return _registry_instance
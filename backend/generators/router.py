@@ -0,0 +1,345 @@
+"""
+图片服务商路由与熔断
+
+按服务商统计最近一段时间内上游调用的延迟（p50/p95）和错误率，
+持续失败或明显变慢时打开熔断器，调用方据此把页面转发给配置的备用服务商（fallback_provider），
+避免服务商故障期间每个页面都耗尽完整的重试次数。
+同一份延迟统计也用于对冲请求（hedging）：页面耗时超过近期延迟的指定分位数时发起第二个请求，
+对冲请求数受预算（占正常请求数的比例）限制。
+
+熔断器状态：
+- closed: 正常放行
+- open: 熔断中，冷却时间内拒绝请求
+- half_open: 冷却结束，只放行一个探测请求，成功则恢复，失败则重新熔断
+
+只有服务商自身的故障计入失败：网络/传输错误、上游超时、5xx 和 429；
+安全过滤、参数错误、截止时间到达、任务取消等与服务商健康度无关的失败不计入统计。
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from ..utils.deadline import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# 错误信息中的上游状态码：生成器抛出的异常形如 "请求失败 (状态码: 503)"、"HTTP 502"、"status=429"，
+# Google GenAI 的原始错误以状态码开头（"429 RESOURCE_EXHAUSTED. ..."）
+_STATUS_PATTERN = re.compile(r"(?:状态码|status(?:_code)?|http)\D{0,3}([1-5]\d\d)\b|^([1-5]\d\d) [A-Z_]+", re.IGNORECASE)
+# 没有状态码时按关键字识别的服务商故障
+_FAILURE_KEYWORDS = (
+    "resource_exhausted", "unavailable", "internal server error", "rate limit",
+    "timeout", "timed out", "connection refused", "connection reset", "connection aborted",
+    "服务器内部错误", "服务暂时不可用", "请求频率超限", "速率限制", "请求超时", "下载图片超时",
+)
+# 传输层异常类型名（requests / httpx / aiohttp 等，不直接导入这些库）
+_TRANSPORT_TYPE_NAMES = ("Timeout", "ConnectError", "ConnectionError", "TransportError", "RemoteProtocolError")
+
+
+def _classify_error(error: BaseException) -> Optional[bool]:
+    """判断单个异常是否为服务商故障，无法判断时返回 None"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if any(marker in cls.__name__ for cls in type(error).__mro__ for marker in _TRANSPORT_TYPE_NAMES):
+        return True
+    message = str(error)
+    match = _STATUS_PATTERN.search(message)
+    if match:
+        status = int(match.group(1) or match.group(2))
+        return status == 429 or status >= 500
+    lowered = message.lower()
+    if any(keyword in lowered for keyword in _FAILURE_KEYWORDS):
+        return True
+    return None
+
+
+def is_provider_failure(error: BaseException) -> bool:
+    """
+    判断一次调用失败是否应计入服务商的熔断统计
+
+    沿异常链（__cause__ / __context__）从最内层的原始错误开始判断：
+    网络/传输错误、上游超时、5xx 和 429 计入；截止时间到达（DeadlineExceeded）、
+    其他状态码（如 400/401）以及无法识别的失败（安全过滤、返回数据为空等）不计入
+
+    Args:
+        error: 调用抛出的异常
+
+    Returns:
+        是否为服务商故障
+    """
+    chain = []
+    current = error
+    while current is not None and all(current is not seen for seen in chain):
+        if isinstance(current, DeadlineExceeded):
+            return False
+        chain.append(current)
+        current = current.__cause__ or current.__context__
+
+    for exc in reversed(chain):
+        verdict = _classify_error(exc)
+        if verdict is not None:
+            return verdict
+    return False
+
+
+def _percentile(sorted_values, q: float) -> Optional[float]:
+    """计算分位数（最近秩法），无数据时返回 None"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(q * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+class ProviderHealth:
+    """单个服务商的滚动统计与熔断器（由 ProviderRouter 加锁访问）"""
+
+    def __init__(self, provider_name: str):
+        self.provider_name = provider_name
+        # (时间戳, 延迟秒数, 是否成功)
+        self.samples: Deque[Tuple[float, float, bool]] = deque(maxlen=ProviderRouter.WINDOW_SIZE)
+        self.consecutive_failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probe_started_at: Optional[float] = None
+        # 对冲请求的时间戳（用于预算控制）
+        self.hedges: Deque[float] = deque()
+
+    def _prune(self, now: float) -> None:
+        """丢弃统计窗口之外的样本"""
+        while self.samples and now - self.samples[0][0] > ProviderRouter.WINDOW_SECONDS:
+            self.samples.popleft()
+        while self.hedges and now - self.hedges[0] > ProviderRouter.WINDOW_SECONDS:
+            self.hedges.popleft()
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        """滚动窗口内的统计数据"""
+        self._prune(now)
+        latencies = sorted(latency for _, latency, ok in self.samples if ok)
+        failures = sum(1 for _, _, ok in self.samples if not ok)
+        total = len(self.samples)
+        return {
+            "requests": total,
+            "failures": failures,
+            "error_rate": failures / total if total else 0.0,
+            "p50": _percentile(latencies, 0.5),
+            "p95": _percentile(latencies, 0.95),
+            "hedges": len(self.hedges),
+        }
+
+
+class ProviderRouter:
+    """图片服务商健康度统计与熔断判定"""
+
+    # 统计窗口：最近 WINDOW_SECONDS 秒内、最多 WINDOW_SIZE 个样本
+    WINDOW_SECONDS = 300
+    WINDOW_SIZE = 200
+    # 连续失败次数达到阈值时熔断
+    FAILURE_THRESHOLD = 5
+    # 样本数不少于 MIN_SAMPLES 且错误率达到阈值时熔断
+    MIN_SAMPLES = 10
+    ERROR_RATE_THRESHOLD = 0.5
+    # 熔断冷却时间（秒），之后进入半开状态放行一个探测请求
+    COOLDOWN_SECONDS = 30
+
+    def __init__(self):
+        self._health: Dict[str, ProviderHealth] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, provider_name: str) -> ProviderHealth:
+        health = self._health.get(provider_name)
+        if health is None:
+            health = ProviderHealth(provider_name)
+            self._health[provider_name] = health
+        return health
+
+    def allow_request(self, provider_name: str) -> bool:
+        """
+        判断是否可以向服务商发送请求
+
+        半开状态下只放行一个探测请求（探测超过冷却时间未返回则允许新的探测）
+
+        Args:
+            provider_name: 服务商名称
+
+        Returns:
+            是否放行
+        """
+        now = time.monotonic()
+        with self._lock:
+            health = self._get(provider_name)
+            if health.state == "closed":
+                return True
+
+            if health.state == "open":
+                if now - health.opened_at < self.COOLDOWN_SECONDS:
+                    return False
+                health.state = "half_open"
+                health.probe_started_at = None
+                logger.info(f"🔌 服务商 {provider_name} 熔断冷却结束，发送探测请求")
+
+            # half_open
+            if health.probe_started_at is not None and now - health.probe_started_at < self.COOLDOWN_SECONDS:
+                return False
+            health.probe_started_at = now
+            return True
+
+    def is_closed(self, provider_name: str) -> bool:
+        """
+        只读查询熔断器是否处于 closed 状态（不会占用半开状态的探测名额）
+
+        Args:
+            provider_name: 服务商名称
+
+        Returns:
+            是否正常放行
+        """
+        with self._lock:
+            health = self._health.get(provider_name)
+            return health is None or health.state == "closed"
+
+    def release_probe(self, provider_name: str) -> None:
+        """
+        释放半开状态的探测名额（探测请求因与服务商无关的原因结束，未得出结论）
+
+        Args:
+            provider_name: 服务商名称
+        """
+        with self._lock:
+            health = self._health.get(provider_name)
+            if health is not None and health.state == "half_open":
+                health.probe_started_at = None
+
+    def record(
+        self,
+        provider_name: str,
+        latency: float,
+        success: bool,
+        latency_threshold: Optional[float] = None
+    ) -> None:
+        """
+        记录一次上游调用结果并更新熔断器
+
+        Args:
+            provider_name: 服务商名称
+            latency: 调用耗时（秒）
+            success: 是否成功
+            latency_threshold: p95 延迟阈值（秒），超过时视为服务降级并熔断，None 表示不按延迟熔断
+        """
+        now = time.monotonic()
+        with self._lock:
+            health = self._get(provider_name)
+            health.samples.append((now, latency, success))
+
+            if success:
+                health.consecutive_failures = 0
+                if health.state == "half_open":
+                    health.state = "closed"
+                    health.probe_started_at = None
+                    logger.info(f"✅ 服务商 {provider_name} 探测成功，熔断器已恢复")
+                    return
+            else:
+                health.consecutive_failures += 1
+
+            if health.state == "half_open":
+                self._open(health, now, "探测请求失败")
+                return
+            if health.state == "open":
+                return
+
+            stats = health.stats(now)
+            if health.consecutive_failures >= self.FAILURE_THRESHOLD:
+                self._open(health, now, f"连续失败 {health.consecutive_failures} 次")
+            elif stats["requests"] >= self.MIN_SAMPLES and stats["error_rate"] >= self.ERROR_RATE_THRESHOLD:
+                self._open(health, now, f"错误率 {stats['error_rate']:.0%}")
+            elif (
+                latency_threshold
+                and stats["requests"] >= self.MIN_SAMPLES
+                and stats["p95"] is not None
+                and stats["p95"] > latency_threshold
+            ):
+                self._open(health, now, f"p95 延迟 {stats['p95']:.1f}s 超过阈值 {latency_threshold}s")
+
+    def latency_percentile(self, provider_name: str, q: float) -> Optional[float]:
+        """
+        最近成功请求延迟的分位数
+
+        Args:
+            provider_name: 服务商名称
+            q: 分位（0~1），如 0.95
+
+        Returns:
+            延迟秒数，成功样本少于 MIN_SAMPLES 时返回 None（样本不足时不做判断）
+        """
+        now = time.monotonic()
+        with self._lock:
+            health = self._get(provider_name)
+            health._prune(now)
+            latencies = sorted(latency for _, latency, ok in health.samples if ok)
+        if len(latencies) < self.MIN_SAMPLES:
+            return None
+        return _percentile(latencies, q)
+
+    def try_acquire_hedge(self, provider_name: str, budget_ratio: float) -> bool:
+        """
+        申请一次对冲请求额度
+
+        统计窗口内对冲请求数不超过正常请求数的 budget_ratio 倍
+
+        Args:
+            provider_name: 服务商名称
+            budget_ratio: 对冲预算比例，如 0.05 表示最多 5% 的额外请求
+
+        Returns:
+            是否获得额度
+        """
+        now = time.monotonic()
+        with self._lock:
+            health = self._get(provider_name)
+            health._prune(now)
+            if len(health.hedges) + 1 > budget_ratio * len(health.samples):
+                return False
+            health.hedges.append(now)
+            return True
+
+    def _open(self, health: ProviderHealth, now: float, reason: str) -> None:
+        """打开熔断器"""
+        health.state = "open"
+        health.opened_at = now
+        health.probe_started_at = None
+        # 清空样本：恢复后重新统计，避免历史失败立即再次触发熔断
+        health.samples.clear()
+        logger.warning(
+            f"⚡ 服务商 {health.provider_name} 已熔断（{reason}），"
+            f"{self.COOLDOWN_SECONDS} 秒内请求将转发给备用服务商"
+        )
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """所有服务商的熔断状态和滚动统计"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "state": health.state,
+                    "consecutive_failures": health.consecutive_failures,
+                    **health.stats(now),
+                }
+                for name, health in self._health.items()
+            }
+
+
+# 全局路由实例
+_router_instance = None
+_router_lock = threading.Lock()
+
+
+def get_provider_router() -> ProviderRouter:
+    """获取全局图片服务商路由"""
+    global _router_instance
+    with _router_lock:
+        if _router_instance is None:
+            _router_instance = ProviderRouter()
+        return _router_instance
@@ -6,6 +6,7 @@ API 路由模块
 - image_routes: 图片生成/获取相关 API
 - history_routes: 历史记录 CRUD API
 - config_routes: 配置管理 API
+- reference_routes: 参考图上传 API
 
 所有路由都注册到统一的 /api 前缀下
 """
@@ -26,6 +27,7 @@ def create_api_blueprint():
     from .image_routes import create_image_blueprint
     from .history_routes import create_history_blueprint
     from .config_routes import create_config_blueprint
+    from .reference_routes import create_reference_blueprint
 
     # 创建主 API 蓝图
     api_bp = Blueprint('api', __name__, url_prefix='/api')
@@ -35,6 +37,7 @@ def create_api_blueprint():
     api_bp.register_blueprint(create_image_blueprint())
     api_bp.register_blueprint(create_history_blueprint())
     api_bp.register_blueprint(create_config_blueprint())
+    api_bp.register_blueprint(create_reference_blueprint())
 
     return api_bp
 
@@ -91,6 +91,16 @@ def create_config_blueprint():
         try:
             data = request.get_json()
 
+            # 自定义生成器路径会在首次使用时被导入：写入配置前先检查是否在允许范围内
+            if 'image_generation' in data:
+                try:
+                    _check_image_provider_types(data['image_generation'])
+                except ValueError as e:
+                    return jsonify({
+                        "success": False,
+                        "error": str(e)
+                    }), 400
+
             # 更新图片生成配置
             if 'image_generation' in data:
                 _update_provider_config(
@@ -119,6 +129,25 @@ def create_config_blueprint():
                 "error": f"更新配置失败: {str(e)}"
             }), 500
 
+    # ==================== 服务商状态 ====================
+
+    @config_bp.route('/config/image-providers/status', methods=['GET'])
+    def get_image_provider_status():
+        """
+        获取图片服务商的运行状态
+
+        返回：
+        - success: 是否成功
+        - providers: 各服务商的熔断状态和最近 5 分钟的统计
+          （state / requests / failures / error_rate / p50 / p95）
+        """
+        from backend.generators.router import get_provider_router
+
+        return jsonify({
+            "success": True,
+            "providers": get_provider_router().snapshot()
+        })
+
     # ==================== 连接测试 ====================
 
     @config_bp.route('/config/test', methods=['POST'])
@@ -223,20 +252,50 @@ def _update_provider_config(config_path: Path, new_data: dict):
     _write_config(config_path, existing_config)
 
 
+def _check_image_provider_types(new_data: dict):
+    """
+    检查图片服务商的 type（不导入任何模块）
+
+    Args:
+        new_data: 新的图片生成配置
+
+    Raises:
+        ValueError: type 为 "模块路径:类名" 且模块不在 Config.CUSTOM_GENERATOR_MODULES 允许的范围内
+    """
+    from backend.generators.factory import ImageGeneratorFactory
+
+    for name, provider_config in (new_data.get('providers') or {}).items():
+        provider_type = (provider_config or {}).get('type')
+        if isinstance(provider_type, str) and (':' in provider_type or '.' in provider_type):
+            try:
+                ImageGeneratorFactory.check_type(provider_type)
+            except ValueError as e:
+                raise ValueError(f"服务商 {name} 配置错误：{e}")
+
+
 def _clear_config_cache():
-    """清除配置缓存"""
+    """清除配置缓存，并按服务商增量刷新图片生成器和大纲服务"""
     try:
         from backend.config import Config
-        Config._image_providers_config = None
+        Config.reload_config()
     except Exception:
         pass
 
     try:
-        from backend.services.image import reset_image_service
-        reset_image_service()
+        from backend.services.outline import refresh_outline_service
+        refresh_outline_service()
     except Exception:
         pass
 
+    try:
+        from backend.services.image import refresh_image_service
+        refresh_image_service()
+    except Exception as e:
+        # 刷新失败时退回到整体重建，确保新配置生效
+        logger.warning(f"增量刷新图片服务失败，将重建服务实例: {e}")
+        from backend.services.image import reset_image_service
+        reset_image_service()
+
 
 def _load_provider_config(provider_type: str, provider_name: str, config: dict) -> dict:
     """
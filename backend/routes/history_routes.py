@@ -10,11 +10,17 @@
 """
 
 import os
-import io
+import json
+import tempfile
+import time
 import zipfile
 import logging
-from flask import Blueprint, request, jsonify, send_file
+from typing import Optional
+from flask import Blueprint, request, jsonify
+from backend.config import Config
 from backend.services.history import get_history_service
+from backend.services.manifest import ARCHIVE_FILENAME, get_manifest_store
+from backend.utils.file_serving import send_history_file
 
 logger = logging.getLogger(__name__)
 
@@ -379,16 +385,16 @@ def create_history_blueprint():
                     "error": f"任务目录不存在：{task_id}"
                 }), 404
 
-            # 创建内存中的 ZIP 文件
-            zip_buffer = _create_images_zip(task_dir)
+            # 获取（必要时生成）任务目录中缓存的 ZIP 文件
+            zip_path = _get_images_zip(task_dir)
 
             # 生成安全的下载文件名
             title = record.get('title', 'images')
             safe_title = _sanitize_filename(title)
             filename = f"{safe_title}.zip"
 
-            return send_file(
-                zip_buffer,
+            return send_history_file(
+                zip_path,
                 mimetype='application/zip',
                 as_attachment=True,
                 download_name=filename
@@ -424,14 +430,14 @@ def create_history_blueprint():
                     "error": f"任务目录不存在：{task_id}"
                 }), 404
             
-            # 创建内存中的 ZIP 文件
-            zip_buffer = _create_images_zip(task_dir)
+            # 获取（必要时生成）任务目录中缓存的 ZIP 文件
+            zip_path = _get_images_zip(task_dir)
             
             # 生成下载文件名
             filename = f"images_{task_id[:8]}.zip"
             
-            return send_file(
-                zip_buffer,
+            return send_history_file(
+                zip_path,
                 mimetype='application/zip',
                 as_attachment=True,
                 download_name=filename
@@ -447,40 +453,125 @@ def create_history_blueprint():
     return history_bp
 
 
-def _create_images_zip(task_dir: str) -> io.BytesIO:
+def _get_images_zip(task_dir: str) -> str:
     """
-    创建包含所有图片的 ZIP 文件
+    获取包含所有图片的 ZIP 文件路径
+
+    ZIP 缓存在任务目录中，图片未变化时直接复用，可由反向代理或 sendfile 零拷贝发送；
+    图片（PNG/JPG）本身已压缩，使用 ZIP_STORED 存储，打包时不再做无效的压缩计算。
+
+    取舍：首次下载仍要经 Python 把所有图片复制进 ZIP，缓存期间占用与图片相同的磁盘空间，
+    换来重复下载时零拷贝发送。缓存占用有上限：页面重新生成时删除（ManifestStore.write_page），
+    所有任务的缓存总大小和未被下载的时间超出 Config.ZIP_CACHE_MAX_MB / ZIP_CACHE_TTL 时
+    在下一次打包后删除最久未下载的缓存（_prune_archives），删除历史记录时随任务目录一起删除。
 
     Args:
         task_dir: 任务目录路径
 
     Returns:
-        io.BytesIO: 内存中的 ZIP 文件
+        str: ZIP 文件路径
     """
-    memory_file = io.BytesIO()
-
-    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-        # 遍历任务目录中的所有图片（排除缩略图）
-        for filename in os.listdir(task_dir):
-            # 跳过缩略图文件
-            if filename.startswith('thumb_'):
-                continue
-
-            if filename.endswith(('.png', '.jpg', '.jpeg')):
-                file_path = os.path.join(task_dir, filename)
-
-                # 生成归档文件名（page_N.png 格式）
-                try:
-                    index = int(filename.split('.')[0])
-                    archive_name = f"page_{index + 1}.png"
-                except ValueError:
-                    archive_name = filename
+    zip_path = os.path.join(task_dir, ARCHIVE_FILENAME)
+    # 打包内容取自任务清单（已完成的页面，不含缩略图）
+    pages = get_manifest_store().list_pages(task_dir)
+    # 页面文件和哈希写入 ZIP 注释，用于判断缓存是否过期（旧任务目录的清单补建完成前没有哈希，改用大小和修改时间）
+    signature = json.dumps(
+        [[page['file'], page['sha256'] or f"{page['size']}:{page['updated_at']}"] for page in pages],
+        separators=(',', ':')
+    ).encode('utf-8')
+
+    if os.path.exists(zip_path):
+        try:
+            with zipfile.ZipFile(zip_path) as zf:
+                if zf.comment == signature:
+                    # 修改时间记录最近一次下载，淘汰时按它排序
+                    os.utime(zip_path)
+                    return zip_path
+        except zipfile.BadZipFile:
+            pass
+
+    # 先写临时文件再原子替换，并发下载时不会读到写了一半的 ZIP
+    fd, tmp_path = tempfile.mkstemp(dir=task_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            with zipfile.ZipFile(f, 'w', zipfile.ZIP_STORED) as zf:
+                for page in pages:
+                    file_path = os.path.join(task_dir, page['file'])
+                    if not os.path.exists(file_path):
+                        logger.warning(f"任务清单中的图片不存在，跳过打包: {file_path}")
+                        continue
+
+                    # 生成归档文件名（page_N.png 格式）
+                    extension = os.path.splitext(page['file'])[1]
+                    archive_name = f"page_{page['index'] + 1}{extension}"
+                    zf.write(file_path, archive_name)
+                zf.comment = signature
+        os.replace(tmp_path, zip_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    _prune_archives(os.path.dirname(task_dir), keep=zip_path)
+    return zip_path
+
+
+def _prune_archives(
+    history_dir: str,
+    keep: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+    ttl: Optional[float] = None
+) -> int:
+    """
+    删除过期的图片 ZIP 缓存：超过 ttl 秒未被下载的，以及总大小超出 max_bytes 时最久未下载的
 
-                zf.write(file_path, archive_name)
+    Args:
+        history_dir: 历史记录根目录
+        keep: 不删除的 ZIP 路径（刚生成、即将发送的缓存）
+        max_bytes: 总大小上限（字节），默认 Config.ZIP_CACHE_MAX_MB，0 表示不限制
+        ttl: 保留时间（秒），默认 Config.ZIP_CACHE_TTL，0 表示不限制
 
-    # 将指针移到开始位置
-    memory_file.seek(0)
-    return memory_file
+    Returns:
+        删除的缓存数量
+    """
+    if max_bytes is None:
+        max_bytes = Config.ZIP_CACHE_MAX_MB * 1024 * 1024
+    if ttl is None:
+        ttl = Config.ZIP_CACHE_TTL
+
+    now = time.time()
+    archives = []  # (最近下载时间, 大小, 路径)
+    try:
+        for entry in os.scandir(history_dir):
+            if not entry.is_dir() or entry.name.startswith('.'):
+                continue
+            path = os.path.join(entry.path, ARCHIVE_FILENAME)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            archives.append((stat.st_mtime, stat.st_size, path))
+    except OSError:
+        return 0
+
+    total = sum(size for _, size, _ in archives)
+    removed = 0
+    for last_used, size, path in sorted(archives):
+        if path == keep:
+            continue
+        expired = ttl and now - last_used > ttl
+        if not expired and not (max_bytes and total > max_bytes):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+
+    if removed:
+        logger.info(f"🧹 图片 ZIP 缓存淘汰: 删除 {removed} 个，剩余 {total / 1024 / 1024:.1f}MB")
+    return removed
 
 
 def _sanitize_filename(title: str) -> str:
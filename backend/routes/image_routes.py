@@ -6,15 +6,28 @@
 - 获取图片
 - 重试/重新生成单张图片
 - 批量重试失败图片
-- 获取任务状态
+- 获取任务状态、取消任务
+- 上报焦点页（优先生成用户正在查看的页面）
 """
 
-import os
-import json
-import base64
 import logging
-from flask import Blueprint, request, jsonify, Response, send_file
-from backend.services.image import get_image_service
+from flask import Blueprint, request, jsonify, Response
+from werkzeug.exceptions import RequestEntityTooLarge
+from backend.services.image import USER_IMAGE_MAX_KB, get_image_service
+from backend.services.jobs import get_job_manager
+from backend.services.scheduler import get_page_scheduler
+from backend.utils.file_serving import resolve_image_path, send_history_file
+from backend.utils.upload import UploadError, resolve_reference_ids
+from .sse import (
+    SSE_HEADERS,
+    parse_generate_request,
+    parse_last_event_id,
+    parse_retry_failed_request,
+    check_provider,
+    stream_job,
+    submit_generate_job,
+    submit_retry_failed_job,
+)
 from .utils import log_request, log_error
 
 logger = logging.getLogger(__name__)
@@ -37,93 +50,59 @@ def create_image_blueprint():
         - full_outline: 完整大纲文本
         - user_topic: 用户原始输入主题
         - user_images: base64 编码的用户参考图片列表
+        - user_image_ids: 已上传参考图的 ID 列表（POST /api/references 返回，可代替 user_images）
+        - provider: 图片服务商名称（可选，默认使用激活的服务商）
+        - step: 生成步骤（all / cover / content）
+        - speculative: step=cover 时，等待确认封面期间是否在后台提前生成内容页（可选）
 
         返回：
-        SSE 事件流，包含以下事件类型：
+        SSE 事件流（每个事件带 id，可通过 /api/jobs/<job_id>/events 断线重连），包含以下事件类型：
+        - job: 后台任务ID（第一个事件）
         - image: 单张图片生成完成
         - error: 生成错误
         - complete: 全部完成
         """
         try:
-            data = request.get_json()
-            pages = data.get('pages')
-            task_id = data.get('task_id')
-            full_outline = data.get('full_outline', '')
+            data = request.get_json() or {}
             user_topic = data.get('user_topic', '')
-            step = data.get('step', 'all')  # 获取生成步骤参数
-            style = data.get('style', '小红书爆款图文风格') # 获取风格参数
-
-            # 解析 base64 格式的用户参考图片
-            user_images = _parse_base64_images(data.get('user_images', []))
 
             log_request('/generate', {
-                'pages_count': len(pages) if pages else 0,
-                'task_id': task_id,
+                'pages_count': len(data.get('pages') or []),
+                'task_id': data.get('task_id'),
                 'user_topic': user_topic[:50] if user_topic else None,
-                'user_images': user_images,
-                'step': step
+                'user_images': data.get('user_images') or [],
+                'step': data.get('step', 'all')
             })
 
-            if not pages:
-                logger.warning("图片生成请求缺少 pages 参数")
+            params, error = parse_generate_request(data)
+            if error:
                 return jsonify({
                     "success": False,
-                    "error": "参数错误：pages 不能为空。\n请提供要生成的页面列表数据。"
+                    "error": error
                 }), 400
 
-            logger.info(f"🖼️  开始图片生成任务: {task_id}, 共 {len(pages)} 页, 步骤: {step}")
+            logger.info(f"🖼️  开始图片生成任务: {params['task_id']}, 共 {len(params['pages'])} 页, 步骤: {params['step']}")
             image_service = get_image_service()
 
-            def generate():
-                """SSE 事件生成器"""
-                try:
-                    for event in image_service.generate_images(
-                        pages, task_id, full_outline,
-                        user_images=user_images if user_images else None,
-                        user_topic=user_topic,
-                        step=step,
-                        style=style
-                    ):
-                        event_type = event["event"]
-                        event_data = event["data"]
-
-                        # 格式化为 SSE 格式
-                        yield f"event: {event_type}\n"
-                        yield f"data: {json.dumps(event_data, ensure_ascii=False)}\n\n"
-                except Exception as e:
-                    # 在 SSE 流中发送错误事件
-                    logger.error(f"SSE 生成过程中发生错误: {e}")
-                    error_event = {
-                        "index": -1,
-                        "status": "error",
-                        "message": str(e),
-                        "retryable": True
-                    }
-                    yield f"event: error\n"
-                    yield f"data: {json.dumps(error_event, ensure_ascii=False)}\n\n"
-                    # 发送完成事件以确保前端能正确关闭
-                    finish_event = {
-                        "success": False,
-                        "task_id": task_id,
-                        "images": [],
-                        "total": len(pages) if pages else 0,
-                        "completed": 0,
-                        "failed": 1,
-                        "failed_indices": [],
-                        "error": str(e)
-                    }
-                    yield f"event: finish\n"
-                    yield f"data: {json.dumps(finish_event, ensure_ascii=False)}\n\n"
+            error = check_provider(image_service, params['provider'])
+            if error:
+                return jsonify({
+                    "success": False,
+                    "error": error
+                }), 400
+
+            # 生成在后台任务中运行，SSE 连接只是订阅者，断开后可通过任务ID重连
+            job = submit_generate_job(image_service, params)
 
             return Response(
-                generate(),
+                stream_job(job.job_id),
                 mimetype='text/event-stream',
-                headers={
-                    'Cache-Control': 'no-cache',
-                    'X-Accel-Buffering': 'no',
-                }
+                headers={**SSE_HEADERS, 'X-Job-ID': job.job_id}
             )
 
+        except RequestEntityTooLarge:
+            raise
+
         except Exception as e:
             log_error('/generate', e)
             error_msg = str(e)
@@ -132,6 +111,63 @@ def create_image_blueprint():
                 "error": f"图片生成异常。\n错误详情: {error_msg}\n建议：检查图片生成服务配置和后端日志"
             }), 500
 
+    # ==================== 后台任务 ====================
+
+    @image_bp.route('/jobs/<job_id>', methods=['GET'])
+    def get_job(job_id):
+        """
+        获取后台任务状态
+
+        路径参数：
+        - job_id: 后台任务 ID
+
+        返回：
+        - success: 是否成功
+        - job: 任务概要（status / task_id / event_count 等）
+        """
+        job = get_job_manager().get_job_info(job_id)
+        if job is None:
+            return jsonify({
+                "success": False,
+                "error": f"后台任务不存在：{job_id}\n可能原因：\n1. 任务ID错误\n2. 任务已结束并超过保留时间\n3. 服务重启导致任务丢失"
+            }), 404
+
+        return jsonify({
+            "success": True,
+            "job": job
+        }), 200
+
+    @image_bp.route('/jobs/<job_id>/events', methods=['GET'])
+    def get_job_events(job_id):
+        """
+        订阅后台任务事件（SSE，支持断线重连）
+
+        路径参数：
+        - job_id: 后台任务 ID
+
+        请求头 / 查询参数：
+        - Last-Event-ID / last_event_id: 已收到的最后一个事件 ID，从其后开始补发
+
+        返回：
+        SSE 事件流，任务结束后关闭
+        """
+        if not get_job_manager().has_job(job_id):
+            return jsonify({
+                "success": False,
+                "error": f"后台任务不存在：{job_id}\n可能原因：\n1. 任务ID错误\n2. 任务已结束并超过保留时间\n3. 服务重启导致任务丢失"
+            }), 404
+
+        last_event_id = parse_last_event_id(
+            request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        )
+        logger.info(f"🔌 订阅后台任务事件: job={job_id}, last_event_id={last_event_id}")
+
+        return Response(
+            stream_job(job_id, last_event_id),
+            mimetype='text/event-stream',
+            headers={**SSE_HEADERS, 'X-Job-ID': job_id}
+        )
+
     # ==================== 图片获取 ====================
 
     @image_bp.route('/images/<task_id>/<filename>', methods=['GET'])
@@ -153,33 +189,25 @@ def create_image_blueprint():
         try:
             logger.debug(f"获取图片: {task_id}/{filename}")
 
-            # 检查是否请求缩略图
+            # 检查是否请求缩略图（存在时优先返回缩略图，否则返回原图）
             thumbnail = request.args.get('thumbnail', 'true').lower() == 'true'
+            resolved = resolve_image_path(task_id, filename, thumbnail)
 
-            # 构建 history 目录路径
-            history_root = os.path.join(
-                os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
-                "history"
-            )
-
-            if thumbnail:
-                # 尝试返回缩略图
-                thumb_filename = f"thumb_{filename}"
-                thumb_filepath = os.path.join(history_root, task_id, thumb_filename)
-
-                if os.path.exists(thumb_filepath):
-                    return send_file(thumb_filepath, mimetype='image/png')
-
-            # 返回原图
-            filepath = os.path.join(history_root, task_id, filename)
-
-            if not os.path.exists(filepath):
+            if resolved is None:
                 return jsonify({
                     "success": False,
                     "error": f"图片不存在：{task_id}/{filename}"
                 }), 404
 
-            return send_file(filepath, mimetype='image/png')
+            filepath, etag = resolved
+            return send_history_file(filepath, mimetype='image/png', etag=etag)
+
+        except FileNotFoundError:
+            # 清单中记录的文件已被手动删除
+            return jsonify({
+                "success": False,
+                "error": f"图片不存在：{task_id}/{filename}"
+            }), 404
 
         except Exception as e:
             log_error('/images', e)
@@ -200,6 +228,8 @@ def create_image_blueprint():
         - task_id: 任务 ID（必填）
         - page: 页面信息（必填）
         - use_reference: 是否使用参考图（默认 true）
+        - provider: 图片服务商名称（可选，默认沿用任务的服务商）
+        - user_image_ids: 已上传参考图的 ID 列表（可选，默认使用任务保存的参考图）
 
         返回：
         - success: 是否成功
@@ -210,6 +240,8 @@ def create_image_blueprint():
             task_id = data.get('task_id')
             page = data.get('page')
             use_reference = data.get('use_reference', True)
+            provider = data.get('provider') or None
+            user_images = resolve_reference_ids(data.get('user_image_ids') or [], USER_IMAGE_MAX_KB)
 
             log_request('/retry', {
                 'task_id': task_id,
@@ -225,7 +257,17 @@ def create_image_blueprint():
 
             logger.info(f"🔄 重试生成图片: task={task_id}, page={page.get('index')}")
             image_service = get_image_service()
-            result = image_service.retry_single_image(task_id, page, use_reference)
+
+            error = check_provider(image_service, provider)
+            if error:
+                return jsonify({
+                    "success": False,
+                    "error": error
+                }), 400
+
+            result = image_service.retry_single_image(
+                task_id, page, use_reference, provider=provider, user_images=user_images or None
+            )
 
             if result["success"]:
                 logger.info(f"✅ 图片重试成功: {result.get('image_url')}")
@@ -234,6 +276,12 @@ def create_image_blueprint():
 
             return jsonify(result), 200 if result["success"] else 500
 
+        except UploadError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), e.status_code
+
         except Exception as e:
             log_error('/retry', e)
             error_msg = str(e)
@@ -250,67 +298,43 @@ def create_image_blueprint():
         请求体：
         - task_id: 任务 ID（必填）
         - pages: 要重试的页面列表（必填）
+        - provider: 图片服务商名称（可选，默认沿用任务的服务商）
+        - user_image_ids: 已上传参考图的 ID 列表（可选，默认使用任务保存的参考图）
 
         返回：
         SSE 事件流
         """
         try:
-            data = request.get_json()
-            task_id = data.get('task_id')
-            pages = data.get('pages')
+            data = request.get_json() or {}
 
             log_request('/retry-failed', {
-                'task_id': task_id,
-                'pages_count': len(pages) if pages else 0
+                'task_id': data.get('task_id'),
+                'pages_count': len(data.get('pages') or [])
             })
 
-            if not task_id or not pages:
-                logger.warning("批量重试请求缺少必要参数")
+            params, error = parse_retry_failed_request(data)
+            if error:
                 return jsonify({
                     "success": False,
-                    "error": "参数错误：task_id 和 pages 不能为空。\n请提供任务ID和要重试的页面列表。"
+                    "error": error
                 }), 400
 
-            logger.info(f"🔄 批量重试失败图片: task={task_id}, 共 {len(pages)} 页")
+            logger.info(f"🔄 批量重试失败图片: task={params['task_id']}, 共 {len(params['pages'])} 页")
             image_service = get_image_service()
 
-            def generate():
-                """SSE 事件生成器"""
-                try:
-                    for event in image_service.retry_failed_images(task_id, pages):
-                        event_type = event["event"]
-                        event_data = event["data"]
-
-                        yield f"event: {event_type}\n"
-                        yield f"data: {json.dumps(event_data, ensure_ascii=False)}\n\n"
-                except Exception as e:
-                    # 在 SSE 流中发送错误事件
-                    logger.error(f"SSE 重试过程中发生错误: {e}")
-                    error_event = {
-                        "index": -1,
-                        "status": "error",
-                        "message": str(e),
-                        "retryable": True
-                    }
-                    yield f"event: error\n"
-                    yield f"data: {json.dumps(error_event, ensure_ascii=False)}\n\n"
-                    # 发送完成事件
-                    finish_event = {
-                        "success": False,
-                        "total": len(pages) if pages else 0,
-                        "completed": 0,
-                        "failed": 1
-                    }
-                    yield f"event: retry_finish\n"
-                    yield f"data: {json.dumps(finish_event, ensure_ascii=False)}\n\n"
+            error = check_provider(image_service, params['provider'])
+            if error:
+                return jsonify({
+                    "success": False,
+                    "error": error
+                }), 400
+
+            job = submit_retry_failed_job(image_service, params)
 
             return Response(
-                generate(),
+                stream_job(job.job_id),
                 mimetype='text/event-stream',
-                headers={
-                    'Cache-Control': 'no-cache',
-                    'X-Accel-Buffering': 'no',
-                }
+                headers={**SSE_HEADERS, 'X-Job-ID': job.job_id}
             )
 
         except Exception as e:
@@ -332,6 +356,8 @@ def create_image_blueprint():
         - use_reference: 是否使用参考图（默认 true）
         - full_outline: 完整大纲文本（用于上下文）
         - user_topic: 用户原始输入主题
+        - provider: 图片服务商名称（可选，默认沿用任务的服务商）
+        - user_image_ids: 已上传参考图的 ID 列表（可选，默认使用任务保存的参考图）
 
         返回：
         - success: 是否成功
@@ -345,6 +371,8 @@ def create_image_blueprint():
             full_outline = data.get('full_outline', '')
             user_topic = data.get('user_topic', '')
             custom_prompt = data.get('custom_prompt', '') # 获取自定义提示词
+            provider = data.get('provider') or None
+            user_images = resolve_reference_ids(data.get('user_image_ids') or [], USER_IMAGE_MAX_KB)
 
             log_request('/regenerate', {
                 'task_id': task_id,
@@ -360,11 +388,21 @@ def create_image_blueprint():
 
             logger.info(f"🔄 重新生成图片: task={task_id}, page={page.get('index')}")
             image_service = get_image_service()
+
+            error = check_provider(image_service, provider)
+            if error:
+                return jsonify({
+                    "success": False,
+                    "error": error
+                }), 400
+
             result = image_service.regenerate_image(
                 task_id, page, use_reference,
                 full_outline=full_outline,
                 user_topic=user_topic,
-                custom_prompt=custom_prompt # 传递自定义提示词
+                custom_prompt=custom_prompt, # 传递自定义提示词
+                provider=provider,
+                user_images=user_images or None
             )
 
             if result["success"]:
@@ -374,6 +412,12 @@ def create_image_blueprint():
 
             return jsonify(result), 200 if result["success"] else 500
 
+        except UploadError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), e.status_code
+
         except Exception as e:
             log_error('/regenerate', e)
             error_msg = str(e)
@@ -398,6 +442,7 @@ def create_image_blueprint():
           - generated: 已生成的图片
           - failed: 失败的图片
           - has_cover: 是否有封面图
+          - cancelled: 是否已被取消
         """
         try:
             image_service = get_image_service()
@@ -413,7 +458,8 @@ def create_image_blueprint():
             safe_state = {
                 "generated": state.get("generated", {}),
                 "failed": state.get("failed", {}),
-                "has_cover": state.get("cover_image") is not None
+                "has_cover": state.get("cover_image") is not None,
+                "cancelled": bool(state.get("cancelled"))
             }
 
             return jsonify({
@@ -428,6 +474,82 @@ def create_image_blueprint():
                 "error": f"获取任务状态失败。\n错误详情: {error_msg}"
             }), 500
 
+    @image_bp.route('/task/<task_id>', methods=['DELETE'])
+    def cancel_task(task_id):
+        """
+        取消任务
+
+        停止该任务正在运行的生成和批量重试：排队中的页面不再生成，进行中的上游请求被中止，
+        服务商并发名额立即释放给其他任务。已生成的图片保留，未生成的页面记为失败，可通过批量重试继续生成。
+        任务在其他 worker 上运行时，该 worker 通过任务状态存储中的取消标记停止生成（最多延迟 JobManager.CANCEL_POLL_SECONDS 秒）。
+
+        路径参数：
+        - task_id: 任务 ID
+
+        返回：
+        - success: 是否成功
+        - cancelled_jobs: 被取消的后台任务 ID 列表
+        - generated: 已生成的页数
+        - cancelled_indices: 未生成的页面索引
+        """
+        try:
+            log_request(f'/task/{task_id} DELETE')
+
+            jobs = get_job_manager().cancel_task(task_id)
+            result = get_image_service().cancel_task(task_id)
+
+            if result is None and not jobs:
+                return jsonify({
+                    "success": False,
+                    "error": f"任务不存在：{task_id}\n可能原因：\n1. 任务ID错误\n2. 任务已过期或被清理\n3. 服务重启导致状态丢失"
+                }), 404
+
+            return jsonify({
+                "success": True,
+                "task_id": task_id,
+                "cancelled_jobs": [job.job_id for job in jobs],
+                **(result or {"generated": 0, "cancelled_indices": []})
+            }), 200
+
+        except Exception as e:
+            log_error(f'/task/{task_id} DELETE', e)
+            return jsonify({
+                "success": False,
+                "error": f"取消任务失败。\n错误详情: {str(e)}"
+            }), 500
+
+    @image_bp.route('/task/<task_id>/focus', methods=['POST'])
+    def focus_task_page(task_id):
+        """
+        上报用户正在查看的页面（焦点页）
+
+        排队中的生成请求优先放行焦点页及其之后的页面，再生成焦点页之前的页面
+
+        路径参数：
+        - task_id: 任务 ID
+
+        请求体：
+        - index: 页面索引
+
+        返回：
+        - success: 是否成功（任务不存在时返回 404）
+        """
+        data = request.get_json(silent=True) or {}
+        index = data.get('index')
+        if isinstance(index, bool) or not isinstance(index, int) or index < 0:
+            return jsonify({
+                "success": False,
+                "error": "参数错误：index 必须是非负整数。\n请提供用户正在查看的页面索引。"
+            }), 400
+
+        # 焦点页写入任务状态存储，由运行该任务的 worker 读取
+        if not get_page_scheduler().set_focus(task_id, index):
+            return jsonify({
+                "success": False,
+                "error": f"任务不存在：{task_id}\n可能原因：\n1. 任务ID错误\n2. 任务已过期或被清理\n3. 服务重启导致状态丢失"
+            }), 404
+        return jsonify({"success": True}), 200
+
     # ==================== 健康检查 ====================
 
     @image_bp.route('/health', methods=['GET'])
@@ -446,27 +568,3 @@ def create_image_blueprint():
 
     return image_bp
 
-
-# ==================== 辅助函数 ====================
-
-def _parse_base64_images(images_base64: list) -> list:
-    """
-    解析 base64 编码的图片列表
-
-    Args:
-        images_base64: base64 编码的图片字符串列表
-
-    Returns:
-        list: 解码后的图片二进制数据列表
-    """
-    if not images_base64:
-        return []
-
-    images = []
-    for img_b64 in images_base64:
-        # 移除可能的 data URL 前缀（如 data:image/png;base64,）
-        if ',' in img_b64:
-            img_b64 = img_b64.split(',')[1]
-        images.append(base64.b64decode(img_b64))
-
-    return images
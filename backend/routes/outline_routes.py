@@ -6,10 +6,17 @@
 """
 
 import time
-import base64
 import logging
 from flask import Blueprint, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
 from backend.services.outline import get_outline_service
+from backend.utils.upload import (
+    UploadError,
+    check_image_count,
+    process_base64_images,
+    process_uploaded_files,
+    resolve_reference_ids,
+)
 from .utils import log_request, log_error
 
 logger = logging.getLogger(__name__)
@@ -28,10 +35,12 @@ def create_outline_blueprint():
         1. multipart/form-data（带图片文件）
            - topic: 主题文本
            - images: 图片文件列表
+           - image_ids: 已上传参考图的 ID（可重复）
 
         2. application/json（无图片或 base64 图片）
            - topic: 主题文本
            - images: base64 编码的图片数组（可选）
+           - image_ids: 已上传参考图的 ID 数组（可选，POST /api/references 返回）
 
         返回：
         - success: 是否成功
@@ -68,6 +77,16 @@ def create_outline_blueprint():
                 logger.error(f"❌ 大纲生成失败: {result.get('error', '未知错误')}")
                 return jsonify(result), 500
 
+        except UploadError as e:
+            logger.warning(f"大纲生成请求的参考图不合法: {e}")
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), e.status_code
+
+        except RequestEntityTooLarge:
+            raise
+
         except Exception as e:
             log_error('/outline', e)
             error_msg = str(e)
@@ -87,36 +106,33 @@ def _parse_outline_request():
     1. multipart/form-data - 用于文件上传
     2. application/json - 用于 base64 图片
 
+    图片不整体读入内存，解码时即缩小并压缩，只保留压缩后的参考图
+
     返回：
         tuple: (topic, images) - 主题和图片列表
+
+    异常：
+        UploadError: 图片超出大小/数量限制或无法识别
     """
     # 检查是否是 multipart/form-data（带图片文件）
     if request.content_type and 'multipart/form-data' in request.content_type:
         topic = request.form.get('topic')
-        images = []
+        images = resolve_reference_ids(request.form.getlist('image_ids'))
 
-        # 获取上传的图片文件
+        # 获取上传的图片文件（werkzeug 已写入临时文件）
         if 'images' in request.files:
-            files = request.files.getlist('images')
-            for file in files:
-                if file and file.filename:
-                    image_data = file.read()
-                    images.append(image_data)
+            images += process_uploaded_files(request.files.getlist('images'))
 
+        check_image_count(len(images))
         return topic, images
 
     # JSON 请求（无图片或 base64 图片）
     data = request.get_json()
     topic = data.get('topic')
-    images = []
 
-    # 支持 base64 格式的图片
-    images_base64 = data.get('images', [])
-    if images_base64:
-        for img_b64 in images_base64:
-            # 移除可能的 data URL 前缀
-            if ',' in img_b64:
-                img_b64 = img_b64.split(',')[1]
-            images.append(base64.b64decode(img_b64))
+    # 支持引用已上传的参考图和 base64 格式的图片
+    images = resolve_reference_ids(data.get('image_ids') or [])
+    images += process_base64_images(data.get('images') or [])
 
+    check_image_count(len(images))
     return topic, images
@@ -0,0 +1,95 @@
+"""
+参考图相关 API 路由
+
+包含功能：
+- 上传参考图，返回参考图 ID
+- 查询参考图是否存在
+
+上传一次后，/outline、/generate、/retry、/retry-failed、/regenerate 都可以通过 ID 引用参考图，
+不必在每次请求中重复携带 base64 图片。
+"""
+
+import logging
+from flask import Blueprint, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
+from backend.services.reference_store import get_reference_store
+from backend.utils.upload import UploadError, store_base64_images, store_uploaded_files
+from .utils import log_request, log_error
+
+logger = logging.getLogger(__name__)
+
+
+def create_reference_blueprint():
+    """创建参考图路由蓝图（工厂函数，支持多次调用）"""
+    reference_bp = Blueprint('reference', __name__)
+
+    @reference_bp.route('/references', methods=['POST'])
+    def upload_references():
+        """
+        上传参考图
+
+        请求格式：
+        1. multipart/form-data
+           - images: 图片文件列表
+        2. application/json
+           - images: base64 编码的图片数组
+
+        返回：
+        - success: 是否成功
+        - ids: 参考图 ID 列表（与上传顺序一致，重复的图片返回已有的 ID）
+        """
+        try:
+            if request.content_type and 'multipart/form-data' in request.content_type:
+                ref_ids = store_uploaded_files(request.files.getlist('images'))
+            else:
+                data = request.get_json(silent=True) or {}
+                ref_ids = store_base64_images(data.get('images') or [])
+
+            log_request('/references', {'count': len(ref_ids)})
+
+            if not ref_ids:
+                return jsonify({
+                    "success": False,
+                    "error": "参数错误：images 不能为空。\n请上传至少一张参考图。"
+                }), 400
+
+            logger.info(f"🖼️ 参考图上传完成: {len(ref_ids)} 张")
+            return jsonify({"success": True, "ids": ref_ids}), 200
+
+        except UploadError as e:
+            logger.warning(f"参考图上传不合法: {e}")
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), e.status_code
+
+        except RequestEntityTooLarge:
+            raise
+
+        except Exception as e:
+            log_error('/references', e)
+            return jsonify({
+                "success": False,
+                "error": f"参考图上传失败。\n错误详情: {str(e)}"
+            }), 500
+
+    @reference_bp.route('/references/<ref_id>', methods=['GET'])
+    def get_reference(ref_id):
+        """
+        查询参考图是否存在（客户端缓存的 ID 失效时需要重新上传）
+
+        返回：
+        - success: 是否存在
+        - id: 参考图 ID
+        - size: 参考图大小（字节）
+        """
+        info = get_reference_store().info(ref_id)
+        if info is None:
+            return jsonify({
+                "success": False,
+                "error": f"参考图不存在: {ref_id}"
+            }), 404
+
+        return jsonify({"success": True, **info}), 200
+
+    return reference_bp
@@ -0,0 +1,238 @@
+"""
+SSE 流式接口公共逻辑
+
+/api/generate 与 /api/retry-failed 的参数解析、后台任务提交、事件格式化和异常兜底事件，
+由 Flask 路由（同步流）和 ASGI 入口（异步流）共用，保证两种部署方式输出一致。
+"""
+
+import json
+import uuid
+import logging
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from backend.services.image import USER_IMAGE_MAX_KB
+from backend.services.jobs import Job, get_job_manager
+from backend.utils.async_runner import get_async_runner
+from backend.utils.upload import (
+    UploadError,
+    check_image_count,
+    process_base64_images,
+    resolve_reference_ids,
+)
+
+logger = logging.getLogger(__name__)
+
+# SSE 响应头
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',
+}
+
+
+def format_sse(event_type: str, data: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    """
+    格式化单个 SSE 事件
+
+    id 行放在 event/data 之后：前端按行解析时只读取前两行
+
+    Args:
+        event_type: 事件类型
+        data: 事件数据
+        event_id: 事件 ID（用于 Last-Event-ID 断线重连）
+
+    Returns:
+        SSE 文本块
+    """
+    text = f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n"
+    if event_id is not None:
+        text += f"id: {event_id}\n"
+    return text + "\n"
+
+
+def parse_generate_request(data: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    解析 /generate 请求体
+
+    Args:
+        data: JSON 请求体
+
+    Returns:
+        (生成参数, 错误信息)，参数错误时生成参数为 None
+    """
+    data = data or {}
+    pages = data.get('pages')
+
+    if not pages:
+        logger.warning("图片生成请求缺少 pages 参数")
+        return None, "参数错误：pages 不能为空。\n请提供要生成的页面列表数据。"
+
+    # 用户参考图：user_image_ids 引用已上传的参考图（POST /api/references），
+    # user_images 为 base64 格式（分块解码并压缩，不保留原图）
+    try:
+        user_images = resolve_reference_ids(data.get('user_image_ids') or [])
+        user_images += process_base64_images(data.get('user_images') or [])
+        check_image_count(len(user_images))
+    except UploadError as e:
+        return None, str(e)
+
+    return {
+        "pages": pages,
+        "task_id": data.get('task_id'),
+        "full_outline": data.get('full_outline', ''),
+        "user_images": user_images if user_images else None,
+        "user_topic": data.get('user_topic', ''),
+        "step": data.get('step', 'all'),  # 获取生成步骤参数
+        "style": data.get('style', '小红书爆款图文风格'),  # 获取风格参数
+        "provider": data.get('provider') or None,  # 指定图片服务商（可选）
+        "speculative": bool(data.get('speculative')),  # step=cover 时在等待确认期间推测生成内容页
+    }, None
+
+
+def parse_retry_failed_request(data: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    解析 /retry-failed 请求体
+
+    Args:
+        data: JSON 请求体
+
+    Returns:
+        (重试参数, 错误信息)，参数错误时重试参数为 None
+    """
+    data = data or {}
+    task_id = data.get('task_id')
+    pages = data.get('pages')
+
+    if not task_id or not pages:
+        logger.warning("批量重试请求缺少必要参数")
+        return None, "参数错误：task_id 和 pages 不能为空。\n请提供任务ID和要重试的页面列表。"
+
+    # 可选：引用已上传的参考图（任务状态过期后仍可带上用户参考图）
+    try:
+        user_images = resolve_reference_ids(data.get('user_image_ids') or [], USER_IMAGE_MAX_KB)
+    except UploadError as e:
+        return None, str(e)
+
+    return {
+        "task_id": task_id,
+        "pages": pages,
+        "provider": data.get('provider') or None,
+        "user_images": user_images or None,
+    }, None
+
+
+def check_provider(image_service, provider: Optional[str]) -> Optional[str]:
+    """
+    检查请求指定的图片服务商是否可用（会预先创建其生成器）
+
+    Args:
+        image_service: 图片生成服务
+        provider: 服务商名称，为空表示使用默认服务商
+
+    Returns:
+        错误信息，可用时返回 None
+    """
+    if not provider:
+        return None
+    try:
+        image_service.get_provider(provider)
+    except ValueError as e:
+        logger.warning(f"请求指定的图片服务商不可用: {provider}")
+        return f"参数错误：图片服务商 {provider} 不可用。\n{e}"
+    return None
+
+
+def generate_failure_events(params: Dict[str, Any], error: Exception) -> List[Dict[str, Any]]:
+    """生成流异常时的兜底事件（错误 + 完成，确保前端能正确关闭）"""
+    logger.error(f"SSE 生成过程中发生错误: {error}")
+    pages = params.get("pages")
+    return [
+        {"event": "error", "data": {
+            "index": -1,
+            "status": "error",
+            "message": str(error),
+            "retryable": True
+        }},
+        {"event": "finish", "data": {
+            "success": False,
+            "task_id": params.get("task_id"),
+            "images": [],
+            "total": len(pages) if pages else 0,
+            "completed": 0,
+            "failed": 1,
+            "failed_indices": [],
+            "error": str(error)
+        }},
+    ]
+
+
+def retry_failure_events(params: Dict[str, Any], error: Exception) -> List[Dict[str, Any]]:
+    """重试流异常时的兜底事件"""
+    logger.error(f"SSE 重试过程中发生错误: {error}")
+    pages = params.get("pages")
+    return [
+        {"event": "error", "data": {
+            "index": -1,
+            "status": "error",
+            "message": str(error),
+            "retryable": True
+        }},
+        {"event": "retry_finish", "data": {
+            "success": False,
+            "total": len(pages) if pages else 0,
+            "completed": 0,
+            "failed": 1
+        }},
+    ]
+
+
+def submit_generate_job(image_service, params: Dict[str, Any]) -> Job:
+    """提交图片生成后台任务"""
+    if not params.get("task_id"):
+        # 提前分配任务ID，便于断线后通过任务ID查询状态
+        params = {**params, "task_id": f"task_{uuid.uuid4().hex[:8]}"}
+
+    return get_job_manager().submit(
+        "generate",
+        image_service.agenerate_images(**params),
+        task_id=params["task_id"],
+        on_error=lambda e: generate_failure_events(params, e),
+        cancel_check=lambda: image_service.task_store.is_cancelled(params["task_id"])
+    )
+
+
+def submit_retry_failed_job(image_service, params: Dict[str, Any]) -> Job:
+    """提交批量重试后台任务"""
+    return get_job_manager().submit(
+        "retry_failed",
+        image_service.aretry_failed_images(**params),
+        task_id=params["task_id"],
+        on_error=lambda e: retry_failure_events(params, e),
+        cancel_check=lambda: image_service.task_store.is_cancelled(params["task_id"])
+    )
+
+
+def parse_last_event_id(value: Optional[str]) -> int:
+    """解析 Last-Event-ID（无效值按 0 处理，即从头补发）"""
+    try:
+        return max(0, int(value or 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def stream_job(job_id: str, last_event_id: int = 0) -> Iterator[str]:
+    """
+    订阅后台任务的 SSE 文本流（同步）
+
+    连接断开只会结束订阅，任务本身继续运行
+    """
+    for event in get_async_runner().iterate(get_job_manager().subscribe(job_id, last_event_id)):
+        yield format_sse(event["event"], event["data"], event["id"])
+
+
+async def astream_job(job_id: str, last_event_id: int = 0) -> AsyncIterator[str]:
+    """
+    订阅后台任务的 SSE 文本流（异步）
+
+    订阅运行在后台事件循环上，调用方所在的事件循环只负责转发事件
+    """
+    async for event in get_async_runner().aiterate(get_job_manager().subscribe(job_id, last_event_id)):
+        yield format_sse(event["event"], event["data"], event["id"])
@@ -4,6 +4,9 @@ import uuid
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from pathlib import Path
+from backend.services.manifest import get_manifest_store
+from backend.services.reference_store import get_reference_store
+from backend.services.task_store import get_task_state_store
 
 
 class HistoryService:
@@ -146,6 +149,9 @@ class HistoryService:
         # 删除任务图片目录
         if record.get("images") and record["images"].get("task_id"):
             task_id = record["images"]["task_id"]
+            # 释放任务状态（内存缓存或 SQLite 记录）和任务使用的参考图
+            get_task_state_store().delete(task_id)
+            get_reference_store().release(task_id)
             task_dir = os.path.join(self.history_dir, task_id)
             if os.path.exists(task_dir) and os.path.isdir(task_dir):
                 try:
@@ -241,23 +247,8 @@ class HistoryService:
             }
 
         try:
-            # 扫描目录下所有图片文件（排除缩略图）
-            image_files = []
-            for filename in os.listdir(task_dir):
-                # 跳过缩略图文件（以 thumb_ 开头）
-                if filename.startswith('thumb_'):
-                    continue
-                if filename.endswith('.png') or filename.endswith('.jpg') or filename.endswith('.jpeg'):
-                    image_files.append(filename)
-
-            # 按文件名排序（数字排序）
-            def get_index(filename):
-                try:
-                    return int(filename.split('.')[0])
-                except:
-                    return 999
-
-            image_files.sort(key=get_index)
+            # 从任务清单读取已完成的图片（按页码排序，写入中断的页面不计入）
+            image_files = [page["file"] for page in get_manifest_store().list_pages(task_dir)]
 
             # 查找关联的历史记录
             index = self._load_index()
@@ -342,8 +333,8 @@ class HistoryService:
             for item in os.listdir(self.history_dir):
                 item_path = os.path.join(self.history_dir, item)
 
-                # 只处理目录（任务文件夹）
-                if not os.path.isdir(item_path):
+                # 只处理目录（任务文件夹），跳过 .references 等内部目录
+                if not os.path.isdir(item_path) or item.startswith('.'):
                     continue
 
                 # 假设任务文件夹名就是 task_id
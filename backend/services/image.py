@@ -2,30 +2,186 @@
 import logging
 import os
 import uuid
-import time
+import asyncio
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Dict, Any, Generator, List, Optional, Tuple
+import time
+from typing import Dict, Any, AsyncGenerator, Generator, List, Optional, Tuple
 from backend.config import Config
-from backend.generators.factory import ImageGeneratorFactory
-from backend.utils.image_compressor import compress_image
+from backend.generators.registry import config_fingerprint, get_generator_registry
+from backend.generators.router import get_provider_router, is_provider_failure
+from backend.services.manifest import get_manifest_store
+from backend.services.reference_store import get_reference_store
+from backend.services.scheduler import PageTicket, PrioritySemaphore, current_page, get_page_scheduler, page_context
+from backend.services.task_store import TaskStateStore, get_task_state_store
+from backend.utils.async_runner import get_async_runner
+from backend.utils.deadline import (
+    DeadlineExceeded, can_retry, create_deadline, deadline_scope, remaining, run_within, start_deadlines
+)
+from backend.utils.image_executor import get_image_executor
 
 logger = logging.getLogger(__name__)
 
+# 用户参考图压缩后的大小上限（KB），降低每页生成请求的 token 消耗
+USER_IMAGE_MAX_KB = 30
+
+
+class TaskCancelledError(Exception):
+    """任务已被取消（获得并发名额时发现，请求未发出）"""
+
+
+class ProviderSlot:
+    """
+    单个服务商的运行时（生成器实例 + 并发信号量）
+
+    任务开始时解析出所用的 ProviderSlot 并一直持有，配置变更不影响正在运行的任务
+    """
+
+    def __init__(
+        self,
+        provider_name: str,
+        provider_config: Dict[str, Any],
+        default_max_concurrent: int,
+        previous: Optional["ProviderSlot"] = None
+    ):
+        """
+        Args:
+            provider_name: 服务商名称
+            provider_config: 服务商配置
+            default_max_concurrent: 未配置 max_concurrent 时的并发上限
+            previous: 配置变更前同一服务商的运行时；沿用它的信号量，
+                新旧运行时上的请求共用同一个并发上限，不会在切换期间叠加
+        """
+        self.provider_name = provider_name
+        self.provider_config = provider_config
+        self.generator = get_generator_registry().get(provider_name, provider_config)
+
+        # 检查是否启用短 prompt 模式
+        self.use_short_prompt = provider_config.get('short_prompt', False)
+
+        self.max_concurrent = int(
+            provider_config.get('max_concurrent', default_max_concurrent) or default_max_concurrent
+        )
+
+        # 并发信号量（首次在事件循环中使用时创建）
+        self._semaphore: Optional[PrioritySemaphore] = None
+        self._semaphore_loop = None
+        if previous is not None and previous._semaphore is not None and not previous._semaphore_loop.is_closed():
+            self._semaphore = previous._semaphore
+            self._semaphore_loop = previous._semaphore_loop
+            if previous.max_concurrent != self.max_concurrent:
+                # 信号量只能在所属事件循环中修改
+                self._semaphore_loop.call_soon_threadsafe(self._semaphore.resize, self.max_concurrent)
+
+        # 进行中的生成器调用数：运行时被移除（配置变化）后，调用全部结束时关闭生成器的连接
+        self._active_calls = 0
+        self._retired = False
+        self._usage_lock = threading.Lock()
+
+    def get_semaphore(self) -> PrioritySemaphore:
+        """
+        获取并发信号量（限制该服务商同时进行的上游请求数，等待中的请求按页面优先级放行）
+
+        信号量绑定事件循环，切换事件循环时重新创建
+        """
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = PrioritySemaphore(self.max_concurrent)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def begin_call(self) -> None:
+        """记录一次进行中的生成器调用"""
+        with self._usage_lock:
+            self._active_calls += 1
+
+    def end_call(self) -> None:
+        """调用结束；运行时已被移除且没有其他进行中的调用时关闭生成器的连接"""
+        with self._usage_lock:
+            self._active_calls -= 1
+            drained = self._retired and self._active_calls == 0
+        if drained:
+            self._close_generator()
+
+    def retire(self) -> None:
+        """标记运行时已被移除；没有进行中的调用时立即关闭生成器的连接，否则等最后一个调用结束"""
+        with self._usage_lock:
+            self._retired = True
+            drained = self._active_calls == 0
+        if drained:
+            self._close_generator()
+
+    def _close_generator(self) -> None:
+        """在后台事件循环中关闭生成器（之后仍有任务使用时会重新创建连接）"""
+        def log_error(future):
+            if not future.cancelled() and future.exception() is not None:
+                logger.warning(f"关闭服务商 {self.provider_name} 的连接失败: {future.exception()}")
+
+        logger.debug(f"关闭已淘汰的生成器连接: {self.provider_name}")
+        get_async_runner().submit(self.generator.aclose()).add_done_callback(log_error)
+
+
+class Speculation:
+    """
+    推测生成的内容页
+
+    分步模式下封面生成后、用户确认前，用刚生成的封面作为参考在后台提前生成前几页内容。
+    生成结果只保存在内存暂存区，用户确认封面时才写入任务目录；
+    封面被重绘、重新生成或超时未确认时丢弃，尚未完成的请求被取消。
+    """
+
+    def __init__(self, task_id: str, cover_image: Optional[bytes], groups: List[List[Dict]]):
+        self.task_id = task_id
+        self.cover_image = cover_image
+        self.groups = groups
+        # 页面索引 -> 图片数据
+        self.staging: Dict[int, bytes] = {}
+        # 每组页面的生成任务（与 groups 一一对应）
+        self.tasks: List[asyncio.Task] = []
+        self.expiry: Optional[asyncio.TimerHandle] = None
+
+    def cancel(self, tasks: Optional[List[asyncio.Task]] = None) -> int:
+        """
+        取消生成任务并清除其暂存结果
+
+        Args:
+            tasks: 要取消的任务，默认全部
+
+        Returns:
+            丢弃的已生成页数
+        """
+        discarded = 0
+        for group, task in zip(self.groups, self.tasks):
+            if tasks is not None and task not in tasks:
+                continue
+            task.cancel()
+            for page in group:
+                if self.staging.pop(page["index"], None) is not None:
+                    discarded += 1
+        return discarded
+
 
 class ImageService:
     """图片生成服务类"""
 
     # 并发配置
-    MAX_CONCURRENT = 15  # 最大并发数
+    MAX_CONCURRENT = 15  # 默认最大并发数（可通过服务商配置 max_concurrent 覆盖）
     AUTO_RETRY_COUNT = 3  # 自动重试次数
+    HEDGE_BUDGET = 0.05  # 默认对冲预算：对冲请求最多占正常请求的 5%（可通过服务商配置 hedge_budget 覆盖）
+    CANCELLED_ERROR = "任务已取消"
 
-    def __init__(self, provider_name: str = None):
+    def __init__(
+        self,
+        provider_name: str = None,
+        task_store: TaskStateStore = None,
+        previous: Optional["ImageService"] = None
+    ):
         """
         初始化图片生成服务
 
         Args:
-            provider_name: 服务商名称，如果为None则使用配置文件中的激活服务商
+            provider_name: 默认服务商名称，如果为None则使用配置文件中的激活服务商
+            task_store: 任务状态存储，如果为None则使用全局存储（由 TASK_STATE_STORE 配置）
+            previous: 被替换的服务实例（切换激活服务商时），沿用它的服务商运行时（含并发信号量）和推测生成
         """
         logger.debug("初始化 ImageService...")
 
@@ -34,19 +190,27 @@ class ImageService:
             provider_name = Config.get_active_image_provider()
 
         logger.info(f"使用图片服务商: {provider_name}")
-        provider_config = Config.get_image_provider_config(provider_name)
 
-        # 创建生成器实例
+        # 各服务商的运行时（按需创建并缓存，请求可通过 provider 字段指定服务商）
+        self._providers: Dict[str, ProviderSlot] = {}
+        # 配置变化后被移除的运行时：重建同一服务商时沿用其信号量
+        self._retired: Dict[str, ProviderSlot] = {}
+        self._providers_lock = threading.Lock()
+        if previous is not None:
+            with previous._providers_lock:
+                self._providers.update(previous._providers)
+                self._retired.update(previous._retired)
+
+        # 默认服务商立即创建，配置错误时尽早暴露
+        self.provider_name = provider_name
+        default_provider = self.get_provider(provider_name)
+        provider_config = default_provider.provider_config
         provider_type = provider_config.get('type', provider_name)
-        logger.debug(f"创建生成器: type={provider_type}")
-        self.generator = ImageGeneratorFactory.create(provider_type, provider_config)
 
-        # 保存配置信息
-        self.provider_name = provider_name
+        # 保存默认服务商信息
         self.provider_config = provider_config
-
-        # 检查是否启用短 prompt 模式
-        self.use_short_prompt = provider_config.get('short_prompt', False)
+        self.generator = default_provider.generator
+        self.use_short_prompt = default_provider.use_short_prompt
 
         # 加载提示词模板
         self.prompt_template = self._load_prompt_template()
@@ -59,11 +223,12 @@ class ImageService:
         )
         os.makedirs(self.history_root_dir, exist_ok=True)
 
-        # 当前任务的输出目录（每个任务一个子文件夹）
-        self.current_task_dir = None
+        # 任务状态存储（用于重试，多 worker 部署时可共享）
+        self.task_store = task_store if task_store is not None else get_task_state_store()
 
-        # 存储任务状态（用于重试）
-        self._task_states: Dict[str, Dict] = {}
+        # 等待封面确认的推测生成（任务ID -> Speculation，只在后台事件循环中访问）
+        # 替换服务实例时共用同一个字典，切换服务商前开始的推测生成仍可被接管
+        self._speculations: Dict[str, Speculation] = previous._speculations if previous is not None else {}
 
         logger.info(f"ImageService 初始化完成: provider={provider_name}, type={provider_type}")
 
@@ -83,160 +248,839 @@ class ImageService:
 
     def get_task_status(self, task_id: str) -> Optional[Dict[str, Any]]:
         """获取任务当前状态"""
-        return self._task_states.get(task_id)
+        return self.task_store.get(task_id)
+
+    def _get_task_dir(self, task_id: str) -> str:
+        """获取任务目录（不存在则创建）"""
+        task_dir = os.path.join(self.history_root_dir, task_id)
+        os.makedirs(task_dir, exist_ok=True)
+        return task_dir
+
+    def get_provider(self, provider_name: str = None) -> ProviderSlot:
+        """
+        获取服务商运行时（首次使用时创建，之后复用生成器和连接）
+
+        Args:
+            provider_name: 服务商名称，为 None 时使用默认服务商
+
+        Returns:
+            ProviderSlot 实例
+
+        Raises:
+            ValueError: 服务商不存在或配置无效
+        """
+        if provider_name is None:
+            provider_name = self.provider_name
+
+        with self._providers_lock:
+            slot = self._providers.get(provider_name)
+            if slot is None:
+                provider_config = Config.get_image_provider_config(provider_name)
+                slot = ProviderSlot(
+                    provider_name, provider_config, self.MAX_CONCURRENT,
+                    previous=self._retired.pop(provider_name, None)
+                )
+                self._providers[provider_name] = slot
+                logger.debug(f"图片服务商已就绪: {provider_name}")
+            return slot
+
+    def _route_provider(self, provider: ProviderSlot) -> Optional[ProviderSlot]:
+        """
+        选择实际发送请求的服务商
 
-    def _save_image(self, image_data: bytes, filename: str, task_dir: str = None) -> str:
+        服务商熔断时改用其配置的备用服务商（fallback_provider）
+
+        Args:
+            provider: 任务使用的服务商运行时
+
+        Returns:
+            可用的服务商运行时；熔断且没有可用的备用服务商时返回 None
+        """
+        router = get_provider_router()
+        if router.allow_request(provider.provider_name):
+            return provider
+
+        fallback_name = provider.provider_config.get('fallback_provider')
+        if not fallback_name or fallback_name == provider.provider_name:
+            return None
+
+        try:
+            fallback = self.get_provider(fallback_name)
+        except ValueError as e:
+            logger.error(f"备用服务商 {fallback_name} 不可用: {e}")
+            return None
+
+        if not router.allow_request(fallback_name):
+            return None
+
+        logger.info(f"↪️  服务商 {provider.provider_name} 熔断中，转发到备用服务商 {fallback_name}")
+        return fallback
+
+    async def _acall_provider(
+        self,
+        provider: ProviderSlot,
+        method,
+        *args,
+        started: Optional[asyncio.Event] = None,
+        **kwargs
+    ):
+        """
+        调用生成器并记录延迟和成败（用于熔断判定）
+
+        延迟从获得信号量开始计算，不包含排队时间。
+        获得信号量时开始计时尚未开始的截止时间（单页截止时间），调用时长不超过剩余时间，
+        超时后中止调用并抛出 DeadlineExceeded
+
+        Args:
+            provider: 服务商运行时
+            method: 生成器的异步方法
+            *args, **kwargs: 方法参数
+            started: 获得信号量、请求真正发出时置位的事件（可选）
+
+        Returns:
+            方法返回值
+
+        Raises:
+            DeadlineExceeded: 排队期间或调用过程中超过截止时间
+            TaskCancelledError: 排队期间任务被取消
+        """
+        router = get_provider_router()
+        latency_threshold = provider.provider_config.get('latency_threshold')
+        async with provider.get_semaphore():
+            # 排队期间任务可能已被取消（取消请求可能落到其他 worker），此时不再发出请求
+            ticket = current_page()
+            if ticket is not None and not ticket.speculative and self.task_store.is_cancelled(ticket.task_id):
+                raise TaskCancelledError(self.CANCELLED_ERROR)
+            start_deadlines()
+            timeout = remaining()
+            if timeout is not None and timeout <= 0:
+                # 排队期间已超过截止时间，不再发出请求
+                raise DeadlineExceeded()
+            if started is not None:
+                started.set()
+            started_at = time.monotonic()
+            provider.begin_call()
+            try:
+                if timeout is None:
+                    result = await method(*args, **kwargs)
+                else:
+                    try:
+                        result = await asyncio.wait_for(method(*args, **kwargs), timeout)
+                    except asyncio.TimeoutError as e:
+                        # 生成器自身抛出的超时（截止时间未到）按原样抛出
+                        if isinstance(e, DeadlineExceeded) or remaining() > 0:
+                            raise
+                        raise DeadlineExceeded() from e
+            except Exception as e:
+                if is_provider_failure(e):
+                    router.record(provider.provider_name, time.monotonic() - started_at, False, latency_threshold)
+                else:
+                    # 安全过滤、截止时间等与服务商健康度无关的失败不计入熔断统计
+                    router.release_probe(provider.provider_name)
+                raise
+            finally:
+                provider.end_call()
+        router.record(provider.provider_name, time.monotonic() - started_at, True, latency_threshold)
+        return result
+
+    def _hedge_target(self, provider: ProviderSlot) -> ProviderSlot:
+        """对冲请求的目标服务商：优先使用可用的备用服务商，否则为同一服务商"""
+        fallback_name = provider.provider_config.get('fallback_provider')
+        if fallback_name and fallback_name != provider.provider_name:
+            try:
+                fallback = self.get_provider(fallback_name)
+            except ValueError:
+                return provider
+            # 只读查询：对冲不占用备用服务商半开状态的探测名额，只发往正常放行的备用服务商
+            if get_provider_router().is_closed(fallback_name):
+                return fallback
+        return provider
+
+    async def _agenerate_image_hedged(
+        self,
+        provider: ProviderSlot,
+        page: Dict,
+        full_outline: str = "",
+        user_topic: str = "",
+        style: str = "小红书爆款图文风格",
+        custom_prompt: str = "",
+        reference_image: Optional[bytes] = None,
+        user_images: Optional[List[bytes]] = None
+    ) -> bytes:
+        """
+        调用生成器生成单张图片，按需发起对冲请求
+
+        服务商配置了 hedge_percentile（如 0.95）时启用：请求发出后耗时超过该服务商近期延迟的对应分位数，
+        且对冲预算（hedge_budget）未用完，则再发起一个请求（备用服务商或同一服务商），
+        先成功的结果生效，另一个请求被取消（已在线程中执行的同步调用无法中断，结果直接丢弃）
+
+        Args:
+            provider: 服务商运行时
+            page: 页面数据
+            full_outline: 完整的大纲文本
+            user_topic: 用户原始输入
+            style: 风格
+            custom_prompt: 用户自定义修改指令
+            reference_image: 参考图片（封面图）
+            user_images: 用户上传的参考图片列表
+
+        Returns:
+            图片二进制数据
+        """
+        def call(slot: ProviderSlot, started: Optional[asyncio.Event] = None):
+            return self._acall_provider(
+                slot,
+                slot.generator.agenerate_image,
+                prompt=self._build_prompt(slot, page, full_outline, user_topic, style, custom_prompt),
+                started=started,
+                **self._build_generate_kwargs(slot, reference_image, user_images)
+            )
+
+        router = get_provider_router()
+        hedge_percentile = provider.provider_config.get('hedge_percentile')
+        hedge_delay = router.latency_percentile(provider.provider_name, float(hedge_percentile)) if hedge_percentile else None
+        if hedge_delay is None:
+            return await call(provider)
+
+        started = asyncio.Event()
+        primary = asyncio.ensure_future(call(provider, started))
+        tasks = [primary]
+        try:
+            # 等待请求真正发出（信号量排队时间不计入对冲等待）
+            started_waiter = asyncio.ensure_future(started.wait())
+            tasks.append(started_waiter)
+            await asyncio.wait({primary, started_waiter}, return_when=asyncio.FIRST_COMPLETED)
+            if not primary.done():
+                await asyncio.wait({primary}, timeout=hedge_delay)
+            if primary.done():
+                return primary.result()
+
+            budget = float(provider.provider_config.get('hedge_budget', self.HEDGE_BUDGET))
+            if not router.try_acquire_hedge(provider.provider_name, budget):
+                logger.debug(f"图片 [{page['index']}] 超过 p{int(float(hedge_percentile) * 100)} 延迟，但对冲预算已用完")
+                return await primary
+
+            target = self._hedge_target(provider)
+            logger.info(
+                f"⏱️  图片 [{page['index']}] 已等待 {hedge_delay:.1f}s"
+                f"（{provider.provider_name} 的 p{int(float(hedge_percentile) * 100)} 延迟），"
+                f"向 {target.provider_name} 发起对冲请求"
+            )
+            hedge = asyncio.ensure_future(call(target))
+            tasks.append(hedge)
+
+            # 先成功的结果生效；两个都失败时抛出主请求的异常
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            logger.info(f"✅ 图片 [{page['index']}] 对冲请求先返回")
+                        return task.result()
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def drop_providers(self, provider_names: List[str]) -> None:
+        """
+        移除服务商运行时（配置变化后调用，下次使用时按新配置重建）
+
+        正在运行的任务已持有旧的运行时，不受影响；重建的运行时沿用旧运行时的信号量。
+        旧运行时上的调用全部结束后关闭其生成器的连接（HTTP 连接池、genai.Client）
+        """
+        retired = []
+        with self._providers_lock:
+            for provider_name in provider_names:
+                slot = self._providers.pop(provider_name, None)
+                if slot is not None:
+                    self._retired[provider_name] = slot
+                    retired.append(slot)
+        for slot in retired:
+            slot.retire()
+
+    def _save_image(self, image_data: bytes, index: int, filename: str, task_dir: str) -> str:
         """
         保存图片到本地，同时生成缩略图
 
+        原图和缩略图均为原子写入，并记录到任务清单（manifest.json）
+
         Args:
             image_data: 图片二进制数据
+            index: 页面索引
             filename: 文件名
-            task_dir: 任务目录（如果为None则使用当前任务目录）
+            task_dir: 任务目录
 
         Returns:
             保存的文件路径
         """
-        if task_dir is None:
-            task_dir = self.current_task_dir
-
         if task_dir is None:
             raise ValueError("任务目录未设置")
 
-        # 保存原图
-        filepath = os.path.join(task_dir, filename)
-        with open(filepath, "wb") as f:
-            f.write(image_data)
+        # 生成缩略图（50KB左右，在图片处理进程池中压缩）
+        thumbnail_data = get_image_executor().compress(image_data, max_size_kb=50)
+
+        get_manifest_store().write_page(task_dir, index, filename, image_data, thumbnail_data)
+        return os.path.join(task_dir, filename)
+
+    async def _astore_image(
+        self,
+        image_data: bytes,
+        index: int,
+        filename: str,
+        task_dir: str,
+        staging: Optional[Dict[int, bytes]] = None
+    ) -> None:
+        """保存生成的图片（写盘和缩略图压缩放到线程中，避免阻塞事件循环），提供暂存区时只放入暂存区"""
+        if staging is not None:
+            staging[index] = image_data
+            return
+        await asyncio.to_thread(self._save_image, image_data, index, filename, task_dir)
+
+    def _is_cancelled(self, task_id: str, staging: Optional[Dict[int, bytes]] = None) -> bool:
+        """
+        任务是否已被取消（读取共享的任务状态存储，其他 worker 收到的取消请求同样生效）
 
-        # 生成缩略图（50KB左右）
-        thumbnail_data = compress_image(image_data, max_size_kb=50)
-        thumbnail_filename = f"thumb_{filename}"
-        thumbnail_path = os.path.join(task_dir, thumbnail_filename)
-        with open(thumbnail_path, "wb") as f:
-            f.write(thumbnail_data)
+        推测生成的页面不检查（由 _discard_speculation 取消）
+        """
+        return staging is None and self.task_store.is_cancelled(task_id)
 
-        return filepath
+    def _load_compressed_cover(self, cover_path: str) -> Optional[bytes]:
+        """读取封面图并压缩到 30KB（降低token消耗），文件不存在时返回 None"""
+        if not os.path.exists(cover_path):
+            return None
+        with open(cover_path, "rb") as f:
+            return get_image_executor().compress(f.read(), max_size_kb=30)
 
-    def _generate_single_image(
+    async def _agenerate_single_image(
         self,
+        provider: ProviderSlot,
         page: Dict,
         task_id: str,
         reference_image: Optional[bytes] = None,
-        retry_count: int = 0,
         full_outline: str = "",
         user_images: Optional[List[bytes]] = None,
         user_topic: str = "",
         style: str = "小红书爆款图文风格",
-        custom_prompt: str = "" # 新增
+        custom_prompt: str = "",
+        staging: Optional[Dict[int, bytes]] = None
     ) -> Tuple[int, bool, Optional[str], Optional[str]]:
         """
         生成单张图片（带自动重试）
 
+        所有尝试共享单页截止时间（Config.PAGE_DEADLINE，从第一次获得并发名额时开始计时），
+        剩余时间不足以再尝试一次时跳过剩余重试
+
         Args:
+            provider: 服务商运行时
             page: 页面数据
             task_id: 任务ID
             reference_image: 参考图片（封面图）
-            retry_count: 当前重试次数
             full_outline: 完整的大纲文本
             user_images: 用户上传的参考图片列表
             user_topic: 用户原始输入
+            style: 风格
+            custom_prompt: 用户自定义修改指令
+            staging: 暂存区（可选），提供时图片数据按页面索引放入暂存区而不保存到任务目录
 
         Returns:
             (index, success, filename, error_message)
         """
         index = page["index"]
         page_type = page["type"]
+        task_dir = self._get_task_dir(task_id)
+
+        with deadline_scope(Config.PAGE_DEADLINE, "单页截止时间", started=False):
+            max_retries = self.AUTO_RETRY_COUNT
+            error_msg = None
+
+            for attempt in range(max_retries):
+                # 每次尝试前检查任务是否已被取消（取消请求可能落到其他 worker）
+                if self._is_cancelled(task_id, staging):
+                    logger.info(f"🛑 图片 [{index}] 跳过：任务已取消")
+                    return (index, False, None, self.CANCELLED_ERROR)
+
+                # 每次尝试前重新路由：服务商熔断后剩余的重试转发给备用服务商
+                target = self._route_provider(provider)
+                if target is None:
+                    logger.warning(f"图片 [{index}] 跳过剩余重试：服务商 {provider.provider_name} 熔断中且没有可用的备用服务商")
+                    return (index, False, None, (
+                        f"图片服务商 {provider.provider_name} 暂时不可用（连续失败已熔断）\n"
+                        + (f"最近错误: {error_msg}\n" if error_msg else "")
+                        + "解决方案：稍后重试，或在 image_providers.yaml 中为该服务商配置 fallback_provider"
+                    ))
+
+                try:
+                    logger.debug(f"生成图片 [{index}]: type={page_type}, provider={target.provider_name}, attempt={attempt + 1}/{max_retries}")
+
+                    # 调用生成器生成图片（信号量限制同时在途的上游请求数并按页面优先级排队，慢请求按配置发起对冲）
+                    with page_context(task_id, index, speculative=staging is not None):
+                        image_data = await self._agenerate_image_hedged(
+                            target, page, full_outline, user_topic, style, custom_prompt,
+                            reference_image, user_images
+                        )
+
+                    # 请求进行中任务被取消：不再记录结果，避免覆盖取消时记下的失败状态
+                    if self._is_cancelled(task_id, staging):
+                        logger.info(f"🛑 图片 [{index}] 生成完成时任务已取消，丢弃结果")
+                        return (index, False, None, self.CANCELLED_ERROR)
+
+                    filename = f"{index}.png"
+                    await self._astore_image(image_data, index, filename, task_dir, staging)
+                    logger.info(f"✅ 图片 [{index}] 生成成功: {filename}")
+
+                    return (index, True, filename, None)
+
+                except TaskCancelledError:
+                    logger.info(f"🛑 图片 [{index}] 跳过：任务已取消")
+                    return (index, False, None, self.CANCELLED_ERROR)
+
+                except Exception as e:
+                    error_msg = str(e)
+                    logger.warning(f"图片 [{index}] 生成失败 (尝试 {attempt + 1}/{max_retries}): {error_msg[:200]}")
+
+                    if isinstance(e, DeadlineExceeded):
+                        logger.error(f"❌ 图片 [{index}] 生成失败，已超过截止时间")
+                        return (index, False, None, error_msg)
+
+                    if attempt < max_retries - 1:
+                        # 等待后重试（剩余时间不足以再尝试一次时直接失败，不再占用并发名额）
+                        wait_time = 2 ** attempt
+                        if not can_retry(wait_time):
+                            return (index, False, None, f"{error_msg}\n{DeadlineExceeded()}")
+                        logger.debug(f"  等待 {wait_time} 秒后重试...")
+                        await asyncio.sleep(wait_time)
+                        continue
+
+                    logger.error(f"❌ 图片 [{index}] 生成失败，已达最大重试次数")
+                    return (index, False, None, error_msg)
+
+            return (index, False, None, "超过最大重试次数")
+
+    def _build_prompt(
+        self,
+        provider: ProviderSlot,
+        page: Dict,
+        full_outline: str = "",
+        user_topic: str = "",
+        style: str = "小红书爆款图文风格",
+        custom_prompt: str = ""
+    ) -> str:
+        """
+        构建单个页面的图片生成提示词
+
+        Args:
+            provider: 服务商运行时
+            page: 页面数据
+            full_outline: 完整的大纲文本
+            user_topic: 用户原始输入
+            style: 风格
+            custom_prompt: 用户自定义修改指令
+
+        Returns:
+            提示词
+        """
+        page_type = page["type"]
         page_content = page["content"]
 
-        max_retries = self.AUTO_RETRY_COUNT
+        # 根据配置选择模板（短 prompt 或完整 prompt）
+        if provider.use_short_prompt and self.prompt_template_short:
+            # 短 prompt 模式：只包含页面类型和内容
+            prompt = self.prompt_template_short.format(
+                page_content=page_content,
+                page_type=page_type
+            )
+            logger.debug(f"  使用短 prompt 模式 ({len(prompt)} 字符)")
+            return prompt
+
+        # 完整 prompt 模式：包含大纲和用户需求
+        base_prompt = self.prompt_template.format(
+            page_content=page_content,
+            page_type=page_type,
+            full_outline=full_outline,
+            user_topic=user_topic if user_topic else "未提供",
+            style=style
+        )
+
+        # 如果有自定义提示词，追加到 Prompt 末尾
+        if custom_prompt:
+            logger.info(f"  使用自定义修改指令: {custom_prompt}")
+            return f"{base_prompt}\n\n【用户修改指令/由于是重绘，请严格遵守以下指令】\n{custom_prompt}"
+
+        return base_prompt
+
+    def _build_generate_kwargs(
+        self,
+        provider: ProviderSlot,
+        reference_image: Optional[bytes] = None,
+        user_images: Optional[List[bytes]] = None
+    ) -> Dict[str, Any]:
+        """
+        根据服务商类型构建生成器调用参数（不含 prompt）
+
+        Args:
+            provider: 服务商运行时
+            reference_image: 参考图片（封面图）
+            user_images: 用户上传的参考图片列表
+
+        Returns:
+            传给 generate_image / generate_images_batch 的关键字参数
+        """
+        provider_config = provider.provider_config
+
+        if provider_config.get('type') == 'google_genai':
+            logger.debug(f"  使用 Google GenAI 生成器")
+            return {
+                "aspect_ratio": provider_config.get('default_aspect_ratio', '3:4'),
+                "temperature": provider_config.get('temperature', 1.0),
+                "model": provider_config.get('model', 'gemini-3-pro-image-preview'),
+                "reference_image": reference_image,
+            }
+
+        if provider_config.get('type') == 'image_api':
+            logger.debug(f"  使用 Image API 生成器")
+            # Image API 支持多张参考图片
+            # 组合参考图片：用户上传的图片 + 封面图
+            reference_images = []
+            if user_images:
+                reference_images.extend(user_images)
+            if reference_image:
+                reference_images.append(reference_image)
+
+            return {
+                "aspect_ratio": provider_config.get('default_aspect_ratio', '3:4'),
+                "temperature": provider_config.get('temperature', 1.0),
+                "model": provider_config.get('model', 'nano-banana-2'),
+                "reference_images": reference_images if reference_images else None,
+            }
+
+        logger.debug(f"  使用 OpenAI 兼容生成器")
+        return {
+            "size": provider_config.get('default_size', '1024x1024'),
+            "model": provider_config.get('model'),
+            "quality": provider_config.get('quality', 'standard'),
+        }
+
+    def _group_pages(self, provider: ProviderSlot, pages: List[Dict]) -> List[List[Dict]]:
+        """
+        按生成器的批量大小将页面分组
+
+        生成器不支持批量时每组只有一个页面
+
+        Args:
+            provider: 服务商运行时
+            pages: 页面列表
+
+        Returns:
+            页面分组列表
+        """
+        batch_size = provider.generator.get_batch_size()
+        return [pages[i:i + batch_size] for i in range(0, len(pages), batch_size)]
+
+    async def _agenerate_page_group(
+        self,
+        provider: ProviderSlot,
+        pages: List[Dict],
+        task_id: str,
+        reference_image: Optional[bytes] = None,
+        full_outline: str = "",
+        user_images: Optional[List[bytes]] = None,
+        user_topic: str = "",
+        style: str = "小红书爆款图文风格",
+        staging: Optional[Dict[int, bytes]] = None
+    ) -> List[Tuple[int, bool, Optional[str], Optional[str]]]:
+        """
+        生成一组页面的图片
+
+        多个页面时通过生成器的批量接口合并为一次上游调用，
+        批量调用失败则回退为逐页生成（逐页生成带自动重试）
 
-        for attempt in range(max_retries):
+        Args:
+            provider: 服务商运行时
+            pages: 同一任务的页面列表
+            task_id: 任务ID
+            reference_image: 参考图片（封面图）
+            full_outline: 完整的大纲文本
+            user_images: 用户上传的参考图片列表
+            user_topic: 用户原始输入
+            style: 风格
+            staging: 暂存区（可选），提供时图片不保存到任务目录
+
+        Returns:
+            [(index, success, filename, error_message), ...]，顺序与 pages 一致
+        """
+        if self._is_cancelled(task_id, staging):
+            return [(page["index"], False, None, self.CANCELLED_ERROR) for page in pages]
+
+        target = self._route_provider(provider) if len(pages) > 1 else None
+        if target is not None:
             try:
-                logger.debug(f"生成图片 [{index}]: type={page_type}, attempt={attempt + 1}/{max_retries}")
-
-                # 根据配置选择模板（短 prompt 或完整 prompt）
-                if self.use_short_prompt and self.prompt_template_short:
-                    # 短 prompt 模式：只包含页面类型和内容
-                    prompt = self.prompt_template_short.format(
-                        page_content=page_content,
-                        page_type=page_type
-                    )
-                    logger.debug(f"  使用短 prompt 模式 ({len(prompt)} 字符)")
-                else:
-                    # 完整 prompt 模式：包含大纲和用户需求
-                    base_prompt = self.prompt_template.format(
-                        page_content=page_content,
-                        page_type=page_type,
-                        full_outline=full_outline,
-                        user_topic=user_topic if user_topic else "未提供",
-                        style=style
-                    )
-                    
-                    # 如果有自定义提示词，追加到 Prompt 末尾
-                    if custom_prompt:
-                        prompt = f"{base_prompt}\n\n【用户修改指令/由于是重绘，请严格遵守以下指令】\n{custom_prompt}"
-                        logger.info(f"  使用自定义修改指令: {custom_prompt}")
-                    else:
-                        prompt = base_prompt
-
-                # 调用生成器生成图片
-                if self.provider_config.get('type') == 'google_genai':
-                    logger.debug(f"  使用 Google GenAI 生成器")
-                    image_data = self.generator.generate_image(
-                        prompt=prompt,
-                        aspect_ratio=self.provider_config.get('default_aspect_ratio', '3:4'),
-                        temperature=self.provider_config.get('temperature', 1.0),
-                        model=self.provider_config.get('model', 'gemini-3-pro-image-preview'),
-                        reference_image=reference_image,
-                    )
-                elif self.provider_config.get('type') == 'image_api':
-                    logger.debug(f"  使用 Image API 生成器")
-                    # Image API 支持多张参考图片
-                    # 组合参考图片：用户上传的图片 + 封面图
-                    reference_images = []
-                    if user_images:
-                        reference_images.extend(user_images)
-                    if reference_image:
-                        reference_images.append(reference_image)
-
-                    image_data = self.generator.generate_image(
-                        prompt=prompt,
-                        aspect_ratio=self.provider_config.get('default_aspect_ratio', '3:4'),
-                        temperature=self.provider_config.get('temperature', 1.0),
-                        model=self.provider_config.get('model', 'nano-banana-2'),
-                        reference_images=reference_images if reference_images else None,
-                    )
-                else:
-                    logger.debug(f"  使用 OpenAI 兼容生成器")
-                    image_data = self.generator.generate_image(
-                        prompt=prompt,
-                        size=self.provider_config.get('default_size', '1024x1024'),
-                        model=self.provider_config.get('model'),
-                        quality=self.provider_config.get('quality', 'standard'),
+                logger.debug(f"批量生成图片: {[page['index'] for page in pages]}, provider={target.provider_name}")
+                task_dir = self._get_task_dir(task_id)
+                prompts = [
+                    self._build_prompt(target, page, full_outline, user_topic, style)
+                    for page in pages
+                ]
+                # 整组按组内最靠前的页面排队，批量请求同样受单页截止时间限制（失败后逐页生成重新计时）
+                with page_context(task_id, min(page["index"] for page in pages), speculative=staging is not None), \
+                        deadline_scope(Config.PAGE_DEADLINE, "单页截止时间", started=False):
+                    images = await self._acall_provider(
+                        target,
+                        target.generator.agenerate_images_batch,
+                        prompts,
+                        **self._build_generate_kwargs(target, reference_image, user_images)
                     )
 
-                # 保存图片（使用当前任务目录）
-                filename = f"{index}.png"
-                self._save_image(image_data, filename, self.current_task_dir)
-                logger.info(f"✅ 图片 [{index}] 生成成功: {filename}")
+                if self._is_cancelled(task_id, staging):
+                    logger.info(f"🛑 批量生成完成时任务已取消，丢弃结果: {[page['index'] for page in pages]}")
+                    return [(page["index"], False, None, self.CANCELLED_ERROR) for page in pages]
+
+                if len(images) != len(pages):
+                    # 生成器未校验返回数量时，避免按位置错配或静默丢失页面
+                    raise ValueError(f"批量生成返回 {len(images)} 张图片，期望 {len(pages)} 张")
 
-                return (index, True, filename, None)
+                results = []
+                for page, image_data in zip(pages, images):
+                    filename = f"{page['index']}.png"
+                    await self._astore_image(image_data, page["index"], filename, task_dir, staging)
+                    logger.info(f"✅ 图片 [{page['index']}] 生成成功: {filename}")
+                    results.append((page["index"], True, filename, None))
+                return results
 
             except Exception as e:
-                error_msg = str(e)
-                logger.warning(f"图片 [{index}] 生成失败 (尝试 {attempt + 1}/{max_retries}): {error_msg[:200]}")
-
-                if attempt < max_retries - 1:
-                    # 等待后重试
-                    wait_time = 2 ** attempt
-                    logger.debug(f"  等待 {wait_time} 秒后重试...")
-                    time.sleep(wait_time)
-                    continue
+                logger.warning(f"批量生成失败，回退为逐页生成: {str(e)[:200]}")
+
+        return [
+            await self._agenerate_single_image(
+                provider, page, task_id, reference_image, full_outline,
+                user_images, user_topic, style, staging=staging
+            )
+            for page in pages
+        ]
+
+    def _content_result_events(
+        self,
+        task_id: str,
+        group: List[Dict],
+        results: List[Tuple[int, bool, Optional[str], Optional[str]]],
+        failed_pages: List[Dict]
+    ) -> List[Dict[str, Any]]:
+        """
+        记录一组内容页的生成结果并构建对应的 SSE 事件
+
+        Args:
+            task_id: 任务ID
+            group: 页面分组
+            results: 该组的生成结果
+            failed_pages: 失败页面列表（原地追加）
+
+        Returns:
+            事件列表
+        """
+        events = []
+        for page, (index, success, filename, error) in zip(group, results):
+            if success:
+                self.task_store.set_generated(task_id, index, filename)
+                # 之前失败或被取消的页面重新生成成功
+                self.task_store.clear_failed(task_id, index)
+
+                events.append({
+                    "event": "complete",
+                    "data": {
+                        "index": index,
+                        "status": "done",
+                        "image_url": f"/api/images/{task_id}/{filename}",
+                        "phase": "content"
+                    }
+                })
+            else:
+                failed_pages.append(page)
+                self.task_store.set_failed(task_id, index, error)
+
+                events.append({
+                    "event": "error",
+                    "data": {
+                        "index": index,
+                        "status": "error",
+                        "message": error,
+                        "retryable": True,
+                        "phase": "content"
+                    }
+                })
+        return events
+
+    # ==================== 推测生成 ====================
+
+    def _start_speculation(
+        self,
+        provider: ProviderSlot,
+        task_id: str,
+        pages: List[Dict],
+        cover_image: Optional[bytes],
+        full_outline: str = "",
+        user_images: Optional[List[bytes]] = None,
+        user_topic: str = "",
+        style: str = "小红书爆款图文风格"
+    ) -> List[int]:
+        """
+        封面等待确认期间，在后台推测生成内容页（需在后台事件循环中调用）
+
+        最多生成 Config.SPECULATIVE_MAX_PAGES 页，超过 Config.SPECULATIVE_TTL 秒未确认则丢弃
+
+        Args:
+            provider: 服务商运行时
+            task_id: 任务ID
+            pages: 待生成的内容页（按顺序取前几页）
+            cover_image: 压缩后的封面参考图
+            full_outline: 完整的大纲文本
+            user_images: 用户上传的参考图片列表（已压缩）
+            user_topic: 用户原始输入
+            style: 风格
+
+        Returns:
+            推测生成的页面索引列表
+        """
+        self._discard_speculation(task_id, "封面已重新生成")
+        get_page_scheduler().clear_promotion(task_id)
+
+        pages = pages[:max(0, Config.SPECULATIVE_MAX_PAGES)]
+        if not pages:
+            return []
+
+        speculation = Speculation(task_id, cover_image, self._group_pages(provider, pages))
+        high_concurrency = provider.provider_config.get('high_concurrency', False)
+        previous = None
+        for group in speculation.groups:
+            # 顺序模式下每组等待上一组完成后再开始，与正式生成的节奏一致
+            task = asyncio.ensure_future(self._aspeculate_group(
+                provider, speculation, group, None if high_concurrency else previous,
+                full_outline, user_images, user_topic, style
+            ))
+            speculation.tasks.append(task)
+            previous = task
+
+        loop = asyncio.get_running_loop()
+        speculation.expiry = loop.call_later(
+            Config.SPECULATIVE_TTL, self._discard_speculation, task_id, "封面确认超时", speculation
+        )
+        self._speculations[task_id] = speculation
+
+        indices = [page["index"] for page in pages]
+        logger.info(f"🔮 封面等待确认，推测生成内容页: task_id={task_id}, pages={indices}")
+        return indices
+
+    async def _aspeculate_group(
+        self,
+        provider: ProviderSlot,
+        speculation: Speculation,
+        group: List[Dict],
+        previous: Optional[asyncio.Task],
+        full_outline: str,
+        user_images: Optional[List[bytes]],
+        user_topic: str,
+        style: str
+    ) -> List[Tuple[int, bool, Optional[str], Optional[str]]]:
+        """推测生成一组页面，结果放入暂存区"""
+        if previous is not None:
+            # 只等待上一组结束，上一组被取消不影响本组
+            await asyncio.wait({previous})
+        try:
+            return await self._agenerate_page_group(
+                provider, group, speculation.task_id, speculation.cover_image,
+                full_outline, user_images, user_topic, style, staging=speculation.staging
+            )
+        except Exception as e:
+            return [(page["index"], False, None, str(e)) for page in group]
+
+    def _discard_speculation(
+        self,
+        task_id: str,
+        reason: str,
+        speculation: Optional[Speculation] = None
+    ) -> None:
+        """
+        丢弃任务的推测生成结果（需在后台事件循环中调用）
 
-                logger.error(f"❌ 图片 [{index}] 生成失败，已达最大重试次数")
-                return (index, False, None, error_msg)
+        Args:
+            task_id: 任务ID
+            reason: 丢弃原因（用于日志）
+            speculation: 只在当前推测生成仍是该实例时丢弃（超时回调使用）
+        """
+        current = self._speculations.get(task_id)
+        if current is None or (speculation is not None and current is not speculation):
+            return
+        del self._speculations[task_id]
+        if current.expiry is not None:
+            current.expiry.cancel()
+        discarded = current.cancel()
+        logger.info(f"🗑️ 丢弃推测生成结果: task_id={task_id}, 原因: {reason}, 已生成 {discarded} 页")
+
+    def _adopt_speculation(
+        self,
+        task_id: str,
+        pages: List[Dict],
+        cover_image: Optional[bytes]
+    ) -> Tuple[Optional[Speculation], List[Tuple[List[Dict], asyncio.Task]]]:
+        """
+        封面确认后接管推测生成的结果（需在后台事件循环中调用）
+
+        只接管封面参考图和页面内容都与本次生成一致的分组，其余分组被取消
+
+        Args:
+            task_id: 任务ID
+            pages: 本次需要生成的内容页
+            cover_image: 本次使用的封面参考图
+
+        Returns:
+            (推测生成实例, [(页面分组, 生成任务), ...])，没有可用的推测生成时为 (None, [])
+        """
+        speculation = self._speculations.pop(task_id, None)
+        if speculation is None:
+            return None, []
+        if speculation.expiry is not None:
+            speculation.expiry.cancel()
+
+        if speculation.cover_image != cover_image:
+            discarded = speculation.cancel()
+            logger.info(f"🗑️ 封面参考图已变化，丢弃推测生成结果: task_id={task_id}, 已生成 {discarded} 页")
+            return None, []
+
+        wanted = {page["index"]: page for page in pages}
+        adopted = [
+            (group, task) for group, task in zip(speculation.groups, speculation.tasks)
+            if all(wanted.get(page["index"]) == page for page in group)
+        ]
+        adopted_tasks = [task for _, task in adopted]
+        discarded = speculation.cancel([task for task in speculation.tasks if task not in adopted_tasks])
+        if adopted:
+            # 接管的页面已是正式生成：仍在排队的请求不再排在其他任务的正式页面之后
+            get_page_scheduler().promote(task_id)
+
+        logger.info(
+            f"🔮 封面已确认，接管推测生成的 {sum(len(group) for group, _ in adopted)} 页: task_id={task_id}"
+            + (f"（页面已修改，丢弃 {discarded} 页）" if discarded else "")
+        )
+        return speculation, adopted
 
-        return (index, False, None, "超过最大重试次数")
+    async def _acommit_speculation(
+        self,
+        speculation: Speculation,
+        task: asyncio.Task,
+        task_dir: str
+    ) -> List[Tuple[int, bool, Optional[str], Optional[str]]]:
+        """等待推测生成的一组页面完成，并把暂存的图片保存到任务目录"""
+        results = []
+        for index, success, filename, error in await task:
+            if success:
+                image_data = speculation.staging.pop(index, None)
+                if image_data is None:
+                    success, filename, error = False, None, "推测生成的图片已被丢弃，请重试该页"
+                else:
+                    await asyncio.to_thread(self._save_image, image_data, index, filename, task_dir)
+            results.append((index, success, filename, error))
+        return results
 
     def generate_images(
         self,
@@ -245,11 +1089,37 @@ class ImageService:
         full_outline: str = "",
         user_images: Optional[List[bytes]] = None,
         user_topic: str = "",
-        step: str = "all",  # 新增参数: all, cover, content
-        style: str = "小红书爆款图文风格" # 新增参数：风格
+        step: str = "all",
+        style: str = "小红书爆款图文风格",
+        provider: str = None,
+        speculative: bool = False
     ) -> Generator[Dict[str, Any], None, None]:
         """
-        生成图片（生成器，支持 SSE 流式返回）
+        生成图片（同步生成器，供 WSGI 路由的 SSE 流式返回使用）
+
+        在后台事件循环中驱动 agenerate_images，参数与其相同
+
+        Yields:
+            进度事件字典
+        """
+        return get_async_runner().iterate(self.agenerate_images(
+            pages, task_id, full_outline, user_images, user_topic, step, style, provider, speculative
+        ))
+
+    async def agenerate_images(
+        self,
+        pages: list,
+        task_id: str = None,
+        full_outline: str = "",
+        user_images: Optional[List[bytes]] = None,
+        user_topic: str = "",
+        step: str = "all",  # 新增参数: all, cover, content
+        style: str = "小红书爆款图文风格", # 新增参数：风格
+        provider: str = None,
+        speculative: bool = False
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        生成图片（异步生成器，支持 SSE 流式返回）
         优化版本：支持分步生成（先封面，确认后再生成内容）
 
         Args:
@@ -259,6 +1129,9 @@ class ImageService:
             user_images: 用户上传的参考图片列表（可选）
             user_topic: 用户原始输入（用于保持意图一致）
             step: 生成步骤 ('all', 'cover', 'content')
+            provider: 服务商名称（可选，默认沿用任务创建时的服务商，新任务使用默认服务商）
+            speculative: step=cover 时，等待用户确认封面期间是否在后台推测生成内容页
+                （确认后 step=content 直接使用已生成的结果，封面被重绘时丢弃）
 
         Yields:
             进度事件字典
@@ -268,21 +1141,26 @@ class ImageService:
 
         logger.info(f"开始图片生成任务: task_id={task_id}, step={step}, pages={len(pages)}")
 
+        # 本次生成的整体截止时间（异步生成器不能跨 yield 保持上下文变量，各页面的生成通过 run_within 继承）
+        task_deadline = create_deadline(Config.TASK_DEADLINE, "任务截止时间")
+
         # 创建任务专属目录
-        self.current_task_dir = os.path.join(self.history_root_dir, task_id)
-        os.makedirs(self.current_task_dir, exist_ok=True)
-        
+        task_dir = self._get_task_dir(task_id)
+
         # 加载或初始化任务状态
-        if task_id in self._task_states:
-             # 如果是 connect 步骤，需要加载已有状态
-             pass
+        if self.task_store.exists(task_id):
+             # 如果是 connect 步骤，需要加载已有状态（可能由其他 worker 创建）
+             # 继续生成已取消的任务时清除取消标记
+             self.task_store.set_cancelled(task_id, False)
         else:
-             # 压缩用户上传的参考图到30KB以内
+             # 压缩用户上传的参考图到30KB以内（已保存的参考图直接使用缓存的 30KB 版本）
             compressed_user_images = None
             if user_images:
-                compressed_user_images = [compress_image(img, max_size_kb=30) for img in user_images]
-            
-            self._task_states[task_id] = {
+                compressed_user_images = await asyncio.to_thread(
+                    get_reference_store().compress_many, user_images, USER_IMAGE_MAX_KB, task_id
+                )
+
+            self.task_store.create(task_id, {
                 "pages": pages,
                 "generated": {},
                 "failed": {},
@@ -290,24 +1168,24 @@ class ImageService:
                 "full_outline": full_outline,
                 "user_images": compressed_user_images,
                 "user_topic": user_topic,
-                "style": style
-            }
+                "style": style,
+                "provider": provider
+            })
 
         # 获取当前任务状态
-        state = self._task_states[task_id]
+        state = self.task_store.get(task_id)
+
+        # 确定本次使用的服务商：显式指定 > 任务创建时的服务商 > 默认服务商
+        provider_slot = self.get_provider(provider or state.get("provider"))
+        logger.info(f"任务 {task_id} 使用图片服务商: {provider_slot.provider_name}")
         total = len(state["pages"])
         cover_image_data = state.get("cover_image")
-        
+
         # 确保 user_images 使用状态中保存的压缩版本
         current_user_images = state.get("user_images")
         # 确保 style 使用状态中保存的
         style = state.get("style", "小红书爆款图文风格")
 
-        generated_images = []
-        # 填充已生成的图片列表
-        for idx, filename in state["generated"].items():
-            generated_images.append(filename)
-
         failed_pages = []
 
         # ==================== 第一阶段：生成封面 ====================
@@ -317,16 +1195,16 @@ class ImageService:
                 if page["type"] == "cover":
                     cover_page = page
                     break
-            
+
             # 如果没有封面且也是第一页，使用第一页作为封面
             if cover_page is None and len(pages) > 0 and pages[0].get("index") == 0:
                 cover_page = pages[0]
 
             if cover_page:
-                # 检查是否已经生成过且 step=content (不应该发生，但在 all 模式下需注意)
                 # 这里逻辑是：如果 step=cover，强制生成/重生成封面
                 # 如果 step=all，也会生成封面
-                
+                self._discard_speculation(task_id, "封面重新生成")
+
                 yield {
                     "event": "progress",
                     "data": {
@@ -340,24 +1218,21 @@ class ImageService:
                 }
 
                 # 生成封面（使用用户上传的图片作为参考）
-                index, success, filename, error = self._generate_single_image(
-                    cover_page, task_id, reference_image=None, full_outline=full_outline,
+                index, success, filename, error = await run_within(task_deadline, self._agenerate_single_image(
+                    provider_slot, cover_page, task_id, reference_image=None, full_outline=full_outline,
                     user_images=current_user_images, user_topic=user_topic, style=style
-                )
+                ))
 
                 if success:
                     # 更新状态
-                    self._task_states[task_id]["generated"][index] = filename
-                    generated_images.append(filename)
-
-                    # 读取封面图片作为参考，并立即压缩
-                    cover_path = os.path.join(self.current_task_dir, filename)
-                    with open(cover_path, "rb") as f:
-                        cover_raw = f.read()
-                    
-                    # 压缩封面图（大幅降低token消耗）
-                    cover_image_data = compress_image(cover_raw, max_size_kb=30)
-                    self._task_states[task_id]["cover_image"] = cover_image_data
+                    self.task_store.set_generated(task_id, index, filename)
+                    self.task_store.clear_failed(task_id, index)
+
+                    # 读取封面图片作为参考，并立即压缩（大幅降低token消耗）
+                    cover_image_data = await asyncio.to_thread(
+                        self._load_compressed_cover, os.path.join(task_dir, filename)
+                    )
+                    self.task_store.set_cover(task_id, cover_image_data)
 
                     yield {
                         "event": "complete",
@@ -368,23 +1243,41 @@ class ImageService:
                             "phase": "cover"
                         }
                     }
-                    
+
                     # 如果是分步模式且只是生成封面
                     if step == "cover":
                         logger.info(f"封面生成完成，等待用户确认: task_id={task_id}")
+                        speculative_pages = []
+                        if speculative:
+                            generated = self.task_store.get(task_id)["generated"]
+                            speculative_pages = self._start_speculation(
+                                provider_slot,
+                                task_id,
+                                [
+                                    page for page in pages
+                                    if page["index"] != index and page.get("type") != "cover"
+                                    and page["index"] not in generated
+                                ],
+                                cover_image_data,
+                                full_outline,
+                                current_user_images,
+                                user_topic,
+                                style
+                            )
                         yield {
                             "event": "waiting_approval",
                             "data": {
                                 "task_id": task_id,
                                 "cover_url": f"/api/images/{task_id}/{filename}",
-                                "message": "封面已生成，请确认风格"
+                                "message": "封面已生成，请确认风格",
+                                "speculative_pages": speculative_pages
                             }
                         }
                         return
-                        
+
                 else:
                     failed_pages.append(cover_page)
-                    self._task_states[task_id]["failed"][index] = error
+                    self.task_store.set_failed(task_id, index, error)
 
                     yield {
                         "event": "error",
@@ -402,17 +1295,20 @@ class ImageService:
 
         # ==================== 第二阶段：生成其他页面 ====================
         if step in ["all", "content"]:
+            # 重新读取状态（封面阶段已更新）
+            state = self.task_store.get(task_id)
+
             # 准备其他页面
             other_pages = []
             for page in pages:
                 # 排除封面页（通常是 index 0 或 type=cover）
-                if page.get("type") == "cover" or (page.get("index") == 0 and step == "all"): 
+                if page.get("type") == "cover" or (page.get("index") == 0 and step == "all"):
                      continue
-                
+
                 # 如果是 content 模式，排除已经生成的页面
                 if page["index"] in state["generated"]:
                     continue
-                    
+
                 other_pages.append(page)
 
             if other_pages:
@@ -421,14 +1317,39 @@ class ImageService:
                     # 尝试从磁盘加载封面（如果 step=content）
                     cover_filename = state["generated"].get(0) # 假设封面是 index 0
                     if cover_filename:
-                         cover_path = os.path.join(self.current_task_dir, cover_filename)
-                         if os.path.exists(cover_path):
-                             with open(cover_path, "rb") as f:
-                                cover_image_data = compress_image(f.read(), max_size_kb=30)
-                                self._task_states[task_id]["cover_image"] = cover_image_data
+                        cover_image_data = await asyncio.to_thread(
+                            self._load_compressed_cover, os.path.join(task_dir, cover_filename)
+                        )
+                        if cover_image_data:
+                            self.task_store.set_cover(task_id, cover_image_data)
+
+                # 封面确认前已推测生成的页面直接接管，其余页面正常生成
+                speculation, adopted = self._adopt_speculation(task_id, other_pages, cover_image_data)
+                adopted_indices = {page["index"] for group, _ in adopted for page in group}
+                plan = adopted + [
+                    (group, None) for group in self._group_pages(
+                        provider_slot,
+                        [page for page in other_pages if page["index"] not in adopted_indices]
+                    )
+                ]
+                speculated_note = f"（其中 {len(adopted_indices)} 页已在确认封面期间提前生成）" if adopted_indices else ""
+
+                def run_group(group: List[Dict], speculative_task: Optional[asyncio.Task]):
+                    if speculative_task is not None:
+                        return self._acommit_speculation(speculation, speculative_task, task_dir)
+                    return run_within(task_deadline, self._agenerate_page_group(
+                        provider_slot,
+                        group,
+                        task_id,
+                        cover_image_data,  # 使用封面作为参考
+                        full_outline,  # 传入完整大纲
+                        current_user_images,  # 用户上传的参考图片（已压缩）
+                        user_topic,  # 用户原始输入
+                        style # 传入风格
+                    ))
 
                 # Check concurrency setting
-                high_concurrency = self.provider_config.get('high_concurrency', False)
+                high_concurrency = provider_slot.provider_config.get('high_concurrency', False)
 
                 if high_concurrency:
                     # 高并发模式：并行生成
@@ -436,31 +1357,20 @@ class ImageService:
                         "event": "progress",
                         "data": {
                             "status": "batch_start",
-                            "message": f"开始并发生成 {len(other_pages)} 页内容...",
+                            "message": f"开始并发生成 {len(other_pages)} 页内容...{speculated_note}",
                             "current": len(state["generated"]),
                             "total": total,
                             "phase": "content"
                         }
                     }
 
-                    # 使用线程池并发生成
-                    with ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT) as executor:
-                        # 提交所有任务
-                        future_to_page = {
-                            executor.submit(
-                                self._generate_single_image,
-                                page,
-                                task_id,
-                                cover_image_data,  # 使用封面作为参考
-                                0,  # retry_count
-                                full_outline,  # 传入完整大纲
-                                current_user_images,  # 用户上传的参考图片（已压缩）
-                                user_topic,  # 用户原始输入
-                                style # 传入风格
-                            ): page
-                            for page in other_pages
-                        }
+                    # 在事件循环上并发生成（并发数由信号量限制，支持批量的服务商按组合并为一次请求）
+                    group_tasks = {
+                        asyncio.ensure_future(run_group(group, speculative_task)): group
+                        for group, speculative_task in plan
+                    }
 
+                    try:
                         # 发送每个页面的进度
                         for page in other_pages:
                             yield {
@@ -474,123 +1384,91 @@ class ImageService:
                                 }
                             }
 
-                        # 收集结果
-                        for future in as_completed(future_to_page):
-                            page = future_to_page[future]
-                            try:
-                                index, success, filename, error = future.result()
-
-                                if success:
-                                    self._task_states[task_id]["generated"][index] = filename
-
-                                    yield {
-                                        "event": "complete",
-                                        "data": {
-                                            "index": index,
-                                            "status": "done",
-                                            "image_url": f"/api/images/{task_id}/{filename}",
-                                            "phase": "content"
-                                        }
-                                    }
-                                else:
-                                    failed_pages.append(page)
-                                    self._task_states[task_id]["failed"][index] = error
-
-                                    yield {
-                                        "event": "error",
-                                        "data": {
-                                            "index": index,
-                                            "status": "error",
-                                            "message": error,
-                                            "retryable": True,
-                                            "phase": "content"
-                                        }
-                                    }
-
-                            except Exception as e:
-                                failed_pages.append(page)
-                                error_msg = str(e)
-                                self._task_states[task_id]["failed"][page["index"]] = error_msg
-
-                                yield {
-                                    "event": "error",
-                                    "data": {
-                                        "index": page["index"],
-                                        "status": "error",
-                                        "message": error_msg,
-                                        "retryable": True,
-                                        "phase": "content"
-                                    }
-                                }
+                        # 收集结果（按完成顺序）
+                        pending = set(group_tasks)
+                        while pending:
+                            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                            for task in done:
+                                group = group_tasks[task]
+                                try:
+                                    results = task.result()
+                                except Exception as e:
+                                    results = [(page["index"], False, None, str(e)) for page in group]
+
+                                for event in self._content_result_events(task_id, group, results, failed_pages):
+                                    yield event
+                    except asyncio.CancelledError:
+                        # 任务被取消：排队中的页面不再生成，进行中的请求被中止
+                        for task in group_tasks:
+                            task.cancel()
+                        raise
+                    finally:
+                        # 客户端提前断开时，等待已发出的请求完成落盘（与线程池退出时的行为一致）
+                        await asyncio.gather(*group_tasks, return_exceptions=True)
                 else:
                     # 顺序模式：逐个生成
                     yield {
                         "event": "progress",
                         "data": {
                             "status": "batch_start",
-                            "message": f"开始顺序生成 {len(other_pages)} 页内容...",
+                            "message": f"开始顺序生成 {len(other_pages)} 页内容...{speculated_note}",
                             "current": len(state["generated"]),
                             "total": total,
                             "phase": "content"
                         }
                     }
 
-                    for page in other_pages:
-                        yield {
-                            "event": "progress",
-                            "data": {
-                                "index": page["index"],
-                                "status": "generating",
-                                "current": len(state["generated"]) + 1,
-                                "total": total,
-                                "phase": "content"
-                            }
-                        }
-
-                        index, success, filename, error = self._generate_single_image(
-                            page, task_id, cover_image_data, 0, full_outline, 
-                            current_user_images, user_topic, style
+                    generated_count = len(state["generated"])
+                    scheduler = get_page_scheduler()
+                    while plan:
+                        if self._is_cancelled(task_id):
+                            # 其他 worker 取消了任务：剩余页面已被记为失败
+                            logger.info(f"🛑 任务已取消，停止顺序生成: task_id={task_id}")
+                            break
+
+                        # 每组开始前按页面优先级选出下一组（用户切换焦点页后立即生效）
+                        position = min(
+                            range(len(plan)),
+                            key=lambda i: scheduler.priority(PageTicket(task_id, plan[i][0][0]["index"]))
                         )
-
-                        if success:
-                            self._task_states[task_id]["generated"][index] = filename
-
+                        group, speculative_task = plan.pop(position)
+                        for page in group:
                             yield {
-                                "event": "complete",
+                                "event": "progress",
                                 "data": {
-                                    "index": index,
-                                    "status": "done",
-                                    "image_url": f"/api/images/{task_id}/{filename}",
+                                    "index": page["index"],
+                                    "status": "generating",
+                                    "current": generated_count + 1,
+                                    "total": total,
                                     "phase": "content"
                                 }
                             }
-                        else:
-                            failed_pages.append(page)
-                            self._task_states[task_id]["failed"][index] = error
 
-                            yield {
-                                "event": "error",
-                                "data": {
-                                    "index": index,
-                                    "status": "error",
-                                    "message": error,
-                                    "retryable": True,
-                                    "phase": "content"
-                                }
-                            }
+                        results = await run_group(group, speculative_task)
+
+                        generated_count += sum(1 for result in results if result[1])
+                        for event in self._content_result_events(task_id, group, results, failed_pages):
+                            yield event
+
+            # 内容页阶段结束后不再保留未被接管的推测生成结果
+            self._discard_speculation(task_id, "内容页已生成")
 
         # ==================== 完成 ====================
+        # batch 落盘模式下统一 fsync 本任务写入的图片
+        await asyncio.to_thread(get_manifest_store().flush, task_dir)
+
         # 统计最终失败（包括之前步骤的）
-        final_failed_indices = list(self._task_states[task_id]["failed"].keys())
-        
+        state = self.task_store.get(task_id)
+        final_failed_indices = list(state["failed"].keys())
+
         yield {
             "event": "finish",
             "data": {
                 "success": len(final_failed_indices) == 0,
                 "task_id": task_id,
-                "images": [v for k, v in sorted(self._task_states[task_id]["generated"].items())], # 按索引排序的图片列表
+                "images": [v for k, v in sorted(state["generated"].items())], # 按索引排序的图片列表
                 "total": total,
-                "completed": len(self._task_states[task_id]["generated"]),
+                "completed": len(state["generated"]),
                 "failed": len(final_failed_indices),
                 "failed_indices": final_failed_indices
             }
@@ -603,7 +1481,35 @@ class ImageService:
         use_reference: bool = True,
         full_outline: str = "",
         user_topic: str = "",
-        custom_prompt: str = "" # 新增
+        custom_prompt: str = "",
+        provider: str = None,
+        user_images: Optional[List[bytes]] = None
+    ) -> Dict[str, Any]:
+        """
+        重试生成单张图片（同步封装，参数与 aretry_single_image 相同）
+
+        Returns:
+            生成结果
+        """
+        return get_async_runner().run(self.aretry_single_image(
+            task_id, page, use_reference,
+            full_outline=full_outline,
+            user_topic=user_topic,
+            custom_prompt=custom_prompt,
+            provider=provider,
+            user_images=user_images
+        ))
+
+    async def aretry_single_image(
+        self,
+        task_id: str,
+        page: Dict,
+        use_reference: bool = True,
+        full_outline: str = "",
+        user_topic: str = "",
+        custom_prompt: str = "", # 新增
+        provider: str = None,
+        user_images: Optional[List[bytes]] = None
     ) -> Dict[str, Any]:
         """
         重试生成单张图片
@@ -614,20 +1520,25 @@ class ImageService:
             use_reference: 是否使用封面作为参考
             full_outline: 完整大纲文本（从前端传入）
             user_topic: 用户原始输入（从前端传入）
+            provider: 服务商名称（可选，默认沿用任务创建时的服务商）
+            user_images: 用户参考图片（可选，已压缩；默认使用任务状态中保存的参考图）
 
         Returns:
             生成结果
         """
-        self.current_task_dir = os.path.join(self.history_root_dir, task_id)
-        os.makedirs(self.current_task_dir, exist_ok=True)
+        task_dir = self._get_task_dir(task_id)
+
+        # 重绘封面等于拒绝当前封面，推测生成的内容页不再可用
+        if page.get("type") == "cover" or page.get("index") == 0:
+            self._discard_speculation(task_id, "封面重绘")
 
         reference_image = None
-        user_images = None
         style = "小红书爆款图文风格"
 
         # 首先尝试从任务状态中获取上下文
-        if task_id in self._task_states:
-            task_state = self._task_states[task_id]
+        task_state = self.task_store.get(task_id)
+        if task_state is not None:
+            provider = provider or task_state.get("provider")
             if use_reference:
                 reference_image = task_state.get("cover_image")
             # 如果没有传入上下文，则使用任务状态中的
@@ -635,23 +1546,23 @@ class ImageService:
                 full_outline = task_state.get("full_outline", "")
             if not user_topic:
                 user_topic = task_state.get("user_topic", "")
-            user_images = task_state.get("user_images")
+            user_images = user_images or task_state.get("user_images")
             style = task_state.get("style", style)
+            # 重试已取消任务的页面时清除取消标记
+            if task_state.get("cancelled"):
+                self.task_store.set_cancelled(task_id, False)
 
         # 如果任务状态中没有封面图，尝试从文件系统加载
         if use_reference and reference_image is None:
-            cover_path = os.path.join(self.current_task_dir, "0.png")
-            if os.path.exists(cover_path):
-                with open(cover_path, "rb") as f:
-                    cover_data = f.read()
-                # 压缩封面图到 30KB（降低token消耗）
-                reference_image = compress_image(cover_data, max_size_kb=30)
-
-        index, success, filename, error = self._generate_single_image(
+            reference_image = await asyncio.to_thread(
+                self._load_compressed_cover, os.path.join(task_dir, "0.png")
+            )
+
+        index, success, filename, error = await self._agenerate_single_image(
+            self.get_provider(provider),
             page,
             task_id,
             reference_image,
-            0,
             full_outline,
             user_images,
             user_topic,
@@ -660,10 +1571,9 @@ class ImageService:
         )
 
         if success:
-            if task_id in self._task_states:
-                self._task_states[task_id]["generated"][index] = filename
-                if index in self._task_states[task_id]["failed"]:
-                    del self._task_states[task_id]["failed"][index]
+            await asyncio.to_thread(get_manifest_store().flush, task_dir)
+            self.task_store.set_generated(task_id, index, filename)
+            self.task_store.clear_failed(task_id, index)
 
             return {
                 "success": True,
@@ -681,14 +1591,33 @@ class ImageService:
     def retry_failed_images(
         self,
         task_id: str,
-        pages: List[Dict]
+        pages: List[Dict],
+        provider: str = None,
+        user_images: Optional[List[bytes]] = None
     ) -> Generator[Dict[str, Any], None, None]:
+        """
+        批量重试失败的图片（同步生成器，参数与 aretry_failed_images 相同）
+
+        Yields:
+            进度事件
+        """
+        return get_async_runner().iterate(self.aretry_failed_images(task_id, pages, provider, user_images))
+
+    async def aretry_failed_images(
+        self,
+        task_id: str,
+        pages: List[Dict],
+        provider: str = None,
+        user_images: Optional[List[bytes]] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
         """
         批量重试失败的图片
 
         Args:
             task_id: 任务ID
             pages: 需要重试的页面列表
+            provider: 服务商名称（可选，默认沿用任务创建时的服务商）
+            user_images: 用户参考图片（可选，已压缩；默认使用任务状态中保存的参考图）
 
         Yields:
             进度事件
@@ -696,10 +1625,16 @@ class ImageService:
         # 获取参考图和风格
         reference_image = None
         style = "小红书爆款图文风格"
-        
-        if task_id in self._task_states:
-            reference_image = self._task_states[task_id].get("cover_image")
-            style = self._task_states[task_id].get("style", style)
+
+        task_state = self.task_store.get(task_id)
+        if task_state is not None:
+            reference_image = task_state.get("cover_image")
+            style = task_state.get("style", style)
+            provider = provider or task_state.get("provider")
+            if task_state.get("cancelled"):
+                self.task_store.set_cancelled(task_id, False)
+
+        provider_slot = self.get_provider(provider)
 
         total = len(pages)
         success_count = 0
@@ -716,75 +1651,83 @@ class ImageService:
         # 并发重试
         # 从任务状态中获取完整大纲
         full_outline = ""
-        user_images = None
         user_topic = ""
-        
-        if task_id in self._task_states:
-            task_state = self._task_states[task_id]
+
+        if task_state is not None:
             full_outline = task_state.get("full_outline", "")
-            user_images = task_state.get("user_images")
+            user_images = user_images or task_state.get("user_images")
             user_topic = task_state.get("user_topic", "")
 
-        with ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT) as executor:
-            future_to_page = {
-                executor.submit(
-                    self._generate_single_image,
-                    page,
-                    task_id,
-                    reference_image,
-                    0,  # retry_count
-                    full_outline,  # 传入完整大纲
-                    user_images,
-                    user_topic,
-                    style
-                ): page
-                for page in pages
-            }
-
-            for future in as_completed(future_to_page):
+        # 本次重试的整体截止时间
+        task_deadline = create_deadline(Config.TASK_DEADLINE, "任务截止时间")
+        page_tasks = {
+            asyncio.ensure_future(run_within(task_deadline, self._agenerate_single_image(
+                provider_slot,
+                page,
+                task_id,
+                reference_image,
+                full_outline,  # 传入完整大纲
+                user_images,
+                user_topic,
+                style
+            ))): page
+            for page in pages
+        }
 
-                page = future_to_page[future]
-                try:
-                    index, success, filename, error = future.result()
+        try:
+            pending = set(page_tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    page = page_tasks[task]
+                    try:
+                        index, success, filename, error = task.result()
 
-                    if success:
-                        success_count += 1
-                        if task_id in self._task_states:
-                            self._task_states[task_id]["generated"][index] = filename
-                            if index in self._task_states[task_id]["failed"]:
-                                del self._task_states[task_id]["failed"][index]
+                        if success:
+                            success_count += 1
+                            self.task_store.set_generated(task_id, index, filename)
+                            self.task_store.clear_failed(task_id, index)
 
-                        yield {
-                            "event": "complete",
-                            "data": {
-                                "index": index,
-                                "status": "done",
-                                "image_url": f"/api/images/{task_id}/{filename}"
+                            yield {
+                                "event": "complete",
+                                "data": {
+                                    "index": index,
+                                    "status": "done",
+                                    "image_url": f"/api/images/{task_id}/{filename}"
+                                }
                             }
-                        }
-                    else:
+                        else:
+                            failed_count += 1
+                            yield {
+                                "event": "error",
+                                "data": {
+                                    "index": index,
+                                    "status": "error",
+                                    "message": error,
+                                    "retryable": True
+                                }
+                            }
+
+                    except Exception as e:
                         failed_count += 1
                         yield {
                             "event": "error",
                             "data": {
-                                "index": index,
+                                "index": page["index"],
                                 "status": "error",
-                                "message": error,
+                                "message": str(e),
                                 "retryable": True
                             }
                         }
-
-                except Exception as e:
-                    failed_count += 1
-                    yield {
-                        "event": "error",
-                        "data": {
-                            "index": page["index"],
-                            "status": "error",
-                            "message": str(e),
-                            "retryable": True
-                        }
-                    }
+        except asyncio.CancelledError:
+            # 任务被取消：排队中的页面不再生成，进行中的请求被中止
+            for task in page_tasks:
+                task.cancel()
+            raise
+        finally:
+            # 客户端提前断开时，等待已发出的请求完成落盘
+            await asyncio.gather(*page_tasks, return_exceptions=True)
+            await asyncio.to_thread(get_manifest_store().flush, self._get_task_dir(task_id))
 
         yield {
             "event": "retry_finish",
@@ -803,7 +1746,9 @@ class ImageService:
         use_reference: bool = True,
         full_outline: str = "",
         user_topic: str = "",
-        custom_prompt: str = "" # 新增
+        custom_prompt: str = "", # 新增
+        provider: str = None,
+        user_images: Optional[List[bytes]] = None
     ) -> Dict[str, Any]:
         """
         重新生成图片（用户手动触发，即使成功的也可以重新生成）
@@ -814,6 +1759,8 @@ class ImageService:
             use_reference: 是否使用封面作为参考
             full_outline: 完整大纲文本
             user_topic: 用户原始输入
+            provider: 服务商名称（可选）
+            user_images: 用户参考图片（可选，已压缩）
 
         Returns:
             生成结果
@@ -822,9 +1769,52 @@ class ImageService:
             task_id, page, use_reference,
             full_outline=full_outline,
             user_topic=user_topic,
-            custom_prompt=custom_prompt
+            custom_prompt=custom_prompt,
+            provider=provider,
+            user_images=user_images
         )
 
+    async def acancel_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        把任务标记为已取消（正在运行的后台任务由 JobManager 取消后调用）
+
+        丢弃推测生成的结果；尚未生成的页面记为失败，之后可以通过批量重试继续生成
+
+        Args:
+            task_id: 任务ID
+
+        Returns:
+            {"generated": 已生成页数, "cancelled_indices": 未生成的页面索引}，任务不存在时返回 None
+        """
+        self._discard_speculation(task_id, "任务已取消")
+
+        state = self.task_store.get(task_id)
+        if state is None:
+            return None
+
+        cancelled_indices = [
+            page["index"] for page in state["pages"]
+            if page["index"] not in state["generated"] and page["index"] not in state["failed"]
+        ]
+        for index in cancelled_indices:
+            self.task_store.set_failed(task_id, index, self.CANCELLED_ERROR)
+        self.task_store.set_cancelled(task_id, True)
+        get_page_scheduler().clear_focus(task_id)
+        get_page_scheduler().clear_promotion(task_id)
+
+        # 已经写入的图片统一落盘
+        await asyncio.to_thread(get_manifest_store().flush, self._get_task_dir(task_id))
+
+        logger.info(f"🛑 任务已取消: task_id={task_id}, 已生成 {len(state['generated'])} 页, 未生成 {len(cancelled_indices)} 页")
+        return {
+            "generated": len(state["generated"]),
+            "cancelled_indices": cancelled_indices,
+        }
+
+    def cancel_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """把任务标记为已取消（同步版本，参数同 acancel_task）"""
+        return get_async_runner().run(self.acancel_task(task_id))
+
     def get_image_path(self, task_id: str, filename: str) -> str:
         """
         获取图片完整路径
@@ -841,25 +1831,61 @@ class ImageService:
 
     def get_task_state(self, task_id: str) -> Optional[Dict]:
         """获取任务状态"""
-        return self._task_states.get(task_id)
+        return self.task_store.get(task_id)
 
     def cleanup_task(self, task_id: str):
         """清理任务状态（释放内存）"""
-        if task_id in self._task_states:
-            del self._task_states[task_id]
+        self.task_store.delete(task_id)
 
 
 # 全局服务实例
 _service_instance = None
+# 切换激活服务商后被替换的服务实例（下次创建服务实例时沿用其运行时和推测生成）
+_previous_service = None
 
 def get_image_service() -> ImageService:
     """获取全局图片生成服务实例"""
-    global _service_instance
+    global _service_instance, _previous_service
     if _service_instance is None:
-        _service_instance = ImageService()
+        _service_instance = ImageService(previous=_previous_service)
+        _previous_service = None
     return _service_instance
 
 def reset_image_service():
-    """重置全局服务实例（配置更新后调用）"""
-    global _service_instance
+    """重置全局服务实例"""
+    global _service_instance, _previous_service
+    _service_instance = None
+    _previous_service = None
+
+def refresh_image_service():
+    """
+    配置更新后刷新全局服务实例（调用前需先清除 Config 缓存）
+
+    只淘汰配置发生变化的服务商的生成器和运行时；激活服务商及其配置都未变化时保留当前服务实例。
+    正在运行的任务持有旧的服务实例，会继续使用原来的生成器直到结束；
+    新的服务实例沿用旧实例的推测生成和各服务商的并发信号量，新旧任务共用同一个并发上限。
+    """
+    global _service_instance, _previous_service
+    providers = Config.load_image_providers_config().get('providers') or {}
+    stale = get_generator_registry().apply_config(providers)
+
+    service = _service_instance
+    if service is None:
+        # 服务实例已在等待重建：淘汰待沿用的旧运行时中配置变化的服务商
+        if _previous_service is not None:
+            _previous_service.drop_providers(stale)
+        return
+    service.drop_providers(stale)
+
+    active = Config.get_active_image_provider()
+    if (
+        active == service.provider_name
+        and active in providers
+        and config_fingerprint(providers[active]) == config_fingerprint(service.provider_config)
+    ):
+        logger.debug(f"激活的图片服务商配置未变化，保留服务实例: {active}")
+        return
+
+    logger.info(f"🔄 图片服务商已变更，新任务将使用新配置: {service.provider_name} -> {active}")
+    _previous_service = service
     _service_instance = None
@@ -0,0 +1,439 @@
+"""
+后台任务（Job）管理
+
+图片生成以后台任务方式运行在后台事件循环上，与发起请求的 HTTP 连接解耦：
+- 每个事件写入任务的事件日志，并分配递增的事件 ID
+- SSE 连接只是事件日志的订阅者，断开后任务继续运行
+- 客户端可携带 Last-Event-ID 重新订阅，从断点继续接收事件，不浪费已付费的生成请求
+- 任务状态存储在多个 worker 间共享时（TASK_STATE_STORE=sqlite），事件日志同时写入存储，
+  重连请求落到其他 worker 时从存储中轮询事件，不需要反向代理的会话保持
+- 已结束任务的事件日志保留 RETENTION_SECONDS 秒，到期后由定时器和每次查询清理
+- 提交第一个任务后，后台事件循环每 MAINTENANCE_INTERVAL 秒执行一次维护：清理过期任务，
+  并让任务状态存储淘汰空闲的任务状态（worker 空闲、没有新请求时同样释放内存）
+- 用户放弃任务时可取消（DELETE /api/task/<task_id>），正在进行的上游请求随之中止；
+  取消请求落到其他 worker 时，运行任务的 worker 通过共享的任务状态存储发现取消标记后停止
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from backend.services.task_store import TaskStateStore, get_task_state_store
+from backend.utils.async_runner import get_async_runner
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """后台任务及其事件日志"""
+
+    def __init__(
+        self,
+        job_id: str,
+        kind: str,
+        task_id: Optional[str] = None,
+        store: Optional[TaskStateStore] = None
+    ):
+        """
+        Args:
+            job_id: 后台任务 ID
+            kind: 任务类型
+            task_id: 关联的图片任务ID
+            store: 共享事件日志的任务状态存储（可选）
+        """
+        self.job_id = job_id
+        self.kind = kind
+        self.task_id = task_id
+        self.events: List[Dict[str, Any]] = []
+        self.done = False
+        self.cancelled = False
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        # 等待新事件的订阅者（只在后台事件循环中访问）
+        self._waiters: List[asyncio.Future] = []
+        # 运行任务的 asyncio.Task（开始运行后设置，用于取消）
+        self._task: Optional[asyncio.Task] = None
+        self._store = store
+
+    @property
+    def status(self) -> str:
+        if self.cancelled:
+            return "cancelled"
+        return "finished" if self.done else "running"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """任务概要（不含事件内容）"""
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "task_id": self.task_id,
+            "status": self.status,
+            "event_count": len(self.events),
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+    def _append(self, event: Dict[str, Any]) -> None:
+        """追加事件并唤醒订阅者，事件 ID 为其在日志中的序号（从 1 开始）"""
+        event = {**event, "id": len(self.events) + 1}
+        self.events.append(event)
+        if self._store is not None:
+            try:
+                self._store.append_job_event(self.job_id, event)
+            except Exception as e:
+                logger.error(f"后台任务事件写入存储失败: job={self.job_id}, {e}")
+        self._notify()
+
+    def _finish(self) -> None:
+        self.done = True
+        self.finished_at = time.time()
+        if self._store is not None:
+            try:
+                self._store.finish_job(self.job_id, self.status)
+            except Exception as e:
+                logger.error(f"后台任务结束状态写入存储失败: job={self.job_id}, {e}")
+        self._notify()
+
+    def _notify(self) -> None:
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters.clear()
+
+
+class JobManager:
+    """后台任务管理器"""
+
+    # 已完成任务的事件日志保留时间（秒），过期后无法再重连
+    RETENTION_SECONDS = 3600
+    # 检查任务是否被其他 worker 取消的间隔（秒）
+    CANCEL_POLL_SECONDS = 2.0
+    # 运行中任务刷新共享存储中更新时间的间隔（秒）
+    HEARTBEAT_SECONDS = 10.0
+    # 订阅其他 worker 上的任务时，超过该时间（秒）没有任何更新视为运行它的 worker 已退出
+    STALE_SECONDS = 60.0
+    # 订阅其他 worker 上的任务时轮询新事件的间隔（秒）
+    REMOTE_POLL_SECONDS = 0.5
+    # 清理共享存储中过期任务的最小间隔（秒）
+    STORE_PURGE_INTERVAL = 60.0
+    # 定期维护（清理过期任务、淘汰空闲任务状态）的间隔（秒）
+    MAINTENANCE_INTERVAL = 60.0
+
+    def __init__(self, store: Optional[TaskStateStore] = None):
+        """
+        Args:
+            store: 任务状态存储（默认使用全局存储），支持共享事件日志时多个 worker 可以互相续接进度流
+        """
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._store = store
+        self._last_store_purge = 0.0
+        self._maintenance_started = False
+
+    def _task_store(self) -> TaskStateStore:
+        if self._store is None:
+            self._store = get_task_state_store()
+        return self._store
+
+    def _shared_store(self) -> Optional[TaskStateStore]:
+        """共享事件日志的任务状态存储（单进程存储时返回 None）"""
+        store = self._task_store()
+        return store if store.shares_job_events else None
+
+    def _start_maintenance(self) -> None:
+        """启动定期维护（只启动一次）"""
+        with self._lock:
+            if self._maintenance_started:
+                return
+            self._maintenance_started = True
+        get_async_runner().submit(self._maintain())
+
+    async def _maintain(self) -> None:
+        """在后台事件循环中定期清理过期任务、淘汰空闲的任务状态"""
+        while True:
+            await asyncio.sleep(self.MAINTENANCE_INTERVAL)
+            try:
+                await asyncio.to_thread(self._maintenance_tick)
+            except Exception as e:
+                logger.warning(f"后台任务定期维护失败: {e}")
+
+    def _maintenance_tick(self) -> None:
+        self._purge_expired()
+        evicted = self._task_store().evict_idle()
+        if evicted:
+            logger.debug(f"定期维护：{evicted} 个空闲任务状态已写入磁盘")
+
+    def submit(
+        self,
+        kind: str,
+        events: AsyncIterator[Dict[str, Any]],
+        task_id: Optional[str] = None,
+        on_error: Optional[Callable[[Exception], List[Dict[str, Any]]]] = None,
+        cancel_check: Optional[Callable[[], bool]] = None
+    ) -> Job:
+        """
+        提交后台任务（线程安全，立即返回）
+
+        Args:
+            kind: 任务类型（generate / retry_failed）
+            events: 产出 {"event", "data"} 字典的异步生成器
+            task_id: 关联的图片任务ID
+            on_error: 事件源异常时生成兜底事件的函数
+            cancel_check: 检查任务是否已被取消的函数（可选，运行期间定期在线程中调用，返回 True 时取消任务）
+
+        Returns:
+            Job 实例
+        """
+        self._purge_expired()
+        self._start_maintenance()
+
+        store = self._shared_store()
+        job = Job(f"job_{uuid.uuid4().hex[:12]}", kind, task_id, store)
+        if store is not None:
+            try:
+                store.save_job(job.job_id, kind, task_id)
+            except Exception as e:
+                logger.error(f"后台任务写入存储失败，仅保存在本进程: job={job.job_id}, {e}")
+                job._store = None
+        with self._lock:
+            self._jobs[job.job_id] = job
+
+        # 第一个事件告知客户端任务 ID，用于断线重连
+        job._append({
+            "event": "job",
+            "data": {"job_id": job.job_id, "task_id": task_id}
+        })
+
+        get_async_runner().submit(self._run(job, events, on_error, cancel_check))
+        logger.info(f"📋 后台任务已提交: job={job.job_id}, kind={kind}, task={task_id}")
+        return job
+
+    async def _run(
+        self,
+        job: Job,
+        events: AsyncIterator[Dict[str, Any]],
+        on_error: Optional[Callable[[Exception], List[Dict[str, Any]]]],
+        cancel_check: Optional[Callable[[], bool]] = None
+    ) -> None:
+        """在后台事件循环中运行任务，把事件写入日志"""
+        job._task = asyncio.current_task()
+        watcher = (
+            asyncio.ensure_future(self._watch(job, cancel_check))
+            if cancel_check or job._store is not None else None
+        )
+        try:
+            if job.cancelled:
+                # 开始运行前已被取消
+                raise asyncio.CancelledError()
+            async for event in events:
+                job._append(event)
+        except asyncio.CancelledError:
+            job.cancelled = True
+            logger.info(f"🛑 后台任务已取消: job={job.job_id}, task={job.task_id}")
+            job._append({
+                "event": "cancelled",
+                "data": {"job_id": job.job_id, "task_id": job.task_id, "message": "任务已取消"}
+            })
+        except Exception as e:
+            logger.error(f"后台任务执行失败: job={job.job_id}, error={e}")
+            for event in (on_error(e) if on_error else []):
+                job._append(event)
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            job._finish()
+            # 保留期结束后清理事件日志（服务空闲、没有新请求时同样释放内存）
+            asyncio.get_running_loop().call_later(self.RETENTION_SECONDS + 1, self._purge_expired)
+            logger.info(f"✅ 后台任务结束: job={job.job_id}, 共 {len(job.events)} 个事件")
+
+    async def _watch(self, job: Job, cancel_check: Optional[Callable[[], bool]]) -> None:
+        """
+        任务运行期间定期执行：
+        - 检查取消标记（取消请求落到其他 worker 时，由这里中止本 worker 上运行的任务）
+        - 刷新共享存储中的更新时间（其他 worker 上的订阅者据此判断任务仍在运行）
+        """
+        last_heartbeat = time.monotonic()
+        while not job.done:
+            await asyncio.sleep(self.CANCEL_POLL_SECONDS)
+            if job._store is not None and time.monotonic() - last_heartbeat >= self.HEARTBEAT_SECONDS:
+                last_heartbeat = time.monotonic()
+                try:
+                    await asyncio.to_thread(job._store.heartbeat_job, job.job_id)
+                except Exception as e:
+                    logger.debug(f"刷新后台任务更新时间失败: job={job.job_id}, {e}")
+            if cancel_check is None:
+                continue
+            try:
+                cancelled = await asyncio.to_thread(cancel_check)
+            except Exception as e:
+                logger.debug(f"检查任务取消标记失败: job={job.job_id}, {e}")
+                continue
+            if cancelled and not job.done:
+                logger.info(f"🛑 任务已在其他 worker 上被取消: job={job.job_id}, task={job.task_id}")
+                job.cancelled = True
+                if job._task is not None:
+                    job._task.cancel()
+                return
+
+    def running_jobs(self, task_id: str) -> List[Job]:
+        """获取图片任务正在运行的后台任务"""
+        with self._lock:
+            return [job for job in self._jobs.values() if job.task_id == task_id and not job.done]
+
+    async def acancel_task(self, task_id: str, timeout: float = 10) -> List[Job]:
+        """
+        取消图片任务正在运行的后台任务（需在后台事件循环中调用）
+
+        排队中的页面不再生成，进行中的上游请求被中止（在线程中执行的同步调用无法中断，结果直接丢弃），
+        等待任务退出后返回，此时其占用的服务商并发名额已释放
+
+        Args:
+            task_id: 图片任务ID
+            timeout: 等待任务退出的最长时间（秒）
+
+        Returns:
+            被取消的后台任务列表
+        """
+        jobs = self.running_jobs(task_id)
+        for job in jobs:
+            job.cancelled = True
+            if job._task is not None:
+                job._task.cancel()
+
+        tasks = {job._task for job in jobs if job._task is not None}
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        return jobs
+
+    def cancel_task(self, task_id: str, timeout: float = 10) -> List[Job]:
+        """取消图片任务正在运行的后台任务（同步版本，参数同 acancel_task）"""
+        return get_async_runner().run(self.acancel_task(task_id, timeout))
+
+    def get_job(self, job_id: str) -> Optional[Job]:
+        """获取本进程中的任务"""
+        self._purge_expired()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_job_info(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取任务概要（本进程中没有时从共享存储查询，任务可能运行在其他 worker 上）
+
+        Args:
+            job_id: 任务ID
+
+        Returns:
+            任务概要（同 Job.to_dict()），不存在时返回 None
+        """
+        job = self.get_job(job_id)
+        if job is not None:
+            return job.to_dict()
+        store = self._shared_store()
+        info = store.get_job(job_id) if store is not None else None
+        if info is None:
+            return None
+        info = dict(info)
+        info.pop("updated_at", None)
+        return info
+
+    def has_job(self, job_id: str) -> bool:
+        """任务是否存在（本进程或共享存储中）"""
+        return self.get_job_info(job_id) is not None
+
+    async def subscribe(self, job_id: str, last_event_id: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """
+        订阅任务事件（需在后台事件循环中迭代）
+
+        先补发 ID 大于 last_event_id 的历史事件，再实时推送新事件，任务结束后退出
+
+        Args:
+            job_id: 任务ID
+            last_event_id: 客户端已收到的最后一个事件 ID
+
+        Yields:
+            {"event", "data", "id"} 字典
+        """
+        job = self.get_job(job_id)
+        cursor = max(0, int(last_event_id or 0))
+        if job is None:
+            async for event in self._subscribe_shared(job_id, cursor):
+                yield event
+            return
+
+        while True:
+            while cursor < len(job.events):
+                event = job.events[cursor]
+                cursor += 1
+                yield event
+
+            if job.done:
+                return
+
+            waiter = asyncio.get_running_loop().create_future()
+            job._waiters.append(waiter)
+            await waiter
+
+    async def _subscribe_shared(self, job_id: str, cursor: int) -> AsyncIterator[Dict[str, Any]]:
+        """订阅运行在其他 worker 上的任务（轮询共享存储中的事件日志）"""
+        store = self._shared_store()
+        if store is None:
+            return
+
+        while True:
+            # 先读取任务状态再读取事件：任务结束前写入的事件都能在本轮读到
+            info = await asyncio.to_thread(store.get_job, job_id)
+            events = await asyncio.to_thread(store.get_job_events, job_id, cursor)
+            for event in events:
+                cursor = event["id"]
+                yield event
+
+            if info is None or info["status"] != "running":
+                return
+            if time.time() - info["updated_at"] > self.STALE_SECONDS:
+                logger.warning(f"后台任务 {job_id} 超过 {self.STALE_SECONDS:.0f} 秒没有更新，运行它的 worker 可能已退出")
+                return
+            if not events:
+                await asyncio.sleep(self.REMOTE_POLL_SECONDS)
+
+    def _purge_expired(self) -> None:
+        """清理过期的已完成任务（本进程和共享存储）"""
+        now = time.time()
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.done and job.finished_at and now - job.finished_at > self.RETENTION_SECONDS
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+            purge_store = now - self._last_store_purge >= self.STORE_PURGE_INTERVAL
+            if purge_store:
+                self._last_store_purge = now
+        if expired:
+            logger.debug(f"清理过期后台任务: {len(expired)} 个")
+
+        store = self._shared_store() if purge_store else None
+        if store is not None:
+            try:
+                purged = store.purge_jobs(now - self.RETENTION_SECONDS)
+            except Exception as e:
+                logger.debug(f"清理存储中的过期后台任务失败: {e}")
+                return
+            if purged:
+                logger.debug(f"清理存储中的过期后台任务: {purged} 个")
+
+
+# 全局任务管理器实例
+_manager_instance = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """获取全局后台任务管理器"""
+    global _manager_instance
+    with _manager_lock:
+        if _manager_instance is None:
+            _manager_instance = JobManager()
+        return _manager_instance
@@ -0,0 +1,563 @@
+"""
+任务图片清单（manifest）
+
+每个任务目录下维护一个 manifest.json，记录 页面 -> 文件 -> 内容哈希：
+
+    {
+        "version": 1,
+        "pages": {
+            "0": {
+                "status": "complete",
+                "file": "0.png",
+                "size": 123456,
+                "sha256": "...",
+                "thumbnail": "thumb_0.png",
+                "updated_at": "2025-01-01T00:00:00"
+            }
+        },
+        "updated_at": "2025-01-01T00:00:00"
+    }
+
+写入流程：
+1. 先在清单中写入预写标记（包含新图片的文件名、大小和哈希）：新页面记为 status=pending；
+   已完成的页面（重试覆盖）保留原有 complete 记录，只增加 "pending": {...} 字段
+2. 图片和缩略图先写临时文件再 os.replace，不会留下写了一半的 PNG
+3. 写入完成后把页面更新为 complete 并记录大小和哈希（同时去掉 pending 字段）
+进程在第 2 步之前崩溃时，新页面仍为 pending，不会被当作已完成；重试覆盖的页面保留原来的完成记录。
+进程在第 2、3 步之间崩溃时，磁盘上已是新图片而清单仍是旧哈希：读取清单时发现带预写标记的页面，
+按磁盘上的实际内容重新计算哈希（与预写标记一致时直接补记为完成），图片的 ETag 和 ZIP 签名不会停留在旧内容上。
+
+清单的读-改-写同时持有进程内的分段锁和任务目录下 .manifest.lock 的 fcntl.flock 文件锁，
+每次都基于磁盘上的最新清单合并修改，多个 worker 进程同时写同一任务时不会互相覆盖
+（没有 fcntl 的平台只有进程内锁）。
+
+历史同步、ZIP 打包和图片下发只读取这一个小文件，不再列目录、逐个 stat 图片。
+旧版本生成的任务目录没有清单：读取时先按目录内容（仅 <页码>.png/jpg/jpeg）返回不含哈希的页面列表，
+清单在后台线程中补建（计算哈希并写入），读请求不等待；第一次写入页面时同样会先补建。
+
+落盘策略由 Config.IMAGE_FSYNC 控制：
+- none: 不主动 fsync，交给操作系统回写
+- batch: 任务（或一轮重试）结束时统一 fsync 本任务写入的文件、目录和清单（默认）
+- always: 每个文件写入后立即 fsync
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from backend.config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只使用进程内锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "manifest.json"
+LOCK_FILENAME = ".manifest.lock"
+# 任务目录中缓存的图片 ZIP 文件名（页面变化时删除）
+ARCHIVE_FILENAME = ".images.zip"
+MANIFEST_VERSION = 1
+
+# 页面图片文件名：<页码>.png / .jpg / .jpeg
+PAGE_FILENAME = re.compile(r"^(\d+)\.(png|jpg|jpeg)$")
+
+
+def write_file_atomic(path: str, data: bytes, fsync: bool = False) -> None:
+    """
+    原子写入文件（同目录临时文件 + os.replace）
+
+    Args:
+        path: 目标路径
+        data: 文件内容
+        fsync: 替换前是否 fsync 文件内容
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _fsync_path(path: str) -> None:
+    """fsync 文件或目录（目录 fsync 使 rename 持久化；不支持的平台忽略）"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class ManifestStore:
+    """任务图片清单的读写（同一任务的清单更新串行执行）"""
+
+    # 分段锁数量：按任务目录哈希选择锁，不随任务数量增长
+    LOCK_STRIPES = 64
+    # 缓存最近读取的清单数量（图片下发时每次请求只需 stat 清单文件）
+    CACHE_SIZE = 256
+    # 预写标记超过该时间（秒）仍未完成时视为写入进程已退出，不再等待它完成
+    PENDING_STALE_SECONDS = 300
+
+    def __init__(self, fsync_mode: Optional[str] = None):
+        self.fsync_mode = fsync_mode or Config.IMAGE_FSYNC
+        self._locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        # 任务目录 -> batch 模式下尚未 fsync 的文件
+        self._unsynced: Dict[str, Set[str]] = {}
+        self._unsynced_lock = threading.Lock()
+        # 任务目录 -> ((mtime_ns, size, inode), 清单)
+        self._cache: "OrderedDict[str, Tuple[Tuple[int, int, int], Dict[str, Any]]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # 任务目录 -> 后台补建清单的 Future（同一目录只补建一次，补建逐个执行）
+        self._rebuilds: Dict[str, Future] = {}
+        self._rebuild_lock = threading.Lock()
+        self._rebuild_executor: Optional[ThreadPoolExecutor] = None
+
+    def _lock_for(self, task_dir: str) -> threading.Lock:
+        return self._locks[hash(os.path.abspath(task_dir)) % self.LOCK_STRIPES]
+
+    @contextmanager
+    def _task_lock(self, task_dir: str):
+        """
+        持有任务清单的锁：进程内分段锁 + 跨进程文件锁
+
+        文件锁所在目录不可写（如只读的旧任务目录）时只使用进程内锁
+        """
+        with self._lock_for(task_dir):
+            fd = None
+            if fcntl is not None:
+                try:
+                    fd = os.open(os.path.join(task_dir, LOCK_FILENAME), os.O_RDWR | os.O_CREAT, 0o644)
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                except OSError as e:
+                    logger.debug(f"获取任务清单文件锁失败，仅使用进程内锁: {task_dir}, {e}")
+                    if fd is not None:
+                        os.close(fd)
+                        fd = None
+            try:
+                yield
+            finally:
+                if fd is not None:
+                    # 关闭文件描述符即释放 flock
+                    os.close(fd)
+
+    def load(self, task_dir: str) -> Dict[str, Any]:
+        """
+        读取任务清单（按清单文件的修改时间缓存，返回值只读）
+
+        Args:
+            task_dir: 任务目录
+
+        Returns:
+            清单字典；文件不存在或损坏时返回空清单
+        """
+        path = os.path.join(task_dir, MANIFEST_FILENAME)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return self._read(task_dir)
+        key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+        with self._cache_lock:
+            cached = self._cache.get(task_dir)
+            if cached is not None and cached[0] == key:
+                self._cache.move_to_end(task_dir)
+                return cached[1]
+
+        manifest = self._read(task_dir)
+        with self._cache_lock:
+            self._cache[task_dir] = (key, manifest)
+            self._cache.move_to_end(task_dir)
+            while len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return manifest
+
+    def _read(self, task_dir: str) -> Dict[str, Any]:
+        """从磁盘读取清单（不使用缓存，可修改）"""
+        path = os.path.join(task_dir, MANIFEST_FILENAME)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if isinstance(manifest, dict) and isinstance(manifest.get("pages"), dict):
+                return manifest
+            logger.warning(f"任务清单格式不正确，将重新生成: {path}")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取任务清单失败，将重新生成: {path}, {e}")
+        return {"version": MANIFEST_VERSION, "pages": {}}
+
+    def _save(self, task_dir: str, manifest: Dict[str, Any]) -> None:
+        """写入清单（调用方持有该任务的锁）"""
+        data = json.dumps(manifest, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        write_file_atomic(
+            os.path.join(task_dir, MANIFEST_FILENAME), data,
+            fsync=self.fsync_mode == "always"
+        )
+
+    def _update_page(self, task_dir: str, index: int, entry: Dict[str, Any], pending: bool = False) -> None:
+        """
+        在锁内基于磁盘上的最新清单更新单个页面
+
+        Args:
+            task_dir: 任务目录
+            index: 页面索引
+            entry: 页面记录
+            pending: 是否为预写标记；页面已有 complete 记录时只附加 pending 字段，保留原记录
+        """
+        with self._task_lock(task_dir):
+            if os.path.exists(os.path.join(task_dir, MANIFEST_FILENAME)):
+                manifest = self._read(task_dir)
+            else:
+                # 旧任务目录第一次写入：先收录已有的图片，避免清单中丢失它们
+                manifest = self._scan_directory(task_dir)
+            pages = manifest["pages"]
+            current = pages.get(str(index))
+            if pending and current and current.get("status") == "complete":
+                marker = {k: v for k, v in entry.items() if k != "status"}
+                entry = dict(current, pending=marker)
+            manifest["version"] = MANIFEST_VERSION
+            pages[str(index)] = entry
+            manifest["updated_at"] = entry["updated_at"]
+            self._save(task_dir, manifest)
+
+    def list_pages(self, task_dir: str) -> List[Dict[str, Any]]:
+        """
+        已完成的页面列表（按页码排序）
+
+        没有清单的旧任务目录按目录内容列出页面（sha256 为 None），并在后台补建清单，
+        读取路径上不计算哈希、不写文件
+
+        Args:
+            task_dir: 任务目录
+
+        Returns:
+            [{"index", "file", "size", "sha256", "thumbnail", "updated_at"}, ...]
+        """
+        if os.path.exists(os.path.join(task_dir, MANIFEST_FILENAME)):
+            manifest = self.load(task_dir)
+        else:
+            self.schedule_rebuild(task_dir)
+            manifest = self._scan_directory(task_dir, hash_files=False)
+
+        if any(self._needs_recovery(entry) for entry in manifest["pages"].values()):
+            manifest = self._recover_pending(task_dir)
+
+        pages = [
+            {**{k: v for k, v in entry.items() if k != "pending"}, "index": int(index)}
+            for index, entry in manifest["pages"].items()
+            if entry.get("status") == "complete"
+        ]
+        return sorted(pages, key=lambda page: page["index"])
+
+    def _needs_recovery(self, entry: Dict[str, Any]) -> bool:
+        """
+        页面是否带有需要核对的预写标记
+
+        重试覆盖的页面（complete + pending）总是核对；新页面（status=pending）的预写标记过期后不再核对，
+        避免每次读取都计算一个从未写入成功的页面的哈希
+        """
+        if entry.get("status") == "complete":
+            return "pending" in entry
+        if entry.get("status") != "pending":
+            return False
+        return not self._is_stale(entry)
+
+    def _is_stale(self, marker: Dict[str, Any]) -> bool:
+        try:
+            updated_at = datetime.fromisoformat(marker["updated_at"])
+        except (KeyError, TypeError, ValueError):
+            return True
+        return (datetime.now() - updated_at).total_seconds() > self.PENDING_STALE_SECONDS
+
+    def _recover_pending(self, task_dir: str) -> Dict[str, Any]:
+        """
+        按磁盘上的实际内容核对带预写标记的页面（写入进程在替换图片后、更新清单前崩溃的情况）
+
+        - 图片已是预写标记记录的新内容：补记为 complete
+        - 重试覆盖的页面内容与记录不符：大小和哈希改为磁盘上的实际值
+        - 预写标记过期：去掉标记，不再核对
+        写入仍在进行时同样安全：图片是原子替换的，核对结果总是描述磁盘上的当前文件
+
+        Args:
+            task_dir: 任务目录
+
+        Returns:
+            核对后的清单
+        """
+        with self._task_lock(task_dir):
+            manifest = self._read(task_dir)
+            changed = False
+            for index, entry in list(manifest["pages"].items()):
+                if not self._needs_recovery(entry):
+                    continue
+                complete = entry.get("status") == "complete"
+                marker = entry["pending"] if complete else entry
+                path = os.path.join(task_dir, marker.get("file") or "")
+                try:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                except OSError:
+                    data = None
+
+                digest = hashlib.sha256(data).hexdigest() if data is not None else None
+                if digest is not None and digest == marker.get("sha256"):
+                    thumbnail = marker.get("thumbnail")
+                    manifest["pages"][index] = {
+                        "status": "complete",
+                        "file": marker["file"],
+                        "size": len(data),
+                        "sha256": digest,
+                        "thumbnail": thumbnail if thumbnail and os.path.exists(os.path.join(task_dir, thumbnail)) else None,
+                        "updated_at": marker["updated_at"],
+                    }
+                    logger.warning(f"📋 补记写入中断的页面: {task_dir} [{index}]")
+                    changed = True
+                elif complete:
+                    if digest is not None and path == os.path.join(task_dir, entry["file"]) and digest != entry.get("sha256"):
+                        entry.update(size=len(data), sha256=digest)
+                        logger.warning(f"📋 页面内容与清单不符，已按实际内容更新哈希: {task_dir} [{index}]")
+                        changed = True
+                    if self._is_stale(marker):
+                        del entry["pending"]
+                        changed = True
+            if changed:
+                try:
+                    self._save(task_dir, manifest)
+                except OSError as e:
+                    logger.warning(f"写入任务清单失败: {task_dir}, {e}")
+            return manifest
+
+    def find_file(self, task_dir: str, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        按文件名查找已完成的页面记录
+
+        Args:
+            task_dir: 任务目录
+            filename: 图片文件名
+
+        Returns:
+            页面记录，不在清单中时返回 None
+        """
+        for page in self.list_pages(task_dir):
+            if page["file"] == filename:
+                return page
+        return None
+
+    def rebuild(self, task_dir: str) -> Dict[str, Any]:
+        """
+        按目录内容重建清单（用于旧版本生成、没有清单的任务目录）
+
+        只收录 <页码>.png/jpg/jpeg，并计算大小和哈希；写入失败（如目录只读）时仍返回重建结果
+
+        Args:
+            task_dir: 任务目录
+
+        Returns:
+            重建后的清单
+        """
+        with self._task_lock(task_dir):
+            # 等待锁期间其他线程或进程可能已写入清单
+            if os.path.exists(os.path.join(task_dir, MANIFEST_FILENAME)):
+                return self._read(task_dir)
+
+            manifest = self._scan_directory(task_dir)
+            try:
+                self._save(task_dir, manifest)
+                logger.info(f"📋 已为任务目录补建图片清单: {task_dir}（{len(manifest['pages'])} 张）")
+            except OSError as e:
+                logger.warning(f"写入任务清单失败: {task_dir}, {e}")
+            return manifest
+
+    def schedule_rebuild(self, task_dir: str) -> Future:
+        """
+        在后台线程中为旧任务目录补建清单（同一目录已在补建时返回已有的 Future）
+
+        Args:
+            task_dir: 任务目录
+
+        Returns:
+            补建任务的 Future，结果为补建后的清单
+        """
+        with self._rebuild_lock:
+            future = self._rebuilds.get(task_dir)
+            if future is not None:
+                return future
+            if self._rebuild_executor is None:
+                self._rebuild_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="manifest-rebuild")
+            future = self._rebuild_executor.submit(self._rebuild_in_background, task_dir)
+            self._rebuilds[task_dir] = future
+            return future
+
+    def _rebuild_in_background(self, task_dir: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self.rebuild(task_dir)
+        except Exception as e:
+            logger.warning(f"补建任务清单失败: {task_dir}, {e}")
+            return None
+        finally:
+            with self._rebuild_lock:
+                self._rebuilds.pop(task_dir, None)
+
+    def _scan_directory(self, task_dir: str, hash_files: bool = True) -> Dict[str, Any]:
+        """
+        扫描目录中的页面图片生成清单（补建时调用方持有该任务的锁）
+
+        Args:
+            task_dir: 任务目录
+            hash_files: 是否读取图片计算哈希；为 False 时只列目录（sha256 为 None，用于读取路径）
+
+        Returns:
+            清单字典
+        """
+        pages = {}
+        for entry in os.scandir(task_dir):
+            match = PAGE_FILENAME.match(entry.name)
+            if not match or not entry.is_file():
+                continue
+            if hash_files:
+                with open(entry.path, "rb") as f:
+                    data = f.read()
+                size, digest = len(data), hashlib.sha256(data).hexdigest()
+            else:
+                size, digest = entry.stat().st_size, None
+            thumbnail = f"thumb_{entry.name}"
+            pages[str(int(match.group(1)))] = {
+                "status": "complete",
+                "file": entry.name,
+                "size": size,
+                "sha256": digest,
+                "thumbnail": thumbnail if os.path.exists(os.path.join(task_dir, thumbnail)) else None,
+                "updated_at": datetime.fromtimestamp(entry.stat().st_mtime).isoformat(),
+            }
+
+        return {
+            "version": MANIFEST_VERSION,
+            "pages": pages,
+            "updated_at": datetime.now().isoformat(),
+        }
+
+    def write_page(
+        self,
+        task_dir: str,
+        index: int,
+        filename: str,
+        image_data: bytes,
+        thumbnail_data: Optional[bytes] = None
+    ) -> Dict[str, Any]:
+        """
+        原子写入页面图片（及缩略图）并记录到清单
+
+        Args:
+            task_dir: 任务目录
+            index: 页面索引
+            filename: 图片文件名
+            image_data: 图片二进制数据
+            thumbnail_data: 缩略图二进制数据（可选，保存为 thumb_<filename>）
+
+        Returns:
+            清单中该页面的记录
+        """
+        os.makedirs(task_dir, exist_ok=True)
+        fsync_now = self.fsync_mode == "always"
+        digest = hashlib.sha256(image_data).hexdigest()
+        thumbnail = f"thumb_{filename}" if thumbnail_data is not None else None
+
+        # 预写标记：写入过程中崩溃时，新页面在清单中保持 pending，已完成的页面保留原记录；
+        # 标记中记录新图片的哈希，图片替换后、清单更新前崩溃时读取清单可据此补记
+        self._update_page(task_dir, index, {
+            "status": "pending",
+            "file": filename,
+            "size": len(image_data),
+            "sha256": digest,
+            "thumbnail": thumbnail,
+            "updated_at": datetime.now().isoformat(),
+        }, pending=True)
+
+        written = [os.path.join(task_dir, filename)]
+        write_file_atomic(written[0], image_data, fsync=fsync_now)
+
+        if thumbnail_data is not None:
+            written.append(os.path.join(task_dir, thumbnail))
+            write_file_atomic(written[1], thumbnail_data, fsync=fsync_now)
+
+        if fsync_now:
+            _fsync_path(task_dir)
+        elif self.fsync_mode == "batch":
+            with self._unsynced_lock:
+                self._unsynced.setdefault(task_dir, set()).update(written)
+
+        entry = {
+            "status": "complete",
+            "file": filename,
+            "size": len(image_data),
+            "sha256": digest,
+            "thumbnail": thumbnail,
+            "updated_at": datetime.now().isoformat(),
+        }
+        self._update_page(task_dir, index, entry)
+
+        # 页面内容变化后缓存的 ZIP 已过期，立即删除而不是留到下次下载时覆盖
+        try:
+            os.remove(os.path.join(task_dir, ARCHIVE_FILENAME))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.debug(f"删除过期的图片 ZIP 缓存失败: {task_dir}, {e}")
+        return entry
+
+    def flush(self, task_dir: str) -> None:
+        """
+        batch 模式下 fsync 该任务写入的文件、任务目录和清单
+
+        Args:
+            task_dir: 任务目录
+        """
+        if self.fsync_mode != "batch":
+            return
+
+        with self._unsynced_lock:
+            paths = self._unsynced.pop(task_dir, set())
+        if not paths:
+            return
+
+        for path in paths:
+            _fsync_path(path)
+        _fsync_path(os.path.join(task_dir, MANIFEST_FILENAME))
+        _fsync_path(task_dir)
+        logger.debug(f"已落盘 {len(paths)} 个文件: {task_dir}")
+
+
+# 全局清单存储实例
+_store_instance = None
+_store_lock = threading.Lock()
+
+
+def get_manifest_store() -> ManifestStore:
+    """获取全局任务清单存储"""
+    global _store_instance
+    with _store_lock:
+        if _store_instance is None:
+            _store_instance = ManifestStore()
+        return _store_instance
@@ -1,26 +1,36 @@
 import logging
-import os
 import re
 import base64
+import threading
 import yaml
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
+from backend.config import Config
+from backend.generators.registry import config_fingerprint
+from backend.utils.deadline import deadline_scope
 from backend.utils.text_client import get_text_chat_client
 
 logger = logging.getLogger(__name__)
 
+TEXT_CONFIG_PATH = Path(__file__).parent.parent.parent / 'text_providers.yaml'
+PROMPT_TEMPLATE_PATH = Path(__file__).parent.parent / 'prompts' / 'outline_prompt.txt'
+
 
 class OutlineService:
-    def __init__(self):
+    def __init__(self, text_config: dict = None):
         logger.debug("初始化 OutlineService...")
-        self.text_config = self._load_text_config()
+        self.text_config = text_config if text_config is not None else self._load_text_config()
+        self.config_version = text_config_version(self.text_config)
         self.client = self._get_client()
-        self.prompt_template = self._load_prompt_template()
+        # 提示词模板缓存：(模板文件 mtime/size/inode, 模板内容)，服务实例被复用时模板文件修改后也能生效
+        self._prompt_cache: Optional[Tuple[Optional[Tuple[int, int, int]], str]] = None
+        self._prompt_lock = threading.Lock()
         logger.info(f"OutlineService 初始化完成，使用服务商: {self.text_config.get('active_provider')}")
 
-    def _load_text_config(self) -> dict:
+    @staticmethod
+    def _load_text_config() -> dict:
         """加载文本生成配置"""
-        config_path = Path(__file__).parent.parent.parent / 'text_providers.yaml'
+        config_path = TEXT_CONFIG_PATH
         logger.debug(f"加载文本配置: {config_path}")
 
         if config_path.exists():
@@ -87,14 +97,25 @@ class OutlineService:
         return get_text_chat_client(provider_config)
 
     def _load_prompt_template(self) -> str:
-        prompt_path = os.path.join(
-            os.path.dirname(os.path.dirname(__file__)),
-            "prompts",
-            "outline_prompt.txt"
-        )
-        with open(prompt_path, "r", encoding="utf-8") as f:
+        with open(PROMPT_TEMPLATE_PATH, "r", encoding="utf-8") as f:
             return f.read()
 
+    @property
+    def prompt_template(self) -> str:
+        """大纲提示词模板（按模板文件状态缓存，文件修改后重新读取）"""
+        try:
+            stat = PROMPT_TEMPLATE_PATH.stat()
+            key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        except OSError:
+            key = None
+
+        with self._prompt_lock:
+            if self._prompt_cache is None or self._prompt_cache[0] != key:
+                if self._prompt_cache is not None:
+                    logger.info("🔄 大纲提示词模板已修改，重新加载")
+                self._prompt_cache = (key, self._load_prompt_template())
+            return self._prompt_cache[1]
+
     def _parse_outline(self, outline_text: str) -> List[Dict[str, Any]]:
         # 按 <page> 分割页面（兼容旧的 --- 分隔符）
         if '<page>' in outline_text:
@@ -152,13 +173,15 @@ class OutlineService:
             max_output_tokens = provider_config.get('max_output_tokens', 8000)
 
             logger.info(f"调用文本生成 API: model={model}, temperature={temperature}")
-            outline_text = self.client.generate_text(
-                prompt=prompt,
-                model=model,
-                temperature=temperature,
-                max_output_tokens=max_output_tokens,
-                images=images
-            )
+            # 大纲与单页图片一样受 PAGE_DEADLINE 限制（含限流重试），请求超时不超过剩余时间
+            with deadline_scope(Config.PAGE_DEADLINE, "大纲生成截止时间"):
+                outline_text = self.client.generate_text(
+                    prompt=prompt,
+                    model=model,
+                    temperature=temperature,
+                    max_output_tokens=max_output_tokens,
+                    images=images
+                )
 
             logger.debug(f"API 返回文本长度: {len(outline_text)} 字符")
             pages = self._parse_outline(outline_text)
@@ -230,9 +253,55 @@ class OutlineService:
             }
 
 
+def text_config_version(text_config: dict) -> str:
+    """文本配置版本：当前服务商名称及其配置的指纹，其余服务商的改动不影响大纲服务"""
+    active_provider = text_config.get('active_provider', 'google_gemini')
+    return config_fingerprint({
+        'active_provider': active_provider,
+        'provider': (text_config.get('providers') or {}).get(active_provider),
+    })
+
+
+# 全局服务实例（客户端及其连接池跨请求复用，文本配置变化时重建）
+_service_instance = None
+_service_lock = threading.Lock()
+# 文本配置缓存：(文件 mtime/size/inode, 配置)，配置文件未变化时不重复解析 YAML
+_config_cache: Optional[Tuple[Optional[Tuple[int, int, int]], dict]] = None
+
+
+def _load_text_config_cached() -> dict:
+    """读取文本配置（按配置文件状态缓存；其他 worker 修改配置文件后也能感知）"""
+    global _config_cache
+    try:
+        stat = TEXT_CONFIG_PATH.stat()
+        key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    except OSError:
+        key = None
+
+    if _config_cache is None or _config_cache[0] != key:
+        _config_cache = (key, OutlineService._load_text_config())
+    return _config_cache[1]
+
+
 def get_outline_service() -> OutlineService:
     """
     获取大纲生成服务实例
-    每次调用都创建新实例以确保配置是最新的
+
+    文本配置（当前服务商及其配置）未变化时复用同一实例，
+    避免每次请求重新解析配置、读取提示词模板并新建客户端和 TLS 连接
     """
-    return OutlineService()
+    global _service_instance
+    with _service_lock:
+        text_config = _load_text_config_cached()
+        if _service_instance is None or _service_instance.config_version != text_config_version(text_config):
+            if _service_instance is not None:
+                logger.info("🔄 文本服务商配置已变化，重建大纲生成服务")
+            _service_instance = OutlineService(text_config)
+        return _service_instance
+
+
+def refresh_outline_service():
+    """清除文本配置缓存（配置更新后调用），下次获取服务时按新配置判断是否需要重建"""
+    global _config_cache
+    with _service_lock:
+        _config_cache = None
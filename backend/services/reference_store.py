@@ -0,0 +1,624 @@
+"""
+参考图存储
+
+用户经常在不同任务中重复上传同一批产品图。参考图上传后按内容保存到
+history/.references/<参考图 ID>/，重复上传时直接复用已有的压缩结果：
+
+    history/.references/<id>/
+        meta.json        内容哈希、各尺寸版本信息（修改时间记录最近一次使用）
+        200kb            大纲生成使用的参考图（不超过 200KB）
+        30kb             图片生成使用的参考图（首次使用时由 200kb 压缩生成）
+        200kb.b64 ...    对应版本的 base64 编码（首次读取时生成）
+        owners/<task_id> 使用该参考图的任务（历史记录删除时释放）
+    history/.references/.hashes/<sha256>   内容哈希 -> 参考图 ID
+    history/.references/.owners/<task_id>  任务使用的参考图 ID 列表
+
+只有内容完全相同时才复用：原始上传内容或任一尺寸版本的 SHA-256 相同。
+存储由所有用户共享，外观相近的图片（如同款产品的不同配色）可能来自不同用户，不能互相替代。
+
+多个 worker 共享同一个目录：
+- 新参考图先写入临时目录，再整体重命名为参考图目录，其他 worker 不会看到只有部分文件的参考图
+- 内容哈希索引是每个哈希一个文件，按需读取，不需要扫描整个目录
+
+目录大小由淘汰策略控制（Config.REFERENCE_STORE_MAX_MB / REFERENCE_STORE_TTL）：
+没有任务使用且超过保留时间未被使用的参考图被删除，总大小超出上限时按最近使用时间淘汰（先淘汰没有任务使用的）。
+"""
+
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from backend.config import Config
+from backend.services.manifest import write_file_atomic
+from backend.utils.image_executor import get_image_executor
+
+logger = logging.getLogger(__name__)
+
+REFERENCES_ROOT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "history",
+    ".references"
+)
+META_FILENAME = "meta.json"
+OWNERS_DIRNAME = "owners"
+HASHES_DIRNAME = ".hashes"
+OWNER_INDEX_DIRNAME = ".owners"
+TMP_PREFIX = ".tmp-"
+
+# 上传时保存的基础版本（KB），其余尺寸由它压缩得到
+BASE_VARIANT_KB = 200
+
+
+def _variant_filename(max_size_kb: int) -> str:
+    return f"{max_size_kb}kb"
+
+
+def content_hash(data: bytes) -> str:
+    """图片内容的 SHA-256"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_image(data: bytes) -> bool:
+    """数据是否为可识别的图片"""
+    from PIL import Image
+
+    try:
+        Image.open(io.BytesIO(data)).verify()
+        return True
+    except Exception as e:
+        logger.debug(f"无法识别的图片: {e}")
+        return False
+
+
+class ReferenceStore:
+    """按内容去重的参考图存储"""
+
+    # 内存中缓存的参考图数据上限（字节）
+    CACHE_BYTES = 32 * 1024 * 1024
+    # 两次淘汰检查的最小间隔（秒）
+    EVICT_INTERVAL = 300
+    # 同一参考图两次记录使用时间的最小间隔（秒）
+    TOUCH_INTERVAL = 60
+    # 任务释放参考图后，最近该时间内（秒）仍被使用过的参考图暂不删除（可能有其他用户刚上传了同一张图片）
+    RELEASE_GRACE = 600
+    # 崩溃残留的临时目录保留时间（秒）
+    TMP_TTL = 3600
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or Config.REFERENCE_STORE_DIR or REFERENCES_ROOT
+        self._lock = threading.Lock()
+        # 内容哈希 -> 参考图 ID（只缓存命中结果，使用前检查参考图仍存在）
+        self._by_hash: Dict[str, str] = {}
+        # 参考图 ID -> 最近一次记录使用时间（time.monotonic）
+        self._touched: Dict[str, float] = {}
+        self._last_evict = 0.0
+        # (参考图 ID, 文件名) -> 数据
+        self._cache: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        self._cache_size = 0
+
+    # ==================== 索引 ====================
+
+    def _ref_dir(self, ref_id: str) -> str:
+        return os.path.join(self.root, ref_id)
+
+    def _hash_path(self, digest: str) -> str:
+        return os.path.join(self.root, HASHES_DIRNAME, digest)
+
+    def _read_meta(self, ref_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self._ref_dir(ref_id), META_FILENAME), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _encode_meta(meta: Dict[str, Any]) -> bytes:
+        return json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def _write_meta(self, ref_id: str, meta: Dict[str, Any]) -> None:
+        write_file_atomic(os.path.join(self._ref_dir(ref_id), META_FILENAME), self._encode_meta(meta))
+
+    def _write_hashes(self, ref_id: str, digests: Iterable[str]) -> None:
+        """写入内容哈希索引（调用方持有锁）"""
+        digests = [digest for digest in digests if self._by_hash.get(digest) != ref_id]
+        if not digests:
+            return
+        os.makedirs(os.path.join(self.root, HASHES_DIRNAME), exist_ok=True)
+        for digest in digests:
+            write_file_atomic(self._hash_path(digest), ref_id.encode("ascii"))
+            self._by_hash[digest] = ref_id
+
+    def _add_hashes(self, ref_id: str, digests: Iterable[str]) -> None:
+        """给参考图追加内容哈希（调用方持有锁）"""
+        digests = [digest for digest in digests if self._by_hash.get(digest) != ref_id]
+        if not digests:
+            return
+        meta = self._read_meta(ref_id)
+        if meta is None:
+            return
+        if not set(digests) <= set(meta.get("hashes", [])):
+            meta["hashes"] = sorted(set(meta.get("hashes", [])) | set(digests))
+            self._write_meta(ref_id, meta)
+        self._write_hashes(ref_id, digests)
+
+    def _touch(self, ref_id: str) -> None:
+        """记录参考图最近一次使用的时间（meta.json 的修改时间，多个 worker 共享）"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._touched.get(ref_id, -self.TOUCH_INTERVAL) < self.TOUCH_INTERVAL:
+                return
+            self._touched[ref_id] = now
+        try:
+            os.utime(os.path.join(self._ref_dir(ref_id), META_FILENAME))
+        except OSError:
+            pass
+
+    # ==================== 查找与保存 ====================
+
+    def is_valid_id(self, ref_id: str) -> bool:
+        """参考图 ID 格式是否合法（32 位十六进制）"""
+        return isinstance(ref_id, str) and len(ref_id) == 32 and all(c in "0123456789abcdef" for c in ref_id)
+
+    def exists(self, ref_id: str) -> bool:
+        """参考图是否存在"""
+        return self.is_valid_id(ref_id) and os.path.isfile(os.path.join(self._ref_dir(ref_id), META_FILENAME))
+
+    def info(self, ref_id: str) -> Optional[Dict[str, Any]]:
+        """
+        参考图信息
+
+        Args:
+            ref_id: 参考图 ID
+
+        Returns:
+            {"id", "size", "created_at"}，不存在时返回 None
+        """
+        meta = self._read_meta(ref_id) if self.exists(ref_id) else None
+        if meta is None:
+            return None
+        return {"id": ref_id, "size": meta.get("size"), "created_at": meta.get("created_at")}
+
+    def lookup(self, digest: str) -> Optional[str]:
+        """
+        按内容哈希查找参考图
+
+        Args:
+            digest: 原始上传内容或任一尺寸版本的 SHA-256
+
+        Returns:
+            参考图 ID，不存在时返回 None
+        """
+        with self._lock:
+            ref_id = self._by_hash.get(digest)
+        if ref_id is None:
+            try:
+                with open(self._hash_path(digest), "r", encoding="ascii") as f:
+                    ref_id = f.read().strip()
+            except (OSError, ValueError):
+                return None
+        if not self.exists(ref_id):
+            with self._lock:
+                self._by_hash.pop(digest, None)
+            return None
+        with self._lock:
+            self._by_hash[digest] = ref_id
+        self._touch(ref_id)
+        return ref_id
+
+    def add(self, image_data: bytes, aliases: Iterable[str] = ()) -> str:
+        """
+        保存参考图（已压缩到 BASE_VARIANT_KB 以内），与已有参考图内容相同时返回已有的 ID
+
+        Args:
+            image_data: 参考图数据
+            aliases: 其他指向该图片的内容哈希（如压缩前原始上传内容的哈希）
+
+        Returns:
+            参考图 ID
+
+        Raises:
+            ValueError: 无法识别的图片
+        """
+        digest = content_hash(image_data)
+        hashes = {digest, *aliases}
+
+        ref_id = self.lookup(digest)
+        if ref_id is not None:
+            with self._lock:
+                self._add_hashes(ref_id, hashes)
+            return ref_id
+
+        if not is_image(image_data):
+            raise ValueError("无法识别的图片文件")
+
+        ref_id = digest[:32]
+        meta = {
+            "id": ref_id,
+            "hashes": sorted(hashes),
+            "size": len(image_data),
+            "variants": {str(BASE_VARIANT_KB): {"sha256": digest, "size": len(image_data)}},
+            "created_at": datetime.now().isoformat(),
+        }
+
+        # 在临时目录中写好所有文件再整体重命名，其他 worker 看到的参考图目录总是完整的
+        os.makedirs(self.root, exist_ok=True)
+        tmp_dir = os.path.join(self.root, f"{TMP_PREFIX}{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        try:
+            with open(os.path.join(tmp_dir, _variant_filename(BASE_VARIANT_KB)), "wb") as f:
+                f.write(image_data)
+            with open(os.path.join(tmp_dir, META_FILENAME), "wb") as f:
+                f.write(self._encode_meta(meta))
+            os.rename(tmp_dir, self._ref_dir(ref_id))
+            created = True
+        except OSError:
+            # 其他 worker 已保存同一张图片
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not self.exists(ref_id):
+                raise
+            created = False
+
+        with self._lock:
+            if created:
+                self._write_hashes(ref_id, hashes)
+            else:
+                self._add_hashes(ref_id, hashes)
+
+        if created:
+            logger.info(f"🖼️ 新增参考图: {ref_id} ({len(image_data) / 1024:.1f}KB)")
+        self.maybe_evict()
+        return ref_id
+
+    # ==================== 读取 ====================
+
+    def _cache_get(self, key: Tuple[str, str]) -> Any:
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self._cache.move_to_end(key)
+            return value
+
+    def _cache_put(self, key: Tuple[str, str], value: Any) -> None:
+        with self._lock:
+            if key in self._cache:
+                return
+            self._cache[key] = value
+            self._cache_size += len(value)
+            while self._cache_size > self.CACHE_BYTES and self._cache:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_size -= len(evicted)
+
+    def _read_file(self, ref_id: str, filename: str) -> Optional[bytes]:
+        key = (ref_id, filename)
+        data = self._cache_get(key)
+        if data is not None:
+            return data
+        try:
+            with open(os.path.join(self._ref_dir(ref_id), filename), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._cache_put(key, data)
+        return data
+
+    def get(self, ref_id: str, max_size_kb: int = BASE_VARIANT_KB) -> Optional[bytes]:
+        """
+        读取参考图的指定尺寸版本（不存在时由基础版本压缩生成并保存）
+
+        Args:
+            ref_id: 参考图 ID
+            max_size_kb: 最大文件大小（KB）
+
+        Returns:
+            图片数据，参考图不存在时返回 None
+        """
+        if not self.exists(ref_id):
+            return None
+        self._touch(ref_id)
+
+        data = self._read_file(ref_id, _variant_filename(max_size_kb))
+        if data is not None or max_size_kb == BASE_VARIANT_KB:
+            return data
+
+        base = self._read_file(ref_id, _variant_filename(BASE_VARIANT_KB))
+        if base is None:
+            return None
+        data = get_image_executor().compress(base, max_size_kb=max_size_kb)
+
+        digest = content_hash(data)
+        try:
+            write_file_atomic(os.path.join(self._ref_dir(ref_id), _variant_filename(max_size_kb)), data)
+        except OSError:
+            # 参考图刚被淘汰：本次仍返回压缩结果
+            return data
+        with self._lock:
+            meta = self._read_meta(ref_id)
+            if meta is not None:
+                meta.setdefault("variants", {})[str(max_size_kb)] = {"sha256": digest, "size": len(data)}
+                meta["hashes"] = sorted(set(meta.get("hashes", [])) | {digest})
+                self._write_meta(ref_id, meta)
+                self._write_hashes(ref_id, [digest])
+        logger.debug(f"生成参考图 {ref_id} 的 {max_size_kb}KB 版本: {len(data) / 1024:.1f}KB")
+        return data
+
+    def get_base64(self, ref_id: str, max_size_kb: int = BASE_VARIANT_KB) -> Optional[str]:
+        """
+        读取参考图指定尺寸版本的 base64 编码（首次读取时编码并保存）
+
+        Args:
+            ref_id: 参考图 ID
+            max_size_kb: 最大文件大小（KB）
+
+        Returns:
+            base64 字符串，参考图不存在时返回 None
+        """
+        filename = _variant_filename(max_size_kb) + ".b64"
+        encoded = self._read_file(ref_id, filename) if self.exists(ref_id) else None
+        if encoded is not None:
+            return encoded.decode("ascii")
+
+        data = self.get(ref_id, max_size_kb)
+        if data is None:
+            return None
+        encoded = base64.b64encode(data)
+        try:
+            write_file_atomic(os.path.join(self._ref_dir(ref_id), filename), encoded)
+        except OSError:
+            return encoded.decode("ascii")
+        self._cache_put((ref_id, filename), encoded)
+        return encoded.decode("ascii")
+
+    def compress_many(self, images: List[bytes], max_size_kb: int, owner: Optional[str] = None) -> List[bytes]:
+        """
+        压缩参考图：已保存的参考图直接使用对应尺寸的版本，其余交给图片处理进程池
+
+        Args:
+            images: 图片数据列表
+            max_size_kb: 最大文件大小（KB）
+            owner: 使用这些参考图的任务 ID（可选），记录后参考图在任务的历史记录删除前不会因过期被删除
+
+        Returns:
+            压缩后的图片数据列表（顺序与输入一致）
+        """
+        results: List[Optional[bytes]] = []
+        missing = []
+        ref_ids = []
+        for index, image_data in enumerate(images):
+            ref_id = self.lookup(content_hash(image_data))
+            data = self.get(ref_id, max_size_kb) if ref_id else None
+            if data is None:
+                missing.append(index)
+            else:
+                ref_ids.append(ref_id)
+            results.append(data)
+
+        if owner and ref_ids:
+            self.claim(owner, ref_ids)
+
+        if missing:
+            compressed = get_image_executor().compress_many([images[i] for i in missing], max_size_kb)
+            for index, data in zip(missing, compressed):
+                results[index] = data
+        return results
+
+    # ==================== 使用记录与淘汰 ====================
+
+    def _owner_index_path(self, owner: str) -> str:
+        return os.path.join(self.root, OWNER_INDEX_DIRNAME, owner)
+
+    @staticmethod
+    def _is_valid_owner(owner: str) -> bool:
+        return bool(owner) and "/" not in owner and "\\" not in owner and not owner.startswith(".")
+
+    def claim(self, owner: str, ref_ids: Iterable[str]) -> None:
+        """
+        记录任务使用的参考图
+
+        Args:
+            owner: 任务 ID
+            ref_ids: 参考图 ID 列表
+        """
+        if not self._is_valid_owner(owner):
+            return
+        ref_ids = [ref_id for ref_id in dict.fromkeys(ref_ids) if self.exists(ref_id)]
+        if not ref_ids:
+            return
+
+        for ref_id in ref_ids:
+            owners_dir = os.path.join(self._ref_dir(ref_id), OWNERS_DIRNAME)
+            try:
+                os.makedirs(owners_dir, exist_ok=True)
+                open(os.path.join(owners_dir, owner), "ab").close()
+            except OSError as e:
+                logger.debug(f"记录参考图使用失败: {ref_id}, {e}")
+
+        os.makedirs(os.path.join(self.root, OWNER_INDEX_DIRNAME), exist_ok=True)
+        with self._lock:
+            claimed = self._read_owner_index(owner)
+            write_file_atomic(
+                self._owner_index_path(owner),
+                "\n".join(dict.fromkeys(claimed + ref_ids)).encode("ascii")
+            )
+
+    def _read_owner_index(self, owner: str) -> List[str]:
+        try:
+            with open(self._owner_index_path(owner), "r", encoding="ascii") as f:
+                return [line for line in f.read().split() if self.is_valid_id(line)]
+        except (OSError, ValueError):
+            return []
+
+    def release(self, owner: str) -> int:
+        """
+        释放任务使用的参考图（任务的历史记录被删除时调用）
+
+        不再被任何任务使用、且最近 RELEASE_GRACE 秒内没有被使用过的参考图立即删除
+
+        Args:
+            owner: 任务 ID
+
+        Returns:
+            删除的参考图数量
+        """
+        if not self._is_valid_owner(owner):
+            return 0
+        removed = 0
+        for ref_id in self._read_owner_index(owner):
+            owners_dir = os.path.join(self._ref_dir(ref_id), OWNERS_DIRNAME)
+            try:
+                os.remove(os.path.join(owners_dir, owner))
+            except OSError:
+                pass
+            try:
+                has_owners = bool(os.listdir(owners_dir))
+            except OSError:
+                has_owners = False
+            last_used = self._last_used(ref_id)
+            if not has_owners and last_used is not None and time.time() - last_used > self.RELEASE_GRACE:
+                removed += self._remove(ref_id)
+        try:
+            os.remove(self._owner_index_path(owner))
+        except OSError:
+            pass
+        if removed:
+            logger.info(f"🗑️ 任务 {owner} 释放参考图: 删除 {removed} 张")
+        return removed
+
+    def _last_used(self, ref_id: str) -> Optional[float]:
+        try:
+            return os.stat(os.path.join(self._ref_dir(ref_id), META_FILENAME)).st_mtime
+        except OSError:
+            return None
+
+    def _remove(self, ref_id: str) -> int:
+        """删除参考图及其内容哈希索引，返回删除的数量（0 或 1）"""
+        meta = self._read_meta(ref_id) or {}
+        # 先重命名再删除，其他 worker 不会读到删除了一半的参考图
+        trash_dir = os.path.join(self.root, f"{TMP_PREFIX}{uuid.uuid4().hex}")
+        try:
+            os.rename(self._ref_dir(ref_id), trash_dir)
+        except OSError:
+            return 0
+        shutil.rmtree(trash_dir, ignore_errors=True)
+
+        with self._lock:
+            for digest in meta.get("hashes", []):
+                if self._by_hash.get(digest) == ref_id:
+                    del self._by_hash[digest]
+                try:
+                    with open(self._hash_path(digest), "r", encoding="ascii") as f:
+                        points_here = f.read().strip() == ref_id
+                    if points_here:
+                        os.remove(self._hash_path(digest))
+                except OSError:
+                    pass
+            self._touched.pop(ref_id, None)
+            for key in [key for key in self._cache if key[0] == ref_id]:
+                self._cache_size -= len(self._cache.pop(key))
+        return 1
+
+    def maybe_evict(self) -> int:
+        """距离上次检查超过 EVICT_INTERVAL 秒时执行淘汰，返回删除的参考图数量"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_evict < self.EVICT_INTERVAL:
+                return 0
+            self._last_evict = now
+        return self.evict()
+
+    def evict(self, max_bytes: Optional[int] = None, ttl: Optional[float] = None) -> int:
+        """
+        淘汰参考图
+
+        1. 没有任务使用、且超过 ttl 秒未被使用的参考图
+        2. 总大小超过 max_bytes 时，按最近使用时间从旧到新删除（先删除没有任务使用的）
+
+        Args:
+            max_bytes: 总大小上限（字节），默认 Config.REFERENCE_STORE_MAX_MB，0 表示不限制
+            ttl: 保留时间（秒），默认 Config.REFERENCE_STORE_TTL，0 表示不限制
+
+        Returns:
+            删除的参考图数量
+        """
+        if max_bytes is None:
+            max_bytes = Config.REFERENCE_STORE_MAX_MB * 1024 * 1024
+        if ttl is None:
+            ttl = Config.REFERENCE_STORE_TTL
+
+        now = time.time()
+        entries = []  # (是否有任务使用, 最近使用时间, 大小, 参考图 ID)
+        total = 0
+        try:
+            scanned = list(os.scandir(self.root))
+        except OSError:
+            return 0
+        for entry in scanned:
+            if entry.name.startswith(TMP_PREFIX):
+                # 崩溃残留的临时目录
+                try:
+                    if now - entry.stat().st_mtime > self.TMP_TTL:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                except OSError:
+                    pass
+                continue
+            if not self.is_valid_id(entry.name):
+                continue
+            last_used = self._last_used(entry.name)
+            if last_used is None:
+                continue
+            size = 0
+            try:
+                for item in os.scandir(entry.path):
+                    if item.is_file():
+                        size += item.stat().st_size
+            except OSError:
+                continue
+            try:
+                owned = bool(os.listdir(os.path.join(entry.path, OWNERS_DIRNAME)))
+            except OSError:
+                owned = False
+            entries.append((owned, last_used, size, entry.name))
+            total += size
+
+        removed = 0
+        kept = []
+        for owned, last_used, size, ref_id in entries:
+            if ttl and not owned and now - last_used > ttl:
+                removed += self._remove(ref_id)
+                total -= size
+            else:
+                kept.append((owned, last_used, size, ref_id))
+
+        if max_bytes and total > max_bytes:
+            for owned, last_used, size, ref_id in sorted(kept):
+                if total <= max_bytes:
+                    break
+                removed += self._remove(ref_id)
+                total -= size
+
+        if removed:
+            logger.info(f"🧹 参考图淘汰: 删除 {removed} 张，剩余 {total / 1024 / 1024:.1f}MB")
+        return removed
+
+
+# 全局参考图存储
+_store_instance = None
+_store_lock = threading.Lock()
+
+
+def get_reference_store() -> ReferenceStore:
+    """获取全局参考图存储"""
+    global _store_instance
+    with _store_lock:
+        if _store_instance is None:
+            _store_instance = ReferenceStore()
+        return _store_instance
@@ -0,0 +1,313 @@
+"""
+页面生成调度
+
+同一服务商同时在途的上游请求数由信号量限制。asyncio.Semaphore 按请求到达顺序放行，
+高并发模式下所有内容页同时提交，重试的页面重新排到队尾，用户最先查看的几页反而可能最后完成。
+
+PrioritySemaphore 在每次有空闲名额时，从等待中的请求里选出优先级最高的一个放行：
+1. 正式生成的页面优先于推测生成的页面（等待封面确认期间提前生成的内容页）；
+   封面确认后被正式生成接管的推测页面（PageScheduler.promote）与正式页面同等排序
+2. 用户正在查看的页面（焦点页，通过 POST /api/task/<task_id>/focus 上报）及其之后的页面优先，
+   其次是焦点页之前的页面。焦点页保存在任务状态存储中（多 worker 部署时上报请求可以落到任意 worker），
+   各进程按任务缓存最多 FOCUS_REFRESH_SECONDS 秒
+3. 同一区间内页码小的优先，优先级相同时按到达顺序
+
+名额空出时立即放行下一个请求，上游请求数始终保持在并发上限；焦点变化在下一次放行时生效。
+请求所属的页面通过 page_context() 设置在上下文变量中，对冲请求等子任务自动继承。
+"""
+
+import asyncio
+import contextvars
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+if TYPE_CHECKING:
+    from backend.services.task_store import TaskStateStore
+
+logger = logging.getLogger(__name__)
+
+
+class PageTicket(NamedTuple):
+    """上游请求所属的页面"""
+    task_id: str
+    index: int
+    speculative: bool = False
+
+
+# 当前协程正在生成的页面（未设置时优先放行）
+_current_page: contextvars.ContextVar[Optional[PageTicket]] = contextvars.ContextVar(
+    "magicbrush_current_page", default=None
+)
+
+
+@contextmanager
+def page_context(task_id: str, index: int, speculative: bool = False) -> Iterator[PageTicket]:
+    """
+    标记当前协程正在生成的页面（其中发起的上游请求按该页面的优先级排队）
+
+    Args:
+        task_id: 任务ID
+        index: 页面索引（批量生成时为组内最小的页码）
+        speculative: 是否为推测生成
+
+    Yields:
+        PageTicket
+    """
+    ticket = PageTicket(task_id, index, speculative)
+    token = _current_page.set(ticket)
+    try:
+        yield ticket
+    finally:
+        _current_page.reset(token)
+
+
+def current_page() -> Optional[PageTicket]:
+    """当前协程正在生成的页面（未设置时返回 None）"""
+    return _current_page.get()
+
+
+class PageScheduler:
+    """页面优先级（焦点页读取自任务状态存储，进程内按任务缓存）"""
+
+    # 焦点页缓存的有效期（秒）：其他 worker 上报的焦点变化最多延迟这么久生效
+    FOCUS_REFRESH_SECONDS = 1.0
+    # 焦点页缓存的最大任务数（按最近访问淘汰）
+    MAX_FOCUS_ENTRIES = 1024
+    # 推测生成接管记录的保留时间（秒）
+    PROMOTION_TTL = 3600
+
+    def __init__(self, store: Optional["TaskStateStore"] = None):
+        """
+        Args:
+            store: 保存焦点页的任务状态存储，默认使用全局存储
+        """
+        self._store = store
+        # 任务ID -> (焦点页, 读取时间)
+        self._focus: "OrderedDict[str, Tuple[Optional[int], float]]" = OrderedDict()
+        # 推测生成已被正式生成接管的任务 -> 接管时间
+        self._promoted: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def store(self) -> "TaskStateStore":
+        if self._store is None:
+            from backend.services.task_store import get_task_state_store
+            self._store = get_task_state_store()
+        return self._store
+
+    def _cache_focus(self, task_id: str, index: Optional[int]) -> None:
+        with self._lock:
+            self._focus[task_id] = (index, time.monotonic())
+            self._focus.move_to_end(task_id)
+            while len(self._focus) > self.MAX_FOCUS_ENTRIES:
+                self._focus.popitem(last=False)
+
+    def set_focus(self, task_id: str, index: int) -> bool:
+        """
+        设置任务的焦点页（用户当前查看的页面，线程安全）
+
+        写入任务状态存储，本进程立即生效，其他 worker 在缓存过期后生效
+
+        Args:
+            task_id: 任务ID
+            index: 页面索引
+
+        Returns:
+            任务是否存在（不存在时不记录）
+        """
+        if not self.store.set_focus(task_id, index):
+            return False
+        self._cache_focus(task_id, index)
+        logger.debug(f"任务焦点页: task_id={task_id}, index={index}")
+        return True
+
+    def get_focus(self, task_id: str) -> Optional[int]:
+        """获取任务的焦点页，未设置时返回 None"""
+        with self._lock:
+            entry = self._focus.get(task_id)
+        if entry is not None and time.monotonic() - entry[1] < self.FOCUS_REFRESH_SECONDS:
+            return entry[0]
+
+        try:
+            index = self.store.get_focus(task_id)
+        except Exception as e:
+            # 存储暂时不可用时沿用缓存的焦点页
+            logger.debug(f"读取任务焦点页失败: task_id={task_id}, {e}")
+            return entry[0] if entry else None
+        self._cache_focus(task_id, index)
+        return index
+
+    def clear_focus(self, task_id: str) -> None:
+        """清除任务的焦点页"""
+        with self._lock:
+            self._focus.pop(task_id, None)
+        try:
+            self.store.set_focus(task_id, None)
+        except Exception as e:
+            logger.debug(f"清除任务焦点页失败: task_id={task_id}, {e}")
+
+    def promote(self, task_id: str) -> None:
+        """
+        把任务的推测生成请求提升为正式优先级（封面确认、推测结果被接管时调用，线程安全）
+
+        已在排队的请求在下一次放行时按新的优先级参与排序
+
+        Args:
+            task_id: 任务ID
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._promoted[task_id] = now
+            expired = [key for key, promoted_at in self._promoted.items() if now - promoted_at > self.PROMOTION_TTL]
+            for key in expired:
+                del self._promoted[key]
+
+    def clear_promotion(self, task_id: str) -> None:
+        """撤销任务推测生成请求的提升（开始新一轮推测生成时调用）"""
+        with self._lock:
+            self._promoted.pop(task_id, None)
+
+    def is_speculative(self, ticket: Optional[PageTicket]) -> bool:
+        """请求是否仍按推测生成排序（推测生成且尚未被接管）"""
+        if ticket is None or not ticket.speculative:
+            return False
+        with self._lock:
+            return ticket.task_id not in self._promoted
+
+    def priority(self, ticket: Optional[PageTicket]) -> Tuple[int, int, int]:
+        """
+        计算页面的优先级（越小越优先）
+
+        Args:
+            ticket: 请求所属的页面，None 表示不属于任何页面
+
+        Returns:
+            (是否推测生成, 区间, 区间内的顺序)
+        """
+        if ticket is None:
+            return (0, 0, -1)
+
+        # 没有焦点时视为从第一页开始查看
+        focus = self.get_focus(ticket.task_id) or 0
+        if ticket.index >= focus:
+            band, order = 0, ticket.index - focus
+        else:
+            band, order = 1, ticket.index
+        return (int(self.is_speculative(ticket)), band, order)
+
+
+class PrioritySemaphore:
+    """
+    按页面优先级放行的信号量（只能在创建它的事件循环中使用）
+
+    用法与 asyncio.Semaphore 相同：async with semaphore: ...
+    """
+
+    def __init__(self, value: int, scheduler: Optional["PageScheduler"] = None):
+        """
+        Args:
+            value: 并发上限
+            scheduler: 页面优先级来源，默认使用全局调度器
+        """
+        self._value = value
+        self._limit = value
+        self._scheduler = scheduler or get_page_scheduler()
+        self._waiters: List[Tuple[int, Optional[PageTicket], asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wake_scheduled = False
+
+    def locked(self) -> bool:
+        """是否没有空闲名额"""
+        return self._value <= 0
+
+    @property
+    def waiting(self) -> int:
+        """排队中的请求数"""
+        return len(self._waiters)
+
+    async def acquire(self, ticket: Optional[PageTicket] = None) -> bool:
+        """
+        获取名额
+
+        Args:
+            ticket: 请求所属的页面，默认读取 page_context() 设置的页面
+        """
+        if ticket is None:
+            ticket = _current_page.get()
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        entry = (next(self._seq), ticket, future)
+        self._waiters.append(entry)
+        if self._value > 0 and not self._wake_scheduled:
+            # 有空闲名额时也不立即放行：同一轮事件循环中同时到达的请求（如一次提交的所有页面）先全部排队，再按优先级放行
+            self._wake_scheduled = True
+            loop.call_soon(self._wake)
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 已被放行但在恢复执行前被取消：归还名额给下一个请求
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+        return True
+
+    def resize(self, value: int) -> None:
+        """
+        调整并发上限（需在信号量所属的事件循环中调用）
+
+        已放行的请求不受影响；上限调小时，在途请求陆续结束后才放行新的请求
+
+        Args:
+            value: 新的并发上限
+        """
+        self._value += value - self._limit
+        self._limit = value
+        self._wake()
+
+    def release(self) -> None:
+        """归还名额并放行优先级最高的等待者"""
+        self._value += 1
+        self._wake()
+
+    def _wake(self) -> None:
+        self._wake_scheduled = False
+        while self._value > 0 and self._waiters:
+            entry = min(
+                self._waiters,
+                key=lambda item: (self._scheduler.priority(item[1]), item[0])
+            )
+            self._waiters.remove(entry)
+            future = entry[2]
+            if future.done():
+                continue
+            self._value -= 1
+            future.set_result(True)
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+
+# 全局调度器
+_scheduler_instance = None
+_scheduler_lock = threading.Lock()
+
+
+def get_page_scheduler() -> PageScheduler:
+    """获取全局页面调度器"""
+    global _scheduler_instance
+    with _scheduler_lock:
+        if _scheduler_instance is None:
+            _scheduler_instance = PageScheduler()
+        return _scheduler_instance
@@ -0,0 +1,928 @@
+"""
+任务状态存储
+
+保存图片生成任务的上下文（页面列表、已生成/失败页面、封面参考图等），
+供重试、继续生成和任务状态查询使用。
+
+- memory: 进程内 LRU 缓存（默认，单进程部署），超出内存预算或空闲超时的任务写入任务目录
+- sqlite: SQLite 数据库 + 任务目录下的二进制文件（多 worker 部署，任意进程都能继续/重试任务），
+  后台任务（JobManager）的事件日志同样保存在数据库中，任意 worker 都能续接进度流
+
+通过环境变量 TASK_STATE_STORE 选择实现，TASK_STATE_DB 指定 SQLite 数据库路径。
+"""
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _default_history_root() -> str:
+    """历史记录根目录（与 ImageService 一致）"""
+    return os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+        "history"
+    )
+
+
+class TaskStateStore(ABC):
+    """
+    任务状态存储抽象基类
+
+    get() 返回的状态字典结构：
+    - pages: 页面列表
+    - generated: {页面索引: 文件名}
+    - failed: {页面索引: 错误信息}
+    - cover_image: 压缩后的封面参考图（bytes 或 None）
+    - full_outline: 完整大纲文本
+    - user_images: 压缩后的用户参考图列表（或 None）
+    - user_topic: 用户原始输入
+    - style: 风格
+    - provider: 任务使用的图片服务商名称（None 表示默认服务商）
+    - cancelled: 任务是否已被用户取消（重新生成或重试时清除）
+    - focus: 用户正在查看的页面（焦点页，None 表示未上报）
+    """
+
+    @abstractmethod
+    def create(self, task_id: str, state: Dict[str, Any]) -> None:
+        """
+        创建任务状态（已存在则覆盖）
+
+        Args:
+            task_id: 任务ID
+            state: 状态字典（结构见类说明）
+        """
+        pass
+
+    @abstractmethod
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取任务状态快照
+
+        Args:
+            task_id: 任务ID
+
+        Returns:
+            状态字典，任务不存在时返回 None
+        """
+        pass
+
+    def exists(self, task_id: str) -> bool:
+        """任务状态是否存在"""
+        return self.get(task_id) is not None
+
+    @abstractmethod
+    def set_generated(self, task_id: str, index: int, filename: str) -> None:
+        """记录页面生成成功"""
+        pass
+
+    @abstractmethod
+    def set_failed(self, task_id: str, index: int, error: str) -> None:
+        """记录页面生成失败"""
+        pass
+
+    @abstractmethod
+    def clear_failed(self, task_id: str, index: int) -> None:
+        """清除页面的失败记录"""
+        pass
+
+    @abstractmethod
+    def set_cover(self, task_id: str, cover_image: bytes) -> None:
+        """保存压缩后的封面参考图"""
+        pass
+
+    @abstractmethod
+    def set_cancelled(self, task_id: str, cancelled: bool) -> None:
+        """记录任务是否已被取消"""
+        pass
+
+    def is_cancelled(self, task_id: str) -> bool:
+        """任务是否已被取消（生成过程中频繁调用，子类应避免读取完整状态）"""
+        state = self.get(task_id)
+        return bool(state and state.get("cancelled"))
+
+    @abstractmethod
+    def set_focus(self, task_id: str, index: Optional[int]) -> bool:
+        """
+        记录用户正在查看的页面（焦点页）
+
+        Args:
+            task_id: 任务ID
+            index: 页面索引，None 表示清除
+
+        Returns:
+            任务是否存在
+        """
+        pass
+
+    def get_focus(self, task_id: str) -> Optional[int]:
+        """任务的焦点页（调度时频繁调用，子类应避免读取完整状态）"""
+        state = self.get(task_id)
+        return state.get("focus") if state else None
+
+    @abstractmethod
+    def delete(self, task_id: str) -> None:
+        """删除任务状态"""
+        pass
+
+    # ==================== 后台任务事件日志 ====================
+    # 默认不保存（单进程部署时 JobManager 的内存日志即可）；多 worker 共享的存储需要实现以下方法
+
+    # 是否在多个 worker 间共享后台任务事件日志
+    shares_job_events = False
+
+    def save_job(self, job_id: str, kind: str, task_id: Optional[str]) -> None:
+        """登记后台任务"""
+
+    def append_job_event(self, job_id: str, event: Dict[str, Any]) -> None:
+        """追加后台任务事件（{"event", "data", "id"}，id 从 1 开始递增）"""
+
+    def heartbeat_job(self, job_id: str) -> None:
+        """刷新运行中后台任务的更新时间（运行任务的 worker 崩溃后，订阅者据此停止等待）"""
+
+    def finish_job(self, job_id: str, status: str) -> None:
+        """记录后台任务结束（status: finished / cancelled）"""
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取后台任务概要
+
+        Returns:
+            {"job_id", "kind", "task_id", "status", "event_count", "created_at", "finished_at", "updated_at"}，
+            不存在时返回 None
+        """
+        return None
+
+    def get_job_events(self, job_id: str, after_id: int = 0) -> List[Dict[str, Any]]:
+        """获取 ID 大于 after_id 的后台任务事件（按 ID 排序）"""
+        return []
+
+    def purge_jobs(self, before: float) -> int:
+        """删除 before（时间戳）之前结束、或此前已停止更新的后台任务及其事件，返回删除数量"""
+        return 0
+
+    def evict_idle(self) -> int:
+        """释放空闲任务占用的内存（由 JobManager 定期调用），返回释放的任务数；不占用内存的存储无需实现"""
+        return 0
+
+
+class _StateFilesMixin:
+    """任务目录 .state 子目录中的状态文件读写（需提供 history_root_dir 属性）"""
+
+    STATE_DIRNAME = ".state"
+    COVER_FILENAME = "cover.bin"
+
+    history_root_dir: str
+
+    def _state_dir(self, task_id: str) -> str:
+        return os.path.join(self.history_root_dir, task_id, self.STATE_DIRNAME)
+
+    def _write_blob(self, task_id: str, filename: str, data: bytes) -> None:
+        """原子写入二进制文件（先写临时文件再替换）"""
+        state_dir = self._state_dir(task_id)
+        os.makedirs(state_dir, exist_ok=True)
+        path = os.path.join(state_dir, filename)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _read_blob(self, task_id: str, filename: str) -> Optional[bytes]:
+        path = os.path.join(self._state_dir(task_id), filename)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+
+class MemoryTaskStateStore(_StateFilesMixin, TaskStateStore):
+    """
+    进程内任务状态存储（仅单进程部署可用）
+
+    内存占用有上限：超出内存预算时按 LRU 淘汰，空闲超过 TTL 的任务也会被淘汰
+    （每次访问存储时检查，worker 空闲时由 JobManager 的定期维护调用 evict_idle() 检查）。
+    被淘汰的任务写入任务目录的 .state 子目录（state.json + 参考图二进制文件），
+    再次访问时（如重试、继续生成）自动从磁盘加载回内存。
+    """
+
+    SPILL_FILENAME = "state.json"
+
+    # 每个页面记录的估算内存开销（字节）
+    PAGE_OVERHEAD = 512
+
+    def __init__(
+        self,
+        history_root_dir: str = None,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: float = 1800
+    ):
+        """
+        Args:
+            history_root_dir: 历史记录根目录（淘汰的任务写入对应任务目录）
+            max_bytes: 内存预算（字节），0 表示不限制
+            ttl_seconds: 空闲超时（秒），0 表示不按时间淘汰
+        """
+        self.history_root_dir = history_root_dir or _default_history_root()
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # 按最近访问顺序排列，最久未访问的在最前
+        self._states: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._last_access: Dict[str, float] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    # ==================== 缓存管理 ====================
+
+    def _estimate_size(self, state: Dict[str, Any]) -> int:
+        """估算任务状态的内存占用（参考图为主，文本按 UTF-8 最坏情况估算）"""
+        size = len(state.get("cover_image") or b"")
+        size += sum(len(img) for img in state.get("user_images") or [])
+        size += 3 * (len(state.get("full_outline") or "") + len(state.get("user_topic") or ""))
+        size += self.PAGE_OVERHEAD * len(state.get("pages") or [])
+        for page in state.get("pages") or []:
+            size += 3 * len(page.get("content") or "")
+        return size
+
+    def _put_locked(self, task_id: str, state: Dict[str, Any]) -> None:
+        """放入内存并标记为最近访问"""
+        self._total_bytes -= self._sizes.get(task_id, 0)
+        size = self._estimate_size(state)
+        self._states[task_id] = state
+        self._states.move_to_end(task_id)
+        self._sizes[task_id] = size
+        self._total_bytes += size
+        self._last_access[task_id] = time.monotonic()
+
+    def _pop_locked(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """从内存中移除"""
+        self._total_bytes -= self._sizes.pop(task_id, 0)
+        self._last_access.pop(task_id, None)
+        return self._states.pop(task_id, None)
+
+    def _evict_locked(self) -> int:
+        """
+        淘汰空闲超时的任务，再按 LRU 淘汰直到回到内存预算内（超出预算时至少保留最近访问的任务）
+
+        Returns:
+            写入磁盘的任务数
+        """
+        now = time.monotonic()
+        evicted = 0
+        while self._states:
+            task_id = next(iter(self._states))
+            idle = now - self._last_access[task_id]
+            over_ttl = self.ttl_seconds and idle > self.ttl_seconds
+            over_budget = self.max_bytes and self._total_bytes > self.max_bytes and len(self._states) > 1
+            if not (over_ttl or over_budget):
+                break
+            if not self._spill_locked(task_id, self._pop_locked(task_id)):
+                break
+            evicted += 1
+            logger.debug(
+                f"任务状态已写入磁盘: {task_id} "
+                f"({'空闲超时' if over_ttl else '超出内存预算'}, 内存占用 {self._total_bytes / 1024 / 1024:.1f}MB)"
+            )
+        return evicted
+
+    def evict_idle(self) -> int:
+        with self._lock:
+            return self._evict_locked()
+
+    def _spill_locked(self, task_id: str, state: Dict[str, Any]) -> bool:
+        """把任务状态写入任务目录（参考图为二进制文件，其余为 JSON），返回是否成功"""
+        user_images = state.get("user_images") or []
+        try:
+            for i, img in enumerate(user_images):
+                self._write_blob(task_id, f"user_{i}.bin", img)
+            if state.get("cover_image"):
+                self._write_blob(task_id, self.COVER_FILENAME, state["cover_image"])
+
+            meta = {
+                "pages": state.get("pages") or [],
+                "generated": state.get("generated") or {},
+                "failed": state.get("failed") or {},
+                "full_outline": state.get("full_outline") or "",
+                "user_topic": state.get("user_topic") or "",
+                "style": state.get("style") or "",
+                "provider": state.get("provider"),
+                "cancelled": bool(state.get("cancelled")),
+                "focus": state.get("focus"),
+                "user_images_count": len(user_images),
+                "has_cover": bool(state.get("cover_image")),
+            }
+            self._write_blob(
+                task_id,
+                self.SPILL_FILENAME,
+                json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            )
+        except OSError as e:
+            # 写盘失败时保留在内存中，避免丢失任务状态
+            logger.error(f"任务状态写入磁盘失败，保留在内存中: {task_id}, {e}")
+            self._put_locked(task_id, state)
+            return False
+        return True
+
+    def _load_spilled(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """从任务目录加载已淘汰的任务状态"""
+        raw = self._read_blob(task_id, self.SPILL_FILENAME)
+        if raw is None:
+            return None
+
+        meta = json.loads(raw.decode("utf-8"))
+        user_images = [
+            img for img in (
+                self._read_blob(task_id, f"user_{i}.bin") for i in range(meta["user_images_count"])
+            ) if img is not None
+        ] or None
+
+        return {
+            "pages": meta["pages"],
+            # JSON 对象的键是字符串，还原为页面索引
+            "generated": {int(k): v for k, v in meta["generated"].items()},
+            "failed": {int(k): v for k, v in meta["failed"].items()},
+            "cover_image": self._read_blob(task_id, self.COVER_FILENAME) if meta["has_cover"] else None,
+            "full_outline": meta["full_outline"],
+            "user_images": user_images,
+            "user_topic": meta["user_topic"],
+            "style": meta["style"],
+            "provider": meta.get("provider"),
+            "cancelled": meta.get("cancelled", False),
+            "focus": meta.get("focus"),
+        }
+
+    def _state_locked(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """获取内部状态（必要时从磁盘加载），并标记为最近访问"""
+        state = self._states.get(task_id)
+        if state is not None:
+            self._states.move_to_end(task_id)
+            self._last_access[task_id] = time.monotonic()
+        else:
+            try:
+                state = self._load_spilled(task_id)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"加载磁盘中的任务状态失败: {task_id}, {e}")
+                return None
+            if state is None:
+                return None
+            # 内存中的状态成为唯一数据源，删除磁盘副本避免过期数据
+            shutil.rmtree(self._state_dir(task_id), ignore_errors=True)
+            self._put_locked(task_id, state)
+            logger.debug(f"任务状态已从磁盘加载: {task_id}")
+
+        self._evict_locked()
+        return state
+
+    # ==================== 存储接口 ====================
+
+    def create(self, task_id: str, state: Dict[str, Any]) -> None:
+        with self._lock:
+            shutil.rmtree(self._state_dir(task_id), ignore_errors=True)
+            self._put_locked(task_id, {
+                **state,
+                "generated": dict(state.get("generated") or {}),
+                "failed": dict(state.get("failed") or {}),
+            })
+            self._evict_locked()
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            state = self._state_locked(task_id)
+            if state is None:
+                return None
+            # 返回快照，避免调用方修改内部状态
+            return {
+                **state,
+                "generated": dict(state["generated"]),
+                "failed": dict(state["failed"]),
+                "cancelled": bool(state.get("cancelled")),
+                "focus": state.get("focus"),
+            }
+
+    def exists(self, task_id: str) -> bool:
+        with self._lock:
+            if task_id in self._states:
+                return True
+        return os.path.exists(os.path.join(self._state_dir(task_id), self.SPILL_FILENAME))
+
+    def set_generated(self, task_id: str, index: int, filename: str) -> None:
+        with self._lock:
+            state = self._state_locked(task_id)
+            if state is not None:
+                state["generated"][index] = filename
+
+    def set_failed(self, task_id: str, index: int, error: str) -> None:
+        with self._lock:
+            state = self._state_locked(task_id)
+            if state is not None:
+                state["failed"][index] = error
+
+    def clear_failed(self, task_id: str, index: int) -> None:
+        with self._lock:
+            state = self._state_locked(task_id)
+            if state is not None:
+                state["failed"].pop(index, None)
+
+    def set_cover(self, task_id: str, cover_image: bytes) -> None:
+        with self._lock:
+            state = self._state_locked(task_id)
+            if state is not None:
+                state["cover_image"] = cover_image
+                self._put_locked(task_id, state)
+                self._evict_locked()
+
+    def set_cancelled(self, task_id: str, cancelled: bool) -> None:
+        with self._lock:
+            state = self._state_locked(task_id)
+            if state is not None:
+                state["cancelled"] = cancelled
+
+    def _read_spilled_field(self, task_id: str, field: str) -> Any:
+        """读取已写入磁盘的任务的元数据字段（不加载封面和参考图）"""
+        meta_path = os.path.join(self._state_dir(task_id), self.SPILL_FILENAME)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f).get(field)
+        except (OSError, ValueError):
+            return None
+
+    def is_cancelled(self, task_id: str) -> bool:
+        with self._lock:
+            state = self._states.get(task_id)
+            if state is not None:
+                return bool(state.get("cancelled"))
+        return bool(self._read_spilled_field(task_id, "cancelled"))
+
+    def set_focus(self, task_id: str, index: Optional[int]) -> bool:
+        with self._lock:
+            state = self._state_locked(task_id)
+            if state is None:
+                return False
+            state["focus"] = index
+            return True
+
+    def get_focus(self, task_id: str) -> Optional[int]:
+        with self._lock:
+            state = self._states.get(task_id)
+            if state is not None:
+                return state.get("focus")
+        return self._read_spilled_field(task_id, "focus")
+
+    def delete(self, task_id: str) -> None:
+        with self._lock:
+            self._pop_locked(task_id)
+            shutil.rmtree(self._state_dir(task_id), ignore_errors=True)
+
+
+class SQLiteTaskStateStore(_StateFilesMixin, TaskStateStore):
+    """
+    SQLite 任务状态存储（多进程共享）
+
+    页面结果按行存储，多个 worker 并发更新同一任务不会互相覆盖；
+    封面参考图和用户参考图以文件形式保存在任务目录的 .state 子目录中，数据库只记录文件名。
+    参考图读取后按任务缓存在本进程，以行中的 blob_version 判断是否失效（每次写入参考图时更换），
+    每页生成、重试都要读取任务状态，不必每次从磁盘重新读取参考图。
+    """
+
+    # 参考图缓存的最大任务数
+    MAX_BLOB_CACHE_ENTRIES = 256
+
+    def __init__(self, db_path: str, history_root_dir: str):
+        """
+        Args:
+            db_path: SQLite 数据库文件路径
+            history_root_dir: 历史记录根目录（任务目录所在位置）
+        """
+        self.db_path = db_path
+        self.history_root_dir = history_root_dir
+        self._local = threading.local()
+        # task_id -> (blob_version, 封面参考图, 用户参考图列表)，按最近访问顺序排列
+        self._blob_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._blob_cache_lock = threading.Lock()
+
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                pages TEXT NOT NULL,
+                full_outline TEXT NOT NULL DEFAULT '',
+                user_topic TEXT NOT NULL DEFAULT '',
+                style TEXT NOT NULL DEFAULT '',
+                provider TEXT,
+                cancelled INTEGER NOT NULL DEFAULT 0,
+                focus INTEGER,
+                user_images_count INTEGER NOT NULL DEFAULT 0,
+                cover_file TEXT,
+                blob_version TEXT,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS task_pages (
+                task_id TEXT NOT NULL,
+                page_index INTEGER NOT NULL,
+                filename TEXT,
+                error TEXT,
+                PRIMARY KEY (task_id, page_index)
+            );
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                task_id TEXT,
+                status TEXT NOT NULL DEFAULT 'running',
+                event_count INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                finished_at REAL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS job_events (
+                job_id TEXT NOT NULL,
+                event_id INTEGER NOT NULL,
+                event TEXT NOT NULL,
+                PRIMARY KEY (job_id, event_id)
+            );
+            """
+        )
+        # 兼容旧版本数据库：补充 provider、cancelled、focus、blob_version 列
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}
+        if "provider" not in columns:
+            conn.execute("ALTER TABLE tasks ADD COLUMN provider TEXT")
+        if "cancelled" not in columns:
+            conn.execute("ALTER TABLE tasks ADD COLUMN cancelled INTEGER NOT NULL DEFAULT 0")
+        if "focus" not in columns:
+            conn.execute("ALTER TABLE tasks ADD COLUMN focus INTEGER")
+        if "blob_version" not in columns:
+            conn.execute("ALTER TABLE tasks ADD COLUMN blob_version TEXT")
+        conn.commit()
+        logger.info(f"任务状态存储: SQLite ({db_path})")
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程一个连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def create(self, task_id: str, state: Dict[str, Any]) -> None:
+        user_images: List[bytes] = state.get("user_images") or []
+        for i, img in enumerate(user_images):
+            self._write_blob(task_id, f"user_{i}.bin", img)
+
+        cover_file = None
+        if state.get("cover_image"):
+            self._write_blob(task_id, self.COVER_FILENAME, state["cover_image"])
+            cover_file = self.COVER_FILENAME
+
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM task_pages WHERE task_id = ?", (task_id,))
+            conn.execute(
+                "INSERT OR REPLACE INTO tasks "
+                "(task_id, pages, full_outline, user_topic, style, provider, cancelled, focus, "
+                "user_images_count, cover_file, blob_version, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    task_id,
+                    json.dumps(state.get("pages") or [], ensure_ascii=False),
+                    state.get("full_outline") or "",
+                    state.get("user_topic") or "",
+                    state.get("style") or "",
+                    state.get("provider"),
+                    int(bool(state.get("cancelled"))),
+                    state.get("focus"),
+                    len(user_images),
+                    cover_file,
+                    uuid.uuid4().hex,
+                    time.time(),
+                )
+            )
+            for index, filename in (state.get("generated") or {}).items():
+                self._upsert_page(conn, task_id, int(index), filename=filename)
+            for index, error in (state.get("failed") or {}).items():
+                self._upsert_page(conn, task_id, int(index), error=error)
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT pages, full_outline, user_topic, style, provider, cancelled, focus, "
+            "user_images_count, cover_file, blob_version "
+            "FROM tasks WHERE task_id = ?",
+            (task_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        (
+            pages, full_outline, user_topic, style, provider, cancelled, focus,
+            user_images_count, cover_file, blob_version
+        ) = row
+
+        generated: Dict[int, str] = {}
+        failed: Dict[int, str] = {}
+        for page_index, filename, error in conn.execute(
+            "SELECT page_index, filename, error FROM task_pages WHERE task_id = ? ORDER BY page_index",
+            (task_id,)
+        ):
+            if filename is not None:
+                generated[page_index] = filename
+            if error is not None:
+                failed[page_index] = error
+
+        cover_image, user_images = self._get_blobs(task_id, blob_version, cover_file, user_images_count)
+
+        return {
+            "pages": json.loads(pages),
+            "generated": generated,
+            "failed": failed,
+            "cover_image": cover_image,
+            "full_outline": full_outline,
+            "user_images": user_images,
+            "user_topic": user_topic,
+            "style": style,
+            "provider": provider,
+            "cancelled": bool(cancelled),
+            "focus": focus,
+        }
+
+    def _get_blobs(
+        self,
+        task_id: str,
+        blob_version: Optional[str],
+        cover_file: Optional[str],
+        user_images_count: int
+    ) -> tuple:
+        """
+        读取任务的参考图（版本未变化时使用本进程缓存）
+
+        Args:
+            task_id: 任务ID
+            blob_version: 数据库中记录的参考图版本（旧版本数据库中为 None，此时不缓存）
+            cover_file: 封面参考图文件名
+            user_images_count: 用户参考图数量
+
+        Returns:
+            (封面参考图, 用户参考图列表)
+        """
+        with self._blob_cache_lock:
+            cached = self._blob_cache.get(task_id)
+            if cached is not None and blob_version is not None and cached[0] == blob_version:
+                self._blob_cache.move_to_end(task_id)
+                return cached[1], list(cached[2]) if cached[2] is not None else None
+
+        user_images = None
+        if user_images_count:
+            user_images = [
+                img for img in (
+                    self._read_blob(task_id, f"user_{i}.bin") for i in range(user_images_count)
+                ) if img is not None
+            ] or None
+        cover_image = self._read_blob(task_id, cover_file) if cover_file else None
+
+        if blob_version is not None:
+            with self._blob_cache_lock:
+                self._blob_cache[task_id] = (blob_version, cover_image, user_images)
+                self._blob_cache.move_to_end(task_id)
+                while len(self._blob_cache) > self.MAX_BLOB_CACHE_ENTRIES:
+                    self._blob_cache.popitem(last=False)
+        return cover_image, list(user_images) if user_images is not None else None
+
+    def exists(self, task_id: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM tasks WHERE task_id = ?", (task_id,)
+        ).fetchone()
+        return row is not None
+
+    def _upsert_page(
+        self,
+        conn: sqlite3.Connection,
+        task_id: str,
+        index: int,
+        **fields
+    ) -> None:
+        """更新单个页面的结果字段（filename / error）"""
+        columns = ", ".join(fields)
+        placeholders = ", ".join("?" for _ in fields)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in fields)
+        conn.execute(
+            f"INSERT INTO task_pages (task_id, page_index, {columns}) VALUES (?, ?, {placeholders}) "
+            f"ON CONFLICT (task_id, page_index) DO UPDATE SET {updates}",
+            (task_id, index, *fields.values())
+        )
+
+    def _touch(self, conn: sqlite3.Connection, task_id: str) -> bool:
+        """更新任务时间戳，返回任务是否存在"""
+        cursor = conn.execute(
+            "UPDATE tasks SET updated_at = ? WHERE task_id = ?", (time.time(), task_id)
+        )
+        return cursor.rowcount > 0
+
+    def set_generated(self, task_id: str, index: int, filename: str) -> None:
+        conn = self._conn()
+        with conn:
+            if self._touch(conn, task_id):
+                self._upsert_page(conn, task_id, int(index), filename=filename)
+
+    def set_failed(self, task_id: str, index: int, error: str) -> None:
+        conn = self._conn()
+        with conn:
+            if self._touch(conn, task_id):
+                self._upsert_page(conn, task_id, int(index), error=error)
+
+    def clear_failed(self, task_id: str, index: int) -> None:
+        conn = self._conn()
+        with conn:
+            if self._touch(conn, task_id):
+                conn.execute(
+                    "UPDATE task_pages SET error = NULL WHERE task_id = ? AND page_index = ?",
+                    (task_id, int(index))
+                )
+
+    def set_cover(self, task_id: str, cover_image: bytes) -> None:
+        if not self.exists(task_id):
+            return
+        self._write_blob(task_id, self.COVER_FILENAME, cover_image)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE tasks SET cover_file = ?, blob_version = ?, updated_at = ? WHERE task_id = ?",
+                (self.COVER_FILENAME, uuid.uuid4().hex, time.time(), task_id)
+            )
+
+    def set_cancelled(self, task_id: str, cancelled: bool) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE tasks SET cancelled = ?, updated_at = ? WHERE task_id = ?",
+                (int(cancelled), time.time(), task_id)
+            )
+
+    def is_cancelled(self, task_id: str) -> bool:
+        row = self._conn().execute(
+            "SELECT cancelled FROM tasks WHERE task_id = ?", (task_id,)
+        ).fetchone()
+        return bool(row and row[0])
+
+    def set_focus(self, task_id: str, index: Optional[int]) -> bool:
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET focus = ? WHERE task_id = ?",
+                (index, task_id)
+            )
+        return cursor.rowcount > 0
+
+    def get_focus(self, task_id: str) -> Optional[int]:
+        row = self._conn().execute(
+            "SELECT focus FROM tasks WHERE task_id = ?", (task_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def delete(self, task_id: str) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM task_pages WHERE task_id = ?", (task_id,))
+            conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+        with self._blob_cache_lock:
+            self._blob_cache.pop(task_id, None)
+        shutil.rmtree(self._state_dir(task_id), ignore_errors=True)
+
+    # ==================== 后台任务事件日志 ====================
+
+    shares_job_events = True
+
+    def save_job(self, job_id: str, kind: str, task_id: Optional[str]) -> None:
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, kind, task_id, status, event_count, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'running', 0, ?, ?)",
+                (job_id, kind, task_id, now, now)
+            )
+
+    def append_job_event(self, job_id: str, event: Dict[str, Any]) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO job_events (job_id, event_id, event) VALUES (?, ?, ?)",
+                (job_id, int(event["id"]), json.dumps(event, ensure_ascii=False, separators=(",", ":")))
+            )
+            conn.execute(
+                "UPDATE jobs SET event_count = MAX(event_count, ?), updated_at = ? WHERE job_id = ?",
+                (int(event["id"]), time.time(), job_id)
+            )
+
+    def heartbeat_job(self, job_id: str) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (time.time(), job_id))
+
+    def finish_job(self, job_id: str, status: str) -> None:
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, updated_at = ? WHERE job_id = ?",
+                (status, now, now, job_id)
+            )
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT kind, task_id, status, event_count, created_at, finished_at, updated_at FROM jobs WHERE job_id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        kind, task_id, status, event_count, created_at, finished_at, updated_at = row
+        return {
+            "job_id": job_id,
+            "kind": kind,
+            "task_id": task_id,
+            "status": status,
+            "event_count": event_count,
+            "created_at": created_at,
+            "finished_at": finished_at,
+            "updated_at": updated_at,
+        }
+
+    def get_job_events(self, job_id: str, after_id: int = 0) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT event FROM job_events WHERE job_id = ? AND event_id > ? ORDER BY event_id",
+            (job_id, int(after_id))
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def purge_jobs(self, before: float) -> int:
+        conn = self._conn()
+        with conn:
+            expired = [
+                row[0] for row in conn.execute(
+                    "SELECT job_id FROM jobs WHERE (finished_at IS NOT NULL AND finished_at < ?) "
+                    "OR (finished_at IS NULL AND updated_at < ?)",
+                    (before, before)
+                )
+            ]
+            for job_id in expired:
+                conn.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+                conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        return len(expired)
+
+
+def create_task_state_store(store_type: str = None) -> TaskStateStore:
+    """
+    根据配置创建任务状态存储
+
+    Args:
+        store_type: 存储类型（memory / sqlite），为 None 时读取 Config.TASK_STATE_STORE
+
+    Returns:
+        TaskStateStore 实例
+    """
+    store_type = (store_type or Config.TASK_STATE_STORE or "memory").lower()
+    history_root_dir = _default_history_root()
+
+    if store_type == "memory":
+        return MemoryTaskStateStore(
+            history_root_dir,
+            max_bytes=Config.TASK_STATE_MEMORY_MB * 1024 * 1024,
+            ttl_seconds=Config.TASK_STATE_TTL
+        )
+
+    if store_type == "sqlite":
+        db_path = Config.TASK_STATE_DB or os.path.join(history_root_dir, "task_states.db")
+        return SQLiteTaskStateStore(db_path, history_root_dir)
+
+    raise ValueError(
+        f"不支持的任务状态存储类型: {store_type}\n"
+        "支持的类型: memory, sqlite\n"
+        "解决方案：检查环境变量 TASK_STATE_STORE 的值"
+    )
+
+
+# 全局存储实例
+_store_instance = None
+_store_lock = threading.Lock()
+
+
+def get_task_state_store() -> TaskStateStore:
+    """获取全局任务状态存储实例"""
+    global _store_instance
+    with _store_lock:
+        if _store_instance is None:
+            _store_instance = create_task_state_store()
+        return _store_instance
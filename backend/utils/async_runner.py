@@ -0,0 +1,142 @@
+"""后台事件循环封装
+
+图片生成的核心逻辑是异步实现的（一个事件循环驱动成百上千个并发请求），
+而 Flask 路由是同步的。AsyncRunner 在一个守护线程中常驻一个事件循环，
+同步代码通过它提交协程、逐个消费异步生成器。
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Awaitable, Coroutine, Generator, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+async def _await(awaitable: Awaitable[T]) -> T:
+    """把任意 awaitable 包装为协程（run_coroutine_threadsafe 只接受协程）"""
+    return await awaitable
+
+
+class AsyncRunner:
+    """在后台线程中运行的事件循环"""
+
+    def __init__(self, name: str = "magicbrush-async"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """获取后台事件循环（首次访问时启动）"""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name=self.name,
+                    daemon=True
+                )
+                self._thread.start()
+                logger.debug(f"后台事件循环已启动: {self.name}")
+            return self._loop
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> "Future[T]":
+        """
+        提交协程到后台事件循环
+
+        Args:
+            coro: 协程对象
+
+        Returns:
+            concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+        """
+        在后台事件循环中运行协程并阻塞等待结果
+
+        Args:
+            coro: 协程对象
+            timeout: 超时时间（秒），None 表示一直等待
+
+        Returns:
+            协程返回值
+        """
+        return self.submit(coro).result(timeout)
+
+    def iterate(self, agen: AsyncIterator[T]) -> Generator[T, None, None]:
+        """
+        同步消费异步生成器（每次 next 在后台事件循环中推进一步）
+
+        调用方提前关闭生成器时（如 SSE 客户端断开），会同步调用异步生成器的 aclose()
+
+        Args:
+            agen: 异步生成器
+
+        Yields:
+            异步生成器产出的值
+        """
+        try:
+            while True:
+                try:
+                    item = self.run(_await(agen.__anext__()))
+                except StopAsyncIteration:
+                    break
+                yield item
+        finally:
+            aclose = getattr(agen, "aclose", None)
+            if aclose is not None:
+                self.run(_await(aclose()))
+
+    async def arun(self, coro: Coroutine[Any, Any, T]) -> T:
+        """
+        在其他事件循环中等待后台事件循环上的协程
+
+        Args:
+            coro: 协程对象
+
+        Returns:
+            协程返回值
+        """
+        return await asyncio.wrap_future(self.submit(coro))
+
+    async def aiterate(self, agen: AsyncIterator[T]) -> AsyncIterator[T]:
+        """
+        在其他事件循环中消费运行在后台事件循环上的异步生成器
+
+        Args:
+            agen: 异步生成器
+
+        Yields:
+            异步生成器产出的值
+        """
+        try:
+            while True:
+                try:
+                    item = await self.arun(_await(agen.__anext__()))
+                except StopAsyncIteration:
+                    break
+                yield item
+        finally:
+            aclose = getattr(agen, "aclose", None)
+            if aclose is not None:
+                await self.arun(_await(aclose()))
+
+
+# 全局运行器实例
+_runner_instance = None
+_runner_lock = threading.Lock()
+
+
+def get_async_runner() -> AsyncRunner:
+    """获取全局后台事件循环运行器"""
+    global _runner_instance
+    with _runner_lock:
+        if _runner_instance is None:
+            _runner_instance = AsyncRunner()
+        return _runner_instance
@@ -0,0 +1,200 @@
+"""
+截止时间传递
+
+一张图片的生成会经过多层重试（服务层逐页重试 × 生成器的重试装饰器），
+每次 HTTP 请求的超时又是固定的 180~300 秒，最坏情况下一页要占用 20 分钟以上。
+这里用上下文变量在调用链中传递截止时间：
+- 任务整体截止时间（Config.TASK_DEADLINE）在生成 / 批量重试开始时设置，包含排队时间
+- 单页截止时间（Config.PAGE_DEADLINE）在该页第一次获得服务商并发名额时开始计时，不包含排队时间
+- 每次请求的超时 = min(默认超时, 剩余时间)，剩余时间不足以完成一次请求时不再重试
+
+上下文变量随 asyncio 任务和 asyncio.to_thread 自动传递，在线程中执行的同步生成器同样生效。
+异步生成器的每一步可能在不同的任务中推进（AsyncRunner.iterate），不能跨 yield 保持上下文变量，
+此时先创建 Deadline，再用 run_within() 包装每个需要受限的调用。
+没有设置截止时间时，所有函数的行为与原来一致。
+"""
+
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Iterator, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 剩余时间少于该值（秒）时不再发起新的尝试
+MIN_ATTEMPT_SECONDS = 5.0
+
+
+class DeadlineExceeded(TimeoutError):
+    """已超过截止时间"""
+
+    def __init__(self, message: str = ""):
+        super().__init__(message or (
+            "图片生成超时：已超过截止时间，跳过剩余重试。\n"
+            "可能原因：\n"
+            "1. 上游服务响应过慢或持续失败\n"
+            "2. 任务页数较多，排队时间较长\n"
+            "解决方案：稍后重试失败的页面，或调大 PAGE_DEADLINE / TASK_DEADLINE"
+        ))
+
+
+class Deadline:
+    """截止时间（start() 之前不计时）"""
+
+    def __init__(self, seconds: float, name: str, started: bool = True):
+        """
+        Args:
+            seconds: 时间预算（秒）
+            name: 名称（用于日志）
+            started: 是否立即开始计时
+        """
+        self.seconds = seconds
+        self.name = name
+        self.expires_at: Optional[float] = time.monotonic() + seconds if started else None
+
+    @property
+    def started(self) -> bool:
+        return self.expires_at is not None
+
+    def start(self) -> None:
+        """开始计时（已开始时不变）"""
+        if self.expires_at is None:
+            self.expires_at = time.monotonic() + self.seconds
+
+    def remaining(self) -> float:
+        """剩余时间（秒），未开始计时时为完整预算"""
+        if self.expires_at is None:
+            return self.seconds
+        return self.expires_at - time.monotonic()
+
+
+# 当前调用链上的截止时间（外层在前），实际剩余时间取其中最小值
+_deadlines: contextvars.ContextVar[Tuple[Deadline, ...]] = contextvars.ContextVar(
+    "magicbrush_deadlines", default=()
+)
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float], name: str, started: bool = True) -> Iterator[Optional[Deadline]]:
+    """
+    在当前上下文中增加一个截止时间（只会收紧外层的截止时间，不会延长）
+
+    Args:
+        seconds: 时间预算（秒），为空或 0 时不增加
+        name: 名称（用于日志）
+        started: 是否立即开始计时（为 False 时由 start_deadlines() 开始计时）
+
+    Yields:
+        Deadline 实例，未增加时为 None
+    """
+    if not seconds or seconds <= 0:
+        yield None
+        return
+
+    deadline = Deadline(seconds, name, started)
+    token = _deadlines.set(_deadlines.get() + (deadline,))
+    try:
+        yield deadline
+    finally:
+        _deadlines.reset(token)
+
+
+def create_deadline(seconds: Optional[float], name: str) -> Optional[Deadline]:
+    """
+    创建立即开始计时的截止时间
+
+    Args:
+        seconds: 时间预算（秒），为空或 0 时不创建
+        name: 名称（用于日志）
+
+    Returns:
+        Deadline 实例，未创建时为 None
+    """
+    if not seconds or seconds <= 0:
+        return None
+    return Deadline(seconds, name)
+
+
+async def run_within(deadline: Optional[Deadline], awaitable: Awaitable[T]) -> T:
+    """
+    在增加了截止时间的上下文中等待 awaitable（用于异步生成器中，不能跨 yield 使用 deadline_scope 的场景）
+
+    awaitable 应为尚未开始执行的协程，其中创建的子任务同样继承该截止时间
+
+    Args:
+        deadline: 截止时间，为 None 时直接等待
+        awaitable: 协程
+
+    Returns:
+        协程返回值
+    """
+    if deadline is None:
+        return await awaitable
+    token = _deadlines.set(_deadlines.get() + (deadline,))
+    try:
+        return await awaitable
+    finally:
+        _deadlines.reset(token)
+
+
+def start_deadlines() -> None:
+    """开始当前上下文中所有尚未计时的截止时间（如单页截止时间在获得并发名额时开始计时）"""
+    for deadline in _deadlines.get():
+        deadline.start()
+
+
+def remaining() -> Optional[float]:
+    """当前上下文的剩余时间（秒），没有截止时间时返回 None"""
+    deadlines = _deadlines.get()
+    if not deadlines:
+        return None
+    return min(deadline.remaining() for deadline in deadlines)
+
+
+def _nearest() -> Optional[Deadline]:
+    deadlines = _deadlines.get()
+    return min(deadlines, key=lambda deadline: deadline.remaining()) if deadlines else None
+
+
+def request_timeout(default: float) -> float:
+    """
+    计算本次请求的超时时间
+
+    Args:
+        default: 没有截止时间时使用的超时（秒）
+
+    Returns:
+        min(default, 剩余时间)
+
+    Raises:
+        DeadlineExceeded: 剩余时间不足 MIN_ATTEMPT_SECONDS，来不及完成一次请求
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left < MIN_ATTEMPT_SECONDS:
+        raise DeadlineExceeded()
+    return min(default, left)
+
+
+def can_retry(delay: float = 0) -> bool:
+    """
+    等待 delay 秒后是否还来得及再尝试一次
+
+    Args:
+        delay: 重试前的等待时间（秒）
+
+    Returns:
+        没有截止时间或剩余时间足够时返回 True
+    """
+    left = remaining()
+    if left is None or left - delay >= MIN_ATTEMPT_SECONDS:
+        return True
+    deadline = _nearest()
+    logger.warning(
+        f"⏱️ 剩余时间 {max(left, 0):.1f}s 不足以再次尝试（{deadline.name if deadline else '截止时间'}），跳过剩余重试"
+    )
+    return False
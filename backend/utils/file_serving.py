@@ -0,0 +1,115 @@
+"""
+history 目录文件下发
+
+图片原图和 ZIP 下载不经过 Python 逐块复制：
+- FILE_OFFLOAD=x-accel：返回 X-Accel-Redirect 头，由 Nginx 从内部 location 直接发送文件
+- FILE_OFFLOAD=x-sendfile：返回 X-Sendfile 头，由 Apache / lighttpd 发送文件（Flask 的 USE_X_SENDFILE）
+- 未配置时按文件路径调用 send_file，WSGI 服务器提供 wsgi.file_wrapper（如 gunicorn）时以 sendfile 零拷贝发送；
+  ASGI 服务器支持 http.response.zerocopysend / pathsend 扩展时由 backend/asgi.py 直接交给服务器发送
+"""
+import os
+import unicodedata
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from flask import Response, send_file
+
+from backend.config import Config
+from backend.services.manifest import get_manifest_store
+
+# history 根目录
+HISTORY_ROOT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "history"
+)
+
+
+def resolve_image_path(task_id: str, filename: str, thumbnail: bool) -> Optional[Tuple[str, Optional[str]]]:
+    """
+    解析图片文件路径（请求缩略图且存在时返回缩略图）
+
+    优先从任务清单查找，不在清单中的文件再检查文件系统
+
+    Args:
+        task_id: 任务 ID
+        filename: 文件名
+        thumbnail: 是否优先返回缩略图
+
+    Returns:
+        (文件绝对路径, ETag)，原图的 ETag 取自清单中的内容哈希，其余（含清单尚未补建的旧任务）为 None；
+        不存在或路径不合法时返回 None
+    """
+    if not task_id or not filename or '/' in task_id + filename or '\\' in task_id + filename:
+        return None
+    if task_id.startswith('.') or filename.startswith('.'):
+        return None
+
+    task_dir = os.path.join(HISTORY_ROOT, task_id)
+    if not os.path.isdir(task_dir):
+        return None
+
+    page = get_manifest_store().find_file(task_dir, filename)
+    if page is not None:
+        if thumbnail and page.get("thumbnail"):
+            return os.path.join(task_dir, page["thumbnail"]), None
+        return os.path.join(task_dir, page["file"]), page.get("sha256")
+
+    if thumbnail:
+        thumb_filepath = os.path.join(task_dir, f"thumb_{filename}")
+        if os.path.isfile(thumb_filepath):
+            return thumb_filepath, None
+
+    filepath = os.path.join(task_dir, filename)
+    return (filepath, None) if os.path.isfile(filepath) else None
+
+
+def send_history_file(
+    filepath: str,
+    mimetype: str,
+    as_attachment: bool = False,
+    download_name: Optional[str] = None,
+    etag: Optional[str] = None
+) -> Response:
+    """
+    发送 history 目录下的文件（按 FILE_OFFLOAD 配置交给反向代理或服务器零拷贝发送）
+
+    Args:
+        filepath: 文件绝对路径（必须位于 history 目录下）
+        mimetype: MIME 类型
+        as_attachment: 是否作为附件下载
+        download_name: 下载文件名
+        etag: ETag（可选，默认由 werkzeug 按修改时间和大小生成）
+
+    Returns:
+        Flask 响应
+    """
+    if Config.FILE_OFFLOAD == 'x-accel':
+        relative_path = os.path.relpath(filepath, HISTORY_ROOT).replace(os.sep, '/')
+        response = Response(status=200, mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = Config.FILE_OFFLOAD_PREFIX.rstrip('/') + '/' + quote(relative_path)
+        if as_attachment:
+            _set_attachment(response, download_name or os.path.basename(filepath))
+        return response
+
+    # x-sendfile 由 Flask 的 USE_X_SENDFILE 处理；未配置时 werkzeug 使用 wsgi.file_wrapper 发送
+    return send_file(
+        filepath,
+        mimetype=mimetype,
+        as_attachment=as_attachment,
+        download_name=download_name,
+        etag=etag if etag is not None else True
+    )
+
+
+def _set_attachment(response: Response, download_name: str) -> None:
+    """设置 Content-Disposition（非 ASCII 文件名按 RFC 2231 编码，与 send_file 一致）"""
+    try:
+        download_name.encode('ascii')
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        quoted = quote(download_name, safe="!#$&+^`|~")
+        response.headers.set(
+            'Content-Disposition', 'attachment',
+            filename=simple, **{'filename*': f"UTF-8''{quoted}"}
+        )
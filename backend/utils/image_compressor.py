@@ -1,8 +1,17 @@
 """图片压缩工具"""
 import io
 import logging
-from PIL import Image
-from typing import Optional
+import math
+from typing import Optional, Tuple
+
+# 最低质量 JPEG 每像素的字节数估计（偏保守），用于由目标大小推算需要解码的尺寸：
+# 50KB 缩略图约 100 万像素、30KB 参考图约 60 万像素，超出的像素最终都会被缩小丢弃
+MIN_BYTES_PER_PIXEL = 0.05
+# JPEG 缩小解码（draft）允许比目标尺寸小的比例，换取按 1/2、1/4、1/8 解码
+DRAFT_TOLERANCE = 0.75
+# 缩放时先用 reduce() 按整数倍缩小（盒式滤波，远快于 LANCZOS），剩余的比例再用 LANCZOS 重采样；
+# PNG 等不支持缩小解码的格式主要靠这一步节省时间
+REDUCING_GAP = 1.0
 
 
 def compress_image(
@@ -34,52 +43,12 @@ def compress_image(
         return image_data
 
     try:
+        # Pillow 在首次压缩时才导入，缩短应用启动时间
+        from PIL import Image
+
         # 打开图片
         img = Image.open(io.BytesIO(image_data))
-
-        # 转换为 RGB（处理 RGBA 等格式）
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-
-        # 如果图片尺寸过大，先缩小
-        width, height = img.size
-        if width > max_dimension or height > max_dimension:
-            ratio = min(max_dimension / width, max_dimension / height)
-            new_width = int(width * ratio)
-            new_height = int(height * ratio)
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-        # 逐步降低质量直到满足大小要求
-        quality = quality_start
-        compressed_data = None
-
-        while quality >= quality_min:
-            output = io.BytesIO()
-            img.save(output, format='JPEG', quality=quality, optimize=True)
-            compressed_data = output.getvalue()
-
-            if len(compressed_data) <= max_size_bytes:
-                break
-
-            quality -= 5
-
-        # 如果还是太大，进一步缩小尺寸
-        if len(compressed_data) > max_size_bytes:
-            width, height = img.size
-            while len(compressed_data) > max_size_bytes and max(width, height) > 512:
-                width = int(width * 0.9)
-                height = int(height * 0.9)
-                img_resized = img.resize((width, height), Image.Resampling.LANCZOS)
-
-                output = io.BytesIO()
-                img_resized.save(output, format='JPEG', quality=quality_min, optimize=True)
-                compressed_data = output.getvalue()
+        compressed_data = compress_pil_image(img, max_size_kb, quality_start, quality_min, max_dimension)
 
         original_size_kb = len(image_data) / 1024
         compressed_size_kb = len(compressed_data) / 1024
@@ -95,6 +64,107 @@ def compress_image(
         return image_data
 
 
+def compress_pil_image(
+    img,
+    max_size_kb: int = 200,
+    quality_start: int = 85,
+    quality_min: int = 20,
+    max_dimension: int = 2048
+) -> bytes:
+    """
+    把已打开的 Pillow 图片压缩为指定大小以内的 JPEG
+
+    Args:
+        img: PIL.Image 对象
+        max_size_kb: 最大文件大小（KB）
+        quality_start: 起始压缩质量（1-100）
+        quality_min: 最低压缩质量（1-100）
+        max_dimension: 最大边长（像素）
+
+    Returns:
+        压缩后的 JPEG 数据
+    """
+    from PIL import Image
+
+    max_size_bytes = max_size_kb * 1024
+
+    # 按目标大小确定需要的尺寸，JPEG 直接缩小解码（必须在读取像素之前）
+    target_width, target_height = _target_size(img.size, max_size_kb, max_dimension)
+    if (target_width, target_height) != img.size:
+        img.draft('RGB', (
+            max(1, int(target_width * DRAFT_TOLERANCE)),
+            max(1, int(target_height * DRAFT_TOLERANCE))
+        ))
+
+    # 转换为 RGB（处理 RGBA 等格式）
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    # 如果图片尺寸过大，先缩小（reduce 整数倍缩小后再重采样）
+    width, height = img.size
+    if width > target_width or height > target_height:
+        ratio = min(target_width / width, target_height / height)
+        new_width = max(1, int(width * ratio))
+        new_height = max(1, int(height * ratio))
+        img = img.resize((new_width, new_height), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+
+    # 逐步降低质量直到满足大小要求
+    quality = quality_start
+    compressed_data = None
+
+    while quality >= quality_min:
+        output = io.BytesIO()
+        img.save(output, format='JPEG', quality=quality, optimize=True)
+        compressed_data = output.getvalue()
+
+        if len(compressed_data) <= max_size_bytes:
+            break
+
+        quality -= 5
+
+    # 如果还是太大，进一步缩小尺寸
+    if len(compressed_data) > max_size_bytes:
+        width, height = img.size
+        while len(compressed_data) > max_size_bytes and max(width, height) > 512:
+            width = int(width * 0.9)
+            height = int(height * 0.9)
+            img_resized = img.resize((width, height), Image.Resampling.LANCZOS)
+
+            output = io.BytesIO()
+            img_resized.save(output, format='JPEG', quality=quality_min, optimize=True)
+            compressed_data = output.getvalue()
+
+    return compressed_data
+
+
+def _target_size(size: Tuple[int, int], max_size_kb: int, max_dimension: int) -> Tuple[int, int]:
+    """
+    推算压缩需要的最大尺寸（保持宽高比）
+
+    不超过 max_dimension，且像素数不超过最低质量下 max_size_kb 能容纳的像素数
+
+    Args:
+        size: 原图尺寸 (宽, 高)
+        max_size_kb: 最大文件大小（KB）
+        max_dimension: 最大边长（像素）
+
+    Returns:
+        (宽, 高)，不需要缩小时返回原尺寸
+    """
+    width, height = size
+    max_pixels = max_size_kb * 1024 / MIN_BYTES_PER_PIXEL
+    ratio = min(1.0, max_dimension / width, max_dimension / height, math.sqrt(max_pixels / (width * height)))
+    if ratio >= 1.0:
+        return size
+    return max(1, int(width * ratio)), max(1, int(height * ratio))
+
+
 def compress_images(images: list[bytes], max_size_kb: int = 200) -> list[bytes]:
     """
     批量压缩图片
@@ -0,0 +1,206 @@
+"""
+图片处理进程池
+
+Pillow 的 JPEG 编码（optimize + 逐步降质量循环）长时间持有 GIL，
+在线程池中并发生成缩略图、压缩参考图时实际是串行执行的。
+ImageExecutor 把这些 CPU 密集的压缩任务交给按 CPU 核数创建的进程池：
+- 背压：同时提交到进程池的任务数量有上限，超出时调用方阻塞等待，避免图片数据在队列中堆积
+- 同步回退：IMAGE_WORKERS=0、当前环境无法创建子进程或进程池崩溃时，在调用线程中直接执行
+
+调用方都运行在工作线程中（Flask 请求线程、asyncio.to_thread），异步代码请通过 asyncio.to_thread 调用。
+"""
+import logging
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Optional, TypeVar
+
+from backend.config import Config
+from .image_compressor import compress_image
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def _run_inline(func: Callable[..., T], args: tuple, kwargs: dict) -> "Future[T]":
+    """在当前线程中执行，结果包装为已完成的 Future"""
+    future: "Future[T]" = Future()
+    try:
+        future.set_result(func(*args, **kwargs))
+    except BaseException as e:
+        future.set_exception(e)
+    return future
+
+
+class ImageExecutor:
+    """CPU 密集图片处理的进程池（带背压和同步回退）"""
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None):
+        """
+        Args:
+            max_workers: 进程数，默认 Config.IMAGE_WORKERS；为 0 时不使用进程池
+            max_pending: 同时提交到进程池的任务上限，默认进程数的 2 倍
+        """
+        if max_workers is None:
+            max_workers = Config.IMAGE_WORKERS
+        self.max_workers = max_workers
+        self.max_pending = max_pending or max(1, max_workers) * 2
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        # 无法使用进程池时记录原因，之后的任务都同步执行
+        self._disabled: Optional[str] = None if max_workers > 0 else "IMAGE_WORKERS 配置为禁用"
+
+    @property
+    def enabled(self) -> bool:
+        """是否使用进程池"""
+        return self._disabled is None
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        """获取进程池（首次使用时创建，失败时禁用进程池）"""
+        with self._pool_lock:
+            if self._pool is None and self._disabled is None:
+                try:
+                    # 使用 spawn 启动子进程：Web 服务进程中有大量线程，fork 可能复制到被持有的锁
+                    import multiprocessing
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+                    logger.info(f"🧵 图片处理进程池已启动: {self.max_workers} 个进程")
+                except (OSError, ValueError, NotImplementedError, AssertionError) as e:
+                    self._disabled = f"无法创建进程池: {e}"
+                    logger.warning(f"⚠️ {self._disabled}，图片处理改为在线程中执行")
+            return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor, error: Optional[BaseException] = None) -> None:
+        """丢弃失效的进程池（下次使用时重新创建）"""
+        with self._pool_lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+        if error is not None:
+            logger.warning(f"⚠️ 图片处理进程池异常，将重新创建: {error}")
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> "Future[T]":
+        """
+        提交函数到进程池
+
+        同时执行的任务达到上限时阻塞等待；无法使用进程池时在当前线程中执行并返回已完成的 Future
+
+        Args:
+            func: 模块级函数（需要可以被 pickle）
+            *args: 位置参数
+            **kwargs: 关键字参数
+
+        Returns:
+            concurrent.futures.Future
+        """
+        pool = self._get_pool()
+        if pool is None:
+            return _run_inline(func, args, kwargs)
+
+        self._slots.acquire()
+        try:
+            future = pool.submit(func, *args, **kwargs)
+        except BrokenProcessPool as e:
+            self._slots.release()
+            self._discard_pool(pool, e)
+            return _run_inline(func, args, kwargs)
+        except (OSError, RuntimeError, AssertionError) as e:
+            # 子进程在首次提交时才启动（如守护进程中不允许创建子进程），此后不再使用进程池
+            self._slots.release()
+            self._disabled = f"无法启动图片处理进程: {e}"
+            logger.warning(f"⚠️ {self._disabled}，图片处理改为在线程中执行")
+            self._discard_pool(pool)
+            return _run_inline(func, args, kwargs)
+
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _result(self, future: "Future[T]", func: Callable[..., T], args: tuple, kwargs: dict) -> T:
+        """等待结果；进程池崩溃（如子进程被 OOM 杀死）时重建进程池，本次任务在当前线程中执行"""
+        try:
+            return future.result()
+        except BrokenProcessPool as e:
+            with self._pool_lock:
+                pool = self._pool
+            if pool is not None:
+                self._discard_pool(pool, e)
+            return func(*args, **kwargs)
+
+    def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        在进程池中执行函数并等待结果
+
+        Args:
+            func: 模块级函数（需要可以被 pickle）
+            *args: 位置参数
+            **kwargs: 关键字参数
+
+        Returns:
+            函数返回值
+        """
+        return self._result(self.submit(func, *args, **kwargs), func, args, kwargs)
+
+    def compress(self, image_data: bytes, max_size_kb: int = 200, **kwargs: Any) -> bytes:
+        """
+        压缩图片（参数同 compress_image）
+
+        Args:
+            image_data: 原始图片数据
+            max_size_kb: 最大文件大小（KB）
+            **kwargs: compress_image 的其余参数
+
+        Returns:
+            压缩后的图片数据
+        """
+        return self.compress_many([image_data], max_size_kb, **kwargs)[0]
+
+    def compress_many(self, images: List[bytes], max_size_kb: int = 200, **kwargs: Any) -> List[bytes]:
+        """
+        并行压缩多张图片（参数同 compress_image）
+
+        Args:
+            images: 原始图片数据列表
+            max_size_kb: 最大文件大小（KB）
+            **kwargs: compress_image 的其余参数
+
+        Returns:
+            压缩后的图片数据列表（顺序与输入一致）
+        """
+        # 不需要压缩的图片直接返回，省去进程间传输
+        futures = [
+            self.submit(compress_image, image_data, max_size_kb, **kwargs)
+            if len(image_data) > max_size_kb * 1024 else None
+            for image_data in images
+        ]
+        return [
+            image_data if future is None
+            else self._result(future, compress_image, (image_data, max_size_kb), kwargs)
+            for image_data, future in zip(images, futures)
+        ]
+
+    def shutdown(self) -> None:
+        """关闭进程池"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+# 全局图片处理执行器
+_executor_instance = None
+_executor_lock = threading.Lock()
+
+
+def get_image_executor() -> ImageExecutor:
+    """获取全局图片处理执行器"""
+    global _executor_instance
+    with _executor_lock:
+        if _executor_instance is None:
+            _executor_instance = ImageExecutor()
+        return _executor_instance
@@ -0,0 +1,182 @@
+"""启动性能分析
+
+设置环境变量 MAGICBRUSH_PROFILE_STARTUP=1 后启用：
+- 统计每个模块的导入耗时（自身耗时 / 含子模块导入的累计耗时）
+- 统计 create_app 各阶段耗时
+应用创建完成后把报告写入日志；设置 MAGICBRUSH_PROFILE_STARTUP_OUTPUT 时同时写出 JSON 文件。
+
+本模块只依赖标准库，需在其他模块之前导入，才能统计到它们的导入耗时。
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from importlib.abc import MetaPathFinder
+from typing import Any, Dict, List, Optional, Tuple
+
+ENV_FLAG = "MAGICBRUSH_PROFILE_STARTUP"
+ENV_OUTPUT = "MAGICBRUSH_PROFILE_STARTUP_OUTPUT"
+ENV_TOP = "MAGICBRUSH_PROFILE_STARTUP_TOP"
+
+
+class _ImportTimingFinder(MetaPathFinder):
+    """
+    导入计时钩子
+
+    自身不查找模块，只在其他查找器找到模块后包装其 loader.exec_module 进行计时
+    """
+
+    def __init__(self, profiler: "StartupProfiler"):
+        self.profiler = profiler
+        self._local = threading.local()
+
+    def find_spec(self, fullname, path=None, target=None):
+        # 避免递归：查找期间再次进入本钩子时直接跳过
+        if getattr(self._local, "finding", False):
+            return None
+
+        self._local.finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._local.finding = False
+
+        loader = spec.loader
+        # 内置/冻结模块的 loader 是类本身（共享），不做包装
+        if loader is not None and not isinstance(loader, type) and hasattr(loader, "exec_module"):
+            loader.exec_module = self._timed(fullname, loader.exec_module)
+        return spec
+
+    def _timed(self, fullname: str, exec_module):
+        profiler = self.profiler
+        local = self._local
+
+        def exec_module_timed(module):
+            stack = getattr(local, "stack", None)
+            if stack is None:
+                stack = local.stack = []
+            # 栈中每一项记录子模块累计耗时，用于计算自身耗时
+            stack.append(0.0)
+            started = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                cumulative = time.perf_counter() - started
+                children = stack.pop()
+                if stack:
+                    stack[-1] += cumulative
+                profiler._record_import(fullname, cumulative - children, cumulative)
+
+        return exec_module_timed
+
+
+class StartupProfiler:
+    """启动耗时统计"""
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.started_at = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        # 模块名 -> (自身耗时, 累计耗时)
+        self.imports: Dict[str, Tuple[float, float]] = {}
+        self._finder: Optional[_ImportTimingFinder] = None
+        self._lock = threading.Lock()
+
+    def install_import_hook(self) -> None:
+        """安装导入计时钩子（之后导入的模块才会被统计）"""
+        if self._finder is None:
+            self._finder = _ImportTimingFinder(self)
+            sys.meta_path.insert(0, self._finder)
+
+    def uninstall_import_hook(self) -> None:
+        """移除导入计时钩子"""
+        if self._finder is not None:
+            sys.meta_path.remove(self._finder)
+            self._finder = None
+
+    def _record_import(self, fullname: str, self_time: float, cumulative: float) -> None:
+        with self._lock:
+            self.imports[fullname] = (self_time, cumulative)
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        统计一个启动阶段的耗时
+
+        Args:
+            name: 阶段名称
+        """
+        if not self.enabled:
+            yield
+            return
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def to_dict(self, top: int = 20) -> Dict[str, Any]:
+        """
+        报告数据
+
+        Args:
+            top: 输出累计导入耗时最长的模块数量
+
+        Returns:
+            {"total", "phases", "imports", "import_count"}
+        """
+        with self._lock:
+            imports = sorted(self.imports.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            "total": time.perf_counter() - self.started_at,
+            "phases": [{"name": name, "seconds": seconds} for name, seconds in self.phases],
+            "import_count": len(imports),
+            "imports": [
+                {"module": name, "self": self_time, "cumulative": cumulative}
+                for name, (self_time, cumulative) in imports[:top]
+            ],
+        }
+
+    def report(self, logger: logging.Logger) -> None:
+        """把启动耗时报告写入日志（并按配置写出 JSON 文件）"""
+        if not self.enabled:
+            return
+
+        data = self.to_dict(top=int(os.environ.get(ENV_TOP, "20")))
+        lines = [f"⏱️  启动耗时 {data['total'] * 1000:.0f}ms（自 startup_profiler 导入起），共导入 {data['import_count']} 个模块"]
+        lines.append("  阶段耗时：")
+        for phase in data["phases"]:
+            lines.append(f"    {phase['seconds'] * 1000:8.1f}ms  {phase['name']}")
+        lines.append("  模块导入耗时（累计 / 自身）：")
+        for item in data["imports"]:
+            lines.append(f"    {item['cumulative'] * 1000:8.1f}ms / {item['self'] * 1000:6.1f}ms  {item['module']}")
+        logger.info("\n".join(lines))
+
+        output_path = os.environ.get(ENV_OUTPUT)
+        if output_path:
+            with open(output_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+# 全局分析器实例（导入本模块时即开始计时）
+_profiler_instance = StartupProfiler(
+    enabled=os.environ.get(ENV_FLAG, "").lower() in ("1", "true", "yes")
+)
+if _profiler_instance.enabled:
+    _profiler_instance.install_import_hook()
+
+
+def get_startup_profiler() -> StartupProfiler:
+    """获取全局启动性能分析器"""
+    return _profiler_instance
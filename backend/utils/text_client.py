@@ -2,14 +2,15 @@
 import time
 import random
 import base64
-import requests
+import threading
 from functools import wraps
 from typing import List, Optional, Union
-from .image_compressor import compress_image
+from .deadline import can_retry, request_timeout
+from .image_executor import get_image_executor
 
 
 def retry_on_429(max_retries=3, base_delay=2):
-    """429 错误自动重试装饰器"""
+    """429 错误自动重试装饰器（剩余时间不足以再尝试一次时不再重试）"""
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
@@ -21,6 +22,8 @@ def retry_on_429(max_retries=3, base_delay=2):
                     if "429" in error_str or "rate" in error_str.lower():
                         if attempt < max_retries - 1:
                             wait_time = (base_delay ** attempt) + random.uniform(0, 1)
+                            if not can_retry(wait_time):
+                                raise
                             print(f"[重试] 遇到限流，{wait_time:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries})")
                             time.sleep(wait_time)
                             continue
@@ -57,6 +60,21 @@ class TextChatClient:
             endpoint = '/' + endpoint
         self.chat_endpoint = f"{self.base_url}{endpoint}"
 
+        # 每个线程各自持有一个 requests.Session（客户端会被多个请求线程共享，而 Session 并不保证线程安全），
+        # 同一线程内复用连接池（Keep-Alive），后续请求无需重新建立 TLS 连接
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        """当前线程的 requests.Session（首次使用时创建）"""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            # requests 在首次请求时才导入，缩短应用启动时间
+            import requests
+            session = requests.Session()
+            self._local.session = session
+        return session
+
     def _encode_image_to_base64(self, image_data: bytes) -> str:
         """将图片数据编码为 base64"""
         return base64.b64encode(image_data).decode('utf-8')
@@ -84,7 +102,7 @@ class TextChatClient:
         for img in images:
             if isinstance(img, bytes):
                 # 压缩图片到 200KB 以内
-                compressed_img = compress_image(img, max_size_kb=200)
+                compressed_img = get_image_executor().compress(img, max_size_kb=200)
                 # 图片数据，转为 base64 data URL
                 base64_data = self._encode_image_to_base64(compressed_img)
                 image_url = f"data:image/png;base64,{base64_data}"
@@ -154,11 +172,11 @@ class TextChatClient:
             "Authorization": f"Bearer {self.api_key}"
         }
 
-        response = requests.post(
+        response = self.session.post(
             self.chat_endpoint,
             json=payload,
             headers=headers,
-            timeout=300  # 5分钟超时
+            timeout=request_timeout(300)  # 默认5分钟超时，不超过剩余时间
         )
 
         if response.status_code != 200:
@@ -0,0 +1,271 @@
+"""
+参考图上传处理
+
+上传的参考图不整体读入内存：
+- multipart 文件由 werkzeug 写入临时文件（SpooledTemporaryFile），直接交给 Pillow 按需读取
+- JSON 中的 base64 图片分块解码到临时文件，不保留完整的解码结果
+- JPEG 使用 draft 模式按目标尺寸缩小解码（DCT 缩放），大尺寸手机照片不再完整解码
+最终只在内存中保留压缩后的参考图（不超过 REFERENCE_MAX_KB）。
+压缩结果保存到参考图存储（backend/services/reference_store.py），重复上传同一张图片时直接复用。
+
+单张图片大小、图片数量由 Config.UPLOAD_MAX_IMAGE_MB / UPLOAD_MAX_IMAGES 限制，
+请求体总大小由 Flask 的 MAX_CONTENT_LENGTH（UPLOAD_MAX_REQUEST_MB）限制。
+"""
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from typing import IO, List, Union
+
+from backend.config import Config
+from backend.services.reference_store import get_reference_store
+from .image_compressor import compress_pil_image
+from .image_executor import get_image_executor
+
+logger = logging.getLogger(__name__)
+
+# 压缩后参考图的大小上限（KB）和最大边长，与大纲生成时的压缩目标一致
+REFERENCE_MAX_KB = 200
+REFERENCE_MAX_DIMENSION = 2048
+# 临时文件超过该大小后写入磁盘
+SPOOL_MEMORY_BYTES = 1024 * 1024
+# base64 分块解码的块大小（必须是 4 的倍数）
+BASE64_CHUNK_CHARS = 64 * 1024
+# 计算内容哈希时每次读取的字节数
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+class UploadError(ValueError):
+    """上传内容不合法（超出大小限制或无法识别的图片）"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+    def __reduce__(self):
+        # 从图片处理子进程传回时保留状态码
+        return type(self), (str(self), self.status_code)
+
+
+def _max_image_bytes() -> int:
+    return Config.UPLOAD_MAX_IMAGE_MB * 1024 * 1024
+
+
+def check_image_count(count: int) -> None:
+    """检查单次请求的参考图数量"""
+    if count > Config.UPLOAD_MAX_IMAGES:
+        raise UploadError(
+            f"参考图数量超出限制：最多 {Config.UPLOAD_MAX_IMAGES} 张，实际 {count} 张",
+            status_code=413
+        )
+
+
+def _too_large(size: int) -> UploadError:
+    return UploadError(
+        f"参考图过大：{size / 1024 / 1024:.1f}MB，单张上限 {Config.UPLOAD_MAX_IMAGE_MB}MB\n"
+        "解决方案：压缩或裁剪图片后重新上传",
+        status_code=413
+    )
+
+
+def _hash_stream(stream: IO[bytes]) -> str:
+    """分块计算文件对象内容的 SHA-256（完成后回到开头）"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_BYTES), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def store_reference_image(stream: IO[bytes]) -> str:
+    """
+    保存参考图到参考图存储，返回参考图 ID
+
+    与已保存的参考图内容相同时不再解码和压缩，直接返回已有的参考图 ID
+
+    Args:
+        stream: 可 seek 的二进制文件对象
+
+    Returns:
+        参考图 ID
+
+    Raises:
+        UploadError: 超出大小限制或无法识别的图片
+    """
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+
+    if size > _max_image_bytes():
+        raise _too_large(size)
+
+    store = get_reference_store()
+    original_hash = _hash_stream(stream)
+    ref_id = store.lookup(original_hash)
+    if ref_id is not None:
+        logger.debug(f"参考图已存在，跳过压缩: {ref_id}")
+        return ref_id
+
+    # 已经足够小的图片原样保留（与 compress_image 一致）
+    if size <= REFERENCE_MAX_KB * 1024:
+        data = stream.read()
+    else:
+        executor = get_image_executor()
+        if executor.enabled:
+            # 解码和压缩在图片处理进程中执行，需要把原图数据传给子进程
+            data = executor.run(_compress_reference, stream.read())
+        else:
+            data = _compress_reference(stream)
+        logger.debug(f"参考图压缩: {size / 1024:.1f}KB -> {len(data) / 1024:.1f}KB")
+
+    try:
+        return store.add(data, aliases=[original_hash])
+    except ValueError as e:
+        raise UploadError(f"{e}\n解决方案：请上传 PNG / JPEG / WebP 格式的图片")
+
+
+def _compress_reference(source: Union[bytes, IO[bytes]]) -> bytes:
+    """解码并压缩参考图（在图片处理进程中执行）"""
+    from PIL import Image, UnidentifiedImageError
+
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    try:
+        # 只读取文件头，JPEG 在 compress_pil_image 中按目标尺寸缩小解码
+        img = Image.open(source)
+        return compress_pil_image(img, REFERENCE_MAX_KB, max_dimension=REFERENCE_MAX_DIMENSION)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise UploadError(f"无法识别的图片文件: {e}\n解决方案：请上传 PNG / JPEG / WebP 格式的图片")
+
+
+def process_uploaded_files(files) -> List[bytes]:
+    """
+    处理 multipart 上传的图片文件
+
+    Args:
+        files: werkzeug FileStorage 列表
+
+    Returns:
+        压缩后的参考图列表
+    """
+    return _load_references(store_uploaded_files(files), REFERENCE_MAX_KB)
+
+
+def store_uploaded_files(files) -> List[str]:
+    """
+    保存 multipart 上传的图片文件到参考图存储
+
+    Args:
+        files: werkzeug FileStorage 列表
+
+    Returns:
+        参考图 ID 列表
+    """
+    files = [file for file in files if file and file.filename]
+    check_image_count(len(files))
+
+    ref_ids = []
+    for file in files:
+        ref_ids.append(store_reference_image(file.stream))
+        file.close()
+    return ref_ids
+
+
+def _spool_base64(img_b64: str) -> IO[bytes]:
+    """把 base64 字符串分块解码到临时文件"""
+    # 跳过可能的 data URL 前缀（如 data:image/png;base64,）
+    start = img_b64.find(',') + 1
+    estimated = (len(img_b64) - start) * 3 // 4
+    if estimated > _max_image_bytes():
+        raise _too_large(estimated)
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+    try:
+        for pos in range(start, len(img_b64), BASE64_CHUNK_CHARS):
+            spool.write(base64.b64decode(img_b64[pos:pos + BASE64_CHUNK_CHARS]))
+    except (binascii.Error, ValueError):
+        # 含换行等非对齐字符时分块会错位，退回整体解码
+        spool.seek(0)
+        spool.truncate()
+        try:
+            spool.write(base64.b64decode(img_b64[start:]))
+        except (binascii.Error, ValueError) as e:
+            spool.close()
+            raise UploadError(f"参考图 base64 数据格式错误: {e}")
+    return spool
+
+
+def process_base64_images(images_base64: list) -> List[bytes]:
+    """
+    处理 base64 编码的图片列表
+
+    Args:
+        images_base64: base64 编码的图片字符串列表（可带 data URL 前缀）
+
+    Returns:
+        压缩后的参考图列表
+    """
+    return _load_references(store_base64_images(images_base64), REFERENCE_MAX_KB)
+
+
+def store_base64_images(images_base64: list) -> List[str]:
+    """
+    保存 base64 编码的图片到参考图存储
+
+    Args:
+        images_base64: base64 编码的图片字符串列表（可带 data URL 前缀）
+
+    Returns:
+        参考图 ID 列表
+    """
+    if not images_base64:
+        return []
+    if not isinstance(images_base64, list) or not all(isinstance(item, str) for item in images_base64):
+        raise UploadError("参数错误：图片必须是 base64 字符串数组")
+    check_image_count(len(images_base64))
+
+    ref_ids = []
+    for img_b64 in images_base64:
+        with _spool_base64(img_b64) as spool:
+            ref_ids.append(store_reference_image(spool))
+    return ref_ids
+
+
+def resolve_reference_ids(ref_ids: list, max_size_kb: int = REFERENCE_MAX_KB) -> List[bytes]:
+    """
+    按参考图 ID 读取参考图（由 POST /api/references 上传得到）
+
+    Args:
+        ref_ids: 参考图 ID 列表
+        max_size_kb: 读取的尺寸版本（KB）
+
+    Returns:
+        参考图数据列表
+
+    Raises:
+        UploadError: ID 格式错误或参考图不存在
+    """
+    if not ref_ids:
+        return []
+    if not isinstance(ref_ids, list):
+        raise UploadError("参数错误：参考图 ID 必须是数组")
+    check_image_count(len(ref_ids))
+    return _load_references(ref_ids, max_size_kb)
+
+
+def _load_references(ref_ids: List[str], max_size_kb: int) -> List[bytes]:
+    store = get_reference_store()
+    images = []
+    for ref_id in ref_ids:
+        data = store.get(ref_id, max_size_kb)
+        if data is None:
+            raise UploadError(
+                f"参考图不存在: {ref_id}\n"
+                "可能原因：参考图 ID 错误，或服务端参考图目录已被清理\n"
+                "解决方案：重新上传参考图"
+            )
+        images.append(data)
+    return images
@@ -0,0 +1,167 @@
+"""
+图片压缩解码耗时基准
+
+对比两种压缩方式在 4K PNG / JPEG 输入上的耗时：
+- 完整解码：Image.open 后完整解码原图，再 LANCZOS 缩小到 max_dimension（旧实现）
+- 缩小解码：按目标大小推算所需尺寸，JPEG 用 draft() 按 1/2、1/4、1/8 解码，
+  其余格式先 reduce() 整数倍缩小再重采样（backend.utils.image_compressor）
+
+目标大小覆盖参考图（200KB）、缩略图（50KB）和封面参考（30KB）三种场景。
+
+用法：
+    python benchmarks/image_decode_benchmark.py                      # 使用生成的 4K 测试图
+    python benchmarks/image_decode_benchmark.py --images a.jpg b.png # 使用指定图片
+    python benchmarks/image_decode_benchmark.py --min-speedup 1.5    # 解码加速比低于该值时返回非零状态码
+"""
+import argparse
+import io
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from PIL import Image, ImageDraw, ImageFilter
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend.utils.image_compressor import REDUCING_GAP, _target_size, compress_image  # noqa: E402
+
+# (场景, 目标大小 KB)
+TARGETS = [
+    ('参考图', 200),
+    ('缩略图', 50),
+    ('封面参考', 30),
+]
+MAX_DIMENSION = 2048
+SIZE_4K = (3840, 2160)
+
+
+def _synthetic_photo(size: Tuple[int, int]) -> Image.Image:
+    """生成接近照片内容的测试图（渐变背景 + 色块 + 颗粒噪声）"""
+    width, height = size
+    background = Image.merge('RGB', (
+        Image.linear_gradient('L').resize(size),
+        Image.linear_gradient('L').rotate(90).resize(size),
+        Image.radial_gradient('L').resize(size),
+    ))
+    draw = ImageDraw.Draw(background)
+    for i in range(40):
+        x = (i * 397) % width
+        y = (i * 211) % height
+        radius = 60 + (i * 37) % 240
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius),
+                     fill=((i * 53) % 256, (i * 97) % 256, (i * 151) % 256))
+    background = background.filter(ImageFilter.GaussianBlur(6))
+    noise = Image.effect_noise(size, 24).convert('RGB')
+    return Image.blend(background, noise, 0.15)
+
+
+def _sample_inputs() -> Dict[str, bytes]:
+    photo = _synthetic_photo(SIZE_4K)
+    inputs = {}
+    for fmt, options in (('JPEG', {'quality': 92}), ('PNG', {})):
+        output = io.BytesIO()
+        photo.save(output, format=fmt, **options)
+        inputs[f'4K {fmt}'] = output.getvalue()
+    return inputs
+
+
+def _full_decode(image_data: bytes, max_size_kb: int) -> Image.Image:
+    """旧实现的解码阶段：完整解码后缩小到 max_dimension"""
+    img = Image.open(io.BytesIO(image_data)).convert('RGB')
+    width, height = img.size
+    if width > MAX_DIMENSION or height > MAX_DIMENSION:
+        ratio = min(MAX_DIMENSION / width, MAX_DIMENSION / height)
+        img = img.resize((int(width * ratio), int(height * ratio)), Image.Resampling.LANCZOS)
+    return img
+
+
+def _reduced_decode(image_data: bytes, max_size_kb: int) -> Image.Image:
+    """新实现的解码阶段：draft / reduce 后缩小到目标尺寸"""
+    img = Image.open(io.BytesIO(image_data))
+    target = _target_size(img.size, max_size_kb, MAX_DIMENSION)
+    if target != img.size:
+        img.draft('RGB', (int(target[0] * 0.75), int(target[1] * 0.75)))
+    img = img.convert('RGB')
+    if img.width > target[0] or img.height > target[1]:
+        ratio = min(target[0] / img.width, target[1] / img.height)
+        img = img.resize((int(img.width * ratio), int(img.height * ratio)),
+                         Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+    return img
+
+
+def _full_compress(image_data: bytes, max_size_kb: int) -> bytes:
+    """旧实现的完整压缩流程（完整解码 + 降质量 + 逐步缩小）"""
+    max_size_bytes = max_size_kb * 1024
+    img = _full_decode(image_data, max_size_kb)
+    quality = 85
+    while quality >= 20:
+        output = io.BytesIO()
+        img.save(output, format='JPEG', quality=quality, optimize=True)
+        data = output.getvalue()
+        if len(data) <= max_size_bytes:
+            return data
+        quality -= 5
+    width, height = img.size
+    while len(data) > max_size_bytes and max(width, height) > 512:
+        width, height = int(width * 0.9), int(height * 0.9)
+        output = io.BytesIO()
+        img.resize((width, height), Image.Resampling.LANCZOS).save(
+            output, format='JPEG', quality=20, optimize=True)
+        data = output.getvalue()
+    return data
+
+
+def _median_ms(func: Callable[[], object], runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='图片压缩解码耗时基准')
+    parser.add_argument('--images', nargs='*', help='输入图片路径（默认生成 4K PNG / JPEG 测试图）')
+    parser.add_argument('--runs', type=int, default=5, help='每组重复次数（默认 5）')
+    parser.add_argument('--min-speedup', type=float, help='解码加速比下限，低于该值时返回非零状态码')
+    args = parser.parse_args()
+
+    if args.images:
+        inputs = {Path(path).name: Path(path).read_bytes() for path in args.images}
+    else:
+        inputs = _sample_inputs()
+
+    print(f"{'输入':<16}{'场景':<10}{'完整解码':>10}{'缩小解码':>10}{'加速':>8}"
+          f"{'旧压缩':>10}{'新压缩':>10}  输出")
+    speedups: List[float] = []
+    for name, data in inputs.items():
+        for label, max_size_kb in TARGETS:
+            full_ms = _median_ms(lambda: _full_decode(data, max_size_kb), args.runs)
+            reduced_ms = _median_ms(lambda: _reduced_decode(data, max_size_kb), args.runs)
+            old_ms = _median_ms(lambda: _full_compress(data, max_size_kb), args.runs)
+            new_ms = _median_ms(lambda: compress_image(data, max_size_kb=max_size_kb), args.runs)
+
+            output = compress_image(data, max_size_kb=max_size_kb)
+            with Image.open(io.BytesIO(output)) as img:
+                output_desc = f"{img.width}x{img.height} {len(output) / 1024:.0f}KB"
+
+            speedup = full_ms / reduced_ms
+            speedups.append(speedup)
+            print(f"{name:<16}{label:<10}{full_ms:>8.0f}ms{reduced_ms:>8.0f}ms{speedup:>7.1f}x"
+                  f"{old_ms:>8.0f}ms{new_ms:>8.0f}ms  {output_desc}")
+
+    worst = min(speedups)
+    if args.min_speedup is not None and worst < args.min_speedup:
+        print(f"❌ 最低解码加速比 {worst:.2f}x 低于要求的 {args.min_speedup:.2f}x")
+        return 1
+
+    print(f"✅ 解码加速比 {worst:.1f}x ~ {max(speedups):.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+冷启动耗时回归基准
+
+在全新的子进程中多次执行「导入入口模块并创建应用」，检查启动期间不应被导入的重量级模块
+（按需导入的 SDK 等），并按需与绝对上限或基线比较中位数，不通过时以非零状态码退出，可直接接入 CI。
+
+启动耗时与机器相关，仓库中不提交基线：基线只在同一台机器（同一个 CI runner）上记录和比较，
+例如 CI 先在目标分支上 --update-baseline，再在待合并的提交上比较。
+
+用法：
+    python benchmarks/startup_benchmark.py                    # 只检查按需加载的模块（本机已记录基线时同时比较）
+    python benchmarks/startup_benchmark.py --max-seconds 1.0  # 同时检查绝对上限
+    python benchmarks/startup_benchmark.py --update-baseline  # 在当前机器上记录基线
+    python benchmarks/startup_benchmark.py --baseline /tmp/startup.json  # 指定基线文件
+
+失败时会以 MAGICBRUSH_PROFILE_STARTUP=1 再运行一次，输出最慢的模块导入，便于定位回归来源。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+# 本机基线的默认位置（已加入 .gitignore，不提交）
+BASELINE_PATH = Path(__file__).resolve().parent / 'startup_baseline.json'
+
+# 这些模块只在首次使用时导入，出现在启动阶段即视为回归
+LAZY_MODULES = [
+    'google.genai',
+    'PIL',
+    'requests',
+]
+
+# 子进程中执行的冷启动代码：输出耗时和已导入的模块
+# 入口模块导入时已创建 app（如 backend.asgi）则不再重复调用 create_app()
+_CHILD_CODE = """
+import importlib, json, sys, time
+started = time.perf_counter()
+entry = importlib.import_module("{entry}")
+if not hasattr(entry, "app"):
+    from backend.app import create_app
+    create_app()
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def _run_once(entry: str, env: dict) -> dict:
+    """在新进程中执行一次冷启动"""
+    result = subprocess.run(
+        [sys.executable, '-c', _CHILD_CODE.format(entry=entry)],
+        cwd=PROJECT_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _profile(entry: str, env: dict, top: int) -> None:
+    """开启启动分析再运行一次，打印最慢的模块导入"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output = Path(tmp_dir) / 'startup_profile.json'
+        profile_env = dict(env, MAGICBRUSH_PROFILE_STARTUP='1',
+                           MAGICBRUSH_PROFILE_STARTUP_OUTPUT=str(output),
+                           MAGICBRUSH_PROFILE_STARTUP_TOP=str(top))
+        _run_once(entry, profile_env)
+        data = json.loads(output.read_text(encoding='utf-8'))
+
+    print(f"\n启动分析（共导入 {data['import_count']} 个模块）：")
+    for phase in data['phases']:
+        print(f"  {phase['seconds'] * 1000:8.1f}ms  [阶段] {phase['name']}")
+    for item in data['imports']:
+        print(f"  {item['cumulative'] * 1000:8.1f}ms  {item['module']}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='冷启动耗时回归基准')
+    parser.add_argument('--entry', default='backend.asgi', help='入口模块（默认 backend.asgi）')
+    parser.add_argument('--runs', type=int, default=5, help='冷启动次数（默认 5）')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='允许超出基线的比例（默认 0.25，即 25%%）')
+    parser.add_argument('--max-seconds', type=float, help='绝对上限（秒），指定后不读取基线')
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH,
+                        help='基线文件（默认 benchmarks/startup_baseline.json，需在同一台机器上记录）')
+    parser.add_argument('--update-baseline', action='store_true', help='把本次结果写入基线文件')
+    parser.add_argument('--top', type=int, default=15, help='失败时输出的最慢模块数量')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.pop('MAGICBRUSH_PROFILE_STARTUP', None)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(PROJECT_ROOT), env.get('PYTHONPATH')]))
+
+    runs = [_run_once(args.entry, env) for _ in range(args.runs)]
+    timings = [run['seconds'] for run in runs]
+    median = statistics.median(timings)
+    print(f"冷启动 {args.entry}：中位数 {median * 1000:.0f}ms "
+          f"（{', '.join(f'{t * 1000:.0f}' for t in timings)} ms）")
+
+    failures = []
+
+    loaded = set(runs[0]['modules'])
+    eager = [name for name in LAZY_MODULES if name in loaded]
+    if eager:
+        failures.append(f"启动阶段导入了应按需加载的模块: {', '.join(eager)}")
+
+    if args.update_baseline:
+        args.baseline.write_text(
+            json.dumps({'entry': args.entry, 'seconds': round(median, 4)}, indent=2) + '\n',
+            encoding='utf-8'
+        )
+        print(f"已更新基线: {args.baseline}")
+    elif args.max_seconds is not None:
+        if median > args.max_seconds:
+            failures.append(f"冷启动 {median:.3f}s 超过上限 {args.max_seconds:.3f}s")
+    elif args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text(encoding='utf-8'))['seconds']
+        limit = baseline * (1 + args.tolerance)
+        print(f"基线 {baseline * 1000:.0f}ms，允许上限 {limit * 1000:.0f}ms")
+        if median > limit:
+            failures.append(f"冷启动 {median:.3f}s 超过基线 {baseline:.3f}s 的 {args.tolerance:.0%} 容差")
+    else:
+        print("未找到本机基线，只检查按需加载的模块（可用 --max-seconds 指定上限，或先运行 --update-baseline）")
+
+    if failures:
+        for message in failures:
+            print(f"❌ {message}")
+        _profile(args.entry, env, args.top)
+        return 1
+
+    print("✅ 启动耗时正常")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
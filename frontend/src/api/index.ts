@@ -30,21 +30,22 @@ export interface FinishEvent {
   images: string[]
 }
 
-// 生成大纲（支持图片上传）
-export async function generateOutline(
-  topic: string,
-  images?: File[]
-): Promise<OutlineResponse & { has_images?: boolean }> {
-  // 如果有图片，使用 FormData
-  if (images && images.length > 0) {
+// ==================== 参考图 ====================
+
+// 已上传文件对应的参考图 ID（同一个 File 在大纲、封面、内容生成之间只上传一次）
+const referenceIdCache = new WeakMap<File, string>()
+
+// 上传参考图，返回与文件顺序一致的参考图 ID
+export async function uploadReferences(files: File[]): Promise<string[]> {
+  const pending = files.filter(file => !referenceIdCache.has(file))
+  if (pending.length > 0) {
     const formData = new FormData()
-    formData.append('topic', topic)
-    images.forEach((file) => {
+    pending.forEach((file) => {
       formData.append('images', file)
     })
 
-    const response = await axios.post<OutlineResponse & { has_images?: boolean }>(
-      `${API_BASE_URL}/outline`,
+    const response = await axios.post<{ success: boolean; ids?: string[]; error?: string }>(
+      `${API_BASE_URL}/references`,
       formData,
       {
         headers: {
@@ -52,16 +53,137 @@ export async function generateOutline(
         }
       }
     )
-    return response.data
+    if (!response.data.success || !response.data.ids) {
+      throw new Error(response.data.error || '参考图上传失败')
+    }
+    pending.forEach((file, i) => referenceIdCache.set(file, response.data.ids![i]))
   }
+  return files.map(file => referenceIdCache.get(file)!)
+}
 
-  // 无图片，使用 JSON
-  const response = await axios.post<OutlineResponse>(`${API_BASE_URL}/outline`, {
-    topic
+// 生成大纲（支持图片上传）
+export async function generateOutline(
+  topic: string,
+  images?: File[]
+): Promise<OutlineResponse & { has_images?: boolean }> {
+  // 有图片时先上传参考图，之后的图片生成请求复用同一批参考图 ID
+  const imageIds = images && images.length > 0 ? await uploadReferences(images) : undefined
+
+  const response = await axios.post<OutlineResponse & { has_images?: boolean }>(`${API_BASE_URL}/outline`, {
+    topic,
+    image_ids: imageIds
   })
   return response.data
 }
 
+// ==================== SSE 流读取 ====================
+
+// 进度流断线后的最大重连次数
+const MAX_RECONNECT_ATTEMPTS = 3
+
+interface SSEMessage {
+  event: string
+  data: any
+  id?: number
+}
+
+// 读取 SSE 流并逐个回调事件，连接异常中断时抛出错误
+async function readSSEStream(
+  response: Response,
+  onMessage: (message: SSEMessage) => void,
+  abortSignal?: AbortSignal
+) {
+  const reader = response.body?.getReader()
+  if (!reader) {
+    throw new Error('无法读取响应流')
+  }
+
+  const decoder = new TextDecoder()
+  let buffer = ''
+
+  while (true) {
+    // Check abort signal before reading
+    if (abortSignal?.aborted) {
+      reader.cancel()
+      throw new Error('Request aborted')
+    }
+
+    const { done, value } = await reader.read()
+
+    if (done) break
+
+    buffer += decoder.decode(value, { stream: true })
+    const blocks = buffer.split('\n\n')
+    buffer = blocks.pop() || ''
+
+    for (const block of blocks) {
+      if (!block.trim()) continue
+
+      let eventType = ''
+      let eventData = ''
+      let eventId: number | undefined
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event: ')) eventType = line.replace('event: ', '').trim()
+        else if (line.startsWith('data: ')) eventData = line.replace('data: ', '').trim()
+        else if (line.startsWith('id: ')) eventId = Number(line.replace('id: ', '').trim())
+      }
+      if (!eventType || !eventData) continue
+
+      try {
+        onMessage({ event: eventType, data: JSON.parse(eventData), id: eventId })
+      } catch (e) {
+        console.error('解析 SSE 数据失败:', e)
+      }
+    }
+  }
+}
+
+// 读取后台任务的进度流，连接中断时携带 Last-Event-ID 重新订阅（后台任务不会因断线中止）
+async function consumeJobStream(
+  response: Response,
+  onMessage: (message: SSEMessage) => void,
+  abortSignal?: AbortSignal
+) {
+  let jobId = response.headers.get('X-Job-ID')
+  let lastEventId = 0
+  let attempts = 0
+  let stream: Response | null = response
+
+  const handleMessage = (message: SSEMessage) => {
+    if (message.id !== undefined) lastEventId = message.id
+    attempts = 0
+    if (message.event === 'job') {
+      jobId = message.data.job_id
+      return
+    }
+    onMessage(message)
+  }
+
+  while (true) {
+    try {
+      if (!stream) {
+        stream = await fetch(`${API_BASE_URL}/jobs/${jobId}/events`, {
+          headers: { 'Last-Event-ID': String(lastEventId) },
+          signal: abortSignal
+        })
+        if (!stream.ok) {
+          throw new Error(`HTTP error! status: ${stream.status}`)
+        }
+      }
+      await readSSEStream(stream, handleMessage, abortSignal)
+      return
+    } catch (error) {
+      if (abortSignal?.aborted || !jobId || attempts >= MAX_RECONNECT_ATTEMPTS) {
+        throw error
+      }
+      attempts++
+      stream = null
+      console.warn(`进度流连接中断，${attempts} 秒后重连 (${attempts}/${MAX_RECONNECT_ATTEMPTS})`)
+      await new Promise(resolve => setTimeout(resolve, 1000 * attempts))
+    }
+  }
+}
+
 // 获取图片 URL（新格式：task_id/filename）
 // thumbnail 参数：true=缩略图（默认），false=原图
 export function getImageUrl(taskId: string, filename: string, thumbnail: boolean = true): string {
@@ -135,54 +257,22 @@ export async function retryFailedImages(
       throw new Error(errorMessage)
     }
 
-    const reader = response.body?.getReader()
-    if (!reader) {
-      throw new Error('无法读取响应流')
-    }
-
-    const decoder = new TextDecoder()
-    let buffer = ''
-
-    while (true) {
-      const { done, value } = await reader.read()
-
-      if (done) break
-
-      buffer += decoder.decode(value, { stream: true })
-      const lines = buffer.split('\n\n')
-      buffer = lines.pop() || ''
-
-      for (const line of lines) {
-        if (!line.trim()) continue
-
-        const [eventLine, dataLine] = line.split('\n')
-        if (!eventLine || !dataLine) continue
-
-        const eventType = eventLine.replace('event: ', '').trim()
-        const eventData = dataLine.replace('data: ', '').trim()
-
-        try {
-          const data = JSON.parse(eventData)
-
-          switch (eventType) {
-            case 'retry_start':
-              onProgress({ index: -1, status: 'generating', message: data.message })
-              break
-            case 'complete':
-              onComplete(data)
-              break
-            case 'error':
-              onError(data)
-              break
-            case 'retry_finish':
-              onFinish(data)
-              break
-          }
-        } catch (e) {
-          console.error('解析 SSE 数据失败:', e)
-        }
+    await consumeJobStream(response, ({ event: eventType, data }) => {
+      switch (eventType) {
+        case 'retry_start':
+          onProgress({ index: -1, status: 'generating', message: data.message })
+          break
+        case 'complete':
+          onComplete(data)
+          break
+        case 'error':
+          onError(data)
+          break
+        case 'retry_finish':
+          onFinish(data)
+          break
       }
-    }
+    })
   } catch (error) {
     onStreamError(error as Error)
   }
@@ -323,20 +413,8 @@ export async function generateImagesPost(
   abortSignal?: AbortSignal
 ) {
   try {
-    // 将用户图片转换为 base64
-    let userImagesBase64: string[] = []
-    if (userImages && userImages.length > 0) {
-      userImagesBase64 = await Promise.all(
-        userImages.map(file => {
-          return new Promise<string>((resolve, reject) => {
-            const reader = new FileReader()
-            reader.onload = () => resolve(reader.result as string)
-            reader.onerror = reject
-            reader.readAsDataURL(file)
-          })
-        })
-      )
-    }
+    // 用户图片只上传一次，请求中只携带参考图 ID
+    const userImageIds = userImages && userImages.length > 0 ? await uploadReferences(userImages) : []
 
     const response = await fetch(`${API_BASE_URL}/generate`, {
       method: 'POST',
@@ -347,7 +425,7 @@ export async function generateImagesPost(
         pages,
         task_id: taskId,
         full_outline: fullOutline,
-        user_images: userImagesBase64.length > 0 ? userImagesBase64 : undefined,
+        user_image_ids: userImageIds.length > 0 ? userImageIds : undefined,
         user_topic: userTopic || '',
         step,
         style
@@ -377,64 +455,26 @@ export async function generateImagesPost(
       throw new Error(errorMessage)
     }
 
-    const reader = response.body?.getReader()
-    if (!reader) {
-      throw new Error('无法读取响应流')
-    }
-
-    const decoder = new TextDecoder()
-    let buffer = ''
-
-    while (true) {
-      // Check abort signal before reading
-      if (abortSignal?.aborted) {
-        reader.cancel()
-        throw new Error('Request aborted')
+    await consumeJobStream(response, ({ event: eventType, data }) => {
+      switch (eventType) {
+        case 'progress':
+          onProgress(data)
+          break
+        case 'complete':
+          onComplete(data)
+          break
+        case 'error':
+          onError(data)
+          break
+        case 'waiting_approval':
+          // @ts-ignore - hacking dynamic event type
+          onProgress({ ...data, status: 'waiting_approval' })
+          break
+        case 'finish':
+          onFinish(data)
+          break
       }
-
-      const { done, value } = await reader.read()
-
-      if (done) break
-
-      buffer += decoder.decode(value, { stream: true })
-      const lines = buffer.split('\n\n')
-      buffer = lines.pop() || ''
-
-      for (const line of lines) {
-        if (!line.trim()) continue
-
-        const [eventLine, dataLine] = line.split('\n')
-        if (!eventLine || !dataLine) continue
-
-        const eventType = eventLine.replace('event: ', '').trim()
-        const eventData = dataLine.replace('data: ', '').trim()
-
-        try {
-          const data = JSON.parse(eventData)
-
-          switch (eventType) {
-            case 'progress':
-              onProgress(data)
-              break
-            case 'complete':
-              onComplete(data)
-              break
-            case 'error':
-              onError(data)
-              break
-            case 'waiting_approval':
-              // @ts-ignore - hacking dynamic event type
-              onProgress({ ...data, status: 'waiting_approval' })
-              break
-            case 'finish':
-              onFinish(data)
-              break
-          }
-        } catch (e) {
-          console.error('解析 SSE 数据失败:', e)
-        }
-      }
-    }
+    }, abortSignal)
   } catch (error) {
     // Don't report abort as error (user-initiated)
     if ((error as Error).name === 'AbortError' || (error as Error).message === 'Request aborted') {
@@ -518,3 +558,24 @@ export async function getTaskStatus(taskId: string): Promise<{
   const response = await axios.get(`${API_BASE_URL}/task/${taskId}`)
   return response.data
 }
+
+// 取消任务：停止正在进行的生成和批量重试，未生成的页面之后可通过批量重试继续生成
+export async function cancelTask(taskId: string): Promise<{
+  success: boolean
+  cancelled_jobs?: string[]
+  generated?: number
+  cancelled_indices?: number[]
+  error?: string
+}> {
+  const response = await axios.delete(`${API_BASE_URL}/task/${taskId}`)
+  return response.data
+}
+
+// 上报用户正在查看的页面，排队中的页面按该页优先生成
+export async function focusTaskPage(taskId: string, index: number): Promise<{
+  success: boolean
+  error?: string
+}> {
+  const response = await axios.post(`${API_BASE_URL}/task/${taskId}/focus`, { index })
+  return response.data
+}
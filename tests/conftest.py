@@ -3,6 +3,7 @@ pytest 配置和共享 fixtures
 """
 import os
 import sys
+import uuid
 import pytest
 import tempfile
 import shutil
@@ -78,3 +79,36 @@ def sample_history_record():
         "created_at": "2025-01-01T00:00:00",
         "updated_at": "2025-01-01T00:00:00"
     }
+
+
+@pytest.fixture
+def make_image_service(monkeypatch, temp_history_dir):
+    """
+    创建使用假生成器（tests.fakes:FakeImageGenerator）的图片生成服务
+
+    允许导入 tests.fakes 中的自定义生成器；每次调用使用新的服务商名称，熔断统计和生成器缓存互不影响；
+    任务目录和任务状态写入临时目录，图片压缩在调用线程中执行（不启动进程池）
+    """
+    from backend.config import Config
+    from backend.services.image import ImageService
+    from backend.services.task_store import MemoryTaskStateStore
+    from backend.utils import image_executor
+
+    monkeypatch.setattr(image_executor, "_executor_instance", image_executor.ImageExecutor(max_workers=0))
+    providers = {}
+    monkeypatch.setattr(Config, "_image_providers_config", {"active_provider": None, "providers": providers})
+    monkeypatch.setattr(Config, "CUSTOM_GENERATOR_MODULES", ["tests.fakes"])
+
+    def factory(**provider_config):
+        provider_name = f"fake_{uuid.uuid4().hex[:8]}"
+        providers[provider_name] = {
+            "type": "tests.fakes:FakeImageGenerator",
+            "api_key": "test-key",
+            "short_prompt": True,
+            **provider_config,
+        }
+        service = ImageService(provider_name, task_store=MemoryTaskStateStore(temp_history_dir))
+        service.history_root_dir = temp_history_dir
+        return service
+
+    return factory
@@ -0,0 +1,62 @@
+"""
+测试用的假生成器
+
+服务商配置中 type 填写 "tests.fakes:FakeImageGenerator" 即可使用，不发起任何网络请求
+"""
+import asyncio
+import io
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image
+
+from backend.generators.base import ImageGeneratorBase
+
+
+def make_png(color: Tuple[int, int, int] = (200, 30, 30), size: Tuple[int, int] = (32, 32)) -> bytes:
+    """生成一张纯色 PNG 图片"""
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class FakeImageGenerator(ImageGeneratorBase):
+    """
+    测试用图片生成器
+
+    服务商配置项：
+    - batch_size: 单次请求最多合并的页面数（默认 1）
+    - batch_returns: 批量调用返回的图片数量（默认与提示词数量一致，用于模拟数量不符）
+    - fail_times: 前几次单页调用失败
+    - error: 失败时抛出的错误信息
+    - delay: 每次调用的耗时（秒）
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        # (调用类型, 提示词) 列表
+        self.calls: List[Tuple[str, Any]] = []
+        self.failures_left = int(config.get("fail_times", 0))
+
+    def validate_config(self) -> bool:
+        return True
+
+    def get_batch_size(self) -> int:
+        return max(1, int(self.config.get("batch_size", 1)))
+
+    def generate_image(self, prompt: str, **kwargs) -> bytes:
+        self.calls.append(("single", prompt))
+        return make_png()
+
+    async def agenerate_image(self, prompt: str, **kwargs) -> bytes:
+        self.calls.append(("single", prompt))
+        await asyncio.sleep(float(self.config.get("delay", 0)))
+        if self.failures_left > 0:
+            self.failures_left -= 1
+            raise Exception(self.config.get("error", "上游请求失败 (状态码: 503)"))
+        return make_png()
+
+    async def agenerate_images_batch(self, prompts: List[str], **kwargs) -> List[bytes]:
+        self.calls.append(("batch", list(prompts)))
+        await asyncio.sleep(float(self.config.get("delay", 0)))
+        count = int(self.config.get("batch_returns", len(prompts)))
+        return [make_png() for _ in range(count)]
@@ -0,0 +1,73 @@
+"""
+批量生成测试：多页合并为一次上游请求，返回数量不符时回退为逐页生成
+"""
+import asyncio
+
+import pytest
+
+from backend.generators.image_api import ImageApiGenerator
+from backend.generators.openai_compatible import OpenAICompatibleGenerator
+
+
+def run_group(service, pages, task_id="task_batch"):
+    provider = service.get_provider()
+    return asyncio.run(service._agenerate_page_group(provider, pages, task_id))
+
+
+def test_batch_merges_pages_into_one_call(make_image_service, sample_pages):
+    """数量一致时整组只调用一次批量接口"""
+    service = make_image_service(batch_size=3)
+    pages = sample_pages[1:]
+
+    results = run_group(service, pages)
+
+    assert [(index, success) for index, success, _, _ in results] == [(1, True), (2, True), (3, True)]
+    calls = service.get_provider().generator.calls
+    assert [kind for kind, _ in calls] == ["batch"]
+    assert len(calls[0][1]) == 3
+
+
+def test_batch_count_mismatch_falls_back_to_single_pages(make_image_service, sample_pages):
+    """批量调用返回的图片少于页面数时，整组回退为逐页生成，不丢失页面"""
+    service = make_image_service(batch_size=3, batch_returns=2)
+    pages = sample_pages[1:]
+
+    results = run_group(service, pages)
+
+    assert [(index, success) for index, success, _, _ in results] == [(1, True), (2, True), (3, True)]
+    assert [kind for kind, _ in service.get_provider().generator.calls] == ["batch", "single", "single", "single"]
+
+
+@pytest.mark.parametrize("generator_class", [OpenAICompatibleGenerator, ImageApiGenerator])
+def test_batch_requires_prompt_array_support(generator_class):
+    """OpenAI images 接口的 prompt 只接受字符串：未声明 prompt_array 时不合并页面"""
+    config = {
+        "api_key": "test-key",
+        "base_url": "http://example.test",
+        "endpoint_type": "/v1/images/generations",
+        "batch_size": 4,
+    }
+
+    assert generator_class(config).get_batch_size() == 1
+    assert generator_class(dict(config, prompt_array=True)).get_batch_size() == 4
+    assert generator_class(dict(config, prompt_array=True, endpoint_type="/v1/chat/completions")).get_batch_size() == 1
+
+
+def test_openai_compatible_rejects_short_batch_response():
+    """批量响应中的图片数量少于提示词数量时抛出错误（由调用方回退为逐页生成）"""
+    generator = OpenAICompatibleGenerator({
+        "api_key": "test-key",
+        "base_url": "http://example.test",
+        "prompt_array": True,
+        "batch_size": 3,
+    })
+
+    class Response:
+        status_code = 200
+        text = ""
+
+        def json(self):
+            return {"data": [{"b64_json": "aW1n"}, {"b64_json": "aW1n"}]}
+
+    with pytest.raises(ValueError, match="期望 3 张"):
+        generator._parse_images_response(Response(), "http://example.test", "test-model", 3)
@@ -0,0 +1,157 @@
+"""
+任务取消测试：取消后不再发出上游请求，已完成的请求结果被丢弃，后台任务被中止
+"""
+import asyncio
+import os
+import time
+
+from backend.services.jobs import JobManager
+from backend.services.task_store import MemoryTaskStateStore, SQLiteTaskStateStore
+
+TASK_ID = "task_cancel"
+
+
+def create_task(service, pages):
+    service.task_store.create(TASK_ID, {
+        "pages": pages,
+        "generated": {},
+        "failed": {},
+        "cover_image": None,
+        "full_outline": "大纲",
+        "user_images": None,
+        "user_topic": "主题",
+        "style": "风格",
+        "provider": None,
+    })
+
+
+def generate_page(service, page, staging=None):
+    provider = service.get_provider()
+    return service._agenerate_single_image(provider, page, TASK_ID, staging=staging)
+
+
+def test_cancelled_task_skips_generation(make_image_service, sample_pages):
+    service = make_image_service()
+    create_task(service, sample_pages)
+    service.task_store.set_cancelled(TASK_ID, True)
+
+    result = asyncio.run(generate_page(service, sample_pages[1]))
+
+    assert result == (1, False, None, service.CANCELLED_ERROR)
+    assert service.get_provider().generator.calls == []
+
+    results = asyncio.run(service._agenerate_page_group(service.get_provider(), sample_pages[1:], TASK_ID))
+    assert [error for _, _, _, error in results] == [service.CANCELLED_ERROR] * 3
+    assert service.get_provider().generator.calls == []
+
+
+def test_cancel_while_queued_does_not_send_request(make_image_service, sample_pages):
+    """排队等待并发名额期间任务被取消：获得名额后不再发出请求"""
+    service = make_image_service(max_concurrent=1)
+    create_task(service, sample_pages)
+    provider = service.get_provider()
+
+    async def scenario():
+        semaphore = provider.get_semaphore()
+        await semaphore.acquire()
+        page = asyncio.ensure_future(generate_page(service, sample_pages[1]))
+        await asyncio.sleep(0.01)
+        service.task_store.set_cancelled(TASK_ID, True)
+        semaphore.release()
+        return await page
+
+    assert asyncio.run(scenario())[3] == service.CANCELLED_ERROR
+    assert provider.generator.calls == []
+
+
+def test_result_discarded_when_cancelled_mid_request(make_image_service, sample_pages):
+    """请求进行中任务被取消：结果不写入任务目录"""
+    service = make_image_service(delay=0.05)
+    create_task(service, sample_pages)
+
+    async def scenario():
+        page = asyncio.ensure_future(generate_page(service, sample_pages[1]))
+        await asyncio.sleep(0.01)
+        service.task_store.set_cancelled(TASK_ID, True)
+        return await page
+
+    assert asyncio.run(scenario())[3] == service.CANCELLED_ERROR
+    assert len(service.get_provider().generator.calls) == 1
+    assert not os.path.exists(service.get_image_path(TASK_ID, "1.png"))
+
+
+def test_speculative_pages_ignore_cancel_flag(make_image_service, sample_pages):
+    """推测生成的页面不检查取消标记（由丢弃推测生成统一取消）"""
+    service = make_image_service()
+    create_task(service, sample_pages)
+    service.task_store.set_cancelled(TASK_ID, True)
+    staging = {}
+
+    assert asyncio.run(generate_page(service, sample_pages[1], staging))[1] is True
+    assert 1 in staging
+
+
+def test_cancel_task_marks_remaining_pages_failed(make_image_service, sample_pages):
+    service = make_image_service()
+    create_task(service, sample_pages)
+    service.task_store.set_generated(TASK_ID, 0, "0.png")
+
+    result = asyncio.run(service.acancel_task(TASK_ID))
+
+    assert result == {"generated": 1, "cancelled_indices": [1, 2, 3]}
+    assert service.task_store.is_cancelled(TASK_ID)
+    assert service.task_store.get(TASK_ID)["failed"] == {i: service.CANCELLED_ERROR for i in (1, 2, 3)}
+    assert asyncio.run(service.acancel_task("task_missing")) is None
+
+
+def test_cancel_flag_shared_between_sqlite_stores(temp_history_dir):
+    """取消标记写入共享存储，其他 worker 可以读取"""
+    db_path = os.path.join(temp_history_dir, "tasks.db")
+    store = SQLiteTaskStateStore(db_path, temp_history_dir)
+    store.create(TASK_ID, {"pages": [], "generated": {}, "failed": {}})
+    other = SQLiteTaskStateStore(db_path, temp_history_dir)
+
+    assert other.is_cancelled(TASK_ID) is False
+    store.set_cancelled(TASK_ID, True)
+    assert other.is_cancelled(TASK_ID) is True
+    store.set_cancelled(TASK_ID, False)
+    assert other.is_cancelled(TASK_ID) is False
+
+
+async def slow_events():
+    yield {"event": "progress", "data": {}}
+    await asyncio.sleep(60)
+    yield {"event": "finish", "data": {}}
+
+
+def wait_done(job, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not job.done and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job.done
+
+
+def test_job_manager_cancels_running_job(temp_history_dir):
+    manager = JobManager(MemoryTaskStateStore(temp_history_dir))
+    job = manager.submit("generate", slow_events(), task_id=TASK_ID)
+    time.sleep(0.05)
+
+    assert manager.cancel_task(TASK_ID) == [job]
+    assert wait_done(job)
+    assert job.cancelled
+    assert job.events[-1]["event"] == "cancelled"
+    assert manager.running_jobs(TASK_ID) == []
+
+
+def test_job_cancelled_by_flag_from_other_worker(temp_history_dir):
+    """取消请求落到其他 worker 时，本 worker 通过取消标记中止任务"""
+    manager = JobManager(MemoryTaskStateStore(temp_history_dir))
+    manager.CANCEL_POLL_SECONDS = 0.01
+    flag = {"cancelled": False}
+    job = manager.submit("generate", slow_events(), task_id=TASK_ID, cancel_check=lambda: flag["cancelled"])
+    time.sleep(0.05)
+    assert not job.done
+
+    flag["cancelled"] = True
+    assert wait_done(job)
+    assert job.events[-1]["event"] == "cancelled"
@@ -0,0 +1,177 @@
+"""
+截止时间测试：沿调用链传递、请求超时不超过剩余时间、剩余时间不足时跳过重试
+"""
+import asyncio
+import time
+
+import pytest
+
+from backend.config import Config
+from backend.utils.deadline import (
+    MIN_ATTEMPT_SECONDS,
+    DeadlineExceeded,
+    can_retry,
+    create_deadline,
+    deadline_scope,
+    remaining,
+    request_timeout,
+    run_within,
+    start_deadlines,
+)
+
+
+def test_no_deadline_keeps_default_behavior():
+    with deadline_scope(0, "未设置") as deadline:
+        assert deadline is None
+        assert remaining() is None
+        assert request_timeout(180) == 180
+        assert can_retry(3600)
+    assert create_deadline(0, "未设置") is None
+
+
+def test_request_timeout_capped_by_remaining_time():
+    with deadline_scope(10, "任务截止时间"):
+        assert 9 < request_timeout(180) <= 10
+        assert request_timeout(3) == 3
+
+
+def test_inner_scope_only_tightens():
+    with deadline_scope(10, "外层"):
+        with deadline_scope(100, "内层"):
+            assert remaining() <= 10
+        with deadline_scope(1, "内层"):
+            assert remaining() <= 1
+        assert 1 < remaining() <= 10
+    assert remaining() is None
+
+
+def test_expired_deadline_raises():
+    with deadline_scope(0.01, "单页截止时间"):
+        time.sleep(0.02)
+        with pytest.raises(DeadlineExceeded):
+            request_timeout(180)
+    assert issubclass(DeadlineExceeded, TimeoutError)
+
+
+def test_request_timeout_raises_when_no_time_for_an_attempt():
+    """剩余时间不足 MIN_ATTEMPT_SECONDS 时不再发出请求"""
+    with deadline_scope(MIN_ATTEMPT_SECONDS - 1, "单页截止时间"):
+        with pytest.raises(DeadlineExceeded):
+            request_timeout(180)
+    with deadline_scope(MIN_ATTEMPT_SECONDS + 1, "单页截止时间"):
+        assert request_timeout(180) > MIN_ATTEMPT_SECONDS
+
+
+@pytest.mark.parametrize("module", ["openai_compatible", "image_api"])
+def test_retry_decorator_does_not_retry_deadline(module):
+    """生成器的重试装饰器遇到 DeadlineExceeded 立即抛出，不再等待重试"""
+    import importlib
+    retry_on_error = importlib.import_module(f"backend.generators.{module}").retry_on_error
+    calls = []
+
+    @retry_on_error(max_retries=3, base_delay=0)
+    def request():
+        calls.append(True)
+        raise DeadlineExceeded()
+
+    @retry_on_error(max_retries=3, base_delay=0)
+    async def arequest():
+        calls.append(True)
+        raise DeadlineExceeded()
+
+    with pytest.raises(DeadlineExceeded):
+        request()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(arequest())
+    assert len(calls) == 2
+
+
+def test_unstarted_deadline_waits_for_start():
+    """单页截止时间在获得并发名额时才开始计时"""
+    with deadline_scope(0.05, "单页截止时间", started=False):
+        time.sleep(0.1)
+        assert remaining() == 0.05
+        start_deadlines()
+        assert 0 < remaining() <= 0.05
+
+
+def test_can_retry_requires_time_for_another_attempt():
+    with deadline_scope(MIN_ATTEMPT_SECONDS + 2, "单页截止时间"):
+        assert can_retry(0)
+        assert can_retry(1)
+        assert not can_retry(3)
+
+
+async def current_remaining():
+    return remaining()
+
+
+def test_deadline_propagates_to_tasks_and_threads():
+    async def scenario():
+        with deadline_scope(10, "任务截止时间"):
+            in_task = await asyncio.create_task(current_remaining())
+            in_thread = await asyncio.to_thread(remaining)
+            child = await asyncio.create_task(asyncio.to_thread(request_timeout, 180))
+        return in_task, in_thread, child
+
+    for value in asyncio.run(scenario()):
+        assert 9 < value <= 10
+
+
+def test_run_within_applies_deadline_to_coroutine():
+    """异步生成器中不能跨 yield 使用 deadline_scope，用 run_within 包装每次调用"""
+    async def scenario():
+        deadline = create_deadline(10, "任务截止时间")
+        inside = await run_within(deadline, current_remaining())
+        return inside, remaining(), await run_within(None, current_remaining())
+
+    inside, outside, without = asyncio.run(scenario())
+    assert 9 < inside <= 10
+    assert outside is None and without is None
+
+
+def test_page_deadline_aborts_slow_request(make_image_service, sample_pages, monkeypatch):
+    """单页截止时间到达时中止进行中的请求，不再重试"""
+    monkeypatch.setattr(Config, "PAGE_DEADLINE", 0.1)
+    service = make_image_service(delay=5)
+    provider = service.get_provider()
+
+    started = time.monotonic()
+    index, success, _, error = asyncio.run(service._agenerate_single_image(provider, sample_pages[1], "task_deadline"))
+
+    assert (index, success) == (1, False)
+    assert "截止时间" in error
+    assert time.monotonic() - started < 2
+    assert len(provider.generator.calls) == 1
+
+
+def test_page_deadline_excludes_queue_time(make_image_service, sample_pages, monkeypatch):
+    """排队等待并发名额的时间不计入单页截止时间"""
+    monkeypatch.setattr(Config, "PAGE_DEADLINE", 0.1)
+    service = make_image_service(max_concurrent=1)
+    provider = service.get_provider()
+
+    async def scenario():
+        semaphore = provider.get_semaphore()
+        await semaphore.acquire()
+        page = asyncio.ensure_future(service._agenerate_single_image(provider, sample_pages[1], "task_deadline"))
+        await asyncio.sleep(0.2)
+        semaphore.release()
+        return await page
+
+    assert asyncio.run(scenario())[1] is True
+
+
+def test_retry_skipped_when_remaining_time_too_short(make_image_service, sample_pages, monkeypatch):
+    """剩余时间不足以等待后再尝试一次时直接失败，不再占用并发名额"""
+    monkeypatch.setattr(Config, "PAGE_DEADLINE", MIN_ATTEMPT_SECONDS + 0.5)
+    service = make_image_service(fail_times=3)
+    provider = service.get_provider()
+
+    started = time.monotonic()
+    _, success, _, error = asyncio.run(service._agenerate_single_image(provider, sample_pages[1], "task_deadline"))
+
+    assert success is False
+    assert "503" in error and "截止时间" in error
+    assert time.monotonic() - started < 1
+    assert len(provider.generator.calls) == 1
@@ -0,0 +1,76 @@
+"""
+生成器工厂测试：自定义生成器路径只有在允许的模块前缀内才会被导入
+"""
+import sys
+
+import pytest
+
+from backend.config import Config
+from backend.generators.factory import ImageGeneratorFactory
+from backend.routes import config_routes
+
+
+@pytest.fixture
+def side_effect_module(tmp_path, monkeypatch):
+    """一个导入时会留下痕迹的模块（用于确认被拒绝的路径没有被导入）"""
+    (tmp_path / "untrusted_generator.py").write_text(
+        "import builtins\nbuiltins.untrusted_generator_imported = True\n", encoding="utf-8"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield "untrusted_generator"
+    sys.modules.pop("untrusted_generator", None)
+    import builtins
+    if hasattr(builtins, "untrusted_generator_imported"):
+        del builtins.untrusted_generator_imported
+
+
+@pytest.mark.parametrize("path", ["untrusted_generator:Generator", "untrusted_generator.Generator"])
+def test_unlisted_custom_path_rejected_without_import(side_effect_module, monkeypatch, path):
+    import builtins
+    monkeypatch.setattr(Config, "CUSTOM_GENERATOR_MODULES", [])
+
+    with pytest.raises(ValueError, match="CUSTOM_GENERATOR_MODULES"):
+        ImageGeneratorFactory.create(path, {})
+
+    assert side_effect_module not in sys.modules
+    assert not hasattr(builtins, "untrusted_generator_imported")
+
+
+def test_prefix_must_match_whole_module_name(side_effect_module, monkeypatch):
+    monkeypatch.setattr(Config, "CUSTOM_GENERATOR_MODULES", ["untrusted"])
+
+    with pytest.raises(ValueError, match="不允许加载"):
+        ImageGeneratorFactory.check_type("untrusted_generator:Generator")
+    assert side_effect_module not in sys.modules
+
+
+def test_allowed_custom_path_is_imported(monkeypatch):
+    from tests.fakes import FakeImageGenerator
+    monkeypatch.setattr(Config, "CUSTOM_GENERATOR_MODULES", ["tests"])
+
+    assert ImageGeneratorFactory.get_generator_class("tests.fakes:FakeImageGenerator") is FakeImageGenerator
+
+
+def test_registered_types_do_not_need_opt_in(monkeypatch):
+    monkeypatch.setattr(Config, "CUSTOM_GENERATOR_MODULES", [])
+
+    assert ImageGeneratorFactory.check_type("image_api") is not None
+    with pytest.raises(ValueError, match="不支持的图片生成服务商"):
+        ImageGeneratorFactory.check_type("unknown_provider")
+
+
+def test_config_api_rejects_unlisted_custom_path(client, side_effect_module, monkeypatch, tmp_path):
+    """配置接口拒绝写入不在允许范围内的自定义生成器路径"""
+    config_path = tmp_path / "image_providers.yaml"
+    monkeypatch.setattr(config_routes, "IMAGE_CONFIG_PATH", config_path)
+    monkeypatch.setattr(Config, "CUSTOM_GENERATOR_MODULES", [])
+
+    response = client.post("/api/config", json={"image_generation": {
+        "active_provider": "evil",
+        "providers": {"evil": {"type": "untrusted_generator:Generator"}},
+    }})
+
+    assert response.status_code == 400
+    assert "evil" in response.get_json()["error"]
+    assert not config_path.exists()
+    assert side_effect_module not in sys.modules
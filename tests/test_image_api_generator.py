@@ -0,0 +1,83 @@
+"""
+ImageApiGenerator 异步接口测试
+
+参考图压缩是 CPU 密集操作，异步请求构建必须放到线程中执行，不能阻塞共享的后台事件循环
+"""
+import asyncio
+import base64
+import threading
+
+import pytest
+
+from backend.generators import image_api
+from backend.generators.image_api import ImageApiGenerator
+
+
+class FakeExecutor:
+    """记录压缩调用所在线程的图片执行器"""
+
+    def __init__(self):
+        self.threads = []
+
+    def compress_many(self, images, max_size_kb=200):
+        self.threads.append(threading.get_ident())
+        return [b"compressed" for _ in images]
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.status_code = 200
+        self.text = ""
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+class FakeAsyncClient:
+    """返回固定响应的异步 HTTP 客户端"""
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.requests = []
+
+    async def post(self, url, headers=None, json=None, timeout=None):
+        self.requests.append((url, json))
+        return FakeResponse(self.payload)
+
+
+IMAGE_B64 = base64.b64encode(b"image-bytes").decode()
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    fake = FakeExecutor()
+    monkeypatch.setattr(image_api, "get_image_executor", lambda: fake)
+    return fake
+
+
+@pytest.mark.parametrize("endpoint_type, payload", [
+    ("/v1/images/generations", {"data": [{"b64_json": IMAGE_B64}]}),
+    ("/v1/chat/completions", {"choices": [{"message": {"content": f"data:image/png;base64,{IMAGE_B64}"}}]}),
+])
+def test_async_request_builders_compress_off_event_loop(executor, endpoint_type, payload):
+    """异步生成时参考图压缩在线程池中执行，而不是在事件循环线程中"""
+    generator = ImageApiGenerator({
+        "api_key": "test-key",
+        "base_url": "http://example.test",
+        "model": "test-model",
+        "endpoint_type": endpoint_type,
+    })
+    client = FakeAsyncClient(payload)
+    generator._get_async_client = lambda: client
+
+    async def run():
+        loop_thread = threading.get_ident()
+        image = await generator.agenerate_image("测试提示词", reference_images=[b"ref-1", b"ref-2"])
+        return loop_thread, image
+
+    loop_thread, image = asyncio.run(run())
+
+    assert image == b"image-bytes"
+    assert len(client.requests) == 1
+    assert executor.threads and loop_thread not in executor.threads
@@ -0,0 +1,86 @@
+"""
+图片 ZIP 下载缓存测试：内容取自任务清单，页面变化时删除，总大小和保留时间超限时淘汰
+"""
+import os
+import time
+import zipfile
+
+from backend.routes.history_routes import _get_images_zip, _prune_archives
+from backend.services.manifest import ARCHIVE_FILENAME, ManifestStore
+
+
+def make_task(history_dir, task_id, pages=2):
+    task_dir = os.path.join(history_dir, task_id)
+    store = ManifestStore("none")
+    for index in range(pages):
+        store.write_page(task_dir, index, f"{index}.png", b"image-%d" % index, thumbnail_data=b"thumb")
+    return task_dir, store
+
+
+def set_last_download(path, seconds_ago):
+    past = time.time() - seconds_ago
+    os.utime(path, (past, past))
+
+
+def test_zip_contains_pages_and_is_reused(temp_history_dir):
+    task_dir, _ = make_task(temp_history_dir, "task_a")
+
+    zip_path = _get_images_zip(task_dir)
+    with zipfile.ZipFile(zip_path) as zf:
+        assert sorted(zf.namelist()) == ["page_1.png", "page_2.png"]
+        assert zf.read("page_2.png") == b"image-1"
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in zf.infolist())
+
+    inode = os.stat(zip_path).st_ino
+    assert _get_images_zip(task_dir) == zip_path
+    assert os.stat(zip_path).st_ino == inode
+
+
+def test_regenerating_page_removes_cached_zip(temp_history_dir):
+    task_dir, store = make_task(temp_history_dir, "task_a")
+    zip_path = _get_images_zip(task_dir)
+
+    store.write_page(task_dir, 1, "1.png", b"regenerated")
+
+    assert not os.path.exists(zip_path)
+    with zipfile.ZipFile(_get_images_zip(task_dir)) as zf:
+        assert zf.read("page_2.png") == b"regenerated"
+
+
+def test_prune_by_total_size_removes_least_recently_downloaded(temp_history_dir):
+    paths = []
+    for i, task_id in enumerate(["task_old", "task_mid", "task_new"]):
+        task_dir, _ = make_task(temp_history_dir, task_id)
+        paths.append(_get_images_zip(task_dir))
+        set_last_download(paths[-1], 300 - i * 100)
+    size = os.path.getsize(paths[0])
+
+    assert _prune_archives(temp_history_dir, max_bytes=2 * size, ttl=0) == 1
+    assert [os.path.exists(path) for path in paths] == [False, True, True]
+
+    # 刚生成、即将发送的缓存不会被删除
+    assert _prune_archives(temp_history_dir, keep=paths[1], max_bytes=1, ttl=0) == 1
+    assert [os.path.exists(path) for path in paths] == [False, True, False]
+
+
+def test_prune_by_ttl(temp_history_dir):
+    old_dir, _ = make_task(temp_history_dir, "task_old")
+    new_dir, _ = make_task(temp_history_dir, "task_new")
+    old_zip, new_zip = _get_images_zip(old_dir), _get_images_zip(new_dir)
+    set_last_download(old_zip, 3600)
+
+    assert _prune_archives(temp_history_dir, max_bytes=0, ttl=60) == 1
+    assert not os.path.exists(old_zip)
+    assert os.path.exists(new_zip)
+    assert os.path.exists(os.path.join(old_dir, "0.png"))
+
+
+def test_cache_hit_refreshes_last_download(temp_history_dir):
+    task_dir, _ = make_task(temp_history_dir, "task_a")
+    zip_path = _get_images_zip(task_dir)
+    set_last_download(zip_path, 3600)
+
+    _get_images_zip(task_dir)
+
+    assert time.time() - os.path.getmtime(zip_path) < 60
+    assert os.path.basename(zip_path) == ARCHIVE_FILENAME
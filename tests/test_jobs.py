@@ -0,0 +1,131 @@
+"""
+后台任务测试：按 Last-Event-ID 续接事件、其他 worker 通过共享存储订阅、清理过期任务
+"""
+import asyncio
+import os
+import time
+
+import pytest
+
+from backend.services.jobs import JobManager
+from backend.services.task_store import MemoryTaskStateStore, SQLiteTaskStateStore
+from backend.utils.async_runner import get_async_runner
+
+TASK_ID = "task_jobs"
+
+
+async def page_events(count=3, delay=0.0):
+    for index in range(count):
+        await asyncio.sleep(delay)
+        yield {"event": "complete", "data": {"index": index}}
+    yield {"event": "finish", "data": {"success": True}}
+
+
+async def slow_events():
+    yield {"event": "progress", "data": {}}
+    await asyncio.sleep(60)
+    yield {"event": "finish", "data": {}}
+
+
+def collect(manager, job_id, last_event_id=0):
+    """订阅任务直到结束，返回收到的全部事件"""
+    async def scenario():
+        return [event async for event in manager.subscribe(job_id, last_event_id)]
+
+    return get_async_runner().run(scenario(), timeout=5)
+
+
+def wait_done(job, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not job.done and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job.done
+
+
+@pytest.fixture
+def sqlite_stores(temp_history_dir):
+    """同一个数据库上的两个存储实例（模拟两个 worker）"""
+    db_path = os.path.join(temp_history_dir, "tasks.db")
+    return SQLiteTaskStateStore(db_path, temp_history_dir), SQLiteTaskStateStore(db_path, temp_history_dir)
+
+
+def test_events_have_increasing_ids(temp_history_dir):
+    manager = JobManager(MemoryTaskStateStore(temp_history_dir))
+    job = manager.submit("generate", page_events(), task_id=TASK_ID)
+
+    events = collect(manager, job.job_id)
+
+    assert [event["id"] for event in events] == [1, 2, 3, 4, 5]
+    assert events[0] == {"event": "job", "data": {"job_id": job.job_id, "task_id": TASK_ID}, "id": 1}
+    assert events[-1]["event"] == "finish"
+
+
+def test_resubscribe_from_last_event_id(temp_history_dir):
+    """断线重连：只补发 Last-Event-ID 之后的事件"""
+    manager = JobManager(MemoryTaskStateStore(temp_history_dir))
+    job = manager.submit("generate", page_events(delay=0.02), task_id=TASK_ID)
+
+    first = collect(manager, job.job_id)
+    assert wait_done(job)
+
+    resumed = collect(manager, job.job_id, last_event_id=3)
+    assert resumed == first[3:]
+    assert [event["data"] for event in resumed] == [{"index": 2}, {"success": True}]
+    assert collect(manager, job.job_id, last_event_id=len(first)) == []
+
+
+def test_subscribe_to_job_on_other_worker(sqlite_stores):
+    """重连请求落到其他 worker：从共享存储轮询事件，任务结束后退出"""
+    running = JobManager(sqlite_stores[0])
+    other = JobManager(sqlite_stores[1])
+    other.REMOTE_POLL_SECONDS = 0.01
+    job = running.submit("generate", page_events(delay=0.05), task_id=TASK_ID)
+
+    assert other.get_job(job.job_id) is None
+    assert other.has_job(job.job_id)
+
+    events = collect(other, job.job_id, last_event_id=1)
+
+    assert [event["id"] for event in events] == [2, 3, 4, 5]
+    assert events == job.events[1:]
+    assert other.get_job_info(job.job_id)["status"] == "finished"
+
+
+def test_subscribe_to_unknown_job_on_other_worker(sqlite_stores):
+    assert collect(JobManager(sqlite_stores[1]), "job_missing") == []
+
+
+def test_shared_subscriber_stops_when_worker_stale(sqlite_stores):
+    """运行任务的 worker 长时间没有更新（已退出）时，订阅者不再等待"""
+    running = JobManager(sqlite_stores[0])
+    other = JobManager(sqlite_stores[1])
+    other.STALE_SECONDS = 0
+    job = running.submit("generate", slow_events(), task_id=TASK_ID)
+    time.sleep(0.05)
+
+    events = collect(other, job.job_id)
+
+    assert [event["event"] for event in events] == ["job", "progress"]
+    running.cancel_task(TASK_ID)
+
+
+def test_purge_expired_jobs(sqlite_stores):
+    """已结束的任务保留期过后从本进程和共享存储中清理，运行中的任务不受影响"""
+    store, other_store = sqlite_stores
+    manager = JobManager(store)
+    manager.RETENTION_SECONDS = 0.2
+    manager.STORE_PURGE_INTERVAL = 0
+    finished = manager.submit("generate", page_events(), task_id=TASK_ID)
+    assert wait_done(finished)
+    time.sleep(0.3)
+
+    running = manager.submit("generate", slow_events(), task_id="task_running")
+    manager._purge_expired()
+
+    assert manager.get_job(finished.job_id) is None
+    assert store.get_job(finished.job_id) is None
+    assert other_store.get_job_events(finished.job_id, 0) == []
+    assert not JobManager(other_store).has_job(finished.job_id)
+    assert manager.get_job(running.job_id) is running
+    assert other_store.get_job(running.job_id)["status"] == "running"
+    manager.cancel_task("task_running")
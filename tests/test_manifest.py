@@ -0,0 +1,190 @@
+"""
+任务图片清单测试：预写标记、崩溃恢复（含图片已替换、清单未更新）和跨进程并发写入
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+
+import pytest
+
+from backend.services import manifest
+from backend.services.manifest import MANIFEST_FILENAME, ManifestStore
+
+
+def read_manifest(task_dir):
+    with open(os.path.join(task_dir, MANIFEST_FILENAME), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def crash_on_image_write(monkeypatch):
+    """模拟写入图片文件时进程崩溃（清单文件仍可写入）"""
+    write_file_atomic = manifest.write_file_atomic
+
+    def crash(path, data, fsync=False):
+        if path.endswith(".png"):
+            raise OSError("模拟写入过程中崩溃")
+        write_file_atomic(path, data, fsync=fsync)
+
+    monkeypatch.setattr(manifest, "write_file_atomic", crash)
+
+
+def test_write_page_records_complete_entry(temp_history_dir):
+    store = ManifestStore("none")
+    entry = store.write_page(temp_history_dir, 0, "0.png", b"image", thumbnail_data=b"thumb")
+
+    assert entry["status"] == "complete"
+    assert entry["thumbnail"] == "thumb_0.png"
+    assert [page["index"] for page in store.list_pages(temp_history_dir)] == [0]
+    assert not [name for name in os.listdir(temp_history_dir) if name.endswith(".tmp")]
+
+
+def test_crash_before_rename_leaves_new_page_pending(temp_history_dir, monkeypatch):
+    """写入图片时崩溃：新页面保持 pending，不被当作已完成"""
+    store = ManifestStore("none")
+    store.write_page(temp_history_dir, 0, "0.png", b"cover")
+
+    crash_on_image_write(monkeypatch)
+    with pytest.raises(OSError):
+        store.write_page(temp_history_dir, 1, "1.png", b"page")
+
+    assert read_manifest(temp_history_dir)["pages"]["1"]["status"] == "pending"
+    assert [page["index"] for page in ManifestStore("none").list_pages(temp_history_dir)] == [0]
+
+
+def test_crash_while_overwriting_keeps_previous_complete_entry(temp_history_dir, monkeypatch):
+    """重试覆盖已完成的页面时崩溃：保留原来的完成记录，预写标记单独记录"""
+    store = ManifestStore("none")
+    original = store.write_page(temp_history_dir, 0, "0.png", b"old")
+
+    crash_on_image_write(monkeypatch)
+    with pytest.raises(OSError):
+        store.write_page(temp_history_dir, 0, "0.png", b"new")
+
+    entry = read_manifest(temp_history_dir)["pages"]["0"]
+    assert entry["status"] == "complete"
+    assert entry["sha256"] == original["sha256"]
+    assert entry["pending"]["file"] == "0.png"
+
+    pages = ManifestStore("none").list_pages(temp_history_dir)
+    assert [page["index"] for page in pages] == [0]
+    assert "pending" not in pages[0]
+
+    # 重试成功后去掉预写标记
+    monkeypatch.undo()
+    entry = store.write_page(temp_history_dir, 0, "0.png", b"new")
+    assert "pending" not in read_manifest(temp_history_dir)["pages"]["0"]
+    assert read_manifest(temp_history_dir)["pages"]["0"]["sha256"] == entry["sha256"]
+
+
+def crash_before_final_update(monkeypatch, store):
+    """模拟图片已替换、清单更新为 complete 之前进程崩溃"""
+    update_page = store._update_page
+
+    def crash(task_dir, index, entry, pending=False):
+        if not pending:
+            raise OSError("模拟更新清单前崩溃")
+        update_page(task_dir, index, entry, pending=pending)
+
+    monkeypatch.setattr(store, "_update_page", crash)
+
+
+def test_crash_after_replacing_image_rehashes_on_read(temp_history_dir, monkeypatch):
+    """重试覆盖时图片已替换但清单未更新：读取时按实际内容补记，ETag 不会停留在旧哈希"""
+    store = ManifestStore("none")
+    original = store.write_page(temp_history_dir, 0, "0.png", b"old")
+
+    crash_before_final_update(monkeypatch, store)
+    with pytest.raises(OSError):
+        store.write_page(temp_history_dir, 0, "0.png", b"new")
+    assert read_manifest(temp_history_dir)["pages"]["0"]["sha256"] == original["sha256"]
+
+    page = ManifestStore("none").find_file(temp_history_dir, "0.png")
+    assert page["sha256"] == hashlib.sha256(b"new").hexdigest()
+    assert page["size"] == 3
+
+    entry = read_manifest(temp_history_dir)["pages"]["0"]
+    assert entry["sha256"] == page["sha256"]
+    assert "pending" not in entry
+
+
+def test_crash_after_writing_new_page_completes_on_read(temp_history_dir, monkeypatch):
+    store = ManifestStore("none")
+    crash_before_final_update(monkeypatch, store)
+    with pytest.raises(OSError):
+        store.write_page(temp_history_dir, 1, "1.png", b"page", thumbnail_data=b"thumb")
+
+    pages = ManifestStore("none").list_pages(temp_history_dir)
+
+    assert [(page["index"], page["thumbnail"]) for page in pages] == [(1, "thumb_1.png")]
+    assert read_manifest(temp_history_dir)["pages"]["1"]["status"] == "complete"
+
+
+def test_stale_marker_dropped_when_write_never_landed(temp_history_dir, monkeypatch):
+    """写入从未完成的预写标记过期后去掉，不再每次读取都重新计算哈希"""
+    store = ManifestStore("none")
+    original = store.write_page(temp_history_dir, 0, "0.png", b"old")
+    crash_on_image_write(monkeypatch)
+    with pytest.raises(OSError):
+        store.write_page(temp_history_dir, 0, "0.png", b"new")
+    monkeypatch.undo()
+
+    reader = ManifestStore("none")
+    reader.list_pages(temp_history_dir)
+    assert "pending" in read_manifest(temp_history_dir)["pages"]["0"]
+
+    reader.PENDING_STALE_SECONDS = -1
+    assert reader.list_pages(temp_history_dir)[0]["sha256"] == original["sha256"]
+    assert read_manifest(temp_history_dir)["pages"]["0"] == original
+
+
+def write_legacy_directory(task_dir):
+    for name in ("0.png", "1.jpg", "thumb_0.png", "notes.txt"):
+        with open(os.path.join(task_dir, name), "wb") as f:
+            f.write(b"data")
+
+
+def test_legacy_directory_listed_without_rebuild_on_read(temp_history_dir, monkeypatch):
+    """没有清单的旧任务目录：读取时只列目录（不计算哈希、不写清单），清单在后台补建"""
+    write_legacy_directory(temp_history_dir)
+    store = ManifestStore("none")
+    scheduled = []
+    monkeypatch.setattr(store, "schedule_rebuild", scheduled.append)
+
+    pages = store.list_pages(temp_history_dir)
+
+    assert [(page["index"], page["file"], page["sha256"]) for page in pages] == [(0, "0.png", None), (1, "1.jpg", None)]
+    assert pages[0]["size"] == 4 and pages[0]["thumbnail"] == "thumb_0.png"
+    assert store.find_file(temp_history_dir, "1.jpg")["file"] == "1.jpg"
+    assert not os.path.exists(os.path.join(temp_history_dir, MANIFEST_FILENAME))
+    assert scheduled == [temp_history_dir, temp_history_dir]
+
+
+def test_rebuild_legacy_directory_in_background(temp_history_dir):
+    """后台补建的清单只收录页面图片，补建完成后读取清单中的哈希"""
+    write_legacy_directory(temp_history_dir)
+    store = ManifestStore("none")
+
+    store.list_pages(temp_history_dir)
+    store.schedule_rebuild(temp_history_dir).result(timeout=5)
+
+    assert sorted(read_manifest(temp_history_dir)["pages"]) == ["0", "1"]
+    pages = store.list_pages(temp_history_dir)
+    assert [page["sha256"] for page in pages] == [hashlib.sha256(b"data").hexdigest()] * 2
+    assert store._rebuilds == {}
+
+
+def _write_from_process(task_dir, index):
+    ManifestStore("none").write_page(task_dir, index, f"{index}.png", b"image-%d" % index)
+
+
+def test_concurrent_writers_in_separate_processes(temp_history_dir):
+    """多个进程同时写同一任务的清单时不会互相覆盖页面记录"""
+    context = multiprocessing.get_context("fork") if hasattr(os, "fork") else multiprocessing.get_context()
+    processes = [context.Process(target=_write_from_process, args=(temp_history_dir, i)) for i in range(12)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert [page["index"] for page in ManifestStore("none").list_pages(temp_history_dir)] == list(range(12))
@@ -0,0 +1,134 @@
+"""
+服务商配置热更新测试：只重建配置变化的服务商，运行中的任务继续使用旧生成器，
+重建的运行时沿用旧的并发信号量；被淘汰的生成器在调用全部结束后关闭连接，切换事件循环时关闭旧客户端
+"""
+import asyncio
+import time
+
+from backend.config import Config
+from backend.services import image as image_module
+from backend.utils.async_runner import get_async_runner
+from tests.fakes import FakeImageGenerator
+
+
+def wait_until(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def record_aclose(generator):
+    """把生成器的 aclose 替换为记录调用次数的版本"""
+    closed = []
+    original = generator.aclose
+
+    async def aclose():
+        closed.append(True)
+        await original()
+
+    generator.aclose = aclose
+    return closed
+
+
+def test_aclose_closes_async_client():
+    async def scenario():
+        generator = FakeImageGenerator({})
+        client = generator._get_async_client()
+        await generator.aclose()
+        await generator.aclose()  # 重复关闭无影响
+        return generator, client
+
+    generator, client = asyncio.run(scenario())
+    assert client.is_closed
+    assert generator._async_client is None
+
+
+def test_aclose_closes_client_on_its_own_loop():
+    """客户端属于后台事件循环时在该循环中关闭"""
+    generator = FakeImageGenerator({})
+
+    async def get_client():
+        return generator._get_async_client()
+
+    client = get_async_runner().run(get_client())
+    asyncio.run(generator.aclose())
+    assert client.is_closed
+
+
+def test_loop_change_closes_previous_client():
+    generator = FakeImageGenerator({})
+
+    async def get_client():
+        return generator._get_async_client()
+
+    old = get_async_runner().run(get_client())
+    new = asyncio.run(get_client())
+
+    assert new is not old
+    assert wait_until(lambda: old.is_closed)
+
+
+def test_dropped_provider_closed_after_running_call(make_image_service):
+    """配置变化时仍有进行中的调用：调用结束后才关闭旧生成器"""
+    service = make_image_service(delay=0.2)
+    provider = service.get_provider()
+    closed = record_aclose(provider.generator)
+
+    runner = get_async_runner()
+    call = runner.submit(service._acall_provider(provider, provider.generator.agenerate_image, prompt="p"))
+    assert wait_until(lambda: provider.generator.calls)
+
+    service.drop_providers([provider.provider_name])
+    time.sleep(0.05)
+    assert closed == []
+
+    call.result(timeout=2)
+    assert wait_until(lambda: closed == [True])
+
+
+def test_idle_dropped_provider_closed_immediately(make_image_service):
+    service = make_image_service()
+    provider = service.get_provider()
+    closed = record_aclose(provider.generator)
+
+    service.drop_providers([provider.provider_name])
+
+    assert wait_until(lambda: closed == [True])
+    assert service.get_provider() is not provider
+
+
+def test_refresh_rebuilds_only_changed_provider(make_image_service, monkeypatch):
+    """修改一个服务商的配置：其他服务商的生成器不变，运行中的任务继续使用旧生成器，重建的运行时沿用信号量"""
+    service = make_image_service(delay=0.2, max_concurrent=2)
+    changed = service.get_provider()
+    unrelated = service.get_provider(make_image_service().provider_name)
+    old_generator, unrelated_generator = changed.generator, unrelated.generator
+    config = Config.load_image_providers_config()
+    config["active_provider"] = changed.provider_name
+    monkeypatch.setattr(image_module, "_service_instance", service)
+    monkeypatch.setattr(image_module, "_previous_service", None)
+
+    runner = get_async_runner()
+    call = runner.submit(service._acall_provider(changed, changed.generator.agenerate_image, prompt="进行中"))
+    assert wait_until(lambda: old_generator.calls)
+    semaphore = changed._semaphore
+
+    config["providers"][changed.provider_name] = {**changed.provider_config, "max_concurrent": 3}
+    image_module.refresh_image_service()
+
+    assert image_module._service_instance is None  # 激活服务商的配置变化，下次使用时重建服务实例
+    new_service = image_module.get_image_service()
+    rebuilt = new_service.get_provider()
+    assert rebuilt is not changed
+    assert rebuilt.generator is not old_generator
+    assert rebuilt.max_concurrent == 3
+    assert rebuilt._semaphore is semaphore
+    assert new_service.get_provider(unrelated.provider_name).generator is unrelated_generator
+
+    # 运行中的任务持有旧的运行时，结果来自旧生成器
+    call.result(timeout=2)
+    assert changed.generator is old_generator
+    assert old_generator.calls == [("single", "进行中")]
+    assert rebuilt.generator.calls == []
+    assert wait_until(lambda: semaphore._value == 3)
@@ -0,0 +1,117 @@
+"""
+服务商熔断测试：closed -> open -> half_open -> closed，以及哪些失败计入熔断统计
+"""
+import asyncio
+
+import pytest
+
+from backend.generators.router import ProviderRouter, is_provider_failure
+from backend.utils.deadline import DeadlineExceeded
+
+
+def open_breaker(router, name="p"):
+    for _ in range(router.FAILURE_THRESHOLD):
+        router.record(name, 0.1, False)
+
+
+def test_consecutive_failures_open_breaker():
+    router = ProviderRouter()
+    for _ in range(router.FAILURE_THRESHOLD - 1):
+        router.record("p", 0.1, False)
+    assert router.allow_request("p")
+
+    router.record("p", 0.1, False)
+    assert router.snapshot()["p"]["state"] == "open"
+    assert not router.allow_request("p")
+    assert not router.is_closed("p")
+
+
+def test_half_open_allows_single_probe_and_success_closes():
+    router = ProviderRouter()
+    router.COOLDOWN_SECONDS = 0
+    open_breaker(router)
+
+    assert router.allow_request("p")  # 冷却结束，放行探测请求
+    assert router.snapshot()["p"]["state"] == "half_open"
+    router.COOLDOWN_SECONDS = 60
+    assert not router.allow_request("p")  # 探测进行中，不放行第二个请求
+
+    router.record("p", 0.1, True)
+    assert router.snapshot()["p"]["state"] == "closed"
+    assert router.allow_request("p")
+
+
+def test_failed_probe_reopens_breaker():
+    router = ProviderRouter()
+    router.COOLDOWN_SECONDS = 0
+    open_breaker(router)
+    assert router.allow_request("p")
+
+    router.record("p", 0.1, False)
+    assert router.snapshot()["p"]["state"] == "open"
+
+
+def test_is_closed_does_not_take_probe_slot():
+    """只读查询不占用半开状态的探测名额"""
+    router = ProviderRouter()
+    router.COOLDOWN_SECONDS = 0
+    open_breaker(router)
+    assert router.allow_request("p")
+    router.COOLDOWN_SECONDS = 60
+
+    assert not router.is_closed("p")
+    router.release_probe("p")
+    assert router.allow_request("p")
+
+
+def test_error_rate_opens_breaker():
+    """连续失败未达阈值，但错误率过高时同样熔断"""
+    router = ProviderRouter()
+    for _ in range(4):
+        router.record("p", 0.1, False)
+        router.record("p", 0.1, False)
+        router.record("p", 0.1, True)
+    assert router.snapshot()["p"]["state"] == "open"
+
+
+def chained(inner, outer):
+    try:
+        try:
+            raise inner
+        except Exception:
+            raise outer
+    except Exception as e:
+        return e
+
+
+@pytest.mark.parametrize("error, expected", [
+    (Exception("Image API 请求失败 (状态码: 503)"), True),
+    (Exception("下载图片失败: HTTP 502"), True),
+    (Exception("⏳ API 配额或速率限制"), True),
+    (ConnectionResetError(), True),
+    (asyncio.TimeoutError(), True),
+    (chained(Exception("429 RESOURCE_EXHAUSTED. quota"), Exception("⏳ 每日配额已用尽")), True),
+    (Exception("OpenAI Images API 请求失败 (状态码: 401)\n4. API配额已用尽"), False),
+    (chained(Exception("401 UNAUTHENTICATED. bad key"), Exception("❌ API Key 认证失败\n网络连接")), False),
+    (ValueError("OpenAI API 未返回图片数据。\n1. 提示词被安全过滤拦截"), False),
+    (DeadlineExceeded(), False),
+    (chained(asyncio.TimeoutError(), DeadlineExceeded()), False),
+])
+def test_only_provider_faults_count(error, expected):
+    """只有传输错误、上游超时、5xx 和 429 计入熔断统计"""
+    assert is_provider_failure(error) is expected
+
+
+def test_non_provider_failures_do_not_trip_breaker(make_image_service):
+    """安全过滤等与服务商健康度无关的失败不会导致熔断"""
+    from backend.generators.router import get_provider_router
+
+    service = make_image_service(fail_times=10, error="图片数据提取失败：提示词被安全过滤")
+    provider = service.get_provider()
+
+    for _ in range(ProviderRouter.FAILURE_THRESHOLD + 1):
+        with pytest.raises(Exception):
+            asyncio.run(service._acall_provider(provider, provider.generator.agenerate_image, "提示词"))
+
+    snapshot = get_provider_router().snapshot().get(provider.provider_name)
+    assert snapshot is None or (snapshot["state"] == "closed" and snapshot["failures"] == 0)
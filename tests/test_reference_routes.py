@@ -0,0 +1,77 @@
+"""
+参考图 ID 接口测试：上传一次后按 ID 引用，ID 无效时返回 400 提示重新上传
+"""
+import base64
+
+import pytest
+
+from backend.services import reference_store
+from backend.services.reference_store import ReferenceStore
+from backend.utils import image_executor
+from backend.utils.upload import UploadError, resolve_reference_ids, store_base64_images
+from tests.fakes import make_png
+
+
+@pytest.fixture(autouse=True)
+def temp_reference_store(monkeypatch, temp_history_dir):
+    """全局参考图存储改为临时目录（图片压缩在调用线程中执行）"""
+    monkeypatch.setattr(image_executor, "_executor_instance", image_executor.ImageExecutor(max_workers=0))
+    store = ReferenceStore(temp_history_dir)
+    monkeypatch.setattr(reference_store, "_store_instance", store)
+    return store
+
+
+def encode(image):
+    return "data:image/png;base64," + base64.b64encode(image).decode("ascii")
+
+
+def test_upload_returns_ids_and_dedups(client):
+    red, blue = make_png((200, 30, 30)), make_png((30, 30, 200))
+
+    response = client.post("/api/references", json={"images": [encode(red), encode(blue), encode(red)]})
+
+    assert response.status_code == 200
+    ids = response.get_json()["ids"]
+    assert len(ids) == 3
+    assert ids[0] == ids[2] != ids[1]
+
+    response = client.get(f"/api/references/{ids[0]}")
+    assert response.status_code == 200
+    assert response.get_json()["id"] == ids[0]
+
+
+def test_upload_rejects_empty_and_invalid_images(client):
+    assert client.post("/api/references", json={"images": []}).status_code == 400
+    assert client.post("/api/references", json={"images": [encode(b"not an image")]}).status_code == 400
+    assert client.post("/api/references", json={"images": "abc"}).status_code == 400
+
+
+def test_unknown_reference_returns_404(client):
+    assert client.get(f"/api/references/{'0' * 32}").status_code == 404
+    assert client.get("/api/references/..").status_code == 404
+
+
+def test_resolve_reference_ids_returns_stored_images(temp_reference_store):
+    ref_ids = store_base64_images([encode(make_png())])
+
+    images = resolve_reference_ids(ref_ids * 2)
+
+    assert len(images) == 2
+    assert images[0] == temp_reference_store.get(ref_ids[0], 200)
+
+
+@pytest.mark.parametrize("ref_ids", [["0" * 32], ["../etc/passwd"], "abc"])
+def test_resolve_invalid_reference_ids(ref_ids):
+    with pytest.raises(UploadError) as excinfo:
+        resolve_reference_ids(ref_ids)
+    assert excinfo.value.status_code == 400
+
+
+def test_outline_with_unknown_reference_id_returns_400(client):
+    """引用不存在的参考图时在调用模型前返回 400，客户端据此重新上传"""
+    response = client.post("/api/outline", json={"topic": "主题", "image_ids": ["0" * 32]})
+
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body["success"] is False
+    assert "重新上传" in body["error"]
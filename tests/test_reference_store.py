@@ -0,0 +1,113 @@
+"""
+参考图存储测试：按内容哈希去重、任务使用记录释放和淘汰
+"""
+import os
+import time
+
+import pytest
+
+from backend.services.reference_store import META_FILENAME, OWNERS_DIRNAME, ReferenceStore, content_hash
+from backend.utils import image_executor
+from tests.fakes import make_png
+
+
+@pytest.fixture
+def store(monkeypatch, temp_history_dir):
+    """使用临时目录的参考图存储（图片压缩在调用线程中执行）"""
+    monkeypatch.setattr(image_executor, "_executor_instance", image_executor.ImageExecutor(max_workers=0))
+    return ReferenceStore(temp_history_dir)
+
+
+def make_idle(store, ref_id, seconds=3600):
+    """把参考图的最近使用时间调到 seconds 秒之前"""
+    past = time.time() - seconds
+    os.utime(os.path.join(store.root, ref_id, META_FILENAME), (past, past))
+
+
+def test_same_image_returns_existing_id(store):
+    image = make_png()
+    ref_id = store.add(image)
+
+    assert store.add(image) == ref_id
+    assert store.lookup(content_hash(image)) == ref_id
+    assert store.get(ref_id) == image
+    assert [name for name in os.listdir(store.root) if store.is_valid_id(name)] == [ref_id]
+
+
+def test_images_differing_only_in_color_are_not_merged(store):
+    """内容不同的图片（即使尺寸和构图相同）不会被合并为同一张参考图"""
+    red = store.add(make_png((200, 30, 30)))
+    blue = store.add(make_png((30, 30, 200)))
+
+    assert red != blue
+    assert store.get(red) != store.get(blue)
+
+
+def test_alias_hash_resolves_to_stored_image(store):
+    """压缩前原始上传内容的哈希同样可以查到参考图"""
+    ref_id = store.add(make_png(), aliases=["original-upload-digest"])
+
+    assert store.lookup("original-upload-digest") == ref_id
+    assert store.lookup("unknown-digest") is None
+
+
+def test_other_worker_sees_stored_image(store):
+    """其他 worker（独立的存储实例）通过磁盘上的哈希索引找到已保存的参考图"""
+    image = make_png()
+    ref_id = store.add(image)
+
+    other = ReferenceStore(store.root)
+    assert other.lookup(content_hash(image)) == ref_id
+    assert other.add(image) == ref_id
+
+
+def test_compress_many_reuses_stored_variant_and_claims(store):
+    image = make_png()
+    ref_id = store.add(image)
+
+    assert store.compress_many([image], 200, owner="task_a") == [store.get(ref_id, 200)]
+    assert os.path.exists(os.path.join(store.root, ref_id, OWNERS_DIRNAME, "task_a"))
+
+
+def test_release_keeps_recently_used_image(store):
+    ref_id = store.add(make_png())
+    store.claim("task_a", [ref_id])
+
+    assert store.release("task_a") == 0
+    assert store.exists(ref_id)
+
+
+def test_release_removes_idle_unowned_image(store):
+    image = make_png()
+    ref_id = store.add(image)
+    store.claim("task_a", [ref_id])
+    store.claim("task_b", [ref_id])
+    make_idle(store, ref_id)
+
+    assert store.release("task_a") == 0  # task_b 仍在使用
+    assert store.release("task_b") == 1
+    assert not store.exists(ref_id)
+    assert store.lookup(content_hash(image)) is None
+
+
+def test_evict_by_ttl_skips_owned_images(store):
+    owned = store.add(make_png((200, 30, 30)))
+    unowned = store.add(make_png((30, 30, 200)))
+    store.claim("task_a", [owned])
+    make_idle(store, owned)
+    make_idle(store, unowned)
+
+    assert store.evict(max_bytes=0, ttl=60) == 1
+    assert store.exists(owned)
+    assert not store.exists(unowned)
+
+
+def test_evict_by_size_removes_least_recently_used(store):
+    old = store.add(make_png((200, 30, 30)))
+    new = store.add(make_png((30, 30, 200)))
+    make_idle(store, old)
+    size = sum(entry.stat().st_size for entry in os.scandir(os.path.join(store.root, new)) if entry.is_file())
+
+    assert store.evict(max_bytes=size, ttl=0) == 1
+    assert not store.exists(old)
+    assert store.exists(new)
@@ -0,0 +1,146 @@
+"""
+页面调度测试：焦点页及其之后的页面优先，推测生成最后，焦点变化（含其他 worker 上报的）和推测接管在下一次放行时生效
+"""
+import asyncio
+
+import pytest
+
+from backend.services.scheduler import PageScheduler, PageTicket, PrioritySemaphore, page_context
+from backend.services.task_store import MemoryTaskStateStore, SQLiteTaskStateStore
+
+
+@pytest.fixture
+def scheduler(temp_history_dir):
+    """焦点页保存在临时任务状态存储中的调度器（已创建任务 t）"""
+    store = MemoryTaskStateStore(temp_history_dir)
+    store.create("t", {"pages": [], "generated": {}, "failed": {}})
+    return PageScheduler(store)
+
+
+async def run_pages(semaphore, tickets, order, before_release=None):
+    """所有页面同时请求名额，记录放行顺序"""
+    async def request(ticket):
+        with page_context(*ticket):
+            async with semaphore:
+                order.append(ticket)
+                if before_release:
+                    before_release(ticket)
+                await asyncio.sleep(0)
+
+    await asyncio.gather(*(request(ticket) for ticket in tickets))
+
+
+def released(tickets):
+    return [(ticket.index, ticket.speculative) for ticket in tickets]
+
+
+def test_priority_without_focus_starts_from_first_page(scheduler):
+    assert scheduler.priority(None) < scheduler.priority(PageTicket("t", 0))
+    assert scheduler.priority(PageTicket("t", 0)) < scheduler.priority(PageTicket("t", 1))
+    assert scheduler.priority(PageTicket("t", 5)) < scheduler.priority(PageTicket("t", 1, True))
+
+
+def test_focus_page_and_following_pages_first(scheduler):
+    assert scheduler.set_focus("t", 2)
+    tickets = [PageTicket("t", 1, True)] + [PageTicket("t", index) for index in range(5)]
+    order = []
+
+    asyncio.run(run_pages(PrioritySemaphore(1, scheduler), tickets, order))
+
+    assert released(order) == [(2, False), (3, False), (4, False), (0, False), (1, False), (1, True)]
+
+
+def test_focus_change_applies_to_queued_requests(scheduler):
+    """排队中的请求在下一次放行时按新的焦点页排序"""
+    tickets = [PageTicket("t", index) for index in range(5)]
+    order = []
+
+    def move_focus(ticket):
+        if ticket.index == 0:
+            scheduler.set_focus("t", 3)
+
+    asyncio.run(run_pages(PrioritySemaphore(1, scheduler), tickets, order, move_focus))
+
+    assert [ticket.index for ticket in order] == [0, 3, 4, 1, 2]
+
+
+def test_promoted_speculation_ranks_with_regular_pages(scheduler):
+    """推测生成被正式生成接管后与正式页面同等排序"""
+    tickets = [PageTicket("other", 2), PageTicket("t", 1, True)]
+    order = []
+
+    scheduler.promote("t")
+    asyncio.run(run_pages(PrioritySemaphore(1, scheduler), tickets, order))
+    assert released(order) == [(1, True), (2, False)]
+
+    scheduler.clear_promotion("t")
+    assert scheduler.is_speculative(PageTicket("t", 1, True))
+
+
+def test_focus_for_unknown_task_is_not_recorded(scheduler):
+    assert scheduler.set_focus("missing", 3) is False
+    assert scheduler.get_focus("missing") is None
+
+
+def test_focus_cache_is_bounded(scheduler):
+    scheduler.MAX_FOCUS_ENTRIES = 3
+    for i in range(10):
+        scheduler.get_focus(f"task_{i}")
+    assert len(scheduler._focus) == 3
+
+
+def test_focus_shared_between_workers(temp_history_dir):
+    """焦点上报落到其他 worker 时，运行任务的 worker 在缓存过期后按新的焦点排序"""
+    db_path = f"{temp_history_dir}/tasks.db"
+    store = SQLiteTaskStateStore(db_path, temp_history_dir)
+    store.create("t", {"pages": [], "generated": {}, "failed": {}})
+    running = PageScheduler(store)
+    other = PageScheduler(SQLiteTaskStateStore(db_path, temp_history_dir))
+    assert running.get_focus("t") is None
+
+    assert other.set_focus("t", 4)
+    assert running.get_focus("t") is None  # 缓存未过期
+    running.FOCUS_REFRESH_SECONDS = 0
+    assert running.get_focus("t") == 4
+    assert running.priority(PageTicket("t", 4)) < running.priority(PageTicket("t", 0))
+
+    other.clear_focus("t")
+    assert running.get_focus("t") is None
+
+
+def test_focus_route_returns_404_for_unknown_task(client):
+    response = client.post("/api/task/task_missing_focus/focus", json={"index": 1})
+    assert response.status_code == 404
+    assert client.post("/api/task/task_missing_focus/focus", json={"index": -1}).status_code == 400
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    async def scenario():
+        semaphore = PrioritySemaphore(1, PageScheduler())
+        await semaphore.acquire(PageTicket("t", 0))
+        waiter = asyncio.ensure_future(semaphore.acquire(PageTicket("t", 1)))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        semaphore.release()
+
+        await asyncio.wait_for(semaphore.acquire(PageTicket("t", 2)), 1)
+        assert semaphore.waiting == 0
+
+    asyncio.run(scenario())
+
+
+def test_resize_releases_queued_requests():
+    async def scenario():
+        semaphore = PrioritySemaphore(1, PageScheduler())
+        await semaphore.acquire(PageTicket("t", 0))
+        waiter = asyncio.ensure_future(semaphore.acquire(PageTicket("t", 1)))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        semaphore.resize(2)
+        await asyncio.wait_for(waiter, 1)
+        assert semaphore.locked()
+
+    asyncio.run(scenario())
@@ -0,0 +1,117 @@
+"""
+推测生成测试：封面确认后接管暂存的页面，封面或大纲变化时丢弃，被丢弃的暂存结果不写入任务目录
+"""
+import asyncio
+import os
+
+from tests.fakes import make_png
+
+TASK_ID = "task_speculation"
+
+
+async def run_step(service, pages, step, speculative=False):
+    return [event async for event in service.agenerate_images(
+        pages, TASK_ID, full_outline="大纲", user_topic="主题", step=step, speculative=speculative
+    )]
+
+
+async def speculate(service, pages):
+    """生成封面并等待推测生成完成，返回推测生成实例"""
+    events = await run_step(service, pages, "cover", speculative=True)
+    assert events[-1]["event"] == "waiting_approval"
+    speculation = service._speculations[TASK_ID]
+    await asyncio.gather(*speculation.tasks)
+    return speculation
+
+
+def page_path(service, index):
+    return service.get_image_path(TASK_ID, f"{index}.png")
+
+
+def single_calls(service):
+    return [call for call in service.get_provider().generator.calls if call[0] == "single"]
+
+
+def test_speculation_adopted_after_cover_approval(make_image_service, sample_pages):
+    service = make_image_service()
+
+    async def scenario():
+        speculation = await speculate(service, sample_pages)
+        assert sorted(speculation.staging) == [1, 2, 3]
+        # 用户确认前不写入任务目录
+        assert not any(os.path.exists(page_path(service, index)) for index in (1, 2, 3))
+        staged = dict(speculation.staging)
+
+        events = await run_step(service, sample_pages, "content")
+        return staged, events
+
+    staged, events = asyncio.run(scenario())
+
+    assert len(single_calls(service)) == 4  # 封面 + 3 页推测生成，确认后没有新的请求
+    assert "3 页已在确认封面期间提前生成" in events[0]["data"]["message"]
+    assert events[-1]["data"]["success"] is True
+    for index in (1, 2, 3):
+        with open(page_path(service, index), "rb") as f:
+            assert f.read() == staged[index]
+    assert TASK_ID not in service._speculations
+
+
+def test_speculation_discarded_for_changed_pages(make_image_service, sample_pages):
+    """确认前页面内容被修改：只接管未修改的页面，被修改页面的暂存结果不写入任务目录"""
+    service = make_image_service()
+    adopted_image, discarded_image = make_png((0, 200, 0)), make_png((0, 0, 200))
+    edited = [dict(page) for page in sample_pages]
+    edited[2]["content"] = "修改后的内容页2"
+
+    async def scenario():
+        speculation = await speculate(service, sample_pages)
+        speculation.staging[1] = adopted_image
+        speculation.staging[2] = discarded_image
+        await run_step(service, edited, "content")
+        return speculation
+
+    speculation = asyncio.run(scenario())
+
+    assert speculation.staging == {}
+    prompts = [prompt for _, prompt in single_calls(service)]
+    assert len(prompts) == 5 and "修改后的内容页2" in prompts[-1]
+    with open(page_path(service, 1), "rb") as f:
+        assert f.read() == adopted_image
+    with open(page_path(service, 2), "rb") as f:
+        assert f.read() != discarded_image
+
+
+def test_speculation_discarded_when_cover_regenerated(make_image_service, sample_pages):
+    """封面重新生成：之前的推测生成结果被丢弃，内容页按新封面重新生成"""
+    service = make_image_service()
+
+    async def scenario():
+        speculation = await speculate(service, sample_pages)
+        await run_step(service, sample_pages, "cover")
+        assert TASK_ID not in service._speculations
+        assert speculation.staging == {}
+        assert not any(os.path.exists(page_path(service, index)) for index in (1, 2, 3))
+        return await run_step(service, sample_pages, "content")
+
+    events = asyncio.run(scenario())
+
+    assert len(single_calls(service)) == 8  # 两次封面 + 3 页推测生成（丢弃）+ 3 页正式生成
+    assert "提前生成" not in events[0]["data"]["message"]
+    assert events[-1]["data"]["completed"] == 4
+
+
+def test_speculation_with_different_cover_image_not_adopted(make_image_service, sample_pages):
+    """任务的封面参考图已变化（如其他 worker 重绘了封面）时不接管推测生成的结果"""
+    service = make_image_service()
+
+    async def scenario():
+        speculation = await speculate(service, sample_pages)
+        service.task_store.set_cover(TASK_ID, b"other cover")
+        await run_step(service, sample_pages, "content")
+        return speculation
+
+    speculation = asyncio.run(scenario())
+
+    assert speculation.staging == {}
+    assert len(single_calls(service)) == 7
+    assert all(os.path.exists(page_path(service, index)) for index in (1, 2, 3))
@@ -0,0 +1,200 @@
+"""
+任务状态存储测试：内存预算（LRU）和空闲超时（TTL，含定期维护）淘汰的任务写入磁盘，再次访问时加载回内存；
+SQLite 存储的多个实例（多个 worker）共享同一任务的状态，参考图在版本未变化时不重复读取
+"""
+import os
+import time
+
+import pytest
+
+from backend.services.task_store import MemoryTaskStateStore, SQLiteTaskStateStore
+
+
+def make_state(image_size=1000):
+    return {
+        "pages": [{"index": 0, "type": "cover", "content": "封面"}],
+        "generated": {0: "0.png"},
+        "failed": {},
+        "cover_image": b"c" * image_size,
+        "full_outline": "大纲",
+        "user_images": [b"u" * image_size],
+        "user_topic": "主题",
+        "style": "风格",
+        "provider": None,
+    }
+
+
+def spill_path(store, task_id):
+    return os.path.join(store.history_root_dir, task_id, store.STATE_DIRNAME, store.SPILL_FILENAME)
+
+
+def test_lru_spills_least_recently_used_task(temp_history_dir):
+    """超出内存预算时淘汰最久未访问的任务，再次访问时完整加载回内存"""
+    store = MemoryTaskStateStore(temp_history_dir, max_bytes=6000, ttl_seconds=0)
+    store.create("task_a", make_state())
+    store.create("task_b", make_state())
+    store.get("task_a")  # task_b 成为最久未访问
+    store.create("task_c", make_state())
+
+    assert "task_b" not in store._states
+    assert os.path.exists(spill_path(store, "task_b"))
+    assert set(store._states) == {"task_a", "task_c"}
+
+    state = store.get("task_b")
+    assert state["cover_image"] == b"c" * 1000
+    assert state["user_images"] == [b"u" * 1000]
+    assert state["generated"] == {0: "0.png"}
+    # 加载回内存后删除磁盘副本
+    assert not os.path.exists(spill_path(store, "task_b"))
+
+
+def test_most_recent_task_is_kept_even_over_budget(temp_history_dir):
+    """单个任务超出预算时仍保留在内存中"""
+    store = MemoryTaskStateStore(temp_history_dir, max_bytes=10, ttl_seconds=0)
+    store.create("task_a", make_state())
+
+    assert "task_a" in store._states
+    assert store.get("task_a") is not None
+
+
+def test_ttl_spills_idle_tasks(temp_history_dir):
+    """空闲超过 TTL 的任务在下一次访问存储时写入磁盘"""
+    store = MemoryTaskStateStore(temp_history_dir, max_bytes=0, ttl_seconds=0.05)
+    store.create("task_idle", make_state())
+    time.sleep(0.1)
+    store.create("task_new", make_state())
+
+    assert "task_idle" not in store._states
+    assert store.exists("task_idle")
+    assert store.get("task_idle")["user_topic"] == "主题"
+
+
+def test_spilled_task_updates_and_cancel_flag(temp_history_dir):
+    """已写入磁盘的任务可以继续更新，取消标记无需加载完整状态即可读取"""
+    store = MemoryTaskStateStore(temp_history_dir, max_bytes=0, ttl_seconds=0.05)
+    store.create("task_a", make_state())
+    store.set_cancelled("task_a", True)
+    time.sleep(0.1)
+    store.create("task_b", make_state())
+
+    assert "task_a" not in store._states
+    assert store.is_cancelled("task_a") is True
+    assert "task_a" not in store._states
+
+    store.set_failed("task_a", 1, "失败")
+    assert store.get("task_a")["failed"] == {1: "失败"}
+
+    store.delete("task_a")
+    assert store.get("task_a") is None
+    assert not os.path.exists(spill_path(store, "task_a"))
+
+
+def test_idle_tasks_spilled_without_further_access(temp_history_dir):
+    """worker 空闲、不再访问存储时，定期维护同样会把空闲任务写入磁盘（包括最后一个任务）"""
+    store = MemoryTaskStateStore(temp_history_dir, max_bytes=0, ttl_seconds=0.05)
+    store.create("task_a", make_state())
+    store.create("task_b", make_state())
+    assert store.evict_idle() == 0
+
+    time.sleep(0.1)
+    assert store.evict_idle() == 2
+
+    assert not store._states
+    assert store._total_bytes == 0
+    assert os.path.exists(spill_path(store, "task_a"))
+    assert store.get("task_b")["user_topic"] == "主题"
+
+
+def test_job_manager_maintenance_evicts_idle_tasks(temp_history_dir):
+    """JobManager 的定期维护在没有新请求时淘汰空闲任务状态"""
+    from backend.services.jobs import JobManager
+
+    store = MemoryTaskStateStore(temp_history_dir, max_bytes=0, ttl_seconds=0.05)
+    store.create("task_idle", make_state())
+    manager = JobManager(store)
+    manager.MAINTENANCE_INTERVAL = 0.02
+
+    async def no_events():
+        return
+        yield
+
+    manager.submit("generate", no_events(), task_id="task_idle")
+
+    deadline = time.monotonic() + 5
+    while "task_idle" in store._states and time.monotonic() < deadline:
+        time.sleep(0.02)
+    manager.MAINTENANCE_INTERVAL = 3600
+    assert "task_idle" not in store._states
+    assert os.path.exists(spill_path(store, "task_idle"))
+
+
+@pytest.fixture
+def sqlite_stores(temp_history_dir):
+    """同一个数据库上的两个存储实例（模拟两个 worker）"""
+    db_path = os.path.join(temp_history_dir, "tasks.db")
+    return SQLiteTaskStateStore(db_path, temp_history_dir), SQLiteTaskStateStore(db_path, temp_history_dir)
+
+
+def test_sqlite_state_round_trip_between_stores(sqlite_stores):
+    store, other = sqlite_stores
+    state = make_state()
+    store.create("t", state)
+
+    assert other.exists("t")
+    assert other.get("t") == {**state, "cancelled": False, "focus": None}
+
+
+def test_sqlite_updates_visible_to_other_store(sqlite_stores):
+    store, other = sqlite_stores
+    store.create("t", make_state())
+    assert other.get("t")["cover_image"] == b"c" * 1000
+
+    other.set_generated("t", 1, "1.png")
+    store.set_failed("t", 2, "上游错误")
+    other.set_cover("t", b"new cover")
+    state = store.get("t")
+    assert state["generated"] == {0: "0.png", 1: "1.png"}
+    assert state["failed"] == {2: "上游错误"}
+    assert state["cover_image"] == b"new cover"
+
+    store.clear_failed("t", 2)
+    assert other.get("t")["failed"] == {}
+
+    # 删除后重新创建同名任务：其他实例不使用旧的参考图缓存
+    assert other.get("t")["cover_image"] == b"new cover"
+    store.delete("t")
+    assert other.get("t") is None
+    store.create("t", {**make_state(), "cover_image": b"recreated"})
+    assert other.get("t")["cover_image"] == b"recreated"
+
+
+def test_sqlite_blobs_cached_until_version_changes(sqlite_stores, monkeypatch):
+    store, other = sqlite_stores
+    store.create("t", make_state())
+    reads = []
+    original = SQLiteTaskStateStore._read_blob
+
+    def counting_read(self, task_id, filename):
+        reads.append(filename)
+        return original(self, task_id, filename)
+
+    monkeypatch.setattr(SQLiteTaskStateStore, "_read_blob", counting_read)
+
+    for _ in range(3):
+        assert other.get("t")["user_images"] == [b"u" * 1000]
+    store.set_generated("t", 1, "1.png")
+    assert other.get("t")["generated"][1] == "1.png"
+    assert sorted(reads) == ["cover.bin", "user_0.bin"]
+
+    store.set_cover("t", b"new cover")
+    assert other.get("t")["cover_image"] == b"new cover"
+    assert len(reads) == 4
+
+
+def test_sqlite_blob_cache_is_bounded(sqlite_stores):
+    store = sqlite_stores[0]
+    store.MAX_BLOB_CACHE_ENTRIES = 2
+    for i in range(5):
+        store.create(f"t{i}", make_state())
+        store.get(f"t{i}")
+    assert list(store._blob_cache) == ["t3", "t4"]